@@ -0,0 +1,110 @@
+"""
+Representative leaves standing for the equivalent leaves of a TreeTopoGeneric tree.
+
+Most of the nodes of a deep tree are leaves under last-level switches, each with a namespace, a
+shell and a veth pair, and below the lowest level of FPGA hosts they are all alike: every link
+under a switch of that level is a standard link, so the leaves of its subtree have the same path
+to the cloud, to the FPGA host above them and to the hosts of every other subtree. An Aggregation
+at a level builds a single representative leaf for the subtree of each switch of that level (of
+the last level of switches, one per switch), the first leaf of the subtree, and the chain of
+switches down to it. The rest of the subtree is not built, so a network grows with the number of
+distinct paths rather than of leaves.
+
+Each link of a chain stands for every link of its level in the subtree, and has their total
+bandwidth with the delay and loss of one. A representative sends the traffic of every leaf it
+stands for, so the links above it carry the load of the full tree: workloads scale the rate (open
+loop) or the connections (closed loop) of its client by its weight, and replays send the flows of
+the whole trace from the representatives alone. ping_all weighs every pair of hosts by the leaves
+they stand for, and the measurements of a representative hold for each of its leaves. This module
+only uses the standard library.
+"""
+
+from tree_index import TreeIndex
+
+MODES = ('switch', 'subtree')
+
+
+def aggregation_level(index, mode='switch', level=None):
+    """Return the level of an Aggregation of a TreeIndex: the last level of switches for the
+    'switch' mode, and level, or by default the lowest level of FPGA hosts (the root if there are
+    none), for the 'subtree' mode."""
+    if mode == 'switch':
+        return index.depth - 2
+    if level is not None:
+        return level
+    return index.fpga_levels[-1] if index.fpga_levels else 0
+
+
+class Aggregation(object):
+    """The representative leaves of the subtrees of the switches of a level of a TreeIndex.
+
+    The level must be a level of switches at or below every level of FPGA hosts."""
+
+    def __init__(self, index, level):
+        if not 0 <= level < index.depth - 1:
+            raise ValueError('Level {} is not a level of switches of a tree of depth {}.'.format(
+                level, index.depth))
+        if index.fpga_levels and level < index.fpga_levels[-1]:
+            raise ValueError('Level {} is above FPGA hosts on level {}, whose leaves differ.'
+                             .format(level, index.fpga_levels[-1]))
+        self.index = index
+        self.level = level
+        # Leaves each representative stands for
+        self.weight = index.spread ** (index.depth - 1 - level)
+
+    def representative(self, leaf):
+        """Return the representative of a leaf: the first leaf of its subtree."""
+        index = self.index
+        return index.leaf(index.position(leaf) // self.weight * self.weight)
+
+    def is_representative(self, leaf):
+        return self.index.position(leaf) % self.weight == 0
+
+    def representatives(self):
+        """Return the representative leaves, in order."""
+        index = self.index
+        return [index.leaf(position) for position in range(0, index.n_leaves, self.weight)]
+
+    def chain(self, leaf):
+        """Return the nodes between a representative leaf and the switch of the level above it,
+        the leaf first."""
+        return self.index.path_to_root(leaf)[:self.index.depth - 1 - self.level]
+
+    def nodes(self):
+        """Return the set of nodes built: the switches of the level and above, the chains of the
+        representatives, the FPGA hosts and the cloud."""
+        index = self.index
+        nodes = set(range(index.level_offsets[self.level + 1]))
+        for leaf in self.representatives():
+            nodes.update(self.chain(leaf))
+        nodes.update(index.fpga_hosts())
+        nodes.add(index.cloud)
+        return nodes
+
+    def bandwidth_scale(self, node):
+        """Return the number of links of the level of a tree node in its subtree, which the link
+        above it stands for (1 above the level)."""
+        return self.index.spread ** max(self.index.level(node) - self.level, 0)
+
+    def targets(self, targets):
+        """Return the (leaf, target) names of workload.workload_targets whose leaves are
+        representatives."""
+        index = self.index
+        return [(leaf, target) for leaf, target in targets
+                if self.is_representative(index.node_by_name(leaf))]
+
+    def host_weight(self, name):
+        """Return the leaves a built host stands for: the weight of a leaf, and 1 for the FPGA
+        hosts and the cloud."""
+        node = self.index.node_by_name(name)
+        return self.weight if self.index.is_leaf(node) else 1
+
+    def fields(self):
+        """Return the fields recorded with the measurements of an aggregated network."""
+        return dict(aggregate_level=self.level, leaf_weight=self.weight)
+
+
+def aggregate_index(spread, depth, fpga=None, placements=None, mode='switch', level=None):
+    """Return the Aggregation of a tree for the aggregation options of fpga_switch_model."""
+    index = TreeIndex(spread, depth, fpga, placements)
+    return Aggregation(index, aggregation_level(index, mode, level))
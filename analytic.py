@@ -0,0 +1,132 @@
+"""
+Closed-form performance model of the TreeTopoGeneric topology.
+
+Predicts what test_cloud_fpga would measure on every leaf host at once, without building (or
+needing root to build) a Mininet network.
+
+Every TCLink applies its bandwidth, delay and loss to both of its interfaces, so a packet pays
+each of them once per link in each direction.
+"""
+
+import logging
+
+import numpy as np
+
+from parameters import delay_to_seconds, link_options
+from tree_index import TreeIndex
+
+# Size of the packets sent by ping: 56 bytes of data, 8 bytes of ICMP header and 20 of IP header
+PING_PACKET_SIZE = 84
+
+
+def _link_values(opts):
+    """Return the (delay in s, bandwidth in Mbps, loss fraction) of a link."""
+    # A bandwidth of 0 leaves the link unshaped
+    bandwidth = float(opts['bw']) if opts['bw'] else np.inf
+    return delay_to_seconds(opts['delay']), bandwidth, opts['loss'] / 100.0
+
+
+def _hops(hosts, *links):
+    """Stack (link_opts, count) groups into (delay, bandwidth, loss) arrays of shape (hosts, hops).
+    """
+    hops = np.concatenate([np.repeat([_link_values(opts)], count, axis=0)
+                           for opts, count in links])
+    return [np.broadcast_to(hops[:, k], (hosts, len(hops))) for k in range(3)]
+
+
+def _path_metrics(delay, bandwidth, loss, packet_size):
+    """Combine per-hop arrays of shape (hosts, hops) into RTT (ms), bottleneck (Mbps) and loss (%).
+    """
+    serialisation = packet_size * 8 / (bandwidth * 1e6)
+    rtt = 2 * (delay + serialisation).sum(axis=1) * 1e3
+    # A ping is lost if either the request or the reply is dropped on any link
+    delivered = np.prod((1 - loss) ** 2, axis=1)
+    return rtt, bandwidth.min(axis=1), (1 - delivered) * 100
+
+
+def predict(spread, depth, bandwidth, delay, loss, fpga=None, fpga_bandwidth=None, fpga_delay=None,
+            fpga_loss=None, poisson=None, packet_size=PING_PACKET_SIZE):
+    """Predict leaf to cloud and leaf to FPGA performance for every host in the tree.
+
+    Takes the same parameters as TreeTopoGeneric. Returns a dict of NumPy arrays indexed by host
+    number: the RTT in ms, bottleneck bandwidth in Mbps and end-to-end ping loss in percent to
+    the cloud ('cloud_*') and to the FPGA host above each leaf ('fpga_*'), along with the index
+    of that FPGA host ('fpga_host'). The FPGA values are NaN (and fpga_host -1) if there are no
+    FPGA switches on the path.
+
+    With poisson set the link delay is a Poisson variable whose mean is the given delay, so the
+    prediction is the expected value."""
+    if depth < 2:
+        raise ValueError('A tree needs a depth of at least 2 to connect a host to the cloud.')
+
+    link_opts, fpga_link_opts, cloud_link_opts = link_options(
+        bandwidth, delay, loss, fpga_bandwidth, fpga_delay, fpga_loss)
+
+    index = TreeIndex(spread, depth, fpga)
+    hosts = np.arange(index.n_leaves)
+    prediction = dict(host=hosts)
+
+    # Every leaf reaches the cloud through depth - 1 standard links and the cloud link
+    prediction['cloud_rtt'], prediction['cloud_bandwidth'], prediction['cloud_loss'] = \
+        _path_metrics(*_hops(len(hosts), (link_opts, depth - 1), (cloud_link_opts, 1)),
+                      packet_size=packet_size)
+
+    if index.fpga is not None:
+        # ... and the FPGA host on the switch above it at level fpga through depth - 1 - fpga
+        # standard links and the FPGA link
+        hops = depth - 1 - fpga
+        prediction['fpga_host'] = index.ancestor_positions(hosts, depth - 1, fpga)
+        prediction['fpga_rtt'], prediction['fpga_bandwidth'], prediction['fpga_loss'] = \
+            _path_metrics(*_hops(len(hosts), (link_opts, hops), (fpga_link_opts, 1)),
+                          packet_size=packet_size)
+    else:
+        prediction['fpga_host'] = np.full(len(hosts), -1)
+        for key in ('fpga_rtt', 'fpga_bandwidth', 'fpga_loss'):
+            prediction[key] = np.full(len(hosts), np.nan)
+
+    return prediction
+
+
+def log_prediction(prediction, fpga):
+    """Log the predicted performance between the leaves and the cloud (or FPGA switches)."""
+    logger = logging.getLogger(__name__)
+    target = 'fpga' if fpga is not None else 'cloud'
+    rtt = prediction[target + '_rtt']
+    logger.info('Predicted performance between %d leaves and %s', len(rtt),
+                'FPGA switches' if fpga is not None else 'cloud')
+    logger.info('Predicted rtt min/avg/max = %.3f/%.3f/%.3f ms', np.min(rtt), np.mean(rtt),
+                np.max(rtt))
+    logger.info('Predicted bottleneck bandwidth: %s Mbps, packet loss: %.2f%%',
+                np.min(prediction[target + '_bandwidth']), np.max(prediction[target + '_loss']))
+
+
+def prediction_measurements(prediction, index, placement=None):
+    """Return the measurement test_cloud_fpga would take from every leaf of the TreeIndex of the
+    prediction, as predicted: to the FPGA host above it, or to the cloud if there are none.
+
+    placement, the number of one of the placements of the index, whose level and options the
+    prediction was made with, returns the measurements from the leaves below its FPGA hosts to
+    them instead."""
+    if placement is not None:
+        measurements = []
+        for leaf, host in index.placement_targets(placement):
+            position = index.position(leaf)
+            measurements.append(dict(
+                test='cloud_fpga', src=index.name(leaf), dst=index.name(host),
+                loss_percent=prediction['fpga_loss'][position],
+                rtt_min=prediction['fpga_rtt'][position], rtt_avg=prediction['fpga_rtt'][position],
+                rtt_max=prediction['fpga_rtt'][position], rtt_mdev=0.0,
+                throughput_mbps=prediction['fpga_bandwidth'][position]))
+        return measurements
+
+    target = 'fpga' if index.fpga is not None else 'cloud'
+    measurements = []
+    for host, fpga_host, rtt, bandwidth, loss in zip(
+            prediction['host'], prediction['fpga_host'], prediction[target + '_rtt'],
+            prediction[target + '_bandwidth'], prediction[target + '_loss']):
+        measurements.append(dict(
+            test='cloud_fpga', src='h{}'.format(host),
+            dst='f{}'.format(fpga_host) if index.fpga is not None else 'cloud',
+            loss_percent=loss, rtt_min=rtt, rtt_avg=rtt, rtt_max=rtt, rtt_mdev=0.0,
+            throughput_mbps=bandwidth))
+    return measurements
@@ -0,0 +1,428 @@
+#!/usr/bin/env python
+"""
+Benchmark how the phases of fpga_switch_model scale with the shape of the tree.
+
+Each phase is timed over a grid of spreads, depths and FPGA levels, and a cost per unit (the
+nodes, links, leaves, ... the phase scales with) is fitted to its times with least squares. The
+pure Python phases (indexing the tree, the analytic and simulation backends and building the
+TreeTopoGeneric) run anywhere. The mininet phases, which need root, split building the network
+into adding its nodes and adding its links, so that the costs of nodes and links can be told apart
+even though every tree has one link fewer than it has nodes.
+
+Results are saved as a versioned baseline file, and a later run can be compared with a baseline to
+flag the phases which became slower than a threshold. The mininet phases can also produce a
+calibration file for the startup time and memory predictions of --plan, and time starting the same
+network with mininet_functions.BatchedMininet, next to the nodes, links, configure and start
+phases it replaces.
+"""
+
+import json
+import logging
+import math
+import os
+import platform
+import subprocess
+import time
+import timeit
+
+import click
+
+from fpga_switch_model import configure_logging
+from planning import available_memory, plan_network
+from sweep import grid, values_of
+from tree_index import TreeIndex
+
+# Version of the format of baseline files
+BASELINE_VERSION = 1
+
+# Every phase, with the count it scales with and whether it needs mininet and root, in the order
+# they run
+PHASES = (
+    ('index', 'nodes', False),
+    ('analytic', 'leaves', False),
+    ('simulation', 'nodes', False),
+    ('simulation_cloud_fpga', 'depth', False),
+    ('topology', 'nodes', False),
+    ('nodes', 'nodes', True),
+    ('links', 'links', True),
+    ('configure', 'nodes', True),
+    ('start', 'nodes', True),
+    ('cloud_fpga', 'depth', True),
+    ('ping_all', 'pairs', True),
+    ('stop', 'nodes', True),
+    ('cleanup', 'links', True),
+    ('batched_startup', 'links', True),
+)
+PHASE_NAMES = tuple(name for name, _, _ in PHASES)
+UNITS = dict((name, unit) for name, unit, _ in PHASES)
+MININET_PHASES = tuple(name for name, _, mininet in PHASES if mininet)
+# Phases of setup_mininet, which make up the startup time predicted by --plan
+STARTUP_PHASES = ('cleanup', 'topology', 'nodes', 'links', 'configure', 'start')
+# Phases of building and starting a network, which batched_startup does in bulk
+BUILD_PHASES = ('nodes', 'links', 'configure', 'start')
+# Mininet phases of the network built one step at a time
+STANDARD_PHASES = tuple(name for name in MININET_PHASES if name != 'batched_startup')
+
+# Parameters of the links of every benchmarked network
+BANDWIDTH = 10
+DELAY = '1ms'
+LOSS = 0
+
+# Slow downs smaller than this are noise, however large they are relative to the baseline
+MIN_REGRESSION_S = 0.001
+
+
+def counts(spread, depth, fpga):
+    """Return the count of every unit of the phases for the given tree."""
+    index = TreeIndex(spread, depth, fpga)
+    plan = plan_network(spread, depth, fpga)
+    return dict(nodes=plan['nodes'], links=plan['links'], leaves=index.n_leaves, depth=depth,
+                pairs=plan['hosts'] * (plan['hosts'] - 1))
+
+
+def _timed_steps(phases, timed):
+    """Return a function running a step of a phase with timed if the phase is in phases, and
+    untimed otherwise, for the steps later phases depend on."""
+    def step(phase, function, *args):
+        if phase in phases:
+            return timed(phase, function, *args)
+        return function(*args)
+    return step
+
+
+def _time_pure_phases(spread, depth, fpga, phases, timed):
+    import analytic
+    import simulation
+    from performance_tests import test_cloud_fpga
+
+    def index_tree():
+        index = TreeIndex(spread, depth, fpga)
+        for _ in index.links():
+            pass
+        for node in index.hosts():
+            index.name(node)
+
+    if 'index' in phases:
+        timed('index', index_tree)
+    if 'analytic' in phases:
+        timed('analytic', analytic.predict, spread, depth, BANDWIDTH, DELAY, LOSS, fpga)
+    step = _timed_steps(phases, timed)
+    if 'simulation' in phases or 'simulation_cloud_fpga' in phases:
+        net = step('simulation', simulation.setup_simulation, spread, depth, BANDWIDTH, DELAY,
+                   LOSS, fpga, None, None, None, False, 0)
+        if 'simulation_cloud_fpga' in phases:
+            timed('simulation_cloud_fpga', test_cloud_fpga, net, net.index.fpga)
+    if 'topology' in phases:
+        from mininet_functions import TreeTopoGeneric
+
+        timed('topology', TreeTopoGeneric, spread, depth, BANDWIDTH, DELAY, LOSS, fpga)
+
+
+def _time_mininet_phases(spread, depth, fpga, phases, timed):
+    from mininet.clean import Cleanup
+    from mininet.link import TCLink
+    from mininet.net import Mininet
+    from mininet.node import CPULimitedHost, DefaultController
+
+    from mininet_functions import TreeTopoGeneric, start_network
+    from performance_tests import test_cloud_fpga, test_ping_all
+
+    def add_nodes():
+        # The nodes and links of Mininet.buildFromTopo, timed separately
+        net.addController('c0')
+        for name in topo.hosts():
+            net.addHost(name, **topo.nodeInfo(name))
+        for name in topo.switches():
+            net.addSwitch(name, **topo.nodeInfo(name))
+
+    def add_links():
+        for _, _, params in topo.links(sort=True, withInfo=True):
+            net.addLink(**params)
+
+    def configure():
+        # The rest of Mininet.build
+        net.configHosts()
+        net.staticArp()
+        net.built = True
+
+    step = _timed_steps(phases, timed)
+    topo = TreeTopoGeneric(spread, depth, BANDWIDTH, DELAY, LOSS, fpga)
+    if any(phase in phases for phase in STANDARD_PHASES):
+        net = Mininet(topo=topo, host=CPULimitedHost, link=TCLink, build=False,
+                      autoStaticArp=True)
+        try:
+            step('nodes', add_nodes)
+            step('links', add_links)
+            step('configure', configure)
+            step('start', net.start)
+            if 'cloud_fpga' in phases:
+                timed('cloud_fpga', test_cloud_fpga, net, topo.index.fpga)
+            if 'ping_all' in phases:
+                timed('ping_all', test_ping_all, net)
+        finally:
+            step('stop', net.stop)
+            step('cleanup', Cleanup.cleanup)
+
+    if 'batched_startup' in phases:
+        net = timed('batched_startup', start_network, topo, DefaultController, True)
+        net.stop()
+        Cleanup.cleanup()
+
+
+def time_phases(spread, depth, fpga, phases):
+    """Time the given phases once on the given tree.
+
+    Returns a dict of the seconds each phase took, and a dict of the MB of memory each mininet
+    phase took from the machine."""
+    seconds, memory = {}, {}
+
+    def timed(phase, function, *args):
+        available = available_memory()
+        start = timeit.default_timer()
+        result = function(*args)
+        seconds[phase] = timeit.default_timer() - start
+        if available is not None:
+            memory[phase] = available - available_memory()
+        return result
+
+    _time_pure_phases(spread, depth, fpga, phases, timed)
+    if any(phase in MININET_PHASES for phase in phases):
+        _time_mininet_phases(spread, depth, fpga, phases, timed)
+    return seconds, memory
+
+
+def run_benchmark(shapes, phases, repeat=3):
+    """Time the phases on every shape, keeping the fastest of repeat runs of each.
+
+    Returns a row for every phase and shape, with the count of its unit, its seconds and (for the
+    mininet phases) its memory in MB."""
+    logger = logging.getLogger(__name__)
+    rows = []
+    if shapes:
+        # Warm up the pure Python phases, so the first shape doesn't pay for first calls
+        shape = shapes[0]
+        time_phases(shape['spread'], shape['depth'], shape['fpga'],
+                    [phase for phase in phases if phase not in MININET_PHASES])
+    for shape in shapes:
+        spread, depth, fpga = shape['spread'], shape['depth'], shape['fpga']
+        logger.info('Benchmarking spread %d, depth %d, FPGA level %s', spread, depth, fpga)
+        shape_counts = counts(spread, depth, fpga)
+        best = {}
+        for _ in range(repeat):
+            seconds, memory = time_phases(spread, depth, fpga, phases)
+            for phase in seconds:
+                if phase not in best or seconds[phase] < best[phase][0]:
+                    best[phase] = seconds[phase], memory.get(phase, float('nan'))
+        for phase in PHASE_NAMES:
+            if phase in best:
+                rows.append(dict(phase=phase, spread=spread, depth=depth, fpga=fpga,
+                                 units=shape_counts[UNITS[phase]], seconds=best[phase][0],
+                                 memory_mb=best[phase][1] if phase in MININET_PHASES else None))
+    return rows
+
+
+def _fit(units, values):
+    """Fit value = base + per_unit * units, returning (base, per_unit)."""
+    import numpy as np
+
+    units, values = np.asarray(units, dtype=float), np.asarray(values, dtype=float)
+    if len(set(units)) < 2:
+        # A single count cannot separate the base from the cost per unit
+        return 0.0, float(np.mean(values / units))
+    per_unit, base = np.polyfit(units, values, 1)
+    return float(base), float(per_unit)
+
+
+def fit_costs(rows):
+    """Return the base cost and cost per unit of every phase in rows, in seconds and MB."""
+    costs = {}
+    for phase in PHASE_NAMES:
+        phase_rows = [row for row in rows if row['phase'] == phase]
+        if not phase_rows:
+            continue
+        units = [row['units'] for row in phase_rows]
+        base_s, per_unit_s = _fit(units, [row['seconds'] for row in phase_rows])
+        cost = dict(unit=UNITS[phase], base_s=base_s, per_unit_s=per_unit_s, base_mb=None,
+                    per_unit_mb=None)
+        if phase in MININET_PHASES:
+            cost['base_mb'], cost['per_unit_mb'] = _fit(
+                units, [row['memory_mb'] for row in phase_rows])
+        costs[phase] = cost
+    return costs
+
+
+def calibration(costs):
+    """Return the coefficients of the --plan predictions (see planning.CALIBRATION) fitted by the
+    startup phases, or None if they did not all run."""
+    if not all(phase in costs for phase in STARTUP_PHASES):
+        return None
+    coefficients = dict(startup_s=dict(base=0.0, per_node=0.0, per_link=0.0),
+                        memory_mb=dict(base=0.0, per_node=0.0, per_link=0.0))
+    for phase in STARTUP_PHASES:
+        cost = costs[phase]
+        per = 'per_link' if cost['unit'] == 'links' else 'per_node'
+        coefficients['startup_s']['base'] += cost['base_s']
+        coefficients['startup_s'][per] += cost['per_unit_s']
+        if cost['base_mb'] is not None:
+            coefficients['memory_mb']['base'] += cost['base_mb']
+            coefficients['memory_mb'][per] += cost['per_unit_mb']
+    return coefficients
+
+
+def code_version():
+    """Return the git description of the code being benchmarked, or '' outside of a checkout."""
+    try:
+        with open(os.devnull, 'w') as devnull:
+            return subprocess.check_output(
+                ['git', 'describe', '--always', '--dirty'], stderr=devnull,
+                cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def make_baseline(rows):
+    """Return a baseline of the given rows, recording what and where they were measured."""
+    return dict(version=BASELINE_VERSION, created=time.time(), code_version=code_version(),
+                machine=platform.node(), python=platform.python_version(), rows=rows,
+                costs=fit_costs(rows))
+
+
+def load_baseline(path):
+    """Load a baseline file, raising ValueError if it has another version of the format."""
+    with open(path, 'rt') as f:
+        baseline = json.load(f)
+    if baseline.get('version') != BASELINE_VERSION:
+        raise ValueError("Baseline '{}' has version {}, but version {} is needed.".format(
+            path, baseline.get('version'), BASELINE_VERSION))
+    return baseline
+
+
+def compare_startup(rows):
+    """Return (spread, depth, fpga, seconds, batched seconds) for every shape in rows with both
+    the BUILD_PHASES and batched_startup, the seconds being those of the BUILD_PHASES together."""
+    shapes, seconds = [], {}
+    for row in rows:
+        shape = row['spread'], row['depth'], row['fpga']
+        if shape not in seconds:
+            shapes.append(shape)
+            seconds[shape] = {}
+        seconds[shape][row['phase']] = row['seconds']
+    return [shape + (sum(seconds[shape][phase] for phase in BUILD_PHASES),
+                     seconds[shape]['batched_startup'])
+            for shape in shapes
+            if all(phase in seconds[shape] for phase in BUILD_PHASES + ('batched_startup',))]
+
+
+def _row_key(row):
+    return row['phase'], row['spread'], row['depth'], row['fpga']
+
+
+def find_regressions(rows, baseline, threshold):
+    """Return (row, baseline seconds) for every row more than threshold (a fraction) slower than
+    the same phase on the same shape in the baseline."""
+    previous = dict((_row_key(row), row['seconds']) for row in baseline['rows'])
+    regressions = []
+    for row in rows:
+        seconds = previous.get(_row_key(row))
+        if (seconds is not None and row['seconds'] > seconds * (1 + threshold)
+                and row['seconds'] - seconds > MIN_REGRESSION_S):
+            regressions.append((row, seconds))
+    return regressions
+
+
+def _format_cost(value, scale):
+    return '-' if value is None or math.isnan(value) else '{:.3f}'.format(value * scale)
+
+
+@click.command()
+@click.option('-s', '--spread', default='2:4', show_default=True,
+              callback=values_of(click.IntRange(min=1)),
+              help='Numbers of children each node will have.')
+@click.option('-d', '--depth', default='2:5', show_default=True,
+              callback=values_of(click.IntRange(min=2)),
+              help='Numbers of levels in the tree.')
+@click.option('-f', '--fpga', default='none', show_default=True,
+              callback=values_of(click.IntRange(min=0)),
+              help='Levels of the tree which should be modelled as FPGA switches (root is 0).')
+@click.option('-r', '--repeat', default=3, show_default=True, type=click.IntRange(min=1),
+              help='Number of times to time each phase, keeping the fastest.')
+@click.option('--mininet', is_flag=True,
+              help='Also benchmark building, starting, testing and stopping mininet networks. '
+                   'Requires root.')
+@click.option('--skip', multiple=True, type=click.Choice(PHASE_NAMES),
+              help='Do not run this phase. May be given more than once.')
+@click.option('-o', '--output', help='Save the results to this baseline file.')
+@click.option('--baseline', 'baseline_path', type=click.Path(exists=True, dir_okay=False),
+              help='Flag the phases which are slower than in this baseline file.')
+@click.option('--threshold', default=0.25, show_default=True, type=click.FloatRange(min=0),
+              help='Fraction by which a phase must be slower than the baseline to be flagged.')
+@click.option('--calibration', 'calibration_path',
+              help='Save the calibration of --plan fitted by the mininet phases to this file.')
+@click.option('--log', default='warning', show_default=True,
+              type=click.Choice(['debug', 'info', 'output', 'warning', 'error', 'critical']),
+              help='Set the log level.')
+def benchmark(repeat, mininet, skip, output, baseline_path, threshold, calibration_path, log,
+              **values):
+    """Time each phase over a grid of tree shapes."""
+    configure_logging(log)
+
+    if mininet and os.geteuid() != 0:
+        raise click.UsageError('--mininet requires root.')
+    phases = [name for name, _, needs_mininet in PHASES
+              if name not in skip and (mininet or not needs_mininet)]
+    if 'topology' in phases:
+        try:
+            import mininet_functions  # noqa: F401
+        except ImportError:
+            logging.getLogger(__name__).warning('Skipping the topology phase: mininet is not '
+                                                'installed.')
+            phases.remove('topology')
+    if calibration_path and not all(phase in phases for phase in STARTUP_PHASES):
+        raise click.UsageError('--calibration requires --mininet and every startup phase: '
+                               '{}.'.format(', '.join(STARTUP_PHASES)))
+
+    if baseline_path:
+        try:
+            baseline = load_baseline(baseline_path)
+        except ValueError as ex:
+            raise click.BadParameter(str(ex), param_hint='--baseline')
+
+    rows = run_benchmark(grid(values), phases, repeat)
+    results = make_baseline(rows)
+
+    click.echo('{:<22} {:<7} {:>10} {:>14} {:>10} {:>13}'.format(
+        'phase', 'unit', 'base (ms)', 'per unit (us)', 'base (MB)', 'per unit (kB)'))
+    for phase in PHASE_NAMES:
+        if phase in results['costs']:
+            cost = results['costs'][phase]
+            click.echo('{:<22} {:<7} {:>10} {:>14} {:>10} {:>13}'.format(
+                phase, cost['unit'], _format_cost(cost['base_s'], 1e3),
+                _format_cost(cost['per_unit_s'], 1e6), _format_cost(cost['base_mb'], 1),
+                _format_cost(cost['per_unit_mb'], 1e3)))
+
+    for spread, depth, fpga, seconds, batched in compare_startup(rows):
+        click.echo('Startup of spread {}, depth {}, FPGA level {}: {:.3f} s, batched {:.3f} s '
+                   '({:.1f}x faster)'.format(spread, depth, fpga, seconds, batched,
+                                             seconds / batched))
+
+    if output:
+        with open(output, 'wt') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if calibration_path:
+        with open(calibration_path, 'wt') as f:
+            json.dump(calibration(results['costs']), f, indent=2, sort_keys=True)
+
+    if baseline_path:
+        regressions = find_regressions(rows, baseline, threshold)
+        for row, seconds in regressions:
+            click.echo('Regression: {} on spread {}, depth {}, FPGA level {} took {:.3f} ms, '
+                       '{:.3f} ms in the baseline'.format(row['phase'], row['spread'], row['depth'],
+                                                          row['fpga'], row['seconds'] * 1e3,
+                                                          seconds * 1e3))
+        if regressions:
+            raise click.ClickException('{} phases are more than {:.0%} slower than the '
+                                       'baseline.'.format(len(regressions), threshold))
+
+
+if __name__ == '__main__':
+    benchmark()
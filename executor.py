@@ -0,0 +1,255 @@
+"""
+Commands run at once on many hosts of an emulated network, without blocking on any of them.
+
+Host.cmd runs one command on one host and waits for it to exit, so the probes of many hosts run one
+after the other, and a command which never exits blocks the tests for good: an iperf client whose
+TCP handshake failed on a lossy link waits forever. An Executor starts commands with the popen of
+their hosts instead, in their network namespaces, and reads the output of every one of them as it
+arrives with select.poll, as rpc_agent does. A command which runs past its timeout, or which is
+cancelled, is interrupted with SIGINT, on which ping and iperf print the statistics of what they
+did so far, and killed if it has not exited KILL_AFTER_S later.
+
+Every command ends in a CommandResult: its output (stdout and stderr together), exit code and run
+time, and whether it timed out or was cancelled. Hosts of the simulation backend have no
+processes, so their commands run with their cmd method as soon as they are started.
+"""
+
+import errno
+import os
+import select
+import signal
+import subprocess
+import time
+
+# Seconds a command has to exit after SIGINT before it is killed, and to close its output after
+KILL_AFTER_S = 1.0
+# Bytes read from the output of a command at a time
+READ_BYTES = 65536
+# Seconds between checks that a command which closed its output has exited
+EXIT_POLL_S = 0.01
+
+
+class CommandResult(object):
+    """The outcome of a command run on a host by an Executor."""
+    __slots__ = ('host', 'args', 'returncode', 'output', 'elapsed', 'timed_out', 'cancelled')
+
+    def __init__(self, host, args, returncode, output, elapsed, timed_out=False, cancelled=False):
+        self.host = host
+        self.args = args
+        self.returncode = returncode
+        self.output = output
+        self.elapsed = elapsed
+        self.timed_out = timed_out
+        self.cancelled = cancelled
+
+    @property
+    def ok(self):
+        """Whether the command exited by itself with status 0."""
+        return self.returncode == 0 and not self.timed_out and not self.cancelled
+
+    def __repr__(self):
+        return '<CommandResult {} {!r}: {}{}{}>'.format(
+            self.host, ' '.join(self.args), self.returncode,
+            ', timed out' if self.timed_out else '', ', cancelled' if self.cancelled else '')
+
+
+class _Command(object):
+    """A command started by an Executor."""
+    __slots__ = ('host', 'args', 'process', 'chunks', 'closed', 'started', 'deadline',
+                 'interrupted', 'killed', 'timed_out', 'cancelled', 'result')
+
+    def __init__(self, host, args, timeout):
+        self.host = host
+        self.args = args
+        self.process = None
+        self.chunks = []
+        self.closed = False
+        self.started = time.time()
+        self.deadline = None if timeout is None else self.started + timeout
+        self.interrupted = None
+        self.killed = None
+        self.timed_out = False
+        self.cancelled = False
+        self.result = None
+
+
+class Executor(object):
+    """Commands running at once on hosts of a network, whose output is read as it arrives.
+
+    start returns a handle for each command, wait returns the CommandResult of commands once they
+    have exited, and cancel interrupts one. Commands still running when the executor is closed are
+    cancelled."""
+
+    def __init__(self):
+        self.poll = select.poll()
+        self.commands = []
+        self.running = []
+        self.by_fd = {}
+
+    def start(self, host, args, timeout=None):
+        """Start a command, a list of arguments, on a host, interrupting it if it runs for more than
+        timeout seconds, and return its handle."""
+        command = _Command(host, [str(arg) for arg in args], timeout)
+        if not hasattr(host, 'popen'):
+            output = host.cmd(' '.join(command.args))
+            command.result = CommandResult(host.name, command.args, 0, output,
+                                           time.time() - command.started)
+        else:
+            command.process = host.popen(command.args, stdout=subprocess.PIPE,
+                                         stderr=subprocess.STDOUT)
+            fd = command.process.stdout.fileno()
+            self.by_fd[fd] = command
+            self.poll.register(fd, select.POLLIN)
+            self.running.append(command)
+        self.commands.append(command)
+        return len(self.commands) - 1
+
+    def output(self, handle):
+        """Return the output of a command so far."""
+        command = self.commands[handle]
+        if command.result is not None:
+            return command.result.output
+        return b''.join(command.chunks).decode('utf-8', 'replace')
+
+    def cancel(self, handle):
+        """Interrupt a command if it is still running; its result records that it was
+        cancelled."""
+        command = self.commands[handle]
+        if command.result is None:
+            command.cancelled = True
+            self._interrupt(command, time.time())
+
+    def _interrupt(self, command, now):
+        if command.interrupted is None:
+            command.interrupted = now
+            self._signal(command, signal.SIGINT)
+
+    @staticmethod
+    def _signal(command, number):
+        try:
+            command.process.send_signal(number)
+        except OSError:
+            # It has already exited
+            pass
+
+    def _close(self, command):
+        """Stop reading the output of a command, which it has closed."""
+        fd = command.process.stdout.fileno()
+        self.poll.unregister(fd)
+        del self.by_fd[fd]
+        command.process.stdout.close()
+        command.closed = True
+
+    def _finish(self, command, returncode):
+        if not command.closed:
+            self._close(command)
+        self.running.remove(command)
+        command.result = CommandResult(
+            getattr(command.host, 'name', str(command.host)), command.args, returncode,
+            b''.join(command.chunks).decode('utf-8', 'replace'), time.time() - command.started,
+            command.timed_out, command.cancelled)
+
+    def _due(self, command, now):
+        """Interrupt, kill or give up on a command past its deadline, and return when it is next
+        due to be, or None."""
+        if command.killed is not None:
+            if now >= command.killed + KILL_AFTER_S:
+                # Something else holds its output open, and it is past saving
+                self._finish(command, command.process.poll())
+                return None
+            return command.killed + KILL_AFTER_S
+        if command.interrupted is not None:
+            if now >= command.interrupted + KILL_AFTER_S:
+                command.killed = now
+                self._signal(command, signal.SIGKILL)
+                return now + KILL_AFTER_S
+            return command.interrupted + KILL_AFTER_S
+        if command.deadline is not None:
+            if now >= command.deadline:
+                command.timed_out = True
+                self._interrupt(command, now)
+                return now + KILL_AFTER_S
+            return command.deadline
+        return None
+
+    def step(self, timeout=None):
+        """Read the output which arrives within timeout seconds (or until the next deadline), and
+        interrupt or kill the commands past their deadlines."""
+        now = time.time()
+        wake = None if timeout is None else now + timeout
+        finished = False
+        for command in list(self.running):
+            if command.closed:
+                returncode = command.process.poll()
+                if returncode is not None:
+                    self._finish(command, returncode)
+                    finished = True
+                    continue
+            due = self._due(command, now)
+            if command.result is not None:
+                finished = True
+            elif command.closed:
+                due = now + EXIT_POLL_S if due is None else min(due, now + EXIT_POLL_S)
+            if due is not None:
+                wake = due if wake is None else min(wake, due)
+        # Commands which finished may be what the caller waits for
+        if finished or not self.running:
+            return
+        wait = -1 if wake is None else max(0, int((wake - time.time()) * 1000) + 1)
+        try:
+            events = self.poll.poll(wait)
+        except (IOError, OSError, select.error) as ex:
+            if ex.args[0] == errno.EINTR:
+                return
+            raise
+        for fd, _ in events:
+            command = self.by_fd[fd]
+            data = os.read(fd, READ_BYTES)
+            if data:
+                command.chunks.append(data)
+                continue
+            self._close(command)
+            returncode = command.process.poll()
+            if returncode is not None:
+                self._finish(command, returncode)
+
+    def wait(self, handles=None, timeout=None):
+        """Wait for commands (every command if handles is None) to exit, for at most timeout
+        seconds, and return the CommandResult of each, None for those still running."""
+        commands = [self.commands[handle] for handle in
+                    (range(len(self.commands)) if handles is None else handles)]
+        end = None if timeout is None else time.time() + timeout
+        while any(command.result is None for command in commands):
+            remaining = None if end is None else end - time.time()
+            if remaining is not None and remaining <= 0:
+                break
+            self.step(remaining)
+        return [command.result for command in commands]
+
+    def close(self):
+        """Cancel the commands still running and wait for them to exit."""
+        for handle, command in enumerate(self.commands):
+            if command.result is None:
+                self.cancel(handle)
+        self.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def run_commands(commands, timeout=None):
+    """Run (host, args) commands at once, interrupting each after timeout seconds, and return the
+    CommandResult of each."""
+    with Executor() as executor:
+        for host, args in commands:
+            executor.start(host, args, timeout)
+        return executor.wait()
+
+
+def run_command(host, args, timeout=None):
+    """Run a command on a host, interrupting it after timeout seconds, and return its
+    CommandResult."""
+    return run_commands([(host, args)], timeout)[0]
@@ -0,0 +1,296 @@
+#!/usr/bin/env python
+"""
+Flow-level model of the throughput of many simultaneous flows through a TreeTopoGeneric tree.
+
+iperf measures one pair of hosts at a time, which says nothing about the throughput of every leaf
+sending at once through the uplinks they share. This model treats every flow as a long-lived
+transfer between two hosts which takes its max-min fair share of each link it crosses: progressive
+filling raises the rates of all the flows together until a link saturates, freezes the flows
+crossing it, and carries on with the others until every flow is frozen. TCLink shapes both
+interfaces of a link, so each direction of a link is a separate resource.
+
+The link-flow incidence matrix is kept as parallel arrays of (flow, resource) pairs, built a level
+at a time with TreeIndex arithmetic, so hundreds of thousands of flows are modelled in seconds.
+Delay and loss are not modelled, and unshaped links (a bandwidth of 0) never saturate.
+
+flows reports the aggregate throughput of a traffic pattern (or of a matrix of flows from a file)
+and the links which limit it, and picks the pairs of hosts worth measuring with iperf: one flow
+through each of the most contended links.
+"""
+
+import csv
+
+import click
+import numpy as np
+
+from fpga_switch_model import configure_logging, validate_placements
+from parameters import fpga_placements, link_options, placement_fpga_options
+from tree_index import TreeIndex
+
+# Directions of a link, in the numbering of resources: 2 * lower node + direction
+UP = 0
+DOWN = 1
+# Relative capacity left on a link below which it counts as saturated
+SATURATED = 1e-9
+TRAFFIC_PATTERNS = ('cloud', 'fpga', 'permutation', 'all')
+
+
+def link_capacities(index, bandwidth, fpga_bandwidth=None):
+    """Return the capacity in Mbps of each direction of the link above every node of a TreeIndex,
+    indexed by resource (see UP and DOWN), with the bandwidth of its placement for the link of each
+    FPGA host. The root switch has no link, and unshaped links have infinite capacities."""
+    link_opts, fpga_link_opts, cloud_link_opts = link_options(bandwidth, '0ms', 0, fpga_bandwidth)
+    capacity = np.full(index.n_nodes, float(link_opts['bw'] or np.inf))
+    capacity[0] = np.inf
+    capacity[index.cloud] = float(cloud_link_opts['bw'] or np.inf)
+    for i, placement in enumerate(index.placements):
+        placement_bandwidth = placement_fpga_options(placement, fpga_link_opts['bw'])[0]
+        capacity[index.placement_hosts(i)] = float(placement_bandwidth or np.inf)
+    return np.repeat(capacity, 2)
+
+
+def flow_resources(index, src, dst):
+    """Return the (flow, resource) pairs of the link-flow incidence matrix of flows from the hosts
+    in src to the hosts in dst, as two arrays."""
+    src = np.asarray(src, dtype=np.int64)
+    dst = np.asarray(dst, dtype=np.int64)
+    if np.any((src < index.n_switches) | (dst < index.n_switches)):
+        raise ValueError('Flows must start and end at hosts.')
+    if np.any(src == dst):
+        raise ValueError('A flow must not start and end at the same host.')
+    flows = np.arange(len(src))
+    pairs = [(flows, 2 * src + UP), (flows, 2 * dst + DOWN)]
+
+    # Climb from the switches of both ends to their lowest common ancestor, one level at a time
+    up, down = index.host_parents(src), index.host_parents(dst)
+    up_levels, down_levels = index.levels(up), index.levels(down)
+    climbing = up != down
+    while np.any(climbing):
+        rising = climbing & (up_levels >= down_levels)
+        falling = climbing & (down_levels >= up_levels)
+        pairs.append((flows[rising], 2 * up[rising] + UP))
+        pairs.append((flows[falling], 2 * down[falling] + DOWN))
+        up[rising] = index.parents(up[rising])
+        up_levels[rising] -= 1
+        down[falling] = index.parents(down[falling])
+        down_levels[falling] -= 1
+        climbing = up != down
+    return np.concatenate([pair[0] for pair in pairs]), np.concatenate([pair[1] for pair in pairs])
+
+
+def max_min_rates(flows, resources, capacity, n_flows, demand=None):
+    """Return the max-min fair rate of every flow by progressive filling, and the resource which
+    froze each flow (-1 if its demand did, or if it crosses no resource with a finite capacity,
+    which makes its rate infinite).
+
+    flows and resources are the (flow, resource) pairs of the incidence matrix, capacity the
+    capacity of every resource and demand, if given, the highest rate of each flow."""
+    rates = np.zeros(n_flows)
+    bottleneck = np.full(n_flows, -1)
+    active = np.zeros(n_flows, dtype=bool)
+    active[flows] = True
+    rising = np.flatnonzero(active)
+    demand = np.full(n_flows, np.inf) if demand is None else np.asarray(demand, dtype=float)
+    # Every flow still rising has the rate all of them have been filled to so far
+    filled = 0.0
+    # Resources are renumbered to those the rising flows cross, so steps only cost as much as the
+    # flows they fill
+    names, resources = np.unique(resources, return_inverse=True)
+    total = np.asarray(capacity, dtype=float)[names]
+    remaining = total.copy()
+    while len(flows):
+        counts = np.bincount(resources, minlength=len(remaining))
+        used = counts > 0
+        step = min(np.min(remaining[used] / counts[used]), np.min(demand[rising]) - filled)
+        if not np.isfinite(step):
+            rates[rising] = np.inf
+            break
+        filled += step
+        remaining -= step * counts
+        # Unshaped resources never saturate, although inf <= inf
+        through = (used & np.isfinite(total) & (remaining <= SATURATED * total))[resources]
+        bottleneck[flows[through]] = names[resources[through]]
+        active[flows[through]] = False
+        active[rising[demand[rising] <= filled * (1 + SATURATED)]] = False
+        frozen = rising[~active[rising]]
+        rates[frozen] = filled
+        rising = rising[active[rising]]
+        live = active[flows]
+        flows, resources = flows[live], resources[live]
+        if 2 * len(flows) < len(remaining):
+            kept, resources = np.unique(resources, return_inverse=True)
+            names, total, remaining = names[kept], total[kept], remaining[kept]
+    return rates, bottleneck
+
+
+def jain_index(rates):
+    """Return the Jain fairness index of rates: 1 if they are all equal, down to 1 / len(rates) if
+    a single one is not 0."""
+    rates = np.asarray(rates, dtype=float)
+    squares = np.sum(rates ** 2)
+    return float(np.sum(rates) ** 2 / (len(rates) * squares)) if squares else 1.0
+
+
+def simulate_flows(index, capacity, src, dst, demand=None):
+    """Return the max-min fair rate (Mbps) and bottleneck resource of flows from the hosts in src
+    to the hosts in dst, and the load (Mbps) of every resource, as a dict of arrays."""
+    flows, resources = flow_resources(index, src, dst)
+    rate, bottleneck = max_min_rates(flows, resources, capacity, len(src), demand)
+    finite = np.where(np.isfinite(rate), rate, 0)
+    load = np.bincount(resources, weights=finite[flows], minlength=len(capacity))
+    return dict(src=np.asarray(src), dst=np.asarray(dst), rate=rate, bottleneck=bottleneck,
+                load=load)
+
+
+def _fpga_targets(index, leaves):
+    """Return the nearest FPGA host above each leaf in an array of leaves, or the cloud."""
+    targets = np.full(len(leaves), index.cloud)
+    switches = np.asarray(index.fpga_switches)
+    positions = leaves - index.n_switches
+    # Lower levels are nearer, so they override the levels above them
+    for level in index.fpga_levels:
+        ancestors = (index.level_offsets[level]
+                     + index.ancestor_positions(positions, index.depth - 1, level))
+        found = np.minimum(np.searchsorted(switches, ancestors), len(switches) - 1)
+        hit = switches[found] == ancestors
+        targets[hit] = index.n_tree + found[hit]
+    return targets
+
+
+def traffic(index, pattern, seed=None):
+    """Return the (src, dst) arrays of hosts of the flows of a traffic pattern: every leaf to the
+    cloud ('cloud') or to the nearest FPGA host above it, if any ('fpga'), every leaf to another
+    leaf chosen by a random permutation ('permutation'), or every leaf to every other leaf ('all').
+    """
+    leaves = np.arange(index.n_switches, index.n_tree)
+    if pattern == 'cloud':
+        return leaves, np.full(len(leaves), index.cloud)
+    if pattern == 'fpga':
+        return leaves, _fpga_targets(index, leaves)
+    if pattern == 'permutation':
+        if len(leaves) < 2:
+            raise ValueError('A permutation needs at least 2 leaves.')
+        # A random cyclic shift of a random order never sends a leaf to itself
+        random = np.random.RandomState(seed)
+        order = random.permutation(leaves)
+        return order, np.roll(order, random.randint(1, len(leaves)))
+    if pattern == 'all':
+        src, dst = np.meshgrid(leaves, leaves, indexing='ij')
+        others = src != dst
+        return src[others], dst[others]
+    raise ValueError('Unknown traffic pattern {}.'.format(pattern))
+
+
+def read_matrix(path, index):
+    """Read flows from a CSV file with src and dst columns of host names, and an optional
+    demand_mbps column, returning (src, dst, demand) arrays (demand None if there is no column).
+    """
+    src, dst, demand = [], [], []
+    with open(path) as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            try:
+                src.append(index.node_by_name(row['src']))
+                dst.append(index.node_by_name(row['dst']))
+            except KeyError as ex:
+                raise ValueError('Line {} of {} has no host {}.'.format(reader.line_num, path, ex))
+            demand.append(float(row.get('demand_mbps') or np.inf))
+    has_demand = 'demand_mbps' in (reader.fieldnames or [])
+    return (np.array(src, dtype=np.int64), np.array(dst, dtype=np.int64),
+            np.array(demand) if has_demand else None)
+
+
+def resource_name(index, resource):
+    """Return a readable name of a direction of a link, such as s1->s0."""
+    lower = resource // 2
+    upper = index.name(index.parent(lower))
+    lower = index.name(lower)
+    return '{}->{}'.format(lower, upper) if resource % 2 == UP else '{}->{}'.format(upper, lower)
+
+
+def pick_pairs(index, result, count):
+    """Return the (src, dst) names and predicted rate of up to count flows worth measuring with
+    iperf: the first flow frozen by each of the most contended resources, slowest first."""
+    bottleneck = result['bottleneck']
+    limited = np.flatnonzero(bottleneck >= 0)
+    order = limited[np.argsort(result['rate'][limited], kind='mergesort')]
+    _, first = np.unique(bottleneck[order], return_index=True)
+    picked = order[np.sort(first)][:count]
+    return [(index.name(result['src'][i]), index.name(result['dst'][i]), float(result['rate'][i]))
+            for i in picked]
+
+
+@click.command()
+@click.option('-s', '--spread', type=click.IntRange(min=1), default=2, show_default=True,
+              help='Number of children each node will have.')
+@click.option('-d', '--depth', type=click.IntRange(min=2), default=4, show_default=True,
+              help='Number of levels in the tree.')
+@click.option('-b', '--bandwidth', type=click.IntRange(min=0), default=10, show_default=True,
+              help='Max bandwidth of all links in Mbps.')
+@click.option('-f', '--fpga', type=click.IntRange(min=0),
+              help='Level of the tree which should be modelled as FPGA switches (root is 0).')
+@click.option('--fpga-bandwidth', type=click.IntRange(min=0), default=504, show_default=True,
+              help='Max bandwidth of FPGA switches in Mbps.')
+@click.option('--placement', multiple=True, callback=validate_placements,
+              help='Also place FPGA hosts as in fpga_switch_model --placement. May be given more '
+                   'than once.')
+@click.option('-t', '--traffic', 'pattern', default='fpga', show_default=True,
+              type=click.Choice(TRAFFIC_PATTERNS),
+              help='Flows from every leaf to the cloud, to the FPGA host above it (or the cloud), '
+                   'to another leaf of a random permutation, or to every other leaf.')
+@click.option('-m', '--matrix', type=click.Path(exists=True, dir_okay=False),
+              help='CSV file of flows with src and dst host names and an optional demand_mbps, '
+                   'instead of --traffic.')
+@click.option('--seed', type=int, help='Seed of the random permutation.')
+@click.option('--top', default=5, show_default=True, type=click.IntRange(min=0),
+              help='Number of the busiest links to report.')
+@click.option('--pick', default=3, show_default=True, type=click.IntRange(min=0),
+              help='Number of pairs of hosts to pick for iperf.')
+@click.option('--log', default='warning', show_default=True,
+              type=click.Choice(['debug', 'info', 'output', 'warning', 'error', 'critical']),
+              help='Set the log level.')
+def flows(spread, depth, bandwidth, fpga, fpga_bandwidth, placement, pattern, matrix, seed, top,
+          pick, log):
+    """Model the max-min fair throughput of many flows at once."""
+    logger = configure_logging(log)
+    try:
+        index = TreeIndex(spread, depth, fpga)
+        if placement:
+            index = TreeIndex(spread, depth, placements=fpga_placements(index.fpga, placement))
+    except ValueError as ex:
+        raise click.BadParameter(str(ex), param_hint='--placement')
+
+    capacity = link_capacities(index, bandwidth, fpga_bandwidth)
+    demand = None
+    try:
+        if matrix:
+            src, dst, demand = read_matrix(matrix, index)
+        else:
+            src, dst = traffic(index, pattern, seed)
+        result = simulate_flows(index, capacity, src, dst, demand)
+    except ValueError as ex:
+        raise click.ClickException(str(ex))
+    logger.info('Modelled %d flows', len(src))
+
+    rate = result['rate']
+    click.echo('Flows: {}, aggregate throughput: {:.3f} Mbps'.format(
+        len(rate), np.sum(rate[np.isfinite(rate)])))
+    if len(rate):
+        click.echo('Rate per flow min/median/max = {:.3f}/{:.3f}/{:.3f} Mbps, Jain index {:.3f}'
+                   .format(np.min(rate), np.median(rate), np.max(rate), jain_index(rate)))
+    busiest = np.argsort(-result['load'], kind='mergesort')[:top]
+    busiest = busiest[result['load'][busiest] > 0]
+    if len(busiest):
+        click.echo('Busiest links:')
+    for resource in busiest:
+        click.echo('  {:<20} {:>12.3f} Mbps of {:g}'.format(
+            resource_name(index, resource), result['load'][resource], capacity[resource]))
+    pairs = pick_pairs(index, result, pick)
+    if pairs:
+        click.echo('Pairs worth measuring with iperf:')
+    for src_name, dst_name, pair_rate in pairs:
+        click.echo('  {} {} {:.3f} Mbps'.format(src_name, dst_name, pair_rate))
+
+
+if __name__ == '__main__':
+    flows()
@@ -3,22 +3,26 @@ Simple example of setting network and CPU parameters
 
 NOTE: link params limit BW, add latency, and loss.
 There is a high chance that pings WILL fail and that
-iperf will hang indefinitely if the TCP handshake fails
-to complete.
+the TCP handshake of iperf fails to complete, in which
+case the test is interrupted after a timeout (see
+executor.py).
 """
 
 import json
 import logging
 import logging.config
 import os
-import re
 import subprocess
 
 import click
 
-from performance_tests import test_cloud_fpga
-from mininet_functions import setup_mininet
-from mininet.util import dumpNodeConnections
+import planning
+import result_cache
+import tracing
+from parameters import (VALID_TIME, compute_options, fpga_placements, parse_placement,
+                        placement_fpga_options)
+from results import SINKS, append_records, make_records, placement_fields, write_records
+from tree_index import TreeIndex
 
 
 def setup_logging(
@@ -39,20 +43,391 @@ def setup_logging(
         logging.basicConfig(level=default_level)
 
 
-def validate_delay(ctx, param, value):
-    valid_time = re.compile('^([-+]?[0-9]*\.?[0-9]+)([PTGMkmunpf]?s)$')
+def check_time(value, name):
     # This will allow any valid time, such as '10ms', '2.3s', '1Gs', etc.
     # Naturally 1Ps is both an absurd unit and not a very useful delay, but it is technically valid.
-    if not valid_time.match(str(value)):
-        raise click.BadParameter("delay must be in the format <time><unit>s. E.g. '10ms', '23s', '200ns'.")
+    if not VALID_TIME.match(str(value)):
+        raise click.BadParameter(
+            "{} must be in the format <time><unit>s. E.g. '10ms', '23s', '200ns'.".format(name))
 
     return str(value)
 
 
+def validate_delay(ctx, param, value):
+    return check_time(value, 'delay')
+
+
+def validate_service_time(ctx, param, value):
+    return check_time(value, 'service time')
+
+
 def validate_fpga_delay(ctx, param, value):
     return None if value is None else validate_delay(ctx, param, value)
 
 
+def validate_placements(ctx, param, value):
+    try:
+        return [parse_placement(text) for text in value]
+    except ValueError as ex:
+        raise click.BadParameter(str(ex))
+
+
+def validate_output(ctx, param, value):
+    for path in value:
+        if os.path.splitext(path)[1].lower() not in SINKS:
+            raise click.BadParameter("'{}' must be a {} file.".format(
+                path, ', '.join(sorted(SINKS))))
+    return value
+
+
+def validate_npz_output(ctx, param, value):
+    if value is not None and not value.endswith('.npz'):
+        raise click.BadParameter("'{}' must be a .npz file.".format(value))
+    return value
+
+
+def configure_logging(log):
+    """Set the log level of the application and return its logger."""
+    logger = logging.getLogger(__name__)
+
+    if log == 'debug':
+        logger.setLevel(logging.DEBUG)
+        setup_logging(default_level=logging.DEBUG)
+    elif log == 'warning':
+        logger.setLevel(logging.WARNING)
+        setup_logging(default_level=logging.WARNING)
+    elif log == 'error':
+        logger.setLevel(logging.ERROR)
+        setup_logging(default_level=logging.ERROR)
+    elif log == 'critical':
+        logger.setLevel(logging.CRITICAL)
+        setup_logging(default_level=logging.CRITICAL)
+    else:
+        logger.setLevel(logging.INFO)
+        setup_logging(default_level=logging.INFO)
+
+    return logger
+
+
+def setup_network(backend, log, spread, depth, bandwidth, delay, loss, fpga, fpga_bandwidth,
+                  fpga_delay, fpga_loss, poisson, compute=None, placements=None, shards=1,
+                  shard_level=None, seed=None, batched=False, aggregate_level=None):
+    """Start an emulated (mininet) or simulated (simulation) network.
+
+    compute, from parameters.compute_options, sets the compute services of the FPGA hosts and the
+    cloud of a mininet network. placements, a list of parameters.placement_options, places the
+    FPGA hosts instead of the fpga level. A mininet network of more than one shard is split
+    between processes at shard_level (see sharding). seed seeds a simulated network. batched
+    configures the links and hosts of a mininet network in bulk (see
+    mininet_functions.BatchedMininet), and aggregate_level builds representative leaves of a
+    mininet network (see aggregation)."""
+    if backend == 'simulation':
+        import simulation
+
+        return simulation.setup_simulation(spread, depth, bandwidth, delay, loss, fpga,
+                                           fpga_bandwidth, fpga_delay, fpga_loss, poisson,
+                                           seed=seed, placements=placements)
+
+    if shards > 1:
+        import sharding
+
+        return sharding.setup_sharded(log, spread, depth, bandwidth, delay, loss, fpga,
+                                      fpga_bandwidth, fpga_delay, fpga_loss, poisson, compute,
+                                      placements, shards, shard_level, batched)
+
+    # Only the mininet backend needs mininet (and root)
+    from mininet_functions import setup_mininet
+
+    return setup_mininet(log, spread, depth, bandwidth, delay, loss, fpga, fpga_bandwidth,
+                         fpga_delay, fpga_loss, poisson, compute, placements, batched,
+                         aggregate_level)
+
+
+def reconfigure_network(backend, net, bandwidth, delay, loss, fpga_bandwidth, fpga_delay,
+                        fpga_loss, poisson):
+    """Apply new link parameters to a network started by setup_network, keeping its shape."""
+    if backend == 'simulation':
+        return net.reconfigure(bandwidth, delay, loss, fpga_bandwidth, fpga_delay, fpga_loss,
+                               poisson)
+
+    import mininet_functions
+
+    return mininet_functions.reconfigure_network(net, bandwidth, delay, loss, fpga_bandwidth,
+                                                 fpga_delay, fpga_loss, poisson)
+
+
+def run_analytic(spread, depth, bandwidth, delay, loss, fpga, fpga_bandwidth, fpga_delay,
+                 fpga_loss, poisson, ping_all, iperf, cloud_fpga):
+    """Predict the performance of the network analytically rather than emulating it.
+
+    Returns the prediction, or None if cloud_fpga is unset."""
+    import analytic
+
+    logger = logging.getLogger(__name__)
+    prediction = None
+
+    if cloud_fpga:
+        prediction = analytic.predict(spread, depth, bandwidth, delay, loss, fpga, fpga_bandwidth,
+                                      fpga_delay, fpga_loss, poisson)
+        analytic.log_prediction(prediction, fpga)
+
+    if ping_all or iperf:
+        logger.warning("The analytic backend does not model ping or bandwidth tests between hosts.")
+
+    return prediction
+
+
+def workload_options(workload, rate, connections, duration, request_size, response_size):
+    """Return the arguments of workload.run_workload for the workload options of main, or None if
+    no workload was asked for."""
+    if workload is None:
+        return None
+    return dict(mode=workload, rate=rate, connections=connections, duration=duration,
+                request_size=request_size, response_size=response_size)
+
+
+def repetition_options(width, confidence, max_batches):
+    """Return the arguments of repetition.repeat for the repetition options of main, or None if
+    the probes were not asked to converge."""
+    if width is None:
+        return None
+    return dict(width=width, confidence=confidence, max_batches=max_batches)
+
+
+def replay_options(trace, speed, connections, response_size):
+    """Return the arguments of workload.run_replay for the replay options of main, or None if no
+    replay was asked for."""
+    if trace is None:
+        return None
+    return dict(trace=trace, speed=speed, connections=connections, response_size=response_size)
+
+
+def iperf_flows_options(pattern, duration, fan_in):
+    """Return the arguments of iperf_flows.run_iperf_flows for the concurrent iperf options of
+    main, or None if no concurrent iperf flows were asked for."""
+    if pattern is None:
+        return None
+    return dict(pattern=pattern, duration=duration, fan_in=fan_in)
+
+
+def latency_options(method, output, validate):
+    """Return the arguments of latency_matrix.run_latency_matrix for the latency matrix options of
+    main, or None if no latency matrix was asked for."""
+    if method is None:
+        return None
+    return dict(method=method, output=output, validate=validate)
+
+
+def aggregation_options(mode, level):
+    """Return the mode and level of the representative leaves of the aggregation options of main
+    (see aggregation.aggregation_level), or None if no aggregation was asked for."""
+    if mode is None:
+        return None
+    return dict(mode=mode, level=level)
+
+
+def telemetry_options(interval, capacity, output):
+    """Return the options of the telemetry sampler of performance_tests.run_tests for the telemetry
+    options of main, or None if no telemetry was asked for."""
+    if interval is None:
+        return None
+    return dict(interval=interval, capacity=capacity, output=output)
+
+
+def run(backend, log, spread, depth, bandwidth, delay, loss, fpga, fpga_bandwidth, fpga_delay,
+        fpga_loss, poisson, ping_all, iperf, cloud_fpga, dump_node_connections, output, plan,
+        calibration, workload=None, compute=None, placements=None, shards=1, shard_level=None,
+        iperf_flows=None, latency=None, seed=None, cache=None, telemetry=None,
+        batched_startup=False, replay=None, repetition=None, aggregation=None):
+    """Plan, build and test the network as main was asked to, recording the measurements.
+
+    placements, a list of parameters.placement_options, adds FPGA hosts on other levels or
+    subtrees to those of the fpga level, all in one network, and tests each placement in turn.
+    shards splits a mininet network between that many processes at shard_level. seed seeds the
+    delays of poisson and the simulation backend. Measurements are served from and stored in the
+    result_cache.ResultCache at the path cache, unless it is None. batched_startup starts a mininet
+    network with mininet_functions.BatchedMininet. replay is a dict of the arguments of
+    workload.run_replay, and repetition of repetition.repeat to repeat the probes with.
+    aggregation, from aggregation_options, builds representative leaves of a mininet network
+    instead of every leaf, and records their level and weight with the measurements."""
+    logger = logging.getLogger(__name__)
+    # A level at or below the leaves has no FPGA hosts, so every backend treats it as unset
+    fpga = TreeIndex(spread, depth, fpga).fpga
+    index = None
+    if placements:
+        placements = fpga_placements(fpga, placements)
+        try:
+            index = TreeIndex(spread, depth, placements=placements)
+        except ValueError as ex:
+            raise click.BadParameter(str(ex), param_hint='--placement')
+    else:
+        placements = None
+
+    if shards > 1 and backend != 'mininet':
+        logger.warning("The %s backend runs in one process, ignoring --shards.", backend)
+        shards = 1
+    if aggregation is not None and backend != 'mininet':
+        logger.warning("The %s backend does not aggregate leaves, ignoring --aggregate.", backend)
+        aggregation = None
+    aggregate_level = None
+    if aggregation is not None:
+        from aggregation import aggregate_index
+
+        try:
+            aggregation = aggregate_index(spread, depth, fpga, placements, **aggregation)
+        except ValueError as ex:
+            raise click.BadParameter(str(ex), param_hint='--aggregate-level')
+        aggregate_level = aggregation.level
+        if shards > 1:
+            logger.warning("An aggregated network runs in one process, ignoring --shards.")
+            shards = 1
+    if shards > 1:
+        from sharding import Partition
+
+        try:
+            Partition(TreeIndex(spread, depth, fpga, placements), shards, shard_level)
+        except ValueError as ex:
+            raise click.BadParameter(str(ex), param_hint='--shards')
+
+    if plan or backend == 'mininet':
+        with tracing.span('plan'):
+            try:
+                network_plan = planning.plan_network(spread, depth, fpga,
+                                                     planning.load_calibration(calibration),
+                                                     placements, shards, shard_level,
+                                                     aggregate_level)
+            except ValueError as ex:
+                raise click.BadParameter(str(ex), param_hint='--calibration')
+            problems = planning.check_plan(network_plan, planning.machine_limits())
+        if plan:
+            planning.log_plan(network_plan)
+        if problems:
+            raise click.ClickException('The network will not fit on this machine: it {}.'.format(
+                '; it '.join(problems)))
+        if plan:
+            return
+
+    if workload is not None and backend != 'mininet':
+        logger.warning("The %s backend does not run RPC workloads.", backend)
+        workload = None
+    if replay is not None and backend != 'mininet':
+        logger.warning("The %s backend does not replay traces.", backend)
+        replay = None
+    if repetition is not None and backend == 'analytic':
+        logger.warning("The analytic backend predicts exact values, ignoring --ci-width.")
+        repetition = None
+    if iperf_flows is not None and backend != 'mininet':
+        logger.warning("The %s backend does not run concurrent iperf flows, see flows.py.",
+                       backend)
+        iperf_flows = None
+    if latency is not None and backend == 'analytic':
+        logger.warning("The analytic backend does not measure latency matrices.")
+        latency = None
+    if aggregation is not None and (iperf_flows is not None or latency is not None):
+        logger.warning("Concurrent iperf flows and latency matrices need every leaf, ignoring "
+                       "them with --aggregate.")
+        iperf_flows = latency = None
+    if telemetry is not None and backend != 'mininet':
+        logger.warning("The %s backend has no link counters to sample.", backend)
+        telemetry = None
+    if batched_startup and backend != 'mininet':
+        logger.warning("The %s backend has no network to start, ignoring --batched-startup.",
+                       backend)
+        batched_startup = False
+
+    parameters = dict(backend=backend, spread=spread, depth=depth, bandwidth=bandwidth,
+                      delay=delay, loss=loss, fpga=fpga, fpga_bandwidth=fpga_bandwidth,
+                      fpga_delay=fpga_delay, fpga_loss=fpga_loss, poisson=poisson)
+    results, key = None, None
+    if cache is not None:
+        run_parameters = result_cache.run_parameters(
+            ping_all=ping_all, iperf=iperf, cloud_fpga=cloud_fpga, workload=workload,
+            compute=compute, placements=placements, shards=shards, shard_level=shard_level,
+            iperf_flows=iperf_flows, latency=latency, telemetry=telemetry, seed=seed,
+            replay=replay, repetition=repetition, aggregate_level=aggregate_level, **parameters)
+        if run_parameters is None:
+            logger.info("The results of this run can not be repeated, so they are not cached.")
+        else:
+            key = result_cache.run_key(run_parameters)
+            results = result_cache.ResultCache(cache)
+            measurements = results.get(key)
+            if measurements is not None:
+                results.close()
+                logger.info("Served %d measurements of an identical run from the cache (%s).",
+                            len(measurements), key[:12])
+                with tracing.span('write_records'):
+                    write_records(output, measurements, **parameters)
+                return
+    if seed is not None:
+        import numpy as np
+
+        np.random.seed(seed)
+
+    if backend == 'analytic':
+        import analytic
+
+        if index is None:
+            with tracing.span('analytic'):
+                prediction = run_analytic(spread, depth, bandwidth, delay, loss, fpga,
+                                          fpga_bandwidth, fpga_delay, fpga_loss, poisson,
+                                          ping_all, iperf, cloud_fpga)
+            measurements = ([] if prediction is None
+                            else analytic.prediction_measurements(
+                                prediction, TreeIndex(spread, depth, fpga)))
+        else:
+            measurements = []
+            for i, placement in enumerate(placements):
+                level_bandwidth, level_delay, level_loss = placement_fpga_options(
+                    placement, fpga_bandwidth, fpga_delay, fpga_loss)
+                # Only warn once about the tests the analytic backend does not model
+                with tracing.span('analytic', placement=i):
+                    prediction = run_analytic(spread, depth, bandwidth, delay, loss,
+                                              placement['level'], level_bandwidth, level_delay,
+                                              level_loss, poisson, ping_all and not i,
+                                              iperf and not i, cloud_fpga)
+                if prediction is not None:
+                    measurements.extend(
+                        dict(measurement, **placement_fields(placement))
+                        for measurement in analytic.prediction_measurements(prediction, index, i))
+    else:
+        from performance_tests import run_tests
+
+        with tracing.span('setup_network'):
+            net = setup_network(backend, log, spread, depth, bandwidth, delay, loss, fpga,
+                                fpga_bandwidth, fpga_delay, fpga_loss, poisson, compute,
+                                placements, shards, shard_level, seed, batched_startup,
+                                aggregate_level)
+
+        if dump_node_connections:
+            if backend == 'simulation':
+                logger.warning("The simulation backend has no node connections to dump.")
+            else:
+                from mininet.util import dumpNodeConnections
+
+                logger.info("Dumping host connections")
+                if shards > 1:
+                    logger.warning("Only the hosts of the coordinator shard are dumped.")
+                with tracing.span('dump_node_connections'):
+                    dumpNodeConnections(net.net.hosts if shards > 1 else net.hosts)
+
+        with tracing.span('run_tests'):
+            measurements = run_tests(net, fpga, cloud_fpga, ping_all, iperf, workload, index,
+                                     iperf_flows, latency, telemetry, replay, repetition)
+        if aggregation is not None:
+            for measurement in measurements:
+                measurement.update(aggregation.fields())
+
+        with tracing.span('stop'):
+            net.stop()
+
+    with tracing.span('write_records'):
+        records = make_records(measurements, **parameters)
+        if results is not None:
+            results.put(key, run_parameters, measurements, records)
+            results.close()
+        append_records(output, records)
+
+
 @click.command()
 @click.option('-s', '--spread', type=click.IntRange(min=1), default=2, show_default=True,
               help='Number of children each node will have.')
@@ -73,66 +448,174 @@ def validate_fpga_delay(ctx, param, value):
 @click.option('--fpga-loss', type=click.IntRange(0, 100),
               help='Percentage chance of packet loss for FPGA switches. Defaults to 2 * loss of '
                    'all links if unset.')
+@click.option('--placement', multiple=True, callback=validate_placements,
+              help='Also place FPGA hosts on the switches of this level, or at the given positions '
+                   'of it, with their own options, as LEVEL[@POSITION[+POSITION...]]'
+                   '[:NAME=VALUE[,NAME=VALUE...]]. NAME is bandwidth, delay, loss, service-time, '
+                   'pipelines or cpu. Tests run on each placement in turn. May be given more than '
+                   'once.')
 @click.option('-p', '--ping-all', is_flag=True, help='Run a ping test between all hosts.')
+@click.option('--latency-matrix', type=click.Choice(['all', 'edge', 'level']),
+              help='Measure the RTT between every pair of hosts by pinging every pair in parallel '
+                   'batches, or infer it from the RTT of every link or of every level of the '
+                   'tree.')
+@click.option('--latency-validate', type=click.IntRange(min=0), default=0, show_default=True,
+              help='Ping this many random pairs of hosts to validate an inferred --latency-matrix.')
+@click.option('--latency-output', callback=validate_npz_output,
+              help='Save the --latency-matrix to this .npz file, as the arrays hosts and rtt_ms.')
 @click.option('-i', '--iperf', is_flag=True, help='Test bandwidth between first and last host.')
+@click.option('--iperf-flows', type=click.Choice(['cloud', 'fpga', 'permutation', 'all']),
+              help='Run concurrent iperf3 flows from every leaf to the cloud, to the FPGA host '
+                   'above it (or the cloud), to another leaf of a random permutation, or to every '
+                   'other leaf, and record each flow and all of them.')
+@click.option('--iperf-fan-in', type=click.IntRange(min=1),
+              help='Leaves sending to each destination of --iperf-flows. Defaults to all of them.')
+@click.option('--iperf-duration', type=click.FloatRange(min=0), default=10.0, show_default=True,
+              help='Seconds to run --iperf-flows for.')
 @click.option('-c', '--cloud-fpga', type=bool, default=True, show_default=True,
               help='Test performance between leaf and root or leaf and FPGA switch')
+@click.option('--ci-width', type=click.FloatRange(min=0.0001),
+              help='Repeat the cloud_fpga ping, the iperf test and the workload in batches until '
+                   'the confidence interval of each estimate is within this fraction of it (e.g. '
+                   '0.05), instead of running each once.')
+@click.option('--ci-confidence', type=click.FloatRange(0.5, 0.999), default=0.95,
+              show_default=True, help='Confidence level of the intervals of --ci-width.')
+@click.option('--max-batches', type=click.IntRange(min=1), default=10, show_default=True,
+              help='Most batches of each probe to run for --ci-width.')
 @click.option('--dump-node-connections', is_flag=True,
               help='Dump all node connections before running tests.')
+@click.option('--telemetry', type=click.FloatRange(min=0.01),
+              help='Sample the byte, drop and queue counters of every link of a mininet network '
+                   'every this many seconds while the tests run, and record the rates, drops and '
+                   'largest queue of each.')
+@click.option('--telemetry-capacity', type=click.IntRange(min=2), default=600, show_default=True,
+              help='Latest --telemetry samples to keep.')
+@click.option('--telemetry-output', callback=validate_npz_output,
+              help='Save the --telemetry samples to this .npz file.')
+@click.option('-w', '--workload', type=click.Choice(['open', 'closed']),
+              help='Run an RPC workload from every leaf to the FPGA host above it (or the cloud), '
+                   'with Poisson arrivals (open) or a request outstanding per connection (closed).')
+@click.option('--rate', type=click.FloatRange(min=0.001), default=100.0, show_default=True,
+              help='Requests per second from each leaf of an open loop workload.')
+@click.option('--connections', type=click.IntRange(min=1), default=1, show_default=True,
+              help='Connections from each leaf of a workload or a --replay.')
+@click.option('--duration', type=click.FloatRange(min=0), default=10.0, show_default=True,
+              help='Seconds to run a workload for.')
+@click.option('--request-size', type=click.IntRange(min=0), default=64, show_default=True,
+              help='Bytes of payload in each request of a workload.')
+@click.option('--response-size', type=click.IntRange(min=0), default=64, show_default=True,
+              help='Bytes of payload in each response of a workload, and of a --replay of a pcap '
+                   'file.')
+@click.option('--replay', type=click.Path(exists=True, dir_okay=False),
+              help='Replay the requests of this pcap file or request log (TIME,FLOW,REQUEST_SIZE'
+                   '[,RESPONSE_SIZE] lines) from the leaves to the FPGA host above each (or the '
+                   'cloud), each flow from one leaf, and record each flow and all of them.')
+@click.option('--replay-speed', type=click.FloatRange(min=0.001), default=1.0,
+              show_default=True,
+              help='Replay --replay this many times faster than it was recorded.')
+@click.option('--service-distribution', default='exponential', show_default=True,
+              type=click.Choice(['constant', 'exponential', 'uniform']),
+              help='Distribution of the service times of the compute services of the FPGA hosts '
+                   'and the cloud.')
+@click.option('--queue-size', type=click.IntRange(min=0), default=64, show_default=True,
+              help='Requests which may wait for a pipeline of a compute service before more are '
+                   'rejected.')
+@click.option('--fpga-service-time', type=str, default='1ms', show_default=True,
+              callback=validate_service_time,
+              help='Mean CPU time an FPGA host spends on each request of a workload.')
+@click.option('--fpga-pipelines', type=click.IntRange(min=0), default=1, show_default=True,
+              help='Requests each FPGA host serves at once. 0 answers requests without computing.')
+@click.option('--fpga-cpu', type=click.FloatRange(0, 1),
+              help='Fraction of the CPU of the machine each FPGA host may use. Unlimited if unset.')
+@click.option('--cloud-service-time', type=str, default='100us', show_default=True,
+              callback=validate_service_time,
+              help='Mean CPU time the cloud spends on each request of a workload.')
+@click.option('--cloud-pipelines', type=click.IntRange(min=0), default=4, show_default=True,
+              help='Requests the cloud serves at once. 0 answers requests without computing.')
+@click.option('--cloud-cpu', type=click.FloatRange(0, 1),
+              help='Fraction of the CPU of the machine the cloud may use. Unlimited if unset.')
 @click.option('--poisson', is_flag=True, help="Use a poisson distribution for link delay.")
+@click.option('--seed', type=int,
+              help='Seed of the delays of --poisson and of the simulation backend. Runs with '
+                   '--poisson are only cached with a seed.')
+@click.option('--backend', default='mininet', show_default=True,
+              type=click.Choice(['mininet', 'simulation', 'analytic']),
+              help='Emulate the network with mininet, simulate it packet by packet, or predict its '
+                   'performance analytically.')
+@click.option('-o', '--output', multiple=True, callback=validate_output,
+              help='Append a record of each measurement to this .csv, .jsonl or .npz file. May be '
+                   'given more than once.')
+@click.option('--cache', type=click.Path(dir_okay=False), default=result_cache.DEFAULT_CACHE,
+              show_default=True,
+              help='SQLite file of cached results. A run identical to a cached one is served from '
+                   'it (see result_cache.py).')
+@click.option('--no-cache', is_flag=True,
+              help='Run the network even if an identical run is cached, and do not cache it.')
+@click.option('--shards', type=click.IntRange(min=1), default=1, show_default=True,
+              help='Split a mininet network between this many processes, each running the '
+                   'subtrees of some switches of --shard-level, and the first running the levels '
+                   'above. For trees too large for one process.')
+@click.option('--shard-level', type=click.IntRange(min=1),
+              help='Level of the switches whose subtrees are divided between the shards. Defaults '
+                   'to the highest level with a switch for every shard.')
+@click.option('--aggregate', type=click.Choice(['switch', 'subtree']),
+              help='Build one representative leaf for the leaves of each switch of the last level, '
+                   'or of each subtree of --aggregate-level, with links of the bandwidth of all '
+                   'those it stands for, and extrapolate the results to every leaf.')
+@click.option('--aggregate-level', type=click.IntRange(min=0),
+              help='Level of the switches whose subtrees --aggregate subtree represents with a '
+                   'leaf each. Defaults to the lowest level of FPGA hosts.')
+@click.option('--batched-startup', is_flag=True,
+              help='Create the links of a mininet network, configure their interfaces and qdiscs, '
+                   'and set the addresses and ARP tables of its hosts in bulk, one batch for each '
+                   'network namespace at once, rather than with a command for each.')
+@click.option('--plan', is_flag=True,
+              help='Report what the mininet backend would create, and predict its startup time and '
+                   'memory, then exit without creating anything.')
+@click.option('--calibration', type=click.Path(exists=True, dir_okay=False),
+              help='JSON file of coefficients for the startup time and memory predictions.')
+@click.option('--trace', help='Write a Chrome trace of the time spent in each phase to this file.')
+@click.option('--trace-detail', is_flag=True,
+              help='Also trace adding each node and link of a mininet network to --trace.')
 @click.option('--log', default='info', show_default=True,
               type=click.Choice(['debug', 'info', 'output', 'warning', 'error', 'critical']),
               help='Set the log level.')
 def main(spread, depth, bandwidth, delay, loss, fpga, fpga_bandwidth, fpga_delay, fpga_loss,
-         ping_all, iperf, dump_node_connections, poisson, log, cloud_fpga):
-
-    net = setup_mininet(log, spread, depth, bandwidth, delay, loss, fpga, fpga_bandwidth,
-                        fpga_delay, fpga_loss, poisson)
-    logger = logging.getLogger(__name__)
-
-    if log == 'debug':
-        logger.setLevel(logging.DEBUG)
-        setup_logging(default_level=logging.DEBUG)
-    elif log == 'warning':
-        logger.setLevel(logging.WARNING)
-        setup_logging(default_level=logging.WARNING)
-    elif log == 'error':
-        logger.setLevel(logging.ERROR)
-        setup_logging(default_level=logging.ERROR)
-    elif log == 'critical':
-        logger.setLevel(logging.CRITICAL)
-        setup_logging(default_level=logging.CRITICAL)
-    else:
-        logger.setLevel(logging.INFO)
-        setup_logging(default_level=logging.INFO)
+         placement, ping_all, latency_matrix, latency_validate, latency_output, iperf, iperf_flows,
+         iperf_fan_in, iperf_duration, ci_width, ci_confidence, max_batches, dump_node_connections,
+         telemetry, telemetry_capacity, telemetry_output, workload, rate, connections, duration,
+         request_size, response_size, replay, replay_speed, service_distribution, queue_size,
+         fpga_service_time, fpga_pipelines, fpga_cpu, cloud_service_time, cloud_pipelines,
+         cloud_cpu, poisson, seed, backend, output, cache, no_cache, shards, shard_level,
+         aggregate, aggregate_level, batched_startup, plan, calibration, trace, trace_detail, log,
+         cloud_fpga):
 
-    if dump_node_connections:
-        logger.info("Dumping host connections")
-        dumpNodeConnections(net.hosts)
-
-    number_of_hosts = 0
-    for node in net.keys():
-        if node[0] == 'h':
-            number_of_hosts += 1
-
-    if cloud_fpga:
-        test_cloud_fpga(net, fpga)
-
-    if ping_all:
-        if number_of_hosts > 1:
-            logger.info("Running ping test between all hosts")
-            net.pingAll()
-        else:
-            logger.warning(str(number_of_hosts) + " host(s). Unable to run ping test.")
-
-    if iperf:
-        if number_of_hosts > 1:
-            logger.info("Testing bandwidth between first and last hosts")
-            net.iperf()
-        else:
-            logger.warning(str(number_of_hosts) + " host(s). Unable to run bandwidth test.")
+    logger = configure_logging(log)
 
-    net.stop()
+    if trace:
+        tracing.start(trace, detail=trace_detail)
+    try:
+        with tracing.span('main', backend=backend, spread=spread, depth=depth, fpga=fpga):
+            run(backend, log, spread, depth, bandwidth, delay, loss, fpga, fpga_bandwidth,
+                fpga_delay, fpga_loss, poisson, ping_all, iperf, cloud_fpga,
+                dump_node_connections, output, plan, calibration,
+                workload_options(workload, rate, connections, duration, request_size,
+                                 response_size),
+                compute_options(service_distribution, queue_size, fpga_service_time,
+                                fpga_pipelines, fpga_cpu, cloud_service_time, cloud_pipelines,
+                                cloud_cpu),
+                placement, shards, shard_level,
+                iperf_flows_options(iperf_flows, iperf_duration, iperf_fan_in),
+                latency_options(latency_matrix, latency_output, latency_validate), seed,
+                None if no_cache else cache,
+                telemetry_options(telemetry, telemetry_capacity, telemetry_output),
+                batched_startup, replay_options(replay, replay_speed, connections, response_size),
+                repetition_options(ci_width, ci_confidence, max_batches),
+                aggregation_options(aggregate, aggregate_level))
+    finally:
+        if trace:
+            tracing.stop()
+            logger.info('Trace written to %s', trace)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,117 @@
+"""
+Concurrent iperf flows between many hosts of an emulated network.
+
+--iperf measures one pair of hosts on an idle network. run_iperf_flows runs a flow from many leaves
+at once, following a traffic pattern of flows.traffic: every leaf to the cloud, to the FPGA host
+above it (fan-in to each FPGA host), or to another leaf of a random permutation. Each flow has its
+own iperf3 server on its destination, and every client starts at the same moment and runs for the
+same duration, so the flows compete for the uplinks and FPGA links they share.
+
+Each flow is recorded with the rates sent and received and its TCP retransmits, and the flows
+together with their total received rate and the Jain fairness index of their rates, which
+flows.py predicts for the same patterns. iperf3 must be installed on the machine.
+"""
+
+import json
+import logging
+import subprocess
+import time
+
+from flows import jain_index, traffic
+
+# Port of the server of the first flow; every flow has its own server, on the following ports
+IPERF_PORT = 5201
+# Time given to the clients to start before they all start sending, in total and per client
+START_DELAY_S = 2.0
+START_DELAY_PER_CLIENT_S = 0.01
+
+
+def iperf_pairs(index, pattern='fpga', fan_in=None, seed=None):
+    """Return (src, dst) names of the flows of a traffic pattern (see flows.traffic) in a
+    TreeIndex, keeping only the first fan_in leaves which send to each destination if fan_in is
+    given."""
+    sent = {}
+    pairs = []
+    for src, dst in zip(*traffic(index, pattern, seed)):
+        if fan_in is None or sent.get(dst, 0) < fan_in:
+            sent[dst] = sent.get(dst, 0) + 1
+            pairs.append((index.name(src), index.name(dst)))
+    return pairs
+
+
+def client_args(server, port, duration, delay=0.0):
+    """Return the command line of an iperf3 client which waits delay seconds before sending to
+    server for duration seconds, and prints its results as JSON."""
+    command = 'iperf3 -c {} -p {} -t {} -J'.format(server, port, duration)
+    return ['sh', '-c', 'sleep {:.3f}; exec {}'.format(max(delay, 0.0), command)]
+
+
+def parse_iperf3(output):
+    """Parse the JSON results of an iperf3 client into the rates received and sent in Mbps and the
+    TCP retransmits of its flow, raising ValueError if the test failed."""
+    results = json.loads(output)
+    if results.get('error'):
+        raise ValueError(results['error'])
+    end = results['end']
+    return dict(throughput_mbps=end['sum_received']['bits_per_second'] / 1e6,
+                client_throughput_mbps=end['sum_sent']['bits_per_second'] / 1e6,
+                retransmits=float(end['sum_sent'].get('retransmits', float('nan'))))
+
+
+def aggregate(flows):
+    """Return the measurement of a set of concurrent flow measurements: their number, total rates
+    and retransmits, and the Jain fairness index of the rates received."""
+    rates = [flow['throughput_mbps'] for flow in flows]
+    return dict(throughput_mbps=sum(rates),
+                client_throughput_mbps=sum(flow['client_throughput_mbps'] for flow in flows),
+                retransmits=sum(flow['retransmits'] for flow in flows),
+                jain_index=jain_index(rates) if rates else float('nan'), flows=len(flows))
+
+
+def run_iperf_flows(net, pattern='fpga', duration=10.0, fan_in=None, seed=None, port=IPERF_PORT):
+    """Run concurrent iperf3 flows in a started network built from TreeTopoGeneric, and return a
+    measurement for every flow which completed, followed by the measurement of all of them."""
+    logger = logging.getLogger(__name__)
+    pairs = iperf_pairs(net.topo.index, pattern, fan_in, seed)
+    if port + len(pairs) > 65536:
+        raise ValueError('{} flows need more ports than there are above {}.'.format(len(pairs),
+                                                                                     port))
+    logger.info('Running %d concurrent iperf flows (%s)', len(pairs), pattern)
+
+    servers = [net.get(dst).popen(['iperf3', '-s', '-1', '-p', str(port + i)],
+                                  stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+               for i, (_, dst) in enumerate(pairs)]
+    try:
+        start_at = time.time() + START_DELAY_S + START_DELAY_PER_CLIENT_S * len(pairs)
+        clients = [net.get(src).popen(client_args(net.get(dst).IP(), port + i, duration,
+                                                  start_at - time.time()),
+                                      stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                   for i, (src, dst) in enumerate(pairs)]
+
+        measurements = []
+        for (src, dst), client in zip(pairs, clients):
+            output, error = client.communicate()
+            try:
+                measurement = parse_iperf3(output.decode())
+            except (KeyError, ValueError) as ex:
+                logger.warning('iperf flow from %s to %s failed: %s', src, dst,
+                               error.decode().strip() or ex)
+                continue
+            measurement.update(test='iperf_flow', src=src, dst=dst)
+            measurements.append(measurement)
+    finally:
+        for server in servers:
+            if server.poll() is None:
+                server.terminate()
+            server.wait()
+
+    destinations = sorted(set(dst for _, dst in pairs))
+    kinds = set(name[0] for name in destinations)
+    total = aggregate(measurements)
+    total.update(test='iperf_flows', src='h*',
+                 dst=(destinations[0] if len(destinations) == 1
+                      else kinds.pop() + '*' if len(kinds) == 1 else '*'))
+    logger.info('%d of %d flows completed, %.3f Gbps in total (%.3f Gbps sent), %g retransmits, '
+                'Jain index %.3f', len(measurements), len(pairs), total['throughput_mbps'] / 1e3,
+                total['client_throughput_mbps'] / 1e3, total['retransmits'], total['jain_index'])
+    return measurements + [total]
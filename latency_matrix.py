@@ -0,0 +1,197 @@
+"""
+Round trip times between every pair of hosts of a network, from few probes.
+
+Pinging every pair of hosts takes longer than everything else on large trees, and the ping_all
+test only reports drops. latency_matrix returns the RTT between every pair of hosts
+as a NumPy array, by one of three methods:
+
+- all pings every pair of hosts, in parallel batches.
+- edge uses the tree: the RTT between two hosts is the sum of the RTTs of the links between them,
+  d(a) + d(b) - 2 d(c), where d is the RTT of the path from the root switch to a node and c is the
+  lowest common ancestor of the hosts. d of every host comes from pinging the cloud, which hangs
+  from the root switch, and d of every switch from pinging between hosts below two of its links,
+  so O(n) probes give all O(n^2) RTTs.
+- level also assumes that the links of a level (and the FPGA links of a placement) are alike, so
+  O(depth) probes are enough.
+
+The RTTs of randomly sampled pairs can be probed directly to validate an inferred matrix.
+"""
+
+import logging
+
+import numpy as np
+
+from executor import run_commands
+from results import parse_ping
+
+METHODS = ('all', 'edge', 'level')
+# Pings sent to each pair, the seconds between them, and the pairs pinged at once
+PROBE_COUNT = 3
+PROBE_INTERVAL_S = 0.2
+PROBE_BATCH = 64
+# Seconds a ping may run beyond its echo requests before it is interrupted
+PROBE_TIMEOUT_S = 5.0
+
+
+def _ping_batch(net, pairs, count):
+    """Ping between every (src, dst) pair of host names of a Mininet network at once, and return
+    the output of each ping, interrupting those which run PROBE_TIMEOUT_S too long."""
+    results = run_commands([(net.get(src), ['ping', '-c', count, '-i', PROBE_INTERVAL_S, '-q',
+                                            net.get(dst).IP()])
+                            for src, dst in pairs], count * PROBE_INTERVAL_S + PROBE_TIMEOUT_S)
+    return [result.output for result in results]
+
+
+def probe(net, pairs, count=PROBE_COUNT, batch=PROBE_BATCH):
+    """Return the mean RTT (ms) of count pings between each (src, dst) pair of host names of a
+    started network, NaN if none was answered, pinging batch pairs at a time."""
+    outputs = []
+    for start in range(0, len(pairs), batch):
+        chunk = pairs[start:start + batch]
+        # The simulation backend runs the pings of a batch together itself
+        if hasattr(net, 'ping_pairs'):
+            outputs.extend(net.ping_pairs(chunk, count))
+        else:
+            outputs.extend(_ping_batch(net, chunk, count))
+    return np.array([parse_ping(output)['rtt_avg'] for output in outputs], dtype=float)
+
+
+def branch_pair(index, switch):
+    """Return two hosts of a TreeIndex whose lowest common ancestor is the switch: the first leaves
+    below two of its children, or below one of them and its FPGA host. None if it has fewer than
+    two links down."""
+    hosts = []
+    level = index.level(switch) + 1
+    for child in list(index.children(switch))[:2]:
+        hosts.append(index.leaf(index.position(child) * index.spread ** (index.depth - 1 - level)))
+    fpga_host = index.fpga_host_of(switch)
+    if fpga_host is not None:
+        hosts.append(fpga_host)
+    return tuple(hosts[:2]) if len(hosts) > 1 else None
+
+
+def plan_probes(index, method):
+    """Return the hosts whose RTT to the cloud, and the switches whose RTT between the hosts of
+    their branch_pair, a method ('edge' or 'level') measures."""
+    if method == 'edge':
+        hosts = [host for host in index.hosts() if host != index.cloud]
+        switches = [switch for switch in index.switches()
+                    if branch_pair(index, switch) is not None]
+        return hosts, switches
+    switches = [index.node(level, 0) for level in range(index.depth - 1)
+                if branch_pair(index, index.node(level, 0)) is not None]
+    hosts = [index.leaf(0)] + [index.placement_hosts(i)[0] for i in range(len(index.placements))]
+    # Only the leaves of a level are alike, so the FPGA hosts probed below switches are measured
+    for switch in switches:
+        hosts.extend(host for host in branch_pair(index, switch)
+                     if not index.is_leaf(host) and host not in hosts)
+    return hosts, switches
+
+
+def infer_distances(index, method, hosts, switches, host_rtts, switch_rtts):
+    """Return the RTT (ms) of the path from the root switch to every node of a TreeIndex, from the
+    RTTs to the cloud of the hosts and between the branch_pair of the switches of plan_probes.
+
+    Switches which are no lowest common ancestor of two hosts are NaN."""
+    cloud_rtts = np.full(index.n_nodes, np.nan)
+    if method == 'level':
+        cloud_rtts[index.n_switches:index.n_tree] = host_rtts[0]
+        for i in range(len(index.placements)):
+            cloud_rtts[index.placement_hosts(i)] = host_rtts[1 + i]
+    cloud_rtts[hosts] = host_rtts
+
+    # The cloud link is the part of the RTT to the cloud two hosts below different links of the
+    # root switch do not share
+    pairs = dict(zip(switches, switch_rtts))
+    cloud = 0.0
+    if 0 in pairs:
+        a, b = branch_pair(index, 0)
+        cloud = (cloud_rtts[a] + cloud_rtts[b] - pairs[0]) / 2
+
+    distances = cloud_rtts - cloud
+    distances[0] = 0.0
+    distances[index.cloud] = cloud
+    for switch, rtt in pairs.items():
+        if switch:
+            a, b = branch_pair(index, switch)
+            distances[switch] = (distances[a] + distances[b] - rtt) / 2
+    if method == 'level':
+        for level in range(1, index.depth - 1):
+            first = index.node(level, 0)
+            distances[first:first + index.spread ** level] = distances[first]
+    return distances
+
+
+def compose(index, distances):
+    """Return the matrix of the RTTs (ms) between the hosts of a TreeIndex, in the order of
+    hosts(), from the RTTs of the paths from the root switch to every node."""
+    hosts = np.array(list(index.hosts()))
+    a, b = np.triu_indices(len(hosts), 1)
+    ancestors = index.common_ancestors(hosts[a], hosts[b])
+    matrix = np.zeros((len(hosts), len(hosts)))
+    matrix[a, b] = (distances[hosts[a]] + distances[hosts[b]]
+                    - 2 * distances[ancestors])
+    matrix[b, a] = matrix[a, b]
+    return matrix
+
+
+def latency_matrix(net, method='edge', count=PROBE_COUNT, batch=PROBE_BATCH, validate=0,
+                   seed=None):
+    """Return the RTTs (ms) between every pair of hosts of a started network built from
+    TreeTopoGeneric, with a method of METHODS.
+
+    Returns a dict of the names of the hosts (in the order of TreeIndex.hosts()), the matrix of
+    RTTs between them, the number of pairs probed, and the absolute differences (ms) between the
+    matrix and direct probes of validate randomly sampled pairs."""
+    index = net.topo.index if hasattr(net, 'topo') else net.index
+    names = [index.name(host) for host in index.hosts()]
+    if method == 'all':
+        a, b = np.triu_indices(len(names), 1)
+        matrix = np.zeros((len(names), len(names)))
+        matrix[a, b] = matrix[b, a] = probe(net, [(names[i], names[j]) for i, j in zip(a, b)],
+                                            count, batch)
+        probes = len(a)
+    else:
+        hosts, switches = plan_probes(index, method)
+        pairs = ([(index.name(host), 'cloud') for host in hosts]
+                 + [tuple(index.name(host) for host in branch_pair(index, switch))
+                    for switch in switches])
+        rtts = probe(net, pairs, count, batch)
+        matrix = compose(index, infer_distances(index, method, hosts, switches,
+                                                rtts[:len(hosts)], rtts[len(hosts):]))
+        probes = len(pairs)
+
+    errors = np.array([])
+    if validate and len(names) > 1:
+        random = np.random.RandomState(seed)
+        a = random.randint(len(names), size=validate)
+        b = (a + random.randint(1, len(names), size=validate)) % len(names)
+        rtts = probe(net, [(names[i], names[j]) for i, j in zip(a, b)], count, batch)
+        errors = np.abs(rtts - matrix[a, b])
+    return dict(hosts=names, rtt_ms=matrix, probes=probes, errors=errors)
+
+
+def run_latency_matrix(net, method='edge', output=None, validate=0, seed=None):
+    """Measure the latency matrix of a started network, save it to an output .npz file if given
+    (as the arrays hosts and rtt_ms), and return its measurement."""
+    logger = logging.getLogger(__name__)
+    result = latency_matrix(net, method, validate=validate, seed=seed)
+    matrix = result['rtt_ms']
+    rtts = matrix[~np.eye(len(matrix), dtype=bool)]
+    rtts = rtts[np.isfinite(rtts)]
+    measurement = dict(test='latency_matrix', src='*', dst='*', method=method,
+                       probes=result['probes'],
+                       rtt_min=float(rtts.min()) if len(rtts) else float('nan'),
+                       rtt_avg=float(rtts.mean()) if len(rtts) else float('nan'),
+                       rtt_max=float(rtts.max()) if len(rtts) else float('nan'),
+                       latency_error_ms=(float(np.nanmean(result['errors']))
+                                         if len(result['errors']) else float('nan')))
+    logger.info('Latency matrix of %d hosts (%s) from %d probes: rtt min/avg/max = '
+                '%.3f/%.3f/%.3f ms', len(matrix), method, result['probes'],
+                measurement['rtt_min'], measurement['rtt_avg'], measurement['rtt_max'])
+    if len(result['errors']):
+        logger.info('Mean absolute error of %d sampled pairs: %.3f ms', len(result['errors']),
+                    measurement['latency_error_ms'])
+    if output:
+        np.savez(output, hosts=np.array(result['hosts']), rtt_ms=matrix)
+    return measurement
@@ -1,128 +1,465 @@
 import logging
 import os
-import re
-from numpy import random
+import subprocess
+import tempfile
+import time
+from collections import defaultdict
 
 
 from mininet.clean import Cleanup
 from mininet.net import Mininet
-from mininet.link import TCLink
+from mininet.link import TCIntf, TCLink
 from mininet.log import setLogLevel
-from mininet.node import CPULimitedHost
+from mininet.node import CPULimitedHost, DefaultController
 from mininet.topo import Topo
 
+import tracing
+from aggregation import Aggregation
+from parameters import (get_poisson_delay, halve_delay, host_options, link_options,
+                        placement_compute, placement_link_options)
+from tree_index import TreeIndex
+
 
 class TreeTopoGeneric(Topo):
     """"Generic Tree topology."""
 
     def __init__(self, spread, depth, bandwidth, delay, loss, fpga, fpga_bandwidth=None, fpga_delay=None,
-                 fpga_loss=None, poisson=None):
-        """"Create tree topology according to given parameters."""
+                 fpga_loss=None, poisson=None, compute=None, placements=None, nodes=None,
+                 aggregate_level=None):
+        """"Create tree topology according to given parameters.
+
+        compute, from parameters.compute_options, limits the CPU of the FPGA hosts and the cloud,
+        and sets the compute services workloads run on them.
+
+        placements, a list of parameters.placement_options, places FPGA hosts on several levels or
+        subtrees instead of the fpga level, each with its own link and compute options.
+
+        nodes, a set of nodes of the TreeIndex of the tree, builds only those nodes and the links
+        between them, for a shard of the tree (see sharding). Their hosts get the IP addresses
+        they would have in the whole tree.
+
+        aggregate_level builds only the representative leaves of the subtrees of the switches of
+        that level instead, with links of the bandwidth of those they stand for (see
+        aggregation)."""
         logger = logging.getLogger(__name__)
 
         # Initialize topology #
         Topo.__init__(self)
 
         # Setup parameters
-        fpga_bandwidth = bandwidth if fpga_bandwidth is None else fpga_bandwidth
-        fpga_delay = delay if fpga_delay is None else halve_delay(fpga_delay)
-        fpga_loss = loss * 2 if fpga_loss is None else fpga_loss
-
-        if poisson:
-            link_opts = dict(bw=bandwidth, delay=get_poisson_delay(delay), loss=loss, use_htb=True)
-            fpga_link_opts = dict(bw=fpga_bandwidth, delay=get_poisson_delay(fpga_delay),
-                                  loss=fpga_loss, use_htb=True)
-        else:
-            link_opts = dict(bw=bandwidth, delay=delay, loss=loss, use_htb=True)
-            fpga_link_opts = dict(bw=fpga_bandwidth, delay=fpga_delay, loss=fpga_loss, use_htb=True)
-        cloud_link_opts = dict(bw=1000, delay='0ms', loss=0, use_htb=True)
+        link_opts, fpga_link_opts, cloud_link_opts = link_options(
+            bandwidth, delay, loss, fpga_bandwidth, fpga_delay, fpga_loss, poisson)
 
         # Add hosts and switches #
 
-        # switch naming convention:
-        #   s[level][switch_number]
-
-        switches = [[None for _ in range(spread ** (depth - 1))] for _ in range(depth - 1)]
-        hosts = [None for _ in range(spread ** (depth - 1))]
-
-        for i in range(depth):
-            for j in range(spread ** i):
-                if i == (depth - 1):
-                    hosts[j] = self.addHost('h' + str(j))
-                else:
-                    sw_name = 's' + str(i) + str(j)
-                    switches[i][j] = self.addSwitch(sw_name)
-                    if fpga is not None and fpga == i:
-                        # Create host to serve as FPGA in switch
-                        # Will have one link to the relevant FPGA
-                        # The link will have the bandwidth and loss specified by the user, and half
-                        # the delay
-                        # These parameters are as if they were caused by the FPGA, rather than a
-                        # link
-                        # As a result, latency is halved since it will essentially be doubled by the
-                        # packet flowing in
-                        # and out of the host
-                        self.addHost('f{}'.format(j))
-                        self.addLink(sw_name, 'f{}'.format(j), **fpga_link_opts)
+        # naming convention:
+        #   s[node] for switches, numbered in level order from the root (s0)
+        #   h[position] for the hosts on the last level
+        #   f[position] for the FPGA host of the switch at that position of the FPGA level, or
+        #   f[level]_[position] if the placements are on several levels
+        # See tree_index for how nodes are numbered.
+
+        self.index = index = TreeIndex(spread, depth, fpga, placements)
+        self.compute = compute
+        self.aggregation = None
+        if aggregate_level is not None:
+            self.aggregation = Aggregation(index, aggregate_level)
+            nodes = self.aggregation.nodes()
+
+        def included(node):
+            return nodes is None or node in nodes
+
+        def host_ip(node):
+            # Mininet numbers the hosts of each network from 10.0.0.1, so shards need the IPs of
+            # the whole tree
+            return {} if nodes is None else dict(ip='{}/8'.format(index.ip(node)))
+
+        for node in index.switches():
+            if included(node):
+                # Give every switch an explicit, non-zero datapath ID
+                self.addSwitch(index.name(node), dpid='{:016x}'.format(node + 1))
+        for node in index.leaves():
+            if included(node):
+                self.addHost(index.name(node), **host_ip(node))
+
+        # Create a host to serve as FPGA in each switch on the FPGA level
+        # Will have one link to the relevant FPGA
+        # The link will have the bandwidth and loss specified by the user, and half the delay
+        # These parameters are as if they were caused by the FPGA, rather than a link
+        # As a result, latency is halved since it will essentially be doubled by the packet
+        # flowing in and out of the host
+        for i, placement in enumerate(index.placements):
+            opts = fpga_link_opts if placements is None else placement_link_options(
+                placement, bandwidth, delay, loss, fpga_bandwidth, fpga_delay, fpga_loss, poisson)
+            host_opts = host_options(placement_compute(compute, placement), 'fpga')
+            for node in index.placement_hosts(i):
+                if included(node):
+                    self.addHost(index.name(node), **dict(host_opts, **host_ip(node)))
+                    self.addLink(index.name(index.parent(node)), index.name(node), **opts)
 
         # Add host to serve as cloud
         # Will have one high bandwidth, 0 latency link to root switch
-        self.addHost('cloud')
-        self.addLink(switches[0][0], 'cloud', **cloud_link_opts)
+        if included(index.cloud):
+            self.addHost('cloud', **dict(host_options(compute, 'cloud'), **host_ip(index.cloud)))
+            self.addLink(index.name(0), 'cloud', **cloud_link_opts)
 
         # Add links #
 
-        for i, row in enumerate(switches):
-            for j, switch in enumerate(row):
-                if switch is None:
-                    break
-                if i == (depth - 2):
-                    for k in range(spread):
-                        # add a link between the current switch, and all hosts
-                        # directly beneath it.
-                        # (spread * j) + k will get all the appropriate hosts
-                        logger.debug("Adding standard link from switch[{}][{}] to "
-                                     "host[{}]".format(i, j, (spread * j) + k))
-                        self.addLink(switch, hosts[(spread * j) + k], **link_opts)
-
-                else:
-                    for k in range(spread):
-                        # add a link between the current switch, and all
-                        # switches directly beneath it.
-                        # i + 1 refers to 1 level deeper in the tree, and
-                        # (spread * j) + k will get all the appropriate child
-                        # switches on that level.
-                        logger.debug("Adding standard link from switch[{}][{}] to "
-                                     "switch[{}][{}]".format(i, j, i + 1, (spread * j) + k))
-                        self.addLink(switch, switches[i + 1][(spread * j) + k], **link_opts)
-
-
-def get_poisson_delay(delay):
-    """Returns a Poisson distributed delay of the given delay."""
-    valid_time = re.compile('^([-+]?[0-9]*\.?[0-9]+)([PTGMkmunpf]?s)$')
-    match = valid_time.match(delay)
-    poisson = random.poisson(float(match.group(1)))
-    return "{}{}".format(poisson, match.group(2))
-
-
-def halve_delay(delay):
-    valid_time = re.compile('^([-+]?[0-9]*\.?[0-9]+)([PTGMkmunpf]?s)$')
-    match = valid_time.match(delay)
-    half = float(match.group(1)) / 2
-    return "{}{}".format(half, match.group(2))
+        # add a link between every switch and each switch or host directly beneath it
+        for node in index.switches():
+            for child in index.children(node):
+                if included(node) and included(child):
+                    logger.debug("Adding standard link from {} to {}".format(index.name(node),
+                                                                              index.name(child)))
+                    opts = link_opts
+                    if self.aggregation is not None:
+                        opts = dict(link_opts,
+                                    bw=link_opts['bw'] * self.aggregation.bandwidth_scale(child))
+                    self.addLink(index.name(node), index.name(child), **opts)
+
+
+class TracedMininet(Mininet):
+    """Mininet with a span around each step of building the network, and detail spans around adding
+    each node and link (see tracing)."""
+
+    def build(self):
+        with tracing.span('build'):
+            return Mininet.build(self)
+
+    def addController(self, *args, **params):
+        with tracing.span('addController'):
+            return Mininet.addController(self, *args, **params)
+
+    def addHost(self, name, *args, **params):
+        with tracing.detail('addHost', name):
+            return Mininet.addHost(self, name, *args, **params)
+
+    def addSwitch(self, name, *args, **params):
+        with tracing.detail('addSwitch', name):
+            return Mininet.addSwitch(self, name, *args, **params)
+
+    def addLink(self, *args, **params):
+        with tracing.detail('addLink'):
+            return Mininet.addLink(self, *args, **params)
+
+    def configHosts(self):
+        with tracing.span('configHosts'):
+            return Mininet.configHosts(self)
+
+    def staticArp(self):
+        with tracing.span('staticArp'):
+            return Mininet.staticArp(self)
+
+
+# Link options BatchedTCIntf applies in bulk, with the commands of tc_add_commands. Interfaces
+# with any other option are configured by TCIntf.config once their veth pair exists.
+BATCHED_LINK_OPTIONS = frozenset(['bw', 'delay', 'loss', 'use_htb'])
+# Host options BatchedMininet.configHosts applies in bulk. Hosts with any other option (such as
+# the CPU limit of a CPULimitedHost) are configured by Host.configDefault.
+BATCHED_HOST_OPTIONS = frozenset(['ip'])
+# Batch scripts running at once, each with a shell (and an mnexec) and a pipe, so that batched
+# startup holds few processes and files beyond those planning.plan_network counts
+BATCH_SCRIPTS_IN_FLIGHT = 64
+
+
+def batchable(params):
+    """Return whether the options of a TCIntf are those tc_add_commands configures just as
+    TCIntf.config would."""
+    return (set(params) <= BATCHED_LINK_OPTIONS and params.get('bw') is not None
+            and 0 <= params['bw'] <= TCIntf.bwParamMax and params.get('delay') is not None
+            and 0 <= (params.get('loss') or 0) <= 100)
+
+
+def veth_command(name1, addr1, name2, addr2, netns):
+    """Return the ip batch command of makeIntfPair, creating a veth pair whose second end is moved
+    to the network namespace of the process netns."""
+    return 'link add name {} address {} type veth peer name {} address {} netns {}'.format(
+        name1, addr1, name2, addr2, netns)
+
+
+def interface_commands(name, params):
+    """Return the ip, tc and shell commands which TCIntf.config runs one at a time to bring up an
+    interface and add the qdiscs of its batchable link options."""
+    return (['link set {} up'.format(name)], tc_add_commands(name, **params),
+            ['ethtool -K {} gro off tx on rx on > /dev/null 2>&1'.format(name)])
+
+
+def batch_script(ip_commands=(), tc_commands=(), shell_commands=()):
+    """Return a shell script running ip commands with a single ip process, then tc commands with a
+    single tc process, then shell commands."""
+    lines = []
+    for tool, commands in (('ip', ip_commands), ('tc', tc_commands)):
+        if commands:
+            lines.append('{} -force -batch - <<\'EOF\''.format(tool))
+            lines.extend(commands)
+            lines.append('EOF')
+    lines.extend(shell_commands)
+    return '\n'.join(lines) + '\n'
+
+
+def _run_scripts(scripts, in_flight=BATCH_SCRIPTS_IN_FLIGHT):
+    """Run shell scripts at once, in_flight at a time, each in the network namespace of its node
+    (the root namespace for None), and return the output of each by node."""
+    files, running, outputs = [], [], {}
+
+    def finish(node, process):
+        outputs[node] = process.communicate()[0].decode()
+
+    try:
+        for node, script in scripts.items():
+            if len(running) >= in_flight:
+                finish(*running.pop(0))
+            with tempfile.NamedTemporaryFile('w', prefix='batch-', suffix='.sh',
+                                             delete=False) as f:
+                f.write(script)
+            files.append(f.name)
+            if node is None:
+                process = subprocess.Popen(['sh', f.name], stdout=subprocess.PIPE,
+                                           stderr=subprocess.STDOUT)
+            else:
+                # Outside of the cgroup of a CPULimitedHost, which may be given little CPU
+                process = node.popen(['sh', f.name], stdout=subprocess.PIPE,
+                                     stderr=subprocess.STDOUT,
+                                     mncmd=['mnexec', '-da', str(node.pid)])
+            running.append((node, process))
+        while running:
+            finish(*running.pop(0))
+        return outputs
+    finally:
+        for _, process in running:
+            process.kill()
+            process.wait()
+        for name in files:
+            os.remove(name)
+
+
+class BatchedTCIntf(TCIntf):
+    """TCIntf whose configuration is left to BatchedMininet, which creates its veth pair and
+    configures it along with every other interface."""
+
+    def config(self, **params):
+        # The veth pair does not exist yet, and params are kept in self.params
+        return {}
+
+
+class BatchedTCLink(TCLink):
+    """TCLink of BatchedTCIntf whose veth pair is created by BatchedMininet, along with those of
+    every other link."""
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('cls1', BatchedTCIntf)
+        kwargs.setdefault('cls2', BatchedTCIntf)
+        self.pair = None
+        TCLink.__init__(self, *args, **kwargs)
+
+    def makeIntfPair(self, intfname1, intfname2, addr1=None, addr2=None, node1=None, node2=None,
+                     deleteIntfs=True):
+        self.pair = (intfname1, intfname2, addr1, addr2, node1, node2)
+
+
+class BatchedMininet(TracedMininet):
+    """Mininet which creates the veth pairs of its BatchedTCLinks, configures their interfaces and
+    qdiscs, sets the addresses of its hosts and fills their ARP tables in bulk.
+
+    Mininet runs a command in the shell of a node for each of these: over a dozen for each link,
+    two for each host and one for each pair of hosts. Here the commands of each network namespace
+    are collected into one script of ip and tc batches (all the switches share the root
+    namespace), and the scripts of every namespace run at once: one round for the veth pairs, one
+    for the interfaces and hosts, and one for the ARP tables."""
+
+    @staticmethod
+    def namespace(node):
+        """Return the node whose network namespace the scripts of a node run in, None for the
+        root namespace."""
+        return node if node is not None and node.inNamespace else None
+
+    def runScripts(self, scripts, step):
+        """Run the scripts of each namespace of a step, logging the output of any that fail."""
+        logger = logging.getLogger(__name__)
+        with tracing.span(step, namespaces=len(scripts)):
+            outputs = _run_scripts(scripts)
+        failed = dict((node, output.strip()) for node, output in outputs.items()
+                      if output.strip())
+        for node, output in failed.items():
+            logger.error('Error in %s of %s: %s', step, 'the root namespace' if node is None
+                         else node.name, output)
+        return failed
+
+    def buildFromTopo(self, topo=None):
+        Mininet.buildFromTopo(self, topo)
+        self.configLinks()
+
+    def configLinks(self):
+        """Create the veth pairs of every BatchedTCLink and configure their interfaces."""
+        links = [link for link in self.links if getattr(link, 'pair', None) is not None]
+        pairs = defaultdict(list)
+        for link in links:
+            name1, name2, addr1, addr2, node1, node2 = link.pair
+            pairs[self.namespace(node1)].append(veth_command(
+                name1, addr1, name2, addr2, 1 if node2 is None else node2.pid))
+        if self.runScripts(dict((node, batch_script(commands)) for node, commands in pairs.items()),
+                           'make_intf_pairs'):
+            raise Exception('Error creating the interface pairs of {} links'.format(len(links)))
+
+        commands = defaultdict(lambda: ([], [], []))
+        for link in links:
+            for intf in (link.intf1, link.intf2):
+                if not batchable(intf.params):
+                    TCIntf.config(intf, **intf.params)
+                    continue
+                for batch, batch_commands in zip(commands[self.namespace(intf.node)],
+                                                 interface_commands(intf.name, intf.params)):
+                    batch.extend(batch_commands)
+        self.runScripts(dict((node, batch_script(*node_commands))
+                             for node, node_commands in commands.items()), 'config_intfs')
+
+    def configHosts(self):
+        with tracing.span('configHosts'):
+            commands = {}
+            for host in self.hosts:
+                intf = host.defaultIntf()
+                if intf is None:
+                    # As Mininet.configHosts does not configure nonexistent interfaces
+                    host.configDefault(ip=None, mac=None)
+                    continue
+                if not set(host.params) <= BATCHED_HOST_OPTIONS:
+                    host.configDefault()
+                    continue
+                ip_commands = ['link set lo up']
+                ip = host.params.get('ip')
+                if ip is not None:
+                    # As Intf.setIP would, with the broadcast address ifconfig sets
+                    intf.ip, intf.prefixLen = ip.split('/') if '/' in ip else (ip, 8)
+                    ip_commands.append('addr add {}/{} brd + dev {}'.format(
+                        intf.ip, intf.prefixLen, intf.name))
+                commands[host] = batch_script(ip_commands)
+            self.runScripts(commands, 'config_hosts')
+
+    def staticArp(self):
+        with tracing.span('staticArp'):
+            hosts = [host for host in self.hosts
+                     if host.defaultIntf() is not None and host.IP() is not None]
+            commands = {}
+            for src in hosts:
+                intf = src.defaultIntf()
+                # The permanent entries of `arp -s`
+                commands[src] = batch_script([
+                    'neigh replace {} lladdr {} dev {} nud permanent'.format(dst.IP(), dst.MAC(),
+                                                                            intf.name)
+                    for dst in hosts if dst is not src])
+            self.runScripts(commands, 'static_arp')
 
 
 def setup_mininet(log, spread, depth, bandwidth, delay, loss, fpga, fpga_bandwidth, fpga_delay,
-                  fpga_loss, poisson):
-    """Run tasks to setup and start the mininet environment."""
-    Cleanup.cleanup()
+                  fpga_loss, poisson, compute=None, placements=None, batched=False,
+                  aggregate_level=None):
+    """Run tasks to setup and start the mininet environment.
+
+    batched starts the network with BatchedMininet. aggregate_level builds representative leaves
+    (see TreeTopoGeneric)."""
+    with tracing.span('cleanup'):
+        Cleanup.cleanup()
 
     setLogLevel(log)
 
     # Create network
-    topo = TreeTopoGeneric(spread, depth, bandwidth, delay, loss, fpga, fpga_bandwidth, fpga_delay,
-                           fpga_loss, poisson)
-    net = Mininet(topo=topo, host=CPULimitedHost, link=TCLink, autoStaticArp=True)
-    net.start()
+    with tracing.span('topology'):
+        topo = TreeTopoGeneric(spread, depth, bandwidth, delay, loss, fpga, fpga_bandwidth,
+                               fpga_delay, fpga_loss, poisson, compute, placements,
+                               aggregate_level=aggregate_level)
+    return start_network(topo, batched=batched)
+
+
+def start_network(topo, controller=DefaultController, batched=False):
+    """Create and start a Mininet network of a TreeTopoGeneric topology, configuring its links and
+    hosts in bulk with BatchedMininet if batched, and log how long it took."""
+    logger = logging.getLogger(__name__)
+    start = time.time()
+    if batched:
+        network, link = BatchedMininet, BatchedTCLink
+    else:
+        # Only pay for the spans of each step of the build when tracing
+        network, link = TracedMininet if tracing.enabled() else Mininet, TCLink
+    with tracing.span('create_network'):
+        net = network(topo=topo, host=CPULimitedHost, link=link, controller=controller,
+                      autoStaticArp=True)
+    with tracing.span('start'):
+        net.start()
+    logger.info('Started %d nodes and %d links in %.3f s%s', len(net.hosts) + len(net.switches),
+                len(net.links), time.time() - start, ' (batched)' if batched else '')
 
     return net
+
+
+def _netem(delay=None, loss=None):
+    netem = 'delay {} '.format(delay) if delay is not None else ''
+    if loss:
+        netem += 'loss {:.5f} '.format(loss)
+    return netem
+
+
+def tc_change_commands(intf, bw=None, delay=None, loss=None, **params):
+    """Return tc batch commands changing the htb class and netem qdisc which TCIntf.config creates
+    for the given link options on an interface."""
+    return ['class change dev {} parent 5:0 classid 5:1 htb rate {:f}Mbit burst 15k'.format(
+                intf, bw),
+            'qdisc change dev {} parent 5:1 handle 10: netem {}'.format(
+                intf, _netem(delay, loss)).rstrip()]
+
+
+def tc_add_commands(intf, bw=None, delay=None, loss=None, **params):
+    """Return tc batch commands adding the htb class and netem qdisc which TCIntf.config creates
+    for the given link options to an interface which has none."""
+    return ['qdisc add dev {} root handle 5:0 htb default 1'.format(intf),
+            'class add dev {} parent 5:0 classid 5:1 htb rate {:f}Mbit burst 15k'.format(
+                intf, bw),
+            'qdisc add dev {} parent 5:1 handle 10: netem {}'.format(
+                intf, _netem(delay, loss)).rstrip()]
+
+
+def _run_tc_batch(node, commands):
+    """Run tc commands in the namespace of node with a single tc process."""
+    with tempfile.NamedTemporaryFile('w', prefix='tc-batch-', suffix='.txt', delete=False) as f:
+        f.write('\n'.join(commands) + '\n')
+    try:
+        return node.cmd('tc -force -batch {}'.format(f.name))
+    finally:
+        os.remove(f.name)
+
+
+def reconfigure_network(net, bandwidth, delay, loss, fpga_bandwidth=None, fpga_delay=None,
+                        fpga_loss=None, poisson=None):
+    """Apply new link parameters to a running network built from TreeTopoGeneric.
+
+    The shape of the network (spread, depth and FPGA level) is unchanged, so rather than rebuilding
+    it, the existing qdiscs of every standard and FPGA link are changed in place. Every FPGA link
+    gets the FPGA options, whichever placement it belongs to. The commands for
+    each namespace are applied in bulk: one tc batch for all the switches, which share the root
+    namespace, and one for each host."""
+    logger = logging.getLogger(__name__)
+
+    link_opts, fpga_link_opts, _ = link_options(bandwidth, delay, loss, fpga_bandwidth,
+                                                fpga_delay, fpga_loss, poisson)
+
+    switches = set(net.switches)
+    commands = defaultdict(list)
+    for link in net.links:
+        names = (link.intf1.node.name, link.intf2.node.name)
+        if 'cloud' in names:
+            # The cloud link never changes
+            continue
+        opts = fpga_link_opts if any(name[0] == 'f' for name in names) else link_opts
+        for intf in (link.intf1, link.intf2):
+            # Switches are not in a namespace, so batch all of their interfaces together
+            node = net.switches[0] if intf.node in switches else intf.node
+            commands[node].extend(tc_change_commands(intf.name, **opts))
+            intf.params.update(opts)
+
+    for node, node_commands in commands.items():
+        logger.debug('Changing %d qdiscs and classes from %s', len(node_commands), node.name)
+        with tracing.span('tc_batch', node=node.name, commands=len(node_commands)):
+            output = _run_tc_batch(node, node_commands)
+        if output.strip():
+            logger.error('Error reconfiguring links from %s: %s', node.name, output.strip())
+
+    return link_opts, fpga_link_opts
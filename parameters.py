@@ -0,0 +1,187 @@
+import re
+
+
+VALID_TIME = re.compile(r'^([-+]?[0-9]*\.?[0-9]+)([PTGMkmunpf]?s)$')
+
+# Multipliers to convert each valid time unit into seconds
+TIME_UNITS = {
+    'Ps': 1e15,
+    'Ts': 1e12,
+    'Gs': 1e9,
+    'Ms': 1e6,
+    'ks': 1e3,
+    's': 1.0,
+    'ms': 1e-3,
+    'us': 1e-6,
+    'ns': 1e-9,
+    'ps': 1e-12,
+    'fs': 1e-15,
+}
+
+# The cloud host has one high bandwidth, 0 latency link to the root switch
+CLOUD_LINK_OPTS = dict(bw=1000, delay='0ms', loss=0, use_htb=True)
+
+
+def get_poisson_delay(delay):
+    """Returns a Poisson distributed delay of the given delay."""
+    from numpy import random
+
+    match = VALID_TIME.match(delay)
+    poisson = random.poisson(float(match.group(1)))
+    return "{}{}".format(poisson, match.group(2))
+
+
+def halve_delay(delay):
+    match = VALID_TIME.match(delay)
+    half = float(match.group(1)) / 2
+    return "{}{}".format(half, match.group(2))
+
+
+def delay_to_seconds(delay):
+    """Convert a delay string such as '10ms' into a number of seconds."""
+    match = VALID_TIME.match(str(delay))
+    if not match:
+        raise ValueError("Invalid delay '{}'. Expected <time><unit>s, e.g. '10ms'.".format(delay))
+    return float(match.group(1)) * TIME_UNITS[match.group(2)]
+
+
+def link_options(bandwidth, delay, loss, fpga_bandwidth=None, fpga_delay=None, fpga_loss=None,
+                 poisson=None):
+    """Return the (link_opts, fpga_link_opts, cloud_link_opts) used to build a tree topology.
+
+    The FPGA link will have the bandwidth and loss specified by the user, and half the delay.
+    These parameters are as if they were caused by the FPGA, rather than a link. As a result,
+    latency is halved since it will essentially be doubled by the packet flowing in and out of
+    the host."""
+    fpga_bandwidth = bandwidth if fpga_bandwidth is None else fpga_bandwidth
+    fpga_delay = delay if fpga_delay is None else halve_delay(fpga_delay)
+    fpga_loss = loss * 2 if fpga_loss is None else fpga_loss
+
+    if poisson:
+        link_opts = dict(bw=bandwidth, delay=get_poisson_delay(delay), loss=loss, use_htb=True)
+        fpga_link_opts = dict(bw=fpga_bandwidth, delay=get_poisson_delay(fpga_delay),
+                              loss=fpga_loss, use_htb=True)
+    else:
+        link_opts = dict(bw=bandwidth, delay=delay, loss=loss, use_htb=True)
+        fpga_link_opts = dict(bw=fpga_bandwidth, delay=fpga_delay, loss=fpga_loss, use_htb=True)
+
+    return link_opts, fpga_link_opts, dict(CLOUD_LINK_OPTS)
+
+
+def compute_options(distribution='exponential', queue_size=64, fpga_service_time='1ms',
+                    fpga_pipelines=1, fpga_cpu=None, cloud_service_time='100us', cloud_pipelines=4,
+                    cloud_cpu=None):
+    """Return the options of the compute services of the FPGA hosts and the cloud.
+
+    Service times are the mean CPU time spent on each request, and cpu the fraction of the CPU of
+    the machine each host may use (None for no limit)."""
+    return dict(
+        distribution=distribution,
+        queue_size=queue_size,
+        fpga=dict(service_time=delay_to_seconds(fpga_service_time), pipelines=fpga_pipelines,
+                  cpu=fpga_cpu),
+        cloud=dict(service_time=delay_to_seconds(cloud_service_time), pipelines=cloud_pipelines,
+                   cpu=cloud_cpu),
+    )
+
+
+def host_options(compute, role):
+    """Return the options of a CPULimitedHost for the 'fpga' or 'cloud' role."""
+    if compute is None or compute[role]['cpu'] is None:
+        return {}
+    return dict(cpu=compute[role]['cpu'])
+
+
+# Options of a placement which override those of the FPGA level, and how to parse them
+PLACEMENT_OPTIONS = (('bandwidth', int), ('delay', str), ('loss', int), ('service_time', str),
+                     ('pipelines', int), ('cpu', float))
+
+
+def placement_options(level, positions=None, bandwidth=None, delay=None, loss=None,
+                      service_time=None, pipelines=None, cpu=None):
+    """Return the options of a placement of FPGA hosts on the switches at the given positions of a
+    level of the tree (None for every switch of the level).
+
+    Its link and compute options override those of the FPGA level (see link_options and
+    compute_options), unless they are None."""
+    return dict(level=level, positions=None if positions is None else tuple(sorted(set(positions))),
+                bandwidth=bandwidth, delay=delay, loss=loss, service_time=service_time,
+                pipelines=pipelines, cpu=cpu)
+
+
+def parse_placement(text):
+    """Parse a placement written as LEVEL[@POSITION[+POSITION...]][:NAME=VALUE[,NAME=VALUE...]],
+    e.g. '1', '2@0+3' or '1:bandwidth=100,delay=5ms', into placement_options.
+
+    Raises ValueError if it is not valid."""
+    kinds = dict(PLACEMENT_OPTIONS)
+    switches, _, overrides = text.partition(':')
+    level, _, positions = switches.partition('@')
+    try:
+        options = dict(level=int(level),
+                       positions=[int(position) for position in positions.split('+')]
+                       if positions else None)
+        for override in overrides.split(',') if overrides else []:
+            name, _, value = override.partition('=')
+            name = name.strip().replace('-', '_')
+            if name not in kinds or name in options:
+                raise ValueError("unknown or repeated option '{}'".format(name))
+            options[name] = kinds[name](value.strip())
+        for name in ('delay', 'service_time'):
+            if options.get(name) is not None:
+                delay_to_seconds(options[name])
+    except ValueError as ex:
+        raise ValueError("Invalid placement '{}' ({}). Expected LEVEL[@POSITION[+POSITION...]]"
+                         "[:NAME=VALUE[,NAME=VALUE...]].".format(text, ex))
+    if options['level'] < 0 or any(position < 0 for position in options['positions'] or []):
+        raise ValueError("Invalid placement '{}'. Levels and positions start at 0.".format(text))
+    if options.get('loss') is not None and not 0 <= options['loss'] <= 100:
+        raise ValueError("Invalid placement '{}'. loss is a percentage.".format(text))
+    if options.get('cpu') is not None and not 0 <= options['cpu'] <= 1:
+        raise ValueError("Invalid placement '{}'. cpu is a fraction of the CPU.".format(text))
+    return placement_options(**options)
+
+
+def format_placement(placement):
+    """Write a placement as parse_placement reads it."""
+    text = str(placement['level'])
+    if placement['positions'] is not None:
+        text += '@' + '+'.join(str(position) for position in placement['positions'])
+    overrides = ['{}={}'.format(name.replace('_', '-'), placement[name])
+                 for name, _ in PLACEMENT_OPTIONS if placement.get(name) is not None]
+    return text + (':' + ','.join(overrides) if overrides else '')
+
+
+def fpga_placements(fpga, placements=None):
+    """Return the placements of a network: every switch of the FPGA level, with the options of the
+    FPGA level, followed by the given placements."""
+    return ([] if fpga is None else [placement_options(fpga)]) + list(placements or [])
+
+
+def placement_fpga_options(placement, fpga_bandwidth=None, fpga_delay=None, fpga_loss=None):
+    """Return the (fpga_bandwidth, fpga_delay, fpga_loss) of a placement, those it does not set
+    being the given ones."""
+    return tuple(default if placement.get(name) is None else placement[name]
+                 for name, default in (('bandwidth', fpga_bandwidth), ('delay', fpga_delay),
+                                       ('loss', fpga_loss)))
+
+
+def placement_link_options(placement, bandwidth, delay, loss, fpga_bandwidth=None, fpga_delay=None,
+                           fpga_loss=None, poisson=None):
+    """Return the link options of the FPGA hosts of a placement, see link_options."""
+    fpga_bandwidth, fpga_delay, fpga_loss = placement_fpga_options(placement, fpga_bandwidth,
+                                                                   fpga_delay, fpga_loss)
+    return link_options(bandwidth, delay, loss, fpga_bandwidth, fpga_delay, fpga_loss, poisson)[1]
+
+
+def placement_compute(compute, placement):
+    """Return compute options (see compute_options) whose FPGA hosts are those of a placement."""
+    if compute is None:
+        return None
+    fpga = dict(compute['fpga'])
+    if placement.get('service_time') is not None:
+        fpga['service_time'] = delay_to_seconds(placement['service_time'])
+    for name in ('pipelines', 'cpu'):
+        if placement.get(name) is not None:
+            fpga[name] = placement[name]
+    return dict(compute, fpga=fpga)
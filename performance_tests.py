@@ -1,28 +1,319 @@
 import logging
+import math
 import re
+import time
 
+import tracing
+from executor import Executor, run_command, run_commands
+from results import combine_pings, parse_ping, parse_ping_rtts, parse_rate, placement_fields
 
-def test_cloud_fpga(net, fpga):
+# Echo requests sent by each batch of a repeated ping
+PING_BATCH = 5
+# Seconds a ping may run beyond one second per echo request before it is interrupted
+PING_TIMEOUT_S = 5.0
+# Pairs of hosts ping_all pings at once
+PING_ALL_BATCH = 64
+IPERF_PORT = 5001
+IPERF_SECONDS = 5
+# Seconds given to an iperf server to listen before its client connects, and an iperf client to
+# run beyond its test before it is interrupted
+IPERF_START_S = 1.0
+IPERF_TIMEOUT_S = 10.0
+IPERF_RATE = re.compile(r'([0-9.]+ [KMG]?bits/sec)')
+
+
+def _ping(net, src, dst, count):
+    """Send count echo requests from the host src to the host dst, interrupting ping if it runs
+    PING_TIMEOUT_S longer than it should, and return its output."""
+    result = run_command(net.get(src), ['ping', '-c', count, net.get(dst).IP()],
+                         count + PING_TIMEOUT_S)
+    if result.timed_out:
+        logging.getLogger(__name__).warning('Ping from %s to %s timed out after %.1f s', src, dst,
+                                            result.elapsed)
+    return result.output
+
+
+def test_cloud_fpga(net, fpga, src='h0', dst=None, repetition=None):
     """Test how long it takes a packet to travel between the leaf and the root (or FPGA switch).
 
-    If the fpga flag is set, this will test how long it takes a packet to travel between the leaf
+    If the fpga level is set, this will test how long it takes a packet to travel between the leaf
     and the first FPGA switch.
     If it is unset, this will test how long it takes a packet to travel between the leaf and the
     root.
 
-    The tests are conducted using the ping protocol, which uses ICMP packets."""
+    The tests are conducted using the ping protocol, which uses ICMP packets.
+
+    src and dst, if given, are the leaf and the FPGA host to test instead of h0 and f0.
+
+    repetition, if given, is a dict of the arguments of repetition.repeat, which sends batches of
+    PING_BATCH echo requests until the mean RTT converges instead of sending 10.
+
+    Returns the parsed ping statistics (see results.parse_ping) along with the test, src and dst.
+    """
     logger = logging.getLogger(__name__)
-    h0 = net.get('h0')
-    if fpga:
-        logger.info('Testing performance between leaf (h0) and FPGA switch (f0)')
-        f0 = net.get('f0')
-        ping = h0.cmd('ping -c 10 {}'.format(f0.IP()))
+    if dst is None:
+        dst = 'f0' if fpga is not None else 'cloud'
+    if dst != 'cloud':
+        logger.info('Testing performance between leaf (%s) and FPGA switch (%s)', src, dst)
     else:
-        logger.info('Testing performance between leaf (h0) and cloud (cloud)')
-        cloud = net.get('cloud')
-        ping = h0.cmd('ping -c 10 {}'.format(cloud.IP()))
+        logger.info('Testing performance between leaf (%s) and cloud (cloud)', src)
+    if repetition is not None:
+        measurement = _repeated_ping(net, src, dst, repetition)
+        logger.info('Ping results: rtt avg %.3f +- %.3f ms (%g%% confidence) over %d pings in %d '
+                    'batches%s', measurement['rtt_avg'], measurement['ci_half_width'],
+                    measurement['ci_confidence'] * 100, measurement['transmitted'],
+                    measurement['batches'], '' if measurement['converged'] else ', not converged')
+        measurement.update(test='cloud_fpga', src=src, dst=dst)
+        return measurement
+    with tracing.span('ping', src=src, dst=dst):
+        ping = _ping(net, src, dst, 10)
 
     rtt_results = re.compile('rtt.*')
     search = rtt_results.search(ping)
-    rtt = search.group(0)
-    logger.info('Ping results: %s', rtt)
+    if search:
+        logger.info('Ping results: %s', search.group(0))
+    else:
+        logger.warning('No ping replies received from %s', dst)
+
+    measurement = parse_ping(ping)
+    measurement.update(test='cloud_fpga', src=src, dst=dst)
+    return measurement
+
+
+def _repeated_ping(net, src, dst, repetition):
+    """Ping dst from src in batches until the mean RTT converges (see repetition.repeat), and
+    return the statistics of every batch together with the confidence of the mean."""
+    from repetition import repeat
+
+    outputs = []
+
+    def probe():
+        with tracing.span('ping', src=src, dst=dst, batch=len(outputs)):
+            outputs.append(_ping(net, src, dst, PING_BATCH))
+        return parse_ping_rtts(outputs[-1])
+
+    _, confidence = repeat(probe, **repetition)
+    measurement = combine_pings(outputs)
+    measurement.update(confidence)
+    return measurement
+
+
+def test_ping_all(net, timeout=1, batch=PING_ALL_BATCH):
+    """Ping between all pairs of hosts once, batch pairs at a time, waiting timeout seconds for
+    each reply, and return the percentage of pings dropped, like Mininet's pingAll.
+
+    In a network of representative leaves (see aggregation), each pair counts for every pair of
+    leaves its hosts stand for, so the drops are extrapolated to the full tree."""
+    logger = logging.getLogger(__name__)
+    # The simulation backend runs its pings itself
+    if hasattr(net, 'ping_pairs'):
+        return net.pingAll()
+    names = _hosts(net)
+    aggregation = net.topo.aggregation
+    weights = dict((name, 1 if aggregation is None else aggregation.host_weight(name))
+                   for name in names)
+    pairs = [(src, dst) for src in names for dst in names if src != dst]
+    sent = received = 0
+    for start in range(0, len(pairs), batch):
+        chunk = pairs[start:start + batch]
+        results = run_commands([(net.get(src), ['ping', '-c1', '-W', timeout, net.get(dst).IP()])
+                                for src, dst in chunk], timeout + PING_TIMEOUT_S)
+        for (src, dst), result in zip(chunk, results):
+            weight = weights[src] * weights[dst]
+            sent += weight
+            received += weight * (parse_ping(result.output)['received'] == 1)
+    dropped = 100.0 * (sent - received) / sent if sent else 0
+    logger.info('Results: %d%% dropped (%d/%d received)%s', dropped, received, sent,
+                '' if aggregation is None else ', extrapolated from {} pairs'.format(len(pairs)))
+    return dropped
+
+
+def test_iperf(net, client, server, seconds=IPERF_SECONDS, port=IPERF_PORT):
+    """Run an iperf test from the host client to the host server, and return the [server, client]
+    rates, like Mininet's iperf.
+
+    The client is interrupted if it runs IPERF_TIMEOUT_S longer than the test, as it does when its
+    TCP handshake fails, and the rates of a failed test are empty."""
+    logger = logging.getLogger(__name__)
+    # The simulation backend runs its transfers itself
+    if hasattr(net, 'ping_pairs'):
+        return net.iperf([net.get(client), net.get(server)], seconds)
+    with Executor() as executor:
+        server_handle = executor.start(net.get(server), ['iperf', '-s', '-p', port])
+        time.sleep(IPERF_START_S)
+        client_handle = executor.start(net.get(client), ['iperf', '-c', net.get(server).IP(),
+                                                         '-p', port, '-t', seconds],
+                                       seconds + IPERF_TIMEOUT_S)
+        client_result, = executor.wait([client_handle])
+        if client_result.timed_out:
+            logger.warning('iperf from %s to %s timed out after %.1f s', client, server,
+                           client_result.elapsed)
+        # Give the server a moment to report the test before it is stopped
+        end = time.time() + IPERF_START_S
+        while '/sec' not in executor.output(server_handle) and time.time() < end:
+            executor.step(end - time.time())
+        executor.cancel(server_handle)
+        server_result, = executor.wait([server_handle])
+    result = [(IPERF_RATE.findall(output) or [''])[-1]
+              for output in (server_result.output, client_result.output)]
+    logger.info('Results: %s', result)
+    return result
+
+
+def _repeated_iperf(net, hosts, repetition):
+    """Run iperf between two named hosts until the mean rate the server received converges (see
+    repetition.repeat), and return the mean rates of the server and the client with the confidence
+    of the first."""
+    from repetition import repeat
+
+    client_rates = []
+
+    def probe():
+        with tracing.span('iperf', src=hosts[0], dst=hosts[-1], batch=len(client_rates)):
+            server, client = test_iperf(net, hosts[0], hosts[-1])
+        client_rates.append(parse_rate(client))
+        rate = parse_rate(server)
+        return [] if math.isnan(rate) else [rate]
+
+    rates, confidence = repeat(probe, **repetition)
+    client_rates = [rate for rate in client_rates if not math.isnan(rate)]
+    measurement = dict(
+        throughput_mbps=sum(rates) / len(rates) if rates else float('nan'),
+        client_throughput_mbps=(sum(client_rates) / len(client_rates) if client_rates
+                                else float('nan')))
+    measurement.update(confidence)
+    logging.getLogger(__name__).info(
+        'Mean throughput %.3f +- %.3f Mbps (%g%% confidence) over %d runs%s',
+        measurement['throughput_mbps'], confidence['ci_half_width'],
+        confidence['ci_confidence'] * 100, confidence['batches'],
+        '' if confidence['converged'] else ', not converged')
+    return measurement
+
+
+def _natural(name):
+    """Sort key which orders the numbers in host names numerically, like Mininet."""
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', name)]
+
+
+def _hosts(net):
+    """Return the names of the hosts of a network, sorted like Mininet sorts them."""
+    return sorted((name for name in net.keys() if name[0] in 'hf' or name == 'cloud'),
+                  key=_natural)
+
+
+def run_tests(net, fpga, cloud_fpga, ping_all, iperf, workload=None, index=None, iperf_flows=None,
+              latency=None, telemetry=None, replay=None, repetition=None):
+    """Run the selected tests on a started network and return a list of their measurements.
+
+    workload, if given, is a dict of the arguments of workload.run_workload to run after the other
+    tests, and replay of workload.run_replay to run after the workload. iperf_flows, if given, is
+    a dict of the arguments of iperf_flows.run_iperf_flows to run after the iperf test, and latency
+    of latency_matrix.run_latency_matrix to run after ping_all.
+    telemetry, if given, is a dict of the interval, capacity and output of a telemetry sampler of
+    the links of a mininet network, which runs throughout the tests and adds their measurements.
+    repetition, if given, is a dict of the arguments of repetition.repeat, which repeats the
+    cloud_fpga ping, the iperf test and the workload until their estimates converge.
+
+    index, the TreeIndex of a network with placements of FPGA hosts, runs the cloud_fpga test, the
+    workload and the replay on each placement in turn instead, from the first leaf below it (and
+    every leaf below it for the workload and the replay) to its FPGA hosts. Their measurements
+    record the placement."""
+    sampler = None
+    if telemetry is not None:
+        from telemetry import start_telemetry, stop_telemetry
+
+        sampler = start_telemetry(net, telemetry['interval'], telemetry['capacity'])
+    try:
+        measurements = _run_tests(net, fpga, cloud_fpga, ping_all, iperf, workload, index,
+                                  iperf_flows, latency, replay, repetition)
+    finally:
+        if sampler is not None:
+            with tracing.span('telemetry'):
+                telemetry_measurements = stop_telemetry(sampler, telemetry.get('output'))
+    if sampler is not None:
+        measurements.extend(telemetry_measurements)
+    return measurements
+
+
+def _run_tests(net, fpga, cloud_fpga, ping_all, iperf, workload, index, iperf_flows, latency,
+               replay, repetition):
+    logger = logging.getLogger(__name__)
+    measurements = []
+
+    number_of_hosts = 0
+    for node in net.keys():
+        if node[0] == 'h':
+            number_of_hosts += 1
+
+    if cloud_fpga and index is not None:
+        for i, placement in enumerate(index.placements):
+            leaf, host = index.placement_targets(i)[0]
+            with tracing.span('cloud_fpga', placement=i):
+                measurement = test_cloud_fpga(net, placement['level'], index.name(leaf),
+                                              index.name(host), repetition)
+            measurement.update(placement_fields(placement))
+            measurements.append(measurement)
+    elif cloud_fpga:
+        with tracing.span('cloud_fpga'):
+            measurements.append(test_cloud_fpga(net, fpga, repetition=repetition))
+
+    if ping_all:
+        if number_of_hosts > 1:
+            logger.info("Running ping test between all hosts")
+            with tracing.span('ping_all'):
+                dropped = test_ping_all(net)
+            measurements.append(dict(test='ping_all', loss_percent=dropped))
+        else:
+            logger.warning(str(number_of_hosts) + " host(s). Unable to run ping test.")
+
+    if latency is not None:
+        from latency_matrix import run_latency_matrix
+
+        with tracing.span('latency_matrix', method=latency.get('method')):
+            measurements.append(run_latency_matrix(net, **latency))
+
+    if iperf:
+        if number_of_hosts > 1:
+            logger.info("Testing bandwidth between first and last hosts")
+            # Mininet sorts its hosts by name, and tests the first against the last by default
+            hosts = _hosts(net)
+            if repetition is not None:
+                measurement = _repeated_iperf(net, [hosts[0], hosts[-1]], repetition)
+            else:
+                with tracing.span('iperf', src=hosts[0], dst=hosts[-1]):
+                    server, client = test_iperf(net, hosts[0], hosts[-1])
+                measurement = dict(throughput_mbps=parse_rate(server),
+                                   client_throughput_mbps=parse_rate(client))
+            measurement.update(test='iperf', src=hosts[0], dst=hosts[-1])
+            measurements.append(measurement)
+        else:
+            logger.warning(str(number_of_hosts) + " host(s). Unable to run bandwidth test.")
+
+    if iperf_flows is not None:
+        from iperf_flows import run_iperf_flows
+
+        with tracing.span('iperf_flows', pattern=iperf_flows.get('pattern')):
+            measurements.extend(run_iperf_flows(net, **iperf_flows))
+
+    if workload is not None:
+        from workload import run_workload
+
+        for i in range(len(index.placements)) if index is not None else [None]:
+            with tracing.span('workload', mode=workload.get('mode'), placement=i):
+                measurement = run_workload(net, placement=i, repetition=repetition, **workload)
+            if i is not None:
+                measurement.update(placement_fields(index.placements[i]))
+            measurements.append(measurement)
+
+    if replay is not None:
+        from workload import run_replay
+
+        for i in range(len(index.placements)) if index is not None else [None]:
+            with tracing.span('replay', trace=replay.get('trace'), placement=i):
+                replayed = run_replay(net, placement=i, **replay)
+            if i is not None:
+                for measurement in replayed:
+                    measurement.update(placement_fields(index.placements[i]))
+            measurements.extend(replayed)
+
+    return measurements
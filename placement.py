@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+"""
+Choose the FPGA level of a tree with the queueing model.
+
+placement predicts every FPGA level (and the cloud alone) of every combination of the given
+parameters with queueing.predict, all at once, and reports the best candidates for each objective:
+the lowest mean latency at the offered load, or the highest rate each leaf can send at. Options
+take comma separated lists and ranges, as in sweeps.
+
+--verify runs an open loop workload on the best candidates of each objective in mininet, and
+reports the latency and rate measured next to the predictions, so the model is checked against
+emulation before it is trusted.
+"""
+
+import click
+import numpy as np
+
+import queueing
+from fpga_switch_model import configure_logging, validate_service_time
+from parameters import compute_options, delay_to_seconds
+from sweep import grid, values_of
+
+# Prediction each objective ranks candidates by, and whether lower values are better
+OBJECTIVES = dict(latency=('latency_ms', True), throughput=('max_rate', False))
+# Parameters of a candidate, matching the arguments of queueing.predict
+CANDIDATE_PARAMETERS = ('spread', 'depth', 'fpga', 'bandwidth', 'delay', 'fpga_bandwidth',
+                        'fpga_delay', 'rate', 'request_size', 'response_size', 'fpga_service_time',
+                        'fpga_pipelines', 'cloud_service_time', 'cloud_pipelines', 'fpga_cpu',
+                        'cloud_cpu')
+SERVICE_TIMES = ('fpga_service_time', 'cloud_service_time')
+# Columns of the report of each objective
+COLUMNS = '{:>6} {:>6} {:>6} {:>6} {:>8} {:>12} {:>12} {:>10} {:>11} {:>12} {:>10}'
+ROW = ('{:>6} {:>6} {:>6} {:>6} {:>8g} {:>12.3f} {:>12.1f} {:>10} {:>11.3f} {:>12.3f} '
+       '{:>10.1f}')
+# The model's queues are unbounded, so verification runs give the services room for every request
+VERIFY_QUEUE_SIZE = 65536
+
+
+def candidates(values):
+    """Return every combination of the given lists of values as a list of dicts, with every FPGA
+    level of its tree and the cloud alone (None) if values has no 'fpga' list."""
+    values = dict(values)
+    levels = values.pop('fpga', None)
+    points = []
+    for point in grid(values):
+        for fpga in ([None] + list(range(point['depth'] - 1)) if levels is None else levels):
+            points.append(dict(point, fpga=fpga))
+    return points
+
+
+def evaluate(points, cores=None):
+    """Predict every candidate with queueing.predict at once, returning a dict of arrays in the
+    order of points."""
+    columns = dict((name, np.array([point[name] for point in points], dtype=object))
+                   for name in CANDIDATE_PARAMETERS)
+    for name in SERVICE_TIMES:
+        columns[name] = np.array([delay_to_seconds(value) for value in columns[name]])
+    return queueing.predict(cores=cores, **columns)
+
+
+def rank(prediction, objective, top=1):
+    """Return the indices of the best candidates for an objective, best first.
+
+    Candidates which cannot sustain their offered load have no latency, so they are only ranked
+    by throughput."""
+    field, lowest = OBJECTIVES[objective]
+    values = prediction[field]
+    indices = np.arange(len(values))
+    if objective == 'latency':
+        indices = indices[np.isfinite(values)]
+    order = np.argsort(values[indices] if lowest else -values[indices], kind='mergesort')
+    return indices[order[:top]]
+
+
+def verify(point, duration=10.0, log='warning'):
+    """Run an open loop workload on a candidate in mininet and return its measurement."""
+    from fpga_switch_model import setup_network
+    from workload import run_workload
+
+    compute = compute_options('exponential', VERIFY_QUEUE_SIZE, point['fpga_service_time'],
+                              point['fpga_pipelines'], point['fpga_cpu'],
+                              point['cloud_service_time'], point['cloud_pipelines'],
+                              point['cloud_cpu'])
+    net = setup_network('mininet', log, point['spread'], point['depth'], point['bandwidth'],
+                        point['delay'], 0, point['fpga'], point['fpga_bandwidth'],
+                        point['fpga_delay'], None, False, compute)
+    try:
+        return run_workload(net, 'open', point['rate'], 1, duration, point['request_size'],
+                            point['response_size'])
+    finally:
+        net.stop()
+
+
+def _level_of(point):
+    return 'cloud' if point['fpga'] is None else str(point['fpga'])
+
+
+def fpga_levels(ctx, param, value):
+    """Parse the list of FPGA levels, None meaning every level of each tree."""
+    return None if value is None else values_of(click.IntRange(min=0))(ctx, param, value)
+
+
+@click.command()
+@click.option('-s', '--spread', default='2', show_default=True,
+              callback=values_of(click.IntRange(min=1)),
+              help='Numbers of children each node will have.')
+@click.option('-d', '--depth', default='4', show_default=True,
+              callback=values_of(click.IntRange(min=2)),
+              help='Numbers of levels in the tree.')
+@click.option('-f', '--fpga', callback=fpga_levels,
+              help='FPGA levels to consider (root is 0), "none" for the cloud alone. Defaults to '
+                   'every level of each tree and the cloud alone.')
+@click.option('-b', '--bandwidth', default='10', show_default=True,
+              callback=values_of(click.IntRange(min=0)),
+              help='Max bandwidths of all links in Mbps.')
+@click.option('-e', '--delay', default='1ms', show_default=True, callback=values_of(None),
+              help='Delays of all links.')
+@click.option('--fpga-bandwidth', default='504', show_default=True,
+              callback=values_of(click.IntRange(min=0)),
+              help='Max bandwidths of FPGA switches in Mbps.')
+@click.option('--fpga-delay', default='none', show_default=True, callback=values_of(None),
+              help='Delays of FPGA switches.')
+@click.option('--rate', default='100', show_default=True,
+              callback=values_of(click.FloatRange(min=0.001)),
+              help='Requests per second offered by each leaf.')
+@click.option('--request-size', default='64', show_default=True,
+              callback=values_of(click.IntRange(min=0)),
+              help='Bytes of payload in each request.')
+@click.option('--response-size', default='64', show_default=True,
+              callback=values_of(click.IntRange(min=0)),
+              help='Bytes of payload in each response.')
+@click.option('--fpga-service-time', default='1ms', show_default=True,
+              callback=values_of(validate_service_time),
+              help='Mean CPU times an FPGA host spends on each request.')
+@click.option('--fpga-pipelines', default='1', show_default=True,
+              callback=values_of(click.IntRange(min=0)),
+              help='Requests each FPGA host serves at once.')
+@click.option('--fpga-cpu', default='none', show_default=True,
+              callback=values_of(click.FloatRange(0, 1)),
+              help='Fractions of the CPU of the machine each FPGA host may use.')
+@click.option('--cloud-service-time', default='100us', show_default=True,
+              callback=values_of(validate_service_time),
+              help='Mean CPU times the cloud spends on each request.')
+@click.option('--cloud-pipelines', default='4', show_default=True,
+              callback=values_of(click.IntRange(min=0)),
+              help='Requests the cloud serves at once.')
+@click.option('--cloud-cpu', default='none', show_default=True,
+              callback=values_of(click.FloatRange(0, 1)),
+              help='Fractions of the CPU of the machine the cloud may use.')
+@click.option('--cores', type=click.IntRange(min=1),
+              help='Cores of the machine the CPU fractions are of. Defaults to this machine.')
+@click.option('-t', '--top', default=3, show_default=True, type=click.IntRange(min=1),
+              help='Number of candidates to report for each objective.')
+@click.option('--verify', 'n_verify', default=0, show_default=True, type=click.IntRange(min=0),
+              help='Cross-check this many of the best candidates of each objective with an open '
+                   'loop workload in mininet. Requires root.')
+@click.option('--duration', default=10.0, show_default=True, type=click.FloatRange(min=0),
+              help='Seconds to run each verification workload for.')
+@click.option('--log', default='warning', show_default=True,
+              type=click.Choice(['debug', 'info', 'output', 'warning', 'error', 'critical']),
+              help='Set the log level.')
+def placement(cores, top, n_verify, duration, log, **values):
+    """Find the best FPGA levels with the queueing model."""
+    logger = configure_logging(log)
+
+    points = candidates(values)
+    prediction = evaluate(points, cores)
+    logger.info('Predicted %d candidates', len(points))
+
+    # Measurements of the verified candidates, by index, since objectives may share candidates
+    verified = {}
+    for objective in sorted(OBJECTIVES):
+        ranked = rank(prediction, objective, max(top, n_verify))
+        click.echo('Best candidates for {}:'.format(objective))
+        click.echo(COLUMNS.format('spread', 'depth', 'level', 'fpgas', 'rate', 'latency ms',
+                                  'max rate', 'limit', 'utilisation', 'measured ms',
+                                  'measured/s'))
+        if not len(ranked):
+            click.echo('No candidate sustains its offered load.')
+        for position, i in enumerate(ranked):
+            point = points[i]
+            # Rates are per leaf, like the offered rate
+            measured_ms = measured_rate = float('nan')
+            if position < n_verify:
+                if i not in verified:
+                    logger.info('Verifying %s', point)
+                    verified[i] = verify(point, duration, log)
+                measured_ms = verified[i]['latency_mean_ms']
+                measured_rate = verified[i]['rps'] / point['spread'] ** (point['depth'] - 1)
+            elif position >= top:
+                continue
+            click.echo(ROW.format(
+                point['spread'], point['depth'], _level_of(point), int(prediction['n_fpga'][i]),
+                point['rate'], prediction['latency_ms'][i], prediction['max_rate'][i],
+                prediction['bottleneck'][i], prediction['utilisation'][i], measured_ms,
+                measured_rate))
+
+
+if __name__ == '__main__':
+    placement()
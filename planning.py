@@ -0,0 +1,165 @@
+"""
+Plan a mininet run without creating anything.
+
+plan_network counts what the mininet backend would create for a tree: its nodes, links, network
+namespaces, interfaces and qdiscs, and the processes and file descriptors Mininet holds for them.
+It also predicts how long the network takes to start and how much memory it uses, from a model
+which is linear in the number of nodes and links. The coefficients of the model are in
+CALIBRATION, and can be replaced by ones measured on the machine with a calibration file.
+
+check_plan compares a plan with the limits of the machine, so that configurations which cannot fit
+are refused before anything is created. This module only uses the standard library, so planning
+needs neither root nor mininet.
+"""
+
+import json
+import logging
+
+from tree_index import TreeIndex
+
+# Coefficients of the predictions: a base cost, plus a cost per node and per link
+CALIBRATION = {
+    # Cleanup, starting the controller, then a shell per node and tc commands per link
+    'startup_s': dict(base=3.0, per_node=0.05, per_link=0.08),
+    # The shell of each node, and the interfaces and qdiscs of each link
+    'memory_mb': dict(base=60.0, per_node=3.5, per_link=0.25),
+}
+# Mininet holds both ends of a pty for the shell of every node
+FDS_PER_NODE = 2
+# File descriptors used by Python, the controller connection and logging
+BASE_FDS = 64
+# Every interface of a TCLink gets an htb qdisc with a netem qdisc below it
+QDISCS_PER_INTERFACE = 2
+
+
+def load_calibration(path=None):
+    """Return CALIBRATION, updated with the coefficients in the given JSON file if there is one."""
+    calibration = dict((name, dict(coefficients)) for name, coefficients in CALIBRATION.items())
+    if path is not None:
+        with open(path, 'rt') as f:
+            measured = json.load(f)
+        for name, coefficients in measured.items():
+            if name not in calibration:
+                raise ValueError("Unknown prediction '{}' in calibration file '{}'.".format(
+                    name, path))
+            calibration[name].update(coefficients)
+    return calibration
+
+
+def _predict(coefficients, nodes, links):
+    return (coefficients['base'] + coefficients['per_node'] * nodes
+            + coefficients['per_link'] * links)
+
+
+def plan_network(spread, depth, fpga=None, calibration=None, placements=None, shards=1,
+                 shard_level=None, aggregate_level=None):
+    """Return the counts of what the mininet backend would create for the given tree (with the
+    given placements of FPGA hosts instead of the fpga level, see TreeIndex), and the predicted
+    startup time (s) and memory (MB) of the network.
+
+    With more than one shard (see sharding.Partition), the open files are those of the process of
+    the largest shard, and the shards start in parallel, so the startup time is that of the
+    largest shard and of joining the shards. aggregate_level only counts the nodes which an
+    aggregation.Aggregation at that level builds."""
+    from aggregation import Aggregation
+    from sharding import Partition
+
+    if calibration is None:
+        calibration = CALIBRATION
+    index = TreeIndex(spread, depth, fpga, placements)
+    switches, leaves = index.n_switches, index.n_leaves
+    if aggregate_level is not None:
+        if shards > 1:
+            raise ValueError('An aggregated network can not be sharded.')
+        aggregation = Aggregation(index, aggregate_level)
+        leaves = len(aggregation.representatives())
+        switches = len(aggregation.nodes()) - leaves - index.n_fpga - 1
+    hosts = leaves + index.n_fpga + 1
+    nodes = switches + hosts
+    # Every node but the root switch has a link above it
+    links = nodes - 1
+    interfaces = 2 * links
+    # Nodes and links of the process of the largest shard, and links joining the shards
+    shard_nodes, shard_links, tunnels = nodes, links, 0
+    if shards > 1:
+        partition = Partition(index, shards, shard_level)
+        tunnels = partition.n_roots
+        # Every node of a shard but the roots of its subtrees has its link above it in the shard
+        shard_nodes, shard_links = max(
+            (len(partition.nodes(shard)), len(partition.nodes(shard)) - len(partition.roots(shard)))
+            for shard in range(1, shards))
+        root_nodes = len(partition.nodes(0))
+        if root_nodes > shard_nodes:
+            shard_nodes, shard_links = root_nodes, root_nodes - 1
+    return dict(
+        shards=shards,
+        switches=switches,
+        hosts=hosts,
+        nodes=nodes,
+        links=links,
+        # Switches share the root namespace, and every host has its own
+        namespaces=hosts,
+        interfaces=interfaces,
+        qdiscs=QDISCS_PER_INTERFACE * interfaces,
+        # A shell for every node, and the controller (and process) of every shard
+        processes=nodes + 2 * shards - 1,
+        open_files=BASE_FDS + FDS_PER_NODE * shard_nodes,
+        startup_s=(_predict(calibration['startup_s'], shard_nodes, shard_links)
+                   + calibration['startup_s']['per_link'] * tunnels),
+        memory_mb=(_predict(calibration['memory_mb'], nodes, links)
+                   + calibration['memory_mb']['base'] * (shards - 1)),
+    )
+
+
+def available_memory(path='/proc/meminfo'):
+    """Return the memory available for new processes in MB, or None if it is unknown."""
+    try:
+        with open(path, 'rt') as f:
+            for line in f:
+                name, value = line.split(':', 1)
+                if name == 'MemAvailable':
+                    return int(value.split()[0]) / 1024.0
+    except (IOError, ValueError):
+        pass
+    return None
+
+
+def machine_limits():
+    """Return the limits of this machine on what a network can use, None meaning unlimited or
+    unknown."""
+    import resource
+
+    def soft_limit(limit):
+        soft, _ = resource.getrlimit(limit)
+        return None if soft == resource.RLIM_INFINITY else soft
+
+    return dict(
+        open_files=soft_limit(resource.RLIMIT_NOFILE),
+        processes=soft_limit(resource.RLIMIT_NPROC),
+        memory_mb=available_memory(),
+    )
+
+
+def check_plan(plan, limits):
+    """Return a description of every limit the planned network would exceed."""
+    problems = []
+    descriptions = dict(open_files='open files', processes='processes',
+                        memory_mb='MB of available memory')
+    for name in sorted(limits):
+        if limits[name] is not None and plan[name] > limits[name]:
+            problems.append('needs {:.0f} {} but only {:.0f} are available'.format(
+                plan[name], descriptions[name], limits[name]))
+    return problems
+
+
+def log_plan(plan):
+    """Log the counts and predictions of a plan."""
+    logger = logging.getLogger(__name__)
+    logger.info('Switches: %d, hosts: %d, links: %d', plan['switches'], plan['hosts'],
+                plan['links'])
+    logger.info('Network namespaces: %d, interfaces: %d, qdiscs: %d', plan['namespaces'],
+                plan['interfaces'], plan['qdiscs'])
+    logger.info('Processes: %d, open files: %d%s', plan['processes'], plan['open_files'],
+                ' per shard ({} shards)'.format(plan['shards']) if plan['shards'] > 1 else '')
+    logger.info('Predicted startup time: %.1f s, memory: %.0f MB', plan['startup_s'],
+                plan['memory_mb'])
@@ -0,0 +1,160 @@
+"""
+Queueing model of the compute services of a TreeTopoGeneric topology.
+
+Every leaf sends requests at the same rate to the FPGA host above it, or to the cloud if there are
+no FPGA hosts (as workload.run_workload does), and each FPGA host or the cloud serves them as an
+M/M/c queue: Poisson arrivals, exponential service times and c pipelines (see rpc_agent). The model
+predicts the mean latency of a request at a given offered load, from the delays and serialisation
+on the links of its path plus its wait for and time in a pipeline, and the highest rate each leaf
+can send at before a pipeline or a link saturates.
+
+Every function takes arrays of parameters (one entry per candidate network) and evaluates them all
+at once, so placement can compare thousands of candidates. Queues of requests on links are not
+modelled: links only limit the sustainable rate.
+"""
+
+import multiprocessing
+
+import numpy as np
+
+from parameters import CLOUD_LINK_OPTS, delay_to_seconds, link_options
+
+# Bytes added to the payload of each request and response: IP and TCP headers, and the header of
+# the rpc_agent protocol
+REQUEST_OVERHEAD = 20 + 20 + 12
+RESPONSE_OVERHEAD = 20 + 20 + 12
+
+# Link values of each distinct set of link parameters, which candidates share
+_link_values = {}
+
+
+def erlang_c(servers, load):
+    """Return the probability that a request waits in an M/M/c queue with the given numbers of
+    servers and offered loads (arrival rate / service rate of a server, in Erlangs).
+
+    Saturated queues (load >= servers) always wait."""
+    servers, load = np.broadcast_arrays(np.asarray(servers, dtype=int),
+                                        np.asarray(load, dtype=float))
+    # Erlang B by its recurrence over the number of servers, stopping at each queue's own number
+    blocking = np.ones(servers.shape)
+    for k in range(1, int(servers.max()) + 1 if servers.size else 1):
+        blocking = np.where(k <= servers, load * blocking / (k + load * blocking), blocking)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        utilisation = load / servers
+        waiting = blocking / (1 - utilisation * (1 - blocking))
+    return np.where(utilisation < 1, waiting, 1.0)
+
+
+def mmc(arrival_rate, service_rate, servers):
+    """Return the utilisation, probability of waiting, mean wait and mean response time (s) of
+    M/M/c queues, which are infinite for saturated queues.
+
+    Queues with no servers answer at once."""
+    arrival_rate, service_rate, servers = np.broadcast_arrays(
+        np.asarray(arrival_rate, dtype=float), np.asarray(service_rate, dtype=float),
+        np.asarray(servers, dtype=int))
+    instant = servers == 0
+    capacity = np.where(instant, np.inf, servers * service_rate)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        utilisation = np.where(instant, 0.0, arrival_rate / capacity)
+        waiting = np.where(instant, 0.0, erlang_c(servers, arrival_rate / service_rate))
+        stable = utilisation < 1
+        wait = np.where(instant, 0.0,
+                        np.where(stable, waiting / (capacity - arrival_rate), np.inf))
+        response = np.where(instant, 0.0, wait + 1 / service_rate)
+    return dict(utilisation=utilisation, wait_probability=waiting, wait=wait, response=response)
+
+
+def link_values(bandwidth, delay, fpga_bandwidth=None, fpga_delay=None):
+    """Return the (delay in s, bandwidth in bits/s) of the standard, FPGA and cloud links built by
+    TreeTopoGeneric with the given parameters, remembering them for the next candidates."""
+    key = (bandwidth, delay, fpga_bandwidth, fpga_delay)
+    if key not in _link_values:
+        options = link_options(bandwidth, delay, 0, fpga_bandwidth, fpga_delay, 0)[:2]
+        values = [(delay_to_seconds(opts['delay']), float(opts['bw']) * 1e6 if opts['bw']
+                   else np.inf) for opts in options + (CLOUD_LINK_OPTS,)]
+        _link_values[key] = values
+    return _link_values[key]
+
+
+def _floats(value):
+    """Return an array of objects as a flat array of floats, with None as NaN."""
+    return np.array([np.nan if item is None else float(item) for item in value.ravel()])
+
+
+def predict(spread, depth, fpga, bandwidth, delay, fpga_bandwidth, fpga_delay, rate, request_size,
+            response_size, fpga_service_time, fpga_pipelines, cloud_service_time, cloud_pipelines,
+            fpga_cpu=None, cloud_cpu=None, cores=None):
+    """Predict the latency and sustainable rate of RPC workloads on candidate networks.
+
+    Every parameter is an array with an entry per candidate (or a scalar shared by all of them).
+    fpga is the FPGA level, NaN or None for the cloud; rate is the requests per second each leaf
+    sends; service times are the mean CPU time per request in seconds; and cpu is the fraction of
+    the CPU of a machine with the given number of cores each host may use, None or NaN for no limit.
+
+    Returns a dict of arrays: the mean latency in ms and its network, wait and service parts, the
+    utilisation and probability of waiting of the pipelines, the number of FPGA hosts, the highest
+    rate per leaf which neither the pipelines nor the links saturate, and which of them saturate
+    first ('compute' or 'link')."""
+    if cores is None:
+        cores = multiprocessing.cpu_count()
+    parameters = np.broadcast_arrays(*[np.asarray(value, dtype=object) for value in (
+        spread, depth, fpga, rate, request_size, response_size, fpga_service_time, fpga_pipelines,
+        cloud_service_time, cloud_pipelines, fpga_cpu, cloud_cpu, bandwidth, delay,
+        fpga_bandwidth, fpga_delay)])
+    shape = parameters[0].shape
+    (spread, depth, fpga, rate, request_size, response_size, fpga_service_time, fpga_pipelines,
+     cloud_service_time, cloud_pipelines, fpga_cpu, cloud_cpu) = [
+        _floats(value) for value in parameters[:12]]
+    links = np.array([link_values(*key) for key in zip(*[value.ravel()
+                                                         for value in parameters[12:]])])
+    (link_delay, link_bandwidth), (fpga_link_delay, fpga_link_bandwidth), \
+        (cloud_link_delay, cloud_link_bandwidth) = [links[:, i, :].T for i in range(3)]
+
+    # FPGA levels at or below the leaves have no FPGA hosts, like in TreeIndex
+    cloud = np.isnan(fpga) | (fpga >= depth - 1)
+    level = np.where(cloud, 0, fpga)
+    n_leaves = spread ** (depth - 1)
+    # Leaves served by each FPGA host or the cloud, and crossing the busiest standard link
+    served = np.where(cloud, n_leaves, spread ** (depth - 1 - level))
+    standard_links = np.where(cloud, depth - 1, depth - 1 - level)
+    busiest_served = served / spread
+    target_delay = np.where(cloud, cloud_link_delay, fpga_link_delay)
+    target_bandwidth = np.where(cloud, cloud_link_bandwidth, fpga_link_bandwidth)
+
+    # Requests cross every link of the path one way and responses the other way
+    request_bits = (request_size + REQUEST_OVERHEAD) * 8
+    response_bits = (response_size + RESPONSE_OVERHEAD) * 8
+    network = (2 * (standard_links * link_delay + target_delay)
+               + (request_bits + response_bits)
+               * (standard_links / link_bandwidth + 1 / target_bandwidth))
+
+    # Pipelines which share less CPU than they need run proportionally slower
+    pipelines = np.where(cloud, cloud_pipelines, fpga_pipelines)
+    cpu = np.where(cloud, cloud_cpu, fpga_cpu)
+    speed = np.where(np.isnan(cpu), 1.0,
+                     np.minimum(1.0, cpu * cores / np.maximum(pipelines, 1)))
+    service_time = np.where(cloud, cloud_service_time, fpga_service_time) / speed
+    with np.errstate(divide='ignore'):
+        service_rate = 1 / service_time
+    queue = mmc(served * rate, service_rate, pipelines)
+
+    bits = np.maximum(request_bits, response_bits)
+    link_rate = np.minimum(link_bandwidth / (bits * busiest_served),
+                           target_bandwidth / (bits * served))
+    compute_rate = np.where(pipelines == 0, np.inf, pipelines * service_rate / served)
+    max_rate = np.minimum(link_rate, compute_rate)
+    latency = np.where(rate < link_rate, network + queue['response'], np.inf)
+
+    prediction = dict(
+        latency_ms=latency * 1e3,
+        network_ms=network * 1e3,
+        wait_ms=queue['wait'] * 1e3,
+        service_ms=np.where(pipelines == 0, 0.0, service_time * 1e3),
+        utilisation=queue['utilisation'],
+        wait_probability=queue['wait_probability'],
+        n_fpga=np.where(cloud, 0, spread ** level),
+        max_rate=max_rate,
+        bottleneck=np.where(compute_rate <= link_rate, 'compute', 'link'),
+    )
+    return dict((name, value.reshape(shape)) for name, value in prediction.items())
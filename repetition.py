@@ -0,0 +1,119 @@
+"""
+Probes repeated in batches until their estimates converge.
+
+A probe run a fixed number of times (the 10 echo requests of the cloud_fpga ping, one iperf, one
+workload) wastes time on a network whose measurements hardly vary, and gives unreliable averages
+on one with lossy links or --poisson delays. repeat runs a probe a batch at a time instead, and
+after each batch computes the Student t confidence interval of the mean of every sample so far. It
+stops once the half-width of the interval is within a fraction of the mean, or after a maximum
+number of batches, so the time goes where the variance is.
+
+The measurement of a repeated probe records the batches run, the half-width and confidence of the
+interval of its estimate, and whether it converged.
+"""
+
+import logging
+import math
+
+DEFAULT_CONFIDENCE = 0.95
+DEFAULT_MAX_BATCHES = 10
+# Iterations and tolerance of the continued fraction of the incomplete beta function
+BETA_ITERATIONS = 200
+BETA_EPSILON = 1e-12
+BETA_TINY = 1e-300
+# Bisection steps of t_quantile
+QUANTILE_STEPS = 100
+
+
+def _beta_fraction(a, b, x):
+    """Evaluate the continued fraction of the regularised incomplete beta function by Lentz's
+    method."""
+    def clamp(value):
+        return value if abs(value) > BETA_TINY else BETA_TINY
+
+    c = 1.0
+    d = 1.0 / clamp(1.0 - (a + b) * x / (a + 1))
+    fraction = d
+    for m in range(1, BETA_ITERATIONS + 1):
+        even = m * (b - m) * x / ((a + 2 * m - 1) * (a + 2 * m))
+        d = 1.0 / clamp(1.0 + even * d)
+        c = clamp(1.0 + even / c)
+        fraction *= d * c
+        odd = -(a + m) * (a + b + m) * x / ((a + 2 * m) * (a + 2 * m + 1))
+        d = 1.0 / clamp(1.0 + odd * d)
+        c = clamp(1.0 + odd / c)
+        fraction *= d * c
+        if abs(d * c - 1.0) < BETA_EPSILON:
+            break
+    return fraction
+
+
+def incomplete_beta(a, b, x):
+    """Return the regularised incomplete beta function I_x(a, b)."""
+    if x <= 0:
+        return 0.0
+    if x >= 1:
+        return 1.0
+    front = math.exp(math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b) + a * math.log(x)
+                     + b * math.log1p(-x))
+    if x < (a + 1) / (a + b + 2):
+        return front * _beta_fraction(a, b, x) / a
+    return 1.0 - front * _beta_fraction(b, a, 1.0 - x) / b
+
+
+def t_cdf(t, df):
+    """Return the cumulative distribution function of Student's t distribution at t."""
+    tail = 0.5 * incomplete_beta(df / 2.0, 0.5, df / (df + t * t))
+    return 1.0 - tail if t > 0 else tail
+
+
+def t_quantile(p, df):
+    """Return the p quantile of Student's t distribution with df degrees of freedom, for p of at
+    least 0.5."""
+    low, high = 0.0, 1.0
+    while t_cdf(high, df) < p:
+        low, high = high, high * 2
+    for _ in range(QUANTILE_STEPS):
+        middle = (low + high) / 2
+        if t_cdf(middle, df) < p:
+            low = middle
+        else:
+            high = middle
+    return (low + high) / 2
+
+
+def confidence_interval(samples, confidence=DEFAULT_CONFIDENCE):
+    """Return the mean of samples and the half-width of its Student t confidence interval, which is
+    NaN with fewer than two samples."""
+    count = len(samples)
+    if not count:
+        return float('nan'), float('nan')
+    mean = sum(samples) / float(count)
+    if count < 2:
+        return mean, float('nan')
+    variance = sum((sample - mean) ** 2 for sample in samples) / (count - 1)
+    return mean, t_quantile((1 + confidence) / 2.0, count - 1) * math.sqrt(variance / count)
+
+
+def repeat(probe, width, confidence=DEFAULT_CONFIDENCE, max_batches=DEFAULT_MAX_BATCHES):
+    """Run probe, which returns a list of samples, a batch at a time until the confidence interval
+    of the mean of the samples is within width (a fraction) of the mean, or max_batches batches
+    have run.
+
+    Returns the samples, and the batches run, the half-width and confidence of the interval and
+    whether it converged as fields of a measurement."""
+    logger = logging.getLogger(__name__)
+    samples = []
+    batches = 0
+    converged = False
+    half_width = float('nan')
+    while batches < max_batches and not converged:
+        samples.extend(probe())
+        batches += 1
+        mean, half_width = confidence_interval(samples, confidence)
+        # A NaN half-width never converges
+        converged = half_width <= width * abs(mean)
+        logger.debug('Batch %d: %d samples, mean %g +- %g', batches, len(samples), mean,
+                     half_width)
+    return samples, dict(batches=batches, ci_half_width=half_width, ci_confidence=confidence,
+                         converged=converged)
@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+"""
+A local SQLite cache of the measurements of runs of fpga_switch_model.
+
+Every run is keyed by a hash of its normalised parameters: delays in seconds, the options of the
+links as parameters.link_options derives them (so '--fpga-delay 2ms' and the default of a 1ms
+tree, which both give FPGA links of 1ms, are the same run), the placements, the tests and their
+options (with the contents rather than the path of a --replay trace), the seed of --poisson, and
+the version of the code. A later run with the same key is
+served from the cache instead of building the network again.
+
+Runs whose results can not be repeated are not cached: --poisson without a --seed (or split
+between shards, which draw their own delays), runs which write a --latency-output or
+--telemetry-output file, and runs of code outside a git checkout, whose version is unknown.
+
+The measurements of each run are stored with its parameters, and a record of each (see
+results.FIELDS) in a table which `result_cache.py` lists or aggregates with SQL.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import subprocess
+import time
+
+import click
+
+from parameters import VALID_TIME, delay_to_seconds, link_options
+from results import FIELD_NAMES, FIELDS, json_safe
+
+# Where results are cached unless --cache says otherwise
+DEFAULT_CACHE = os.path.join(os.path.expanduser('~'), '.cache', 'fpga_switch_model',
+                             'results.sqlite')
+# Version of the normalised parameters, changed whenever a key would mean something else
+KEY_VERSION = 1
+# Columns of the runs listed by the cache command
+LIST_FIELDS = ('backend', 'spread', 'depth', 'fpga', 'delay_ms', 'poisson')
+# Bytes of a file read at a time to hash it
+DIGEST_CHUNK_BYTES = 1 << 20
+
+
+def code_version():
+    """Return the git commit of the code, with a hash of its uncommitted changes if there are any,
+    or '' outside of a git checkout."""
+    directory = os.path.dirname(os.path.abspath(__file__))
+    try:
+        with open(os.devnull, 'w') as devnull:
+            commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=devnull,
+                                             cwd=directory).decode().strip()
+            diff = subprocess.check_output(['git', 'diff', 'HEAD', '--', '*.py'], stderr=devnull,
+                                           cwd=directory)
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+    return commit + ('+' + hashlib.sha1(diff).hexdigest()[:12] if diff else '')
+
+
+def file_digest(path):
+    """Return the sha256 of the contents of a file, read a chunk at a time."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(DIGEST_CHUNK_BYTES), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def normalise(value):
+    """Return a value in a canonical form for a key: delays and times in seconds, and every other
+    number as a float."""
+    if isinstance(value, dict):
+        return dict((str(name), normalise(item)) for name, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return [normalise(item) for item in value]
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, (int, float)):
+        return float(value)
+    if VALID_TIME.match(str(value)):
+        return delay_to_seconds(value)
+    return value
+
+
+def run_parameters(backend, spread, depth, bandwidth, delay, loss, fpga, fpga_bandwidth,
+                   fpga_delay, fpga_loss, poisson, ping_all, iperf, cloud_fpga, workload=None,
+                   compute=None, placements=None, shards=1, shard_level=None, iperf_flows=None,
+                   latency=None, telemetry=None, seed=None, replay=None, repetition=None,
+                   aggregate_level=None):
+    """Return the normalised parameters which identify a run of fpga_switch_model.run, or None if
+    its results can not be repeated and must not be cached."""
+    if poisson and (seed is None or shards > 1):
+        return None
+    if any(options is not None and options.get('output') for options in (latency, telemetry)):
+        return None
+    version = code_version()
+    if not version:
+        return None
+
+    if poisson:
+        import numpy as np
+
+        # The delays the run will draw, as run seeds NumPy before building the network
+        np.random.seed(seed)
+    if replay is not None:
+        replay = dict(replay, trace=file_digest(replay['trace']))
+    links = link_options(bandwidth, delay, loss, fpga_bandwidth, fpga_delay, fpga_loss, poisson)
+    return normalise(dict(
+        key_version=KEY_VERSION, code_version=version, backend=backend, spread=spread,
+        depth=depth, fpga=fpga, links=links, poisson=bool(poisson), seed=seed if poisson else None,
+        placements=placements or [],
+        tests=dict(ping_all=bool(ping_all), iperf=bool(iperf), cloud_fpga=bool(cloud_fpga),
+                   workload=workload, replay=replay,
+                   compute=compute if workload is not None or replay is not None else None,
+                   iperf_flows=iperf_flows, latency=latency, telemetry=telemetry,
+                   repetition=repetition),
+        shards=shards, shard_level=shard_level if shards > 1 else None,
+        aggregate_level=aggregate_level))
+
+
+def run_key(parameters):
+    """Return the key of the normalised parameters of a run."""
+    text = json.dumps(parameters, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class ResultCache(object):
+    """The measurements of runs in an SQLite database, by the keys of their parameters."""
+
+    def __init__(self, path=DEFAULT_CACHE):
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.connection = sqlite3.connect(path)
+        columns = ', '.join('{} {}'.format(name, 'TEXT' if kind is str else 'REAL')
+                            for name, kind in FIELDS)
+        with self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS runs (key TEXT PRIMARY KEY, created REAL, '
+                'code_version TEXT, parameters TEXT, measurements TEXT)')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS records (key TEXT, {})'.format(
+                columns))
+            self.connection.execute('CREATE INDEX IF NOT EXISTS records_key ON records (key)')
+            # Caches made before fields were added to results.FIELDS lack their columns
+            existing = set(row[1] for row in self.connection.execute(
+                'PRAGMA table_info(records)'))
+            for name, kind in FIELDS:
+                if name not in existing:
+                    self.connection.execute('ALTER TABLE records ADD COLUMN {} {}'.format(
+                        name, 'TEXT' if kind is str else 'REAL'))
+
+    def get(self, key):
+        """Return the measurements of the run with a key, or None if it is not cached."""
+        row = self.connection.execute('SELECT measurements FROM runs WHERE key = ?',
+                                      (key,)).fetchone()
+        if row is None:
+            return None
+        return [dict((name, float('nan') if value is None else value)
+                     for name, value in measurement.items())
+                for measurement in json.loads(row[0])]
+
+    def put(self, key, parameters, measurements, records):
+        """Store the measurements of a run and their records, replacing any of the same key."""
+        with self.connection:
+            self.connection.execute('DELETE FROM records WHERE key = ?', (key,))
+            self.connection.execute(
+                'INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?)',
+                (key, time.time(), parameters['code_version'], json.dumps(parameters),
+                 json.dumps([json_safe(measurement) for measurement in measurements])))
+            self.connection.executemany(
+                'INSERT INTO records (key, {}) VALUES ({})'.format(
+                    ', '.join(FIELD_NAMES), ', '.join('?' * (len(FIELDS) + 1))),
+                [[key] + [record[name] for name in FIELD_NAMES]
+                 for record in (json_safe(record) for record in records)])
+
+    def runs(self, where=()):
+        """Return (key, created, number of records, first record) of the cached runs with records
+        matching every (field, value) of where, oldest first."""
+        condition, values = _condition(where)
+        rows = self.connection.execute(
+            'SELECT runs.key, runs.created, COUNT(records.key), {} FROM runs LEFT JOIN records '
+            'ON runs.key = records.key {} GROUP BY runs.key ORDER BY runs.created'.format(
+                ', '.join('records.' + name for name in LIST_FIELDS), condition), values)
+        return [(row[0], row[1], row[2], dict(zip(LIST_FIELDS, row[3:]))) for row in rows]
+
+    def aggregate(self, fields, group_by=(), where=()):
+        """Return a row for every combination of the values of the group_by fields among the
+        records matching where: those values, the number of records, and the mean, minimum and
+        maximum of each of the fields."""
+        for name in tuple(fields) + tuple(group_by):
+            if name not in FIELD_NAMES:
+                raise ValueError("Unknown field '{}'.".format(name))
+        condition, values = _condition(where)
+        columns = list(group_by) + ['COUNT(*)'] + [
+            '{}({})'.format(function, name) for name in fields for function in ('AVG', 'MIN',
+                                                                               'MAX')]
+        query = 'SELECT {} FROM records {}'.format(', '.join(columns), condition)
+        if group_by:
+            query += ' GROUP BY {0} ORDER BY {0}'.format(', '.join(group_by))
+        return [tuple(row) for row in self.connection.execute(query, values)]
+
+    def close(self):
+        self.connection.close()
+
+
+def _condition(where):
+    """Return the WHERE clause and its values matching every (field, value) of where."""
+    for name, _ in where:
+        if name not in FIELD_NAMES:
+            raise ValueError("Unknown field '{}'.".format(name))
+    if not where:
+        return '', []
+    kinds = dict(FIELDS)
+    return ('WHERE ' + ' AND '.join('records.{} = ?'.format(name) for name, _ in where),
+            [kinds[name](value) for name, value in where])
+
+
+def parse_where(ctx, param, value):
+    """Parse NAME=VALUE conditions into (field, value) pairs."""
+    where = []
+    for text in value:
+        name, equals, field_value = text.partition('=')
+        if not equals:
+            raise click.BadParameter("'{}' is not NAME=VALUE.".format(text))
+        where.append((name.strip().replace('-', '_'), field_value.strip()))
+    return where
+
+
+@click.command()
+@click.option('--cache', 'path', type=click.Path(dir_okay=False), default=DEFAULT_CACHE,
+              show_default=True, help='SQLite file of the cached results.')
+@click.option('-w', '--where', multiple=True, callback=parse_where,
+              help='Only use the records whose FIELD is VALUE, as FIELD=VALUE (e.g. '
+                   'test=ping_all). May be given more than once.')
+@click.option('-g', '--group-by', multiple=True,
+              help='Aggregate the records of each value of this field. May be given more than '
+                   'once.')
+@click.option('-a', '--aggregate', 'fields', multiple=True,
+              help='Report the mean, minimum and maximum of this field of the records, instead of '
+                   'listing the runs. May be given more than once.')
+@click.option('--log', default='info', show_default=True,
+              type=click.Choice(['debug', 'info', 'output', 'warning', 'error', 'critical']),
+              help='Set the log level.')
+def cache(path, where, group_by, fields, log):
+    """List the cached runs of fpga_switch_model, or aggregate the records of their
+    measurements."""
+    from fpga_switch_model import configure_logging
+
+    configure_logging(log)
+    if not os.path.exists(path):
+        raise click.ClickException("There is no cache at '{}'.".format(path))
+    results = ResultCache(path)
+    try:
+        if fields or group_by:
+            try:
+                rows = results.aggregate(fields or ('rtt_avg',), group_by, where)
+            except ValueError as ex:
+                raise click.BadParameter(str(ex))
+            click.echo(' '.join(['{:>12}'.format(name) for name in group_by] + ['{:>8}'.format(
+                'records')] + ['{:>12}'.format('{} {}'.format(function, name)) for name in fields
+                               or ('rtt_avg',) for function in ('mean', 'min', 'max')]))
+            for row in rows:
+                click.echo(' '.join('{:>12}'.format(_format(value)) if i != len(group_by)
+                                    else '{:>8}'.format(value) for i, value in enumerate(row)))
+            return
+        try:
+            runs = results.runs(where)
+        except ValueError as ex:
+            raise click.BadParameter(str(ex))
+        for key, created, records, first in runs:
+            click.echo('{} {} {:>4} records  {}'.format(
+                key[:12], time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(created)), records,
+                ' '.join('{}={}'.format(name, _format(first[name])) for name in LIST_FIELDS)))
+        logging.getLogger(__name__).info('%d runs cached in %s', len(runs), path)
+    finally:
+        results.close()
+
+
+def _format(value):
+    if value is None:
+        return '-'
+    if isinstance(value, float):
+        return '{:g}'.format(value)
+    return str(value)
+
+
+if __name__ == '__main__':
+    cache()
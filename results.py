@@ -0,0 +1,322 @@
+"""
+Typed measurement records, and sinks which stream them to disk.
+
+Every measurement is a flat record of the fields in FIELDS: the test which was run, the network
+parameters, a timestamp and the measured values. Values which a test does not measure are NaN
+(or empty strings).
+
+Records can be appended to CSV (.csv), JSON lines (.jsonl) and chunked NPZ (.npz) files. The NPZ
+sink stores each column of every chunk of records as its own array of the archive, so thousands
+of runs load with load_npz as NumPy columns without parsing any text.
+"""
+
+import csv
+import io
+import json
+import math
+import os
+import re
+import time
+import zipfile
+
+from parameters import delay_to_seconds, format_placement
+
+# Fields of a record, and whether each holds text (str) or a number (float)
+FIELDS = (
+    ('timestamp', float),
+    ('backend', str),
+    ('test', str),
+    ('src', str),
+    ('dst', str),
+    ('spread', float),
+    ('depth', float),
+    ('bandwidth', float),
+    ('delay_ms', float),
+    ('loss', float),
+    ('fpga', float),
+    ('fpga_bandwidth', float),
+    ('fpga_delay_ms', float),
+    ('fpga_loss', float),
+    ('poisson', float),
+    ('transmitted', float),
+    ('received', float),
+    ('loss_percent', float),
+    ('rtt_min', float),
+    ('rtt_avg', float),
+    ('rtt_max', float),
+    ('rtt_mdev', float),
+    ('throughput_mbps', float),
+    ('client_throughput_mbps', float),
+    ('workload', str),
+    ('rate', float),
+    ('connections', float),
+    ('requests', float),
+    ('completed', float),
+    ('rejected', float),
+    ('errors', float),
+    ('rps', float),
+    ('latency_mean_ms', float),
+    ('latency_p50_ms', float),
+    ('latency_p99_ms', float),
+    ('latency_p999_ms', float),
+    ('placement', str),
+    ('retransmits', float),
+    ('flows', float),
+    ('jain_index', float),
+    ('method', str),
+    ('probes', float),
+    ('latency_error_ms', float),
+    ('peak_mbps', float),
+    ('drops', float),
+    ('backlog_max', float),
+    ('samples', float),
+    ('flow', str),
+    ('speed', float),
+    ('batches', float),
+    ('ci_half_width', float),
+    ('ci_confidence', float),
+    ('converged', float),
+    ('aggregate_level', float),
+    ('leaf_weight', float),
+)
+FIELD_NAMES = tuple(name for name, _ in FIELDS)
+
+PING_PACKETS = re.compile(r'(\d+) packets transmitted, (\d+) (?:packets )?received')
+PING_LOSS = re.compile(r'([0-9.]+)% packet loss')
+PING_RTT = re.compile(r'rtt min/avg/max/mdev = ([0-9.]+)/([0-9.]+)/([0-9.]+)/([0-9.]+) ms')
+PING_REPLY = re.compile(r'^\d+ bytes from .* time=([0-9.]+) ms', re.MULTILINE)
+RATE = re.compile(r'^\s*([0-9.]+)\s*([KMG]?)bits/sec\s*$')
+RATE_UNITS = {'': 1e-6, 'K': 1e-3, 'M': 1.0, 'G': 1e3}
+
+
+def parse_ping(output):
+    """Parse the statistics at the end of the output of ping into a dict of measurements.
+
+    The RTTs (in ms) are NaN if no echo replies were received."""
+    measurement = dict(transmitted=float('nan'), received=float('nan'),
+                       loss_percent=float('nan'), rtt_min=float('nan'), rtt_avg=float('nan'),
+                       rtt_max=float('nan'), rtt_mdev=float('nan'))
+    packets = PING_PACKETS.search(output)
+    if packets:
+        measurement['transmitted'] = float(packets.group(1))
+        measurement['received'] = float(packets.group(2))
+    loss = PING_LOSS.search(output)
+    if loss:
+        measurement['loss_percent'] = float(loss.group(1))
+    rtt = PING_RTT.search(output)
+    if rtt:
+        for i, name in enumerate(('rtt_min', 'rtt_avg', 'rtt_max', 'rtt_mdev')):
+            measurement[name] = float(rtt.group(i + 1))
+    return measurement
+
+
+def parse_ping_rtts(output):
+    """Return the RTT (in ms) of every echo reply in the output of ping."""
+    return [float(rtt) for rtt in PING_REPLY.findall(output)]
+
+
+def combine_pings(outputs):
+    """Parse the outputs of several pings between the same hosts into a dict of measurements, as
+    parse_ping would parse the output of a single ping sending all of their echo requests."""
+    pings = [parse_ping(output) for output in outputs]
+    rtts = [rtt for output in outputs for rtt in parse_ping_rtts(output)]
+    transmitted = sum(ping['transmitted'] for ping in pings)
+    received = sum(ping['received'] for ping in pings)
+    measurement = dict(transmitted=transmitted, received=received,
+                       loss_percent=(100.0 * (transmitted - received) / transmitted
+                                     if transmitted else float('nan')),
+                       rtt_min=float('nan'), rtt_avg=float('nan'), rtt_max=float('nan'),
+                       rtt_mdev=float('nan'))
+    if rtts:
+        mean = sum(rtts) / len(rtts)
+        measurement.update(rtt_min=min(rtts), rtt_avg=mean, rtt_max=max(rtts),
+                           rtt_mdev=max(sum(rtt * rtt for rtt in rtts) / len(rtts) - mean * mean,
+                                        0) ** 0.5)
+    return measurement
+
+
+def parse_rate(rate):
+    """Convert a rate reported by iperf, such as '9.57 Mbits/sec', into Mbps."""
+    match = RATE.match(rate)
+    if not match:
+        return float('nan')
+    return float(match.group(1)) * RATE_UNITS[match.group(2)]
+
+
+def _number(value):
+    if value is None:
+        return float('nan')
+    return float(value)
+
+
+def make_record(measurement, backend=None, spread=None, depth=None, bandwidth=None, delay=None,
+                loss=None, fpga=None, fpga_bandwidth=None, fpga_delay=None, fpga_loss=None,
+                poisson=None, timestamp=None):
+    """Return a complete record of a measurement taken on a network with the given parameters.
+
+    Values of None, as json_safe leaves them, are missing values."""
+    record = dict((name, '' if kind is str else float('nan')) for name, kind in FIELDS)
+    record.update(
+        timestamp=time.time() if timestamp is None else timestamp,
+        backend=backend or '',
+        spread=_number(spread),
+        depth=_number(depth),
+        bandwidth=_number(bandwidth),
+        delay_ms=float('nan') if delay is None else delay_to_seconds(delay) * 1e3,
+        loss=_number(loss),
+        fpga=_number(fpga),
+        fpga_bandwidth=_number(fpga_bandwidth),
+        fpga_delay_ms=float('nan') if fpga_delay is None else delay_to_seconds(fpga_delay) * 1e3,
+        fpga_loss=_number(fpga_loss),
+        poisson=float(bool(poisson)),
+    )
+    for name, kind in FIELDS:
+        if measurement.get(name) is not None:
+            record[name] = kind(measurement[name])
+    return record
+
+
+def placement_fields(placement):
+    """Return the fields of the measurements of a placement (see parameters.placement_options)
+    which differ from the network parameters: the placement itself, its level and the link options
+    it overrides."""
+    fields = dict(placement=format_placement(placement), fpga=placement['level'])
+    if placement.get('bandwidth') is not None:
+        fields['fpga_bandwidth'] = placement['bandwidth']
+    if placement.get('delay') is not None:
+        fields['fpga_delay_ms'] = delay_to_seconds(placement['delay']) * 1e3
+    if placement.get('loss') is not None:
+        fields['fpga_loss'] = placement['loss']
+    return fields
+
+
+def json_safe(measurement):
+    """Return a copy of a measurement or record with NaN values replaced by None."""
+    return dict((name, None if isinstance(value, float) and math.isnan(value) else value)
+                for name, value in measurement.items())
+
+
+class CsvSink(object):
+    """Append records to a CSV file, writing the header if the file is new."""
+
+    def __init__(self, path):
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, 'a')
+        self.writer = csv.writer(self.file)
+        if new:
+            self.writer.writerow(FIELD_NAMES)
+
+    def write(self, record):
+        self.writer.writerow([record[name] for name in FIELD_NAMES])
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class JsonLinesSink(object):
+    """Append records to a JSON lines file, with NaN written as null."""
+
+    def __init__(self, path):
+        self.file = open(path, 'a')
+
+    def write(self, record):
+        self.file.write(json.dumps(json_safe(record), sort_keys=True) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class NpzSink(object):
+    """Append records to an NPZ archive in chunks of columns.
+
+    Each chunk of chunk_size records adds one array per field to the archive, named
+    '<field>.<chunk number>', so the archive can be appended to without rewriting it."""
+
+    def __init__(self, path, chunk_size=1000):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.records = []
+        self.chunk = 0
+        if os.path.exists(path):
+            with zipfile.ZipFile(path) as archive:
+                self.chunk = len(set(name.rsplit('.', 2)[1] for name in archive.namelist()))
+
+    def write(self, record):
+        self.records.append(record)
+        if len(self.records) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        import numpy as np
+
+        if not self.records:
+            return
+        with zipfile.ZipFile(self.path, 'a', zipfile.ZIP_DEFLATED, allowZip64=True) as archive:
+            for name, kind in FIELDS:
+                column = np.array([record[name] for record in self.records],
+                                  dtype=np.str_ if kind is str else np.float64)
+                # ZipFile.open can't write before Python 3.6, so write each array from memory
+                buffer = io.BytesIO()
+                np.lib.format.write_array(buffer, column, allow_pickle=False)
+                archive.writestr('{}.{:06d}.npy'.format(name, self.chunk), buffer.getvalue())
+        self.chunk += 1
+        self.records = []
+
+    def close(self):
+        self.flush()
+
+
+SINKS = {
+    '.csv': CsvSink,
+    '.jsonl': JsonLinesSink,
+    '.npz': NpzSink,
+}
+
+
+def open_sink(path):
+    """Open a sink for the given file, choosing the format from its extension."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in SINKS:
+        raise ValueError("Unsupported output file '{}'. Expected one of: {}.".format(
+            path, ', '.join(sorted(SINKS))))
+    return SINKS[extension](path)
+
+
+def make_records(measurements, **parameters):
+    """Return a record of each measurement, with the given network parameters (see make_record)
+    and the same timestamp."""
+    timestamp = time.time()
+    return [make_record(measurement, timestamp=timestamp, **parameters)
+            for measurement in measurements]
+
+
+def write_records(paths, measurements, **parameters):
+    """Append a record of each measurement, with the given network parameters (see make_record),
+    to each of the given files."""
+    append_records(paths, make_records(measurements, **parameters))
+
+
+def append_records(paths, records):
+    """Append records to each of the given files."""
+    for path in paths:
+        sink = open_sink(path)
+        try:
+            for record in records:
+                sink.write(record)
+        finally:
+            sink.close()
+
+
+def load_npz(path):
+    """Load the records of an NPZ sink as a dict of NumPy columns."""
+    import numpy as np
+
+    chunks = {}
+    with np.load(path, allow_pickle=False) as data:
+        for key in sorted(data.files):
+            name, _ = key.rsplit('.', 1)
+            chunks.setdefault(name, []).append(data[key])
+    return dict((name, np.concatenate(chunks[name]) if name in chunks else np.array([]))
+                for name in FIELD_NAMES)
@@ -0,0 +1,575 @@
+#!/usr/bin/env python
+"""
+Request/response (RPC) traffic agent, run on the hosts of a network by the workload module.
+
+The server answers every request it receives on a TCP port. The client sends requests to a server
+and prints a JSON summary, with the latency of every completed request, when it finishes. It runs
+either open loop, with Poisson arrivals at a fixed rate which are sent whether or not earlier
+requests have been answered, or closed loop, with each connection sending its next request as soon
+as the response to the previous one arrives, or replays a schedule of requests (see traces), each
+sent at its own time with its own sizes, summarising each of their flows as well.
+
+A request is a header of (request id, request size, response size) followed by request size
+bytes, and its response a header of (request id, status, response size) followed by response size
+bytes. Latencies are measured from the time a request was due to be sent, so a server which falls
+behind in open loop isn't hidden by the client falling behind with it.
+
+With --pipelines, the server emulates a compute service rather than answering at once. Each
+request needs a service time drawn from a distribution, and is served by one of a number of
+pipeline processes, which spend that much CPU time on it. Requests which arrive while every
+pipeline is busy wait in a queue of bounded size, and are rejected when it is full. Since the
+pipelines use CPU time rather than sleeping, the cgroup CPU limits of a CPULimitedHost slow them
+down, so a host given less of the CPU serves fewer requests per second.
+
+The agent only needs the standard library and click, so it runs with the Python of any host.
+"""
+
+import collections
+import errno
+import json
+import mmap
+import os
+import random
+import select
+import socket
+import struct
+import sys
+import time
+
+import click
+
+REQUEST = struct.Struct('!III')
+RESPONSE = struct.Struct('!III')
+# A request of a replayed schedule: the seconds from the start it is due at, its flow, and the
+# sizes of its request and response
+SCHEDULE = struct.Struct('!dIII')
+# Statuses of responses
+OK = 0
+REJECTED = 1
+# Service time sent to a pipeline, and the byte it answers with when done
+SERVICE = struct.Struct('!d')
+DONE = b'\0'
+DISTRIBUTIONS = ('constant', 'exponential', 'uniform')
+RPC_PORT = 5555
+RECEIVE_SIZE = 65536
+# How long clients keep trying to connect to a server which hasn't started listening yet
+CONNECT_TIMEOUT = 10.0
+
+try:
+    process_time = time.process_time
+except AttributeError:
+    # Python 2, where clock is the CPU time of the process
+    process_time = time.clock
+
+
+class Connection(object):
+    """A non-blocking socket with buffers of received and unsent bytes."""
+
+    def __init__(self, sock):
+        self.sock = sock
+        sock.setblocking(False)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.received = bytearray()
+        self.unsent = bytearray()
+        self.closed = False
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def receive(self):
+        """Read what has arrived, marking the connection closed when the peer closes it."""
+        try:
+            data = self.sock.recv(RECEIVE_SIZE)
+        except socket.error as ex:
+            if ex.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            data = b''
+        if data:
+            self.received.extend(data)
+        else:
+            self.closed = True
+
+    def send(self, data=b''):
+        """Queue data, and send as much of what is queued as the socket accepts."""
+        self.unsent.extend(data)
+        if self.unsent and not self.closed:
+            try:
+                sent = self.sock.send(self.unsent)
+            except socket.error as ex:
+                if ex.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return
+                self.closed = True
+                return
+            del self.unsent[:sent]
+
+    def events(self):
+        return select.POLLIN | (select.POLLOUT if self.unsent else 0)
+
+    def close(self):
+        self.closed = True
+        self.sock.close()
+
+
+class Server(object):
+    """Answer the requests of any number of clients, from a single thread."""
+
+    def __init__(self, port=RPC_PORT, address=''):
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind((address, port))
+        self.listener.listen(1024)
+        self.listener.setblocking(False)
+        self.port = self.listener.getsockname()[1]
+        self.poll = select.poll()
+        self.poll.register(self.listener, select.POLLIN)
+        self.connections = {}
+
+    def answer(self, connection, request_id, response_size):
+        """Send the response to a request."""
+        respond(connection, request_id, response_size)
+
+    def _accept(self):
+        while True:
+            try:
+                sock, _ = self.listener.accept()
+            except socket.error:
+                return
+            connection = Connection(sock)
+            self.connections[connection.fileno()] = connection
+            self.poll.register(connection, connection.events())
+
+    def _read_requests(self, connection):
+        received = connection.received
+        start = 0
+        while len(received) - start >= REQUEST.size:
+            request_id, request_size, response_size = REQUEST.unpack_from(received, start)
+            if len(received) - start < REQUEST.size + request_size:
+                break
+            start += REQUEST.size + request_size
+            self.answer(connection, request_id, response_size)
+        del received[:start]
+
+    def ready(self, fd, event):
+        """Handle an event of a file descriptor other than the listener and the connections, which
+        subclasses register with self.poll."""
+        raise KeyError(fd)
+
+    def step(self, timeout=None):
+        """Handle the events of the next timeout seconds (or until there are some)."""
+        for fd, event in self.poll.poll(None if timeout is None else timeout * 1000):
+            if fd == self.listener.fileno():
+                self._accept()
+                continue
+            if fd not in self.connections:
+                self.ready(fd, event)
+                continue
+            connection = self.connections[fd]
+            if event & select.POLLIN:
+                connection.receive()
+                self._read_requests(connection)
+            if event & select.POLLOUT:
+                connection.send()
+            if connection.closed or event & (select.POLLERR | select.POLLHUP):
+                self.poll.unregister(fd)
+                del self.connections[fd]
+                connection.close()
+            else:
+                self.poll.modify(fd, connection.events())
+
+    def serve_forever(self):
+        while True:
+            self.step()
+
+
+def respond(connection, request_id, response_size, status=OK):
+    connection.send(RESPONSE.pack(request_id, status, response_size) + b'\0' * response_size)
+
+
+def service_times(distribution, mean, generator):
+    """Return a function drawing service times with the given distribution and mean from a
+    random.Random."""
+    if distribution == 'constant':
+        return lambda: mean
+    if distribution == 'exponential':
+        return lambda: generator.expovariate(1.0 / mean) if mean > 0 else 0.0
+    if distribution == 'uniform':
+        return lambda: generator.uniform(0, 2 * mean)
+    raise ValueError("Unknown service time distribution '{}'.".format(distribution))
+
+
+def _receive_exactly(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def _pipeline(sock):
+    """Spend the CPU time of each service time received on sock, answering DONE after each, until
+    sock is closed."""
+    while True:
+        data = _receive_exactly(sock, SERVICE.size)
+        if data is None:
+            return
+        end = process_time() + SERVICE.unpack(data)[0]
+        while process_time() < end:
+            pass
+        sock.sendall(DONE)
+
+
+class ComputeServer(Server):
+    """A Server which serves each request with one of a number of pipeline processes, queueing
+    requests while every pipeline is busy."""
+
+    def __init__(self, port=RPC_PORT, address='', service_time=0.001, distribution='exponential',
+                 pipelines=1, queue_size=64, seed=None):
+        Server.__init__(self, port, address)
+        self.service_time = service_times(distribution, service_time, random.Random(seed))
+        self.queue_size = queue_size
+        self.waiting = collections.deque()
+        self.rejected = 0
+        # Request each pipeline is serving, by the file descriptor of its socket
+        self.serving = {}
+        self.sockets = {}
+        self.idle = []
+        self.pids = []
+        for _ in range(pipelines):
+            sock, pipeline_sock = socket.socketpair()
+            pid = os.fork()
+            if pid == 0:
+                # Close the sockets of the server, so that every pipeline sees its socket closed,
+                # and exits, when the server exits
+                sock.close()
+                self.listener.close()
+                for other in self.sockets.values():
+                    other.close()
+                try:
+                    _pipeline(pipeline_sock)
+                finally:
+                    os._exit(0)
+            pipeline_sock.close()
+            self.pids.append(pid)
+            self.sockets[sock.fileno()] = sock
+            self.idle.append(sock.fileno())
+            self.poll.register(sock, select.POLLIN)
+
+    def answer(self, connection, request_id, response_size):
+        """Start serving a request, or queue it if every pipeline is busy, or reject it if the
+        queue is full."""
+        request = (connection, request_id, response_size)
+        if self.idle:
+            self._serve(self.idle.pop(), request)
+        elif len(self.waiting) < self.queue_size:
+            self.waiting.append(request)
+        else:
+            self.rejected += 1
+            respond(connection, request_id, 0, REJECTED)
+
+    def _serve(self, fd, request):
+        self.serving[fd] = request
+        self.sockets[fd].sendall(SERVICE.pack(self.service_time()))
+
+    def ready(self, fd, event):
+        """Answer the request a pipeline has finished, and give it the next one waiting."""
+        if fd not in self.sockets:
+            raise KeyError(fd)
+        if not self.sockets[fd].recv(len(DONE)):
+            raise RuntimeError('A compute pipeline exited.')
+        connection, request_id, response_size = self.serving.pop(fd)
+        if not connection.closed:
+            respond(connection, request_id, response_size)
+            self.poll.modify(connection, connection.events())
+        while self.waiting:
+            request = self.waiting.popleft()
+            if not request[0].closed:
+                self._serve(fd, request)
+                return
+        self.idle.append(fd)
+
+    def close(self):
+        """Stop the pipelines."""
+        for sock in self.sockets.values():
+            self.poll.unregister(sock)
+            sock.close()
+        for pid in self.pids:
+            os.waitpid(pid, 0)
+        self.sockets = {}
+        self.pids = []
+
+
+def read_schedule(path):
+    """Yield the (offset, flow, request size, response size) of every request of a schedule file,
+    reading it through a memory map rather than into memory."""
+    with open(path, 'rb') as f:
+        if not os.fstat(f.fileno()).st_size:
+            return
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for start in range(0, len(mapped) - SCHEDULE.size + 1, SCHEDULE.size):
+                yield SCHEDULE.unpack_from(mapped, start)
+        finally:
+            mapped.close()
+
+
+def schedule_duration(path):
+    """Return the offset of the last request of a schedule file, 0 if it has none."""
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < SCHEDULE.size:
+            return 0.0
+        f.seek(size - size % SCHEDULE.size - SCHEDULE.size)
+        return SCHEDULE.unpack(f.read(SCHEDULE.size))[0]
+
+
+def percentile(values, percent):
+    """Return a percentile of sorted values, interpolated as numpy.percentile does."""
+    if not values:
+        return float('nan')
+    position = (len(values) - 1) * percent / 100.0
+    low = int(position)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (position - low)
+
+
+def connect(address, port, timeout=CONNECT_TIMEOUT):
+    """Connect to a server, retrying until it is listening or the timeout expires."""
+    deadline = time.time() + timeout
+    while True:
+        try:
+            return socket.create_connection((address, port), timeout=timeout)
+        except socket.error:
+            if time.time() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+class Client(object):
+    """Send requests to a server over one or more connections, and time their responses."""
+
+    def __init__(self, address, port=RPC_PORT, connections=1, request_size=64, response_size=64):
+        self.connections = [Connection(connect(address, port)) for _ in range(connections)]
+        self.request = b'\0' * request_size
+        self.response_size = response_size
+        self.next_id = 0
+        # Time each outstanding request was due to be sent, by id
+        self.due = {}
+        self.latencies = []
+        self.sent = 0
+        self.rejected = 0
+        self.errors = 0
+        # Flow and request size of each outstanding request of a replayed flow, by id, and the
+        # statistics of each flow
+        self.flow_of = {}
+        self.flows = {}
+
+    def _send(self, connection, due, flow=None, request_size=None, response_size=None):
+        request = self.request if request_size is None else b'\0' * request_size
+        response_size = self.response_size if response_size is None else response_size
+        request_id = self.next_id
+        self.next_id = (self.next_id + 1) % 2 ** 32
+        self.due[request_id] = due
+        self.sent += 1
+        if flow is not None:
+            self.flow_of[request_id] = flow, len(request)
+            if flow not in self.flows:
+                self.flows[flow] = dict(sent=0, rejected=0, bytes=0, first=due, last=due,
+                                        latencies=[])
+            self.flows[flow]['sent'] += 1
+        connection.send(REQUEST.pack(request_id, len(request), response_size) + request)
+
+    def _read_responses(self, connection, now):
+        """Record the responses which have fully arrived on a connection, returning how many."""
+        received = connection.received
+        start = 0
+        count = 0
+        while len(received) - start >= RESPONSE.size:
+            request_id, status, response_size = RESPONSE.unpack_from(received, start)
+            if len(received) - start < RESPONSE.size + response_size:
+                break
+            start += RESPONSE.size + response_size
+            due = self.due.pop(request_id, None)
+            if due is None:
+                continue
+            flow, request_size = self.flow_of.pop(request_id, (None, 0))
+            stats = self.flows.get(flow)
+            if status == REJECTED:
+                self.rejected += 1
+                if stats is not None:
+                    stats['rejected'] += 1
+            else:
+                self.latencies.append(now - due)
+                if stats is not None:
+                    stats['latencies'].append(now - due)
+                    stats['bytes'] += request_size + response_size
+                    stats['last'] = now
+            count += 1
+        del received[:start]
+        return count
+
+    @staticmethod
+    def _arrivals(mode, rate, start, generator, schedule):
+        """Yield the (due time, flow, request size, response size) of every request of an open
+        loop, or of a replayed schedule file. Closed loops send as responses arrive instead."""
+        if mode == 'closed':
+            return
+        if mode == 'replay':
+            for offset, flow, request_size, response_size in read_schedule(schedule):
+                yield start + offset, flow, request_size, response_size
+            return
+        due = start
+        while True:
+            due += generator.expovariate(rate)
+            yield due, None, None, None
+
+    def run(self, mode='closed', rate=100.0, duration=10.0, start_at=None, drain=2.0, seed=None,
+            schedule=None):
+        """Send requests for duration seconds from start_at (a time.time(), default now), then
+        wait up to drain seconds for the outstanding responses. In mode 'replay', the requests of
+        the schedule file are sent instead, for as long as it lasts.
+
+        Returns a summary of the requests sent and the latencies of those answered, with the
+        requests, latency percentiles and bytes of each flow of a replay."""
+        generator = random.Random(seed)
+        poll = select.poll()
+        by_fd = dict((connection.fileno(), connection) for connection in self.connections)
+        if mode == 'replay':
+            duration = schedule_duration(schedule)
+
+        if start_at is not None:
+            time.sleep(max(0.0, start_at - time.time()))
+        start = time.time()
+        end = start + duration
+        arrivals = self._arrivals(mode, rate, start, generator, schedule)
+        arrival = next(arrivals, None)
+        turn = 0
+
+        if mode == 'closed':
+            for connection in self.connections:
+                self._send(connection, start)
+        for connection in self.connections:
+            poll.register(connection, connection.events())
+
+        while True:
+            now = time.time()
+            while arrival is not None and arrival[0] <= min(now, end):
+                due, flow, request_size, response_size = arrival
+                # The requests of a flow keep their order on a connection of their own
+                connection = self.connections[(turn if flow is None else flow)
+                                              % len(self.connections)]
+                turn += 1
+                self._send(connection, due, flow, request_size, response_size)
+                arrival = next(arrivals, None)
+            if now >= end + drain or (now >= end and not self.due):
+                break
+            if all(connection.closed for connection in self.connections):
+                break
+
+            timeout = (end if now < end else end + drain) - now
+            if arrival is not None and arrival[0] < end:
+                timeout = min(timeout, arrival[0] - now)
+            for fd, event in poll.poll(max(0.0, timeout) * 1000):
+                connection = by_fd[fd]
+                if event & select.POLLIN:
+                    connection.receive()
+                    now = time.time()
+                    answered = self._read_responses(connection, now)
+                    if mode == 'closed' and now < end:
+                        for _ in range(answered):
+                            self._send(connection, now)
+                if event & select.POLLOUT:
+                    connection.send()
+                if event & (select.POLLERR | select.POLLHUP) or connection.closed:
+                    connection.closed = True
+                    self.errors += 1
+                    poll.unregister(fd)
+                else:
+                    poll.modify(fd, connection.events())
+
+        # Unmap the schedule of a replay which ended early
+        arrivals.close()
+        for connection in self.connections:
+            connection.close()
+        summary = dict(mode=mode, sent=self.sent, completed=len(self.latencies),
+                       rejected=self.rejected, errors=self.errors, duration=duration,
+                       latencies=[round(latency, 6) for latency in self.latencies])
+        if mode == 'replay':
+            summary['flows'] = [self._flow_summary(flow) for flow in sorted(self.flows)]
+        return summary
+
+    def _flow_summary(self, flow):
+        stats = self.flows[flow]
+        latencies = sorted(stats['latencies'])
+        return dict(flow=flow, sent=stats['sent'], completed=len(latencies),
+                    rejected=stats['rejected'], bytes=stats['bytes'],
+                    seconds=stats['last'] - stats['first'],
+                    latency_mean=sum(latencies) / len(latencies) if latencies else float('nan'),
+                    latency_p50=percentile(latencies, 50), latency_p99=percentile(latencies, 99))
+
+
+@click.group()
+def agent():
+    """Request/response traffic agent."""
+
+
+@agent.command()
+@click.option('--port', default=RPC_PORT, show_default=True, type=click.IntRange(0, 65535),
+              help='TCP port to listen on.')
+@click.option('--pipelines', default=0, show_default=True, type=click.IntRange(min=0),
+              help='Number of pipelines of the emulated compute service. 0 answers requests at '
+                   'once.')
+@click.option('--service-time', default=0.001, show_default=True, type=click.FloatRange(min=0),
+              help='Mean CPU time in seconds a pipeline spends on each request.')
+@click.option('--distribution', default='exponential', show_default=True,
+              type=click.Choice(DISTRIBUTIONS), help='Distribution of the service times.')
+@click.option('--queue-size', default=64, show_default=True, type=click.IntRange(min=0),
+              help='Number of requests which may wait for a pipeline before more are rejected.')
+@click.option('--seed', type=int, help='Seed of the service times.')
+def server(port, pipelines, service_time, distribution, queue_size, seed):
+    """Answer requests until killed."""
+    if pipelines:
+        ComputeServer(port, service_time=service_time, distribution=distribution,
+                      pipelines=pipelines, queue_size=queue_size, seed=seed).serve_forever()
+    else:
+        Server(port).serve_forever()
+
+
+@agent.command()
+@click.option('--server', 'address', required=True, help='Address of the server.')
+@click.option('--port', default=RPC_PORT, show_default=True, type=click.IntRange(0, 65535),
+              help='TCP port of the server.')
+@click.option('--mode', default='closed', show_default=True,
+              type=click.Choice(['open', 'closed', 'replay']),
+              help='Send requests at Poisson arrivals (open), as responses arrive (closed), or as '
+                   'the --schedule says (replay).')
+@click.option('--rate', default=100.0, show_default=True, type=click.FloatRange(min=0.001),
+              help='Requests per second of the open loop.')
+@click.option('--connections', default=1, show_default=True, type=click.IntRange(min=1),
+              help='Number of connections, and so of outstanding requests in closed loop.')
+@click.option('--duration', default=10.0, show_default=True, type=click.FloatRange(min=0),
+              help='Seconds to send requests for.')
+@click.option('--start-at', type=float, help='Time (since the epoch) to start sending at.')
+@click.option('--drain', default=2.0, show_default=True, type=click.FloatRange(min=0),
+              help='Seconds to wait for outstanding responses after the last request.')
+@click.option('--request-size', default=64, show_default=True, type=click.IntRange(min=0),
+              help='Bytes of payload in each request.')
+@click.option('--response-size', default=64, show_default=True, type=click.IntRange(min=0),
+              help='Bytes of payload in each response.')
+@click.option('--seed', type=int, help='Seed of the Poisson arrivals.')
+@click.option('--schedule', type=click.Path(exists=True, dir_okay=False),
+              help='Schedule file of the requests to replay (see traces.py).')
+def client(address, port, mode, rate, connections, duration, start_at, drain, request_size,
+           response_size, seed, schedule):
+    """Send requests and print a JSON summary of their latencies."""
+    if mode == 'replay' and schedule is None:
+        raise click.UsageError('--mode replay needs a --schedule.')
+    rpc_client = Client(address, port, connections, request_size, response_size)
+    summary = rpc_client.run(mode, rate, duration, start_at, drain, seed, schedule)
+    json.dump(summary, sys.stdout)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    agent()
@@ -27,7 +27,12 @@ setup(
     name='fpga_switch_model',
     version='1.0',
     packages=find_packages(),
-    py_modules=['fpga_switch_model'],
+    py_modules=['fpga_switch_model', 'mininet_functions', 'performance_tests', 'parameters',
+                'analytic', 'simulation', 'sweep', 'tree_index', 'results', 'planning', 'benchmark',
+                'tracing', 'rpc_agent', 'workload', 'queueing',
+                'placement', 'sharding', 'flows', 'iperf_flows',
+                'latency_matrix', 'result_cache', 'telemetry', 'traces',
+                'repetition', 'executor', 'aggregation'],
     install_requires=[
         'Click',
         'logging',
@@ -36,6 +41,11 @@ setup(
     entry_points='''
         [console_scripts]
         fpga_switch_model=fpga_switch_model:cli
+        fpga_switch_model_sweep=sweep:sweep
+        fpga_switch_model_benchmark=benchmark:benchmark
+        fpga_switch_model_placement=placement:placement
+        fpga_switch_model_flows=flows:flows
+        fpga_switch_model_cache=result_cache:cache
     ''',
 
     # metadata to display on PyPI
@@ -0,0 +1,316 @@
+"""
+Emulate a TreeTopoGeneric tree with several Mininet networks, one per process.
+
+A single Mininet network holds the shell of every node, and the file descriptors and memory which
+go with them, in one Python process, which caps the size of the trees it can emulate. A Partition
+cuts the tree at a shard level into the upper levels, the cloud and their FPGA hosts (shard 0, the
+coordinator, which runs in the calling process) and the subtrees below the shard level, which are
+divided between the worker shards 1 to shards - 1 in contiguous ranges.
+
+Every shard starts its own Mininet network, with its own controller, in parallel. The switches of
+every network are Open vSwitch bridges in the root namespace, so once all of them have started the
+coordinator joins the root of each subtree to the switch above it with a veth pair, shaped like
+the standard links of the tree. Hosts keep the IP addresses they would have in a single network.
+
+The network of the coordinator runs the tests as usual. Hosts of the worker shards are reached
+through the namespaces of their shells with mnexec, so the tests and workloads run unchanged. The
+partition only needs the standard library, so shards can be planned without mininet or root.
+"""
+
+import logging
+import subprocess
+
+from tree_index import TreeIndex
+
+# Port of the controller of the coordinator; worker shard k listens on CONTROLLER_PORT + k
+CONTROLLER_PORT = 6653
+# Seconds between checks that the worker shards are still starting
+SHARD_POLL_INTERVAL = 1.0
+
+
+class Partition(object):
+    """Assignment of the nodes of a TreeIndex to shards: a coordinator and shards - 1 workers.
+
+    The subtrees rooted at the shard level (the lowest level with at least one subtree per worker
+    shard, by default) are divided between the worker shards."""
+
+    def __init__(self, index, shards, level=None):
+        self.index = index
+        self.shards = shards
+        self.workers = shards - 1
+        if level is None:
+            level = 1
+            while index.spread ** level < self.workers and level < index.depth - 2:
+                level += 1
+        if not 1 <= level <= index.depth - 2:
+            raise ValueError('A tree of depth {} has no level of switches below the root to shard '
+                             'at (level {}).'.format(index.depth, level))
+        self.level = level
+        self.n_roots = index.spread ** level
+        if not 1 <= self.workers <= self.n_roots:
+            raise ValueError('Level {} of the tree has {} subtrees to divide between {} worker '
+                             'shards.'.format(level, self.n_roots, self.workers))
+
+    def roots(self, shard):
+        """Return the positions on the shard level of the subtrees of a worker shard."""
+        first = -(-(shard - 1) * self.n_roots // self.workers)
+        last = -(-shard * self.n_roots // self.workers)
+        return range(first, last)
+
+    def shard(self, node):
+        """Return the shard of a node."""
+        index = self.index
+        if node == index.cloud:
+            return 0
+        if index.is_fpga(node):
+            node = index.parent(node)
+        level = index.level(node)
+        if level < self.level:
+            return 0
+        root = index.position(node) // index.spread ** (level - self.level)
+        return 1 + root * self.workers // self.n_roots
+
+    def nodes(self, shard):
+        """Return the nodes of a shard: tree nodes in level order, then their FPGA hosts."""
+        index = self.index
+        if shard == 0:
+            levels = [(level, range(index.spread ** level)) for level in range(self.level)]
+        else:
+            roots = self.roots(shard)
+            levels = []
+            for level in range(self.level, index.depth):
+                scale = index.spread ** (level - self.level)
+                levels.append((level, range(roots[0] * scale, (roots[-1] + 1) * scale)))
+        nodes = [index.node(level, position) for level, positions in levels
+                 for position in positions]
+        hosts = [index.fpga_host_of(node) for node in nodes if index.is_switch(node)]
+        nodes.extend(host for host in hosts if host is not None)
+        if shard == 0:
+            nodes.append(index.cloud)
+        return nodes
+
+    def links(self):
+        """Return the (upper, lower) links which join the roots of the subtrees to the coordinator.
+        """
+        index = self.index
+        return [(index.parent(node), node) for node in
+                (index.node(self.level, position) for position in range(self.n_roots))]
+
+
+def tunnel_names(lower):
+    """Return the names of the upper and lower ends of the veth pair above a subtree root."""
+    return 'x{}u'.format(lower), 'x{}l'.format(lower)
+
+
+def tunnel_commands(partition, link_opts):
+    """Return the ip batch, ovs-vsctl and tc batch commands which join the subtrees of a partition
+    to the coordinator with veth pairs shaped by link_opts."""
+    from mininet_functions import tc_add_commands
+
+    index = partition.index
+    ip_commands = []
+    ovs_args = []
+    tc_commands = []
+    for upper, lower in partition.links():
+        upper_intf, lower_intf = tunnel_names(lower)
+        ip_commands += ['link add {} type veth peer name {}'.format(upper_intf, lower_intf),
+                        'link set {} up'.format(upper_intf), 'link set {} up'.format(lower_intf)]
+        ovs_args += ['--', 'add-port', index.name(upper), upper_intf,
+                     '--', 'add-port', index.name(lower), lower_intf]
+        tc_commands += tc_add_commands(upper_intf, **link_opts)
+        tc_commands += tc_add_commands(lower_intf, **link_opts)
+    return ip_commands, ovs_args[1:], tc_commands
+
+
+def _batch(command, commands):
+    """Run commands with a single ip or tc batch process from standard input."""
+    process = subprocess.Popen([command, '-force', '-batch', '-'], stdin=subprocess.PIPE,
+                               stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    output, _ = process.communicate(('\n'.join(commands) + '\n').encode())
+    if process.returncode:
+        raise RuntimeError('{} batch failed: {}'.format(command, output.decode().strip()))
+
+
+def connect_shards(partition, link_opts):
+    """Join the subtrees of a partition to the coordinator, once every shard has started."""
+    ip_commands, ovs_args, tc_commands = tunnel_commands(partition, link_opts)
+    _batch('ip', ip_commands)
+    subprocess.check_call(['ovs-vsctl'] + ovs_args)
+    _batch('tc', tc_commands)
+
+
+def disconnect_shards(partition):
+    """Delete the veth pairs joining the subtrees of a partition to the coordinator."""
+    _batch('ip', ['link del {}'.format(tunnel_names(lower)[0])
+                  for _, lower in partition.links()])
+
+
+def start_shard(partition, shard, log, spread, depth, bandwidth, delay, loss, fpga, fpga_bandwidth,
+                fpga_delay, fpga_loss, poisson, compute=None, placements=None, batched=False):
+    """Build and start the Mininet network of a shard, with BatchedMininet if batched."""
+    from functools import partial
+
+    from mininet.log import setLogLevel
+    from mininet.node import Controller
+
+    from mininet_functions import TreeTopoGeneric, start_network
+
+    setLogLevel(log)
+    topo = TreeTopoGeneric(spread, depth, bandwidth, delay, loss, fpga, fpga_bandwidth, fpga_delay,
+                           fpga_loss, poisson, compute, placements,
+                           nodes=set(partition.nodes(shard)))
+    return start_network(topo, partial(Controller, port=CONTROLLER_PORT + shard), batched)
+
+
+def run_shard(partition, shard, connection, *args):
+    """Start the network of a worker shard, send the (name, IP, shell pid) of each of its hosts
+    (or the error which stopped it) on the connection, and stop the network once told to."""
+    try:
+        net = start_shard(partition, shard, *args)
+    except Exception as ex:
+        connection.send('{}: {}'.format(type(ex).__name__, ex))
+        return
+    try:
+        connection.send([(host.name, host.IP(), host.pid) for host in net.hosts])
+        connection.recv()
+    except EOFError:
+        # The coordinator exited without stopping the shard
+        pass
+    finally:
+        net.stop()
+
+
+class ShardHost(object):
+    """A host of a worker shard, with the Mininet host methods used by the tests, which run in the
+    namespaces of its shell."""
+
+    def __init__(self, name, ip, pid):
+        self.name = name
+        self.ip = ip
+        self.pid = pid
+
+    def IP(self):
+        return self.ip
+
+    def popen(self, args, **params):
+        return subprocess.Popen(['mnexec', '-a', str(self.pid)] + list(args), **params)
+
+    def cmd(self, command):
+        process = self.popen(['sh', '-c', command], stdout=subprocess.PIPE,
+                             stderr=subprocess.STDOUT)
+        output, _ = process.communicate()
+        return output.decode()
+
+    def __repr__(self):
+        return '<ShardHost {}>'.format(self.name)
+
+
+class ShardedNet(object):
+    """Mininet networks of the shards of a tree, joined into one network with the parts of the
+    Mininet API used by this application."""
+
+    def __init__(self, net, partition, hosts, workers):
+        self.net = net
+        self.topo = net.topo
+        self.index = partition.index
+        self.partition = partition
+        # ShardHost of every host of the worker shards, by name
+        self.shard_hosts = hosts
+        # (process, connection) of every worker shard
+        self.workers = workers
+
+    def keys(self):
+        index = self.index
+        for node in index.hosts():
+            yield index.name(node)
+        for node in index.switches():
+            yield index.name(node)
+
+    def get(self, name):
+        if name in self.shard_hosts:
+            return self.shard_hosts[name]
+        return self.net.get(name)
+
+    def stop(self):
+        """Disconnect and stop the network of every shard."""
+        logger = logging.getLogger(__name__)
+        try:
+            disconnect_shards(self.partition)
+        except RuntimeError as ex:
+            logger.error('Error disconnecting shards: %s', ex)
+        for _, connection in self.workers:
+            try:
+                connection.send('stop')
+            except (EOFError, IOError, OSError):
+                pass
+        for process, _ in self.workers:
+            process.join()
+        self.net.stop()
+
+
+def setup_sharded(log, spread, depth, bandwidth, delay, loss, fpga, fpga_bandwidth, fpga_delay,
+                  fpga_loss, poisson, compute=None, placements=None, shards=2, shard_level=None,
+                  batched=False):
+    """Start the network of setup_mininet as a coordinator and shards worker processes (see
+    Partition), joined into one ShardedNet.
+
+    shards counts the coordinator, so shards - 1 worker processes are started. batched starts the
+    network of each shard with BatchedMininet."""
+    import multiprocessing
+
+    from mininet.clean import Cleanup
+
+    import tracing
+    from parameters import link_options
+
+    logger = logging.getLogger(__name__)
+    partition = Partition(TreeIndex(spread, depth, fpga, placements), shards, shard_level)
+    args = (log, spread, depth, bandwidth, delay, loss, fpga, fpga_bandwidth, fpga_delay,
+            fpga_loss, poisson, compute, placements, batched)
+
+    with tracing.span('cleanup'):
+        Cleanup.cleanup()
+
+    workers = []
+    net = None
+    try:
+        with tracing.span('start_shards', shards=shards):
+            for shard in range(1, shards):
+                connection, child = multiprocessing.Pipe()
+                process = multiprocessing.Process(target=run_shard,
+                                                  args=(partition, shard, child) + args)
+                process.start()
+                workers.append((process, connection))
+            net = start_shard(partition, 0, *args)
+
+            hosts = {}
+            for shard, (process, connection) in enumerate(workers, 1):
+                while not connection.poll(SHARD_POLL_INTERVAL):
+                    if not process.is_alive():
+                        raise RuntimeError('Shard {} exited with code {}'.format(
+                            shard, process.exitcode))
+                reply = connection.recv()
+                if not isinstance(reply, list):
+                    raise RuntimeError('Shard {} failed to start: {}'.format(shard, reply))
+                hosts.update((name, ShardHost(name, ip, pid)) for name, ip, pid in reply)
+                logger.info('Shard %d started %d hosts', shard, len(reply))
+
+        with tracing.span('connect_shards', links=len(partition.links())):
+            link_opts, _, _ = link_options(bandwidth, delay, loss, fpga_bandwidth, fpga_delay,
+                                           fpga_loss, poisson)
+            connect_shards(partition, link_opts)
+    except Exception:
+        try:
+            disconnect_shards(partition)
+        except RuntimeError:
+            # Nothing was connected yet
+            pass
+        for process, connection in workers:
+            if process.is_alive():
+                connection.send('stop')
+            process.join()
+        if net is not None:
+            net.stop()
+        raise
+
+    return ShardedNet(net, partition, hosts, workers)
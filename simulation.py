@@ -0,0 +1,377 @@
+"""
+Packet-level discrete-event simulation of the TreeTopoGeneric topology.
+
+Builds the same tree as TreeTopoGeneric (switches, leaf hosts h{j}, FPGA hosts f{j} and the cloud
+host) without creating any namespaces or interfaces, so it scales to trees with hundreds of
+thousands of leaves. Each link direction is a FIFO queue which serialises packets at the link
+bandwidth before they propagate with the link delay, and drops them with the link loss.
+
+Nodes are numbered implicitly by a TreeIndex. Links are identified by the node below them and
+every per-link value is kept in a flat array.
+
+SimNet mirrors the parts of the Mininet API used by this application (get, keys, pingAll, iperf,
+stop and the cmd and IP methods of hosts), so the tests can run against either.
+"""
+
+import heapq
+import logging
+import random
+import re
+from array import array
+
+from parameters import delay_to_seconds, link_options, placement_link_options
+from tree_index import TreeIndex
+
+# Size of the packets sent by ping: 56 bytes of data, 8 bytes of ICMP header and 20 of IP header
+PING_PACKET_SIZE = 84
+# Size of a full TCP segment and of a bare TCP acknowledgement on an ethernet link
+MSS_PACKET_SIZE = 1500
+ACK_PACKET_SIZE = 66
+# Default packet limit of a netem qdisc
+QUEUE_LIMIT = 1000
+# Minimum TCP retransmission timeout on Linux
+MIN_RTO = 0.2
+
+# Packet kinds
+ECHO_REQUEST = 0
+ECHO_REPLY = 1
+DATA = 2
+ACK = 3
+TIMER = 4
+
+
+class Packet(object):
+    """A packet in flight, or a timer when route is None."""
+    __slots__ = ('kind', 'size', 'sent', 'app', 'route', 'hop')
+
+    def __init__(self, kind, size, sent, app, route):
+        self.kind = kind
+        self.size = size
+        self.sent = sent
+        self.app = app
+        self.route = route
+        self.hop = 0
+
+
+def _link_values(opts):
+    """Return the (delay in s, rate in bytes/s, loss fraction) of a link."""
+    # A bandwidth of 0 leaves the link unshaped
+    rate = opts['bw'] * 1e6 / 8 if opts['bw'] else 0.0
+    return delay_to_seconds(opts['delay']), rate, opts['loss'] / 100.0
+
+
+class Simulator(object):
+    """Heap-based event queue over the links of a tree topology."""
+
+    def __init__(self, index, link_opts, fpga_link_opts, cloud_link_opts, queue_limit=QUEUE_LIMIT,
+                 seed=None):
+        if index.depth < 2:
+            raise ValueError('A tree needs a depth of at least 2 to connect a host to the cloud.')
+
+        self.index = index
+        self.queue_limit = queue_limit
+        self.random = random.Random(seed)
+        n_nodes = index.n_nodes
+
+        # Per-link (indexed by the node below the link) delay in s, rate in bytes/s and loss
+        self.delay = array('d', [0.0]) * n_nodes
+        self.rate = array('d', [0.0]) * n_nodes
+        self.loss = array('d', [0.0]) * n_nodes
+        self.set_links(link_opts, fpga_link_opts, cloud_link_opts)
+
+        # Time at which each link direction finishes sending its queue: 2k is up from node k, and
+        # 2k + 1 is down to node k
+        self.busy_until = array('d', [0.0]) * (2 * n_nodes)
+
+        self.now = 0.0
+        self.events = []
+        self.sequence = 0
+
+    def set_links(self, link_opts, fpga_link_opts, cloud_link_opts=None):
+        """Set the options of the standard, FPGA and (unless None) cloud links."""
+        index = self.index
+        groups = [(1, index.n_tree, link_opts), (index.n_tree, index.cloud, fpga_link_opts)]
+        if cloud_link_opts is not None:
+            groups.append((index.cloud, index.n_nodes, cloud_link_opts))
+        for first, last, opts in groups:
+            count = last - first
+            delay, rate, loss = _link_values(opts)
+            self.delay[first:last] = array('d', [delay]) * count
+            self.rate[first:last] = array('d', [rate]) * count
+            self.loss[first:last] = array('d', [loss]) * count
+
+    def set_nodes(self, nodes, opts):
+        """Set the options of the links above the given nodes."""
+        delay, rate, loss = _link_values(opts)
+        for node in nodes:
+            self.delay[node] = delay
+            self.rate[node] = rate
+            self.loss[node] = loss
+
+    def send(self, kind, size, app, src, dst, at=None):
+        """Inject a packet at src, to be delivered to app once it reaches dst, and return it."""
+        at = self.now if at is None else at
+        packet = Packet(kind, size, at, app, self.index.route(src, dst))
+        self.push(at, packet)
+        return packet
+
+    def timer(self, app, at):
+        """Call app.on_timer at the given time."""
+        self.push(at, Packet(TIMER, 0, at, app, None))
+
+    def push(self, at, packet):
+        self.sequence += 1
+        heapq.heappush(self.events, (at, self.sequence, packet))
+
+    def run(self, until=None):
+        """Process events in time order until there are none left or the time limit is reached."""
+        events = self.events
+        while events:
+            if until is not None and events[0][0] > until:
+                self.now = until
+                return
+            self.now, _, packet = heapq.heappop(events)
+            if packet.route is None:
+                packet.app.on_timer(self, packet)
+            elif packet.hop == len(packet.route) - 1:
+                packet.app.on_deliver(self, packet)
+            else:
+                self.forward(packet)
+
+    def forward(self, packet):
+        """Queue the packet on the link to the next node of its route."""
+        here = packet.route[packet.hop]
+        there = packet.route[packet.hop + 1]
+        if self.index.parent(here) == there:
+            link, direction = here, 2 * here
+        else:
+            link, direction = there, 2 * there + 1
+
+        now = self.now
+        start = max(now, self.busy_until[direction])
+        rate = self.rate[link]
+        if rate:
+            # Tail drop once the FIFO queue holds more than queue_limit packets of this size
+            if (start - now) * rate > self.queue_limit * packet.size:
+                packet.app.on_drop(self, packet)
+                return
+            start += packet.size / rate
+            self.busy_until[direction] = start
+        if self.random.random() < self.loss[link]:
+            packet.app.on_drop(self, packet)
+            return
+
+        packet.hop += 1
+        self.push(start + self.delay[link], packet)
+
+
+class Ping(object):
+    """ICMP echo requests sent at a fixed interval, like the ping command."""
+    __slots__ = ('src', 'dst', 'count', 'rtts')
+
+    def __init__(self, sim, src, dst, count=10, interval=1.0, size=PING_PACKET_SIZE, start=None):
+        self.src = src
+        self.dst = dst
+        self.count = count
+        self.rtts = []
+        start = sim.now if start is None else start
+        for i in range(count):
+            sim.send(ECHO_REQUEST, size, self, src, dst, at=start + i * interval)
+
+    def on_deliver(self, sim, packet):
+        if packet.kind == ECHO_REQUEST:
+            reply = sim.send(ECHO_REPLY, packet.size, self, self.dst, self.src)
+            # Measure the round trip from the time the request was sent
+            reply.sent = packet.sent
+        else:
+            self.rtts.append(sim.now - packet.sent)
+
+    def on_drop(self, sim, packet):
+        pass
+
+    def on_timer(self, sim, packet):
+        pass
+
+
+class BulkTransfer(object):
+    """Window-limited stream of full segments from src to dst, like an iperf TCP test.
+
+    Each delivered segment is acknowledged and each acknowledgement releases the next segment
+    until the duration has passed. A lost segment or acknowledgement is retransmitted after a
+    retransmission timeout."""
+    __slots__ = ('src', 'dst', 'end', 'rto', 'sent', 'acked')
+
+    def __init__(self, sim, src, dst, duration=5.0, window=64, rto=MIN_RTO):
+        self.src = src
+        self.dst = dst
+        self.end = sim.now + duration
+        self.rto = rto
+        self.sent = 0
+        self.acked = 0
+        for _ in range(window):
+            self.send_segment(sim)
+
+    def send_segment(self, sim):
+        self.sent += MSS_PACKET_SIZE
+        sim.send(DATA, MSS_PACKET_SIZE, self, self.src, self.dst)
+
+    def on_deliver(self, sim, packet):
+        if packet.kind == DATA:
+            sim.send(ACK, ACK_PACKET_SIZE, self, self.dst, self.src)
+        elif sim.now <= self.end:
+            self.acked += MSS_PACKET_SIZE
+            self.send_segment(sim)
+
+    def on_drop(self, sim, packet):
+        sim.timer(self, sim.now + self.rto)
+
+    def on_timer(self, sim, packet):
+        if sim.now <= self.end:
+            self.send_segment(sim)
+
+
+class SimHost(object):
+    """A host of a SimNet, with the Mininet host methods used by the tests."""
+    __slots__ = ('net', 'node', 'name')
+
+    def __init__(self, net, node, name):
+        self.net = net
+        self.node = node
+        self.name = name
+
+    def IP(self):
+        return self.net.ip(self.node)
+
+    def cmd(self, command):
+        """Run a ping command against the simulated network and return its output."""
+        match = PING_COMMAND.match(command)
+        if not match:
+            raise ValueError("The simulation backend cannot run '{}'.".format(command))
+        dst = self.net.node_by_ip(match.group(2))
+        count = int(match.group(1)) if match.group(1) else 10
+        ping = Ping(self.net.sim, self.node, dst, count)
+        self.net.sim.run()
+        return format_ping(match.group(2), count, ping.rtts)
+
+    def __repr__(self):
+        return '<SimHost {}>'.format(self.name)
+
+
+PING_COMMAND = re.compile(r'^\s*ping\s+(?:-c\s*(\d+)\s+)?(\d+\.\d+\.\d+\.\d+)\s*$')
+
+
+def format_ping(ip, count, rtts):
+    """Format the round trip times of count echo requests like the output of ping."""
+    lines = ['PING {0} ({0}) 56(84) bytes of data.'.format(ip)]
+    lines += ['64 bytes from {}: icmp_seq={} ttl=64 time={:.3f} ms'.format(ip, i + 1, rtt * 1e3)
+              for i, rtt in enumerate(rtts)]
+    lines += ['', '--- {} ping statistics ---'.format(ip),
+             '{} packets transmitted, {} received, {}% packet loss, time {}ms'.format(
+                 count, len(rtts), int(100 * (count - len(rtts)) / count), (count - 1) * 1000)]
+    if rtts:
+        rtts = [rtt * 1e3 for rtt in rtts]
+        mean = sum(rtts) / len(rtts)
+        mdev = max(sum(rtt * rtt for rtt in rtts) / len(rtts) - mean * mean, 0) ** 0.5
+        lines.append('rtt min/avg/max/mdev = {:.3f}/{:.3f}/{:.3f}/{:.3f} ms'.format(
+            min(rtts), mean, max(rtts), mdev))
+    return '\n'.join(lines) + '\n'
+
+
+class SimNet(object):
+    """Simulated counterpart of a started Mininet network built from TreeTopoGeneric."""
+
+    def __init__(self, sim):
+        self.sim = sim
+        self.index = sim.index
+
+    def keys(self):
+        index = self.index
+        for node in index.hosts():
+            yield index.name(node)
+        for node in index.switches():
+            yield index.name(node)
+
+    def ip(self, node):
+        return self.index.ip(node)
+
+    def node_by_ip(self, ip):
+        a, b, c, d = (int(part) for part in ip.split('.'))
+        return self.index.host_by_number((b << 16 | c << 8 | d) - 1)
+
+    def get(self, name):
+        node = self.index.node_by_name(name)
+        if self.index.is_switch(node):
+            raise KeyError("The simulation backend has no switch objects ('{}').".format(name))
+        return SimHost(self, node, name)
+
+    def start(self):
+        pass
+
+    def reconfigure(self, bandwidth, delay, loss, fpga_bandwidth=None, fpga_delay=None,
+                    fpga_loss=None, poisson=None):
+        """Apply new link parameters without rebuilding the network, like reconfigure_network."""
+        link_opts, fpga_link_opts, _ = link_options(bandwidth, delay, loss, fpga_bandwidth,
+                                                    fpga_delay, fpga_loss, poisson)
+        self.sim.set_links(link_opts, fpga_link_opts)
+        return link_opts, fpga_link_opts
+
+    def stop(self):
+        pass
+
+    def pingAll(self):
+        """Ping between all pairs of hosts once, and return the percentage of pings dropped."""
+        logger = logging.getLogger(__name__)
+        hosts = list(self.index.hosts())
+        sent = received = 0
+        for src in hosts:
+            for dst in hosts:
+                if src != dst:
+                    ping = Ping(self.sim, src, dst, count=1)
+                    self.sim.run()
+                    sent += 1
+                    received += len(ping.rtts)
+        dropped = 100.0 * (sent - received) / sent if sent else 0
+        logger.info('Results: %d%% dropped (%d/%d received)', dropped, received, sent)
+        return dropped
+
+    def ping_pairs(self, pairs, count=10):
+        """Ping between every (src, dst) pair of host names at once, and return the output ping
+        would print for each pair.
+
+        The pings of the pairs start spread over a second, as separate ping processes would, so
+        they do not all queue on the links they share."""
+        index = self.index
+        pings = [Ping(self.sim, index.node_by_name(src), index.node_by_name(dst), count,
+                      start=self.sim.now + i / float(len(pairs)))
+                 for i, (src, dst) in enumerate(pairs)]
+        self.sim.run()
+        return [format_ping(self.ip(ping.dst), count, ping.rtts) for ping in pings]
+
+    def iperf(self, hosts=None, seconds=5):
+        """Run a bulk transfer between two hosts (the first and last by default) and return the
+        [server, client] rates."""
+        logger = logging.getLogger(__name__)
+        if hosts is None:
+            index = self.index
+            hosts = [self.get(index.name(index.host_by_number(0))),
+                     self.get(index.name(index.host_by_number(index.n_fpga + index.n_leaves)))]
+        client, server = hosts
+        transfer = BulkTransfer(self.sim, client.node, server.node, duration=seconds)
+        self.sim.run()
+        result = ['{:.2f} Mbits/sec'.format(transfer.acked * 8 / 1e6 / seconds),
+                  '{:.2f} Mbits/sec'.format(transfer.sent * 8 / 1e6 / seconds)]
+        logger.info('Results: %s', result)
+        return result
+
+
+def setup_simulation(spread, depth, bandwidth, delay, loss, fpga, fpga_bandwidth, fpga_delay,
+                     fpga_loss, poisson, seed=None, placements=None):
+    """Build a simulated network with the same parameters as setup_mininet."""
+    link_opts, fpga_link_opts, cloud_link_opts = link_options(
+        bandwidth, delay, loss, fpga_bandwidth, fpga_delay, fpga_loss, poisson)
+    index = TreeIndex(spread, depth, fpga, placements)
+    sim = Simulator(index, link_opts, fpga_link_opts, cloud_link_opts, seed=seed)
+    for i, placement in enumerate(placements or []):
+        sim.set_nodes(index.placement_hosts(i), placement_link_options(
+            placement, bandwidth, delay, loss, fpga_bandwidth, fpga_delay, fpga_loss, poisson))
+    return SimNet(sim)
@@ -0,0 +1,417 @@
+#!/usr/bin/env python
+"""
+Run fpga_switch_model over a grid of parameters.
+
+Every option of fpga_switch_model takes a comma separated list of values (and integer options
+also take inclusive start:stop[:step] ranges), and the sweep runs every combination of them.
+
+The analytic and simulation backends run one point per core. Mininet points run one shape
+(spread, depth and FPGA level) at a time in a fresh process, since the emulated networks share the
+interfaces and processes of the host. Each shape is built once, and its links are reconfigured in
+place for every point of that shape. If the process of a shape crashes, its remaining points are
+recorded as errors and the sweep moves on to the next shape.
+
+Results are appended to the output file as JSON lines as soon as each point finishes, and points
+already in the output file are skipped, so an interrupted sweep resumes where it left off.
+"""
+
+import functools
+import itertools
+import json
+import multiprocessing
+import time
+
+try:
+    from queue import Empty
+except ImportError:
+    from Queue import Empty
+
+import click
+
+import analytic
+import parameters
+from fpga_switch_model import (configure_logging, reconfigure_network, run_analytic,
+                               setup_network, validate_delay, validate_output,
+                               repetition_options, validate_service_time, workload_options)
+from performance_tests import run_tests
+from results import json_safe, write_records
+from tree_index import TreeIndex
+
+# Seconds between checks that the process of a shape is still running while waiting for results
+SHAPE_POLL_INTERVAL = 1.0
+
+# Order of the parameters of a point, matching the arguments of setup_network
+PARAMETERS = ('spread', 'depth', 'bandwidth', 'delay', 'loss', 'fpga', 'fpga_bandwidth',
+              'fpga_delay', 'fpga_loss', 'poisson')
+# Parameters which only change the options of links, matching the arguments of reconfigure_network
+LINK_PARAMETERS = ('bandwidth', 'delay', 'loss', 'fpga_bandwidth', 'fpga_delay', 'fpga_loss',
+                   'poisson')
+# Parameters of the RPC workload of a point, matching the arguments of workload_options
+WORKLOAD_PARAMETERS = ('workload', 'rate', 'connections', 'duration', 'request_size',
+                       'response_size')
+# Parameters of the repetition of the probes of a point, matching the arguments of
+# repetition_options
+REPETITION_PARAMETERS = ('ci_width', 'ci_confidence', 'max_batches')
+# Parameters of the compute services of a point, matching the arguments of
+# parameters.compute_options
+COMPUTE_PARAMETERS = ('service_distribution', 'queue_size', 'fpga_service_time', 'fpga_pipelines',
+                      'fpga_cpu', 'cloud_service_time', 'cloud_pipelines', 'cloud_cpu')
+# Defaults of the parameters added since the first sweeps, which are left out of the keys of
+# points which have them, so that sweeps written before they existed still resume
+OPTIONAL_PARAMETERS = dict(
+    workload=None, rate=100.0, connections=1, duration=10.0, request_size=64, response_size=64,
+    service_distribution='exponential', queue_size=64, fpga_service_time='1ms', fpga_pipelines=1,
+    fpga_cpu=None, cloud_service_time='100us', cloud_pipelines=4, cloud_cpu=None, ci_width=None,
+    ci_confidence=0.95, max_batches=10)
+
+
+def values_of(value_type):
+    """Return a click callback parsing a comma separated list of values of the given type, where
+    integers may also be given as inclusive start:stop[:step] ranges and 'none' means unset."""
+    def parse_values(ctx, param, value):
+        values = []
+        for item in value.split(','):
+            item = item.strip()
+            if item.lower() in ('', 'none'):
+                values.append(None)
+            elif isinstance(value_type, click.IntRange):
+                bounds = [value_type.convert(bound, param, ctx) for bound in item.split(':')]
+                if len(bounds) == 1:
+                    values.extend(bounds)
+                elif len(bounds) == 2:
+                    values.extend(range(bounds[0], bounds[1] + 1))
+                elif len(bounds) == 3 and bounds[2] > 0:
+                    values.extend(range(bounds[0], bounds[1] + 1, bounds[2]))
+                else:
+                    raise click.BadParameter(
+                        "'{}' is not a value or a start:stop[:step] range.".format(item))
+            elif not isinstance(value_type, click.ParamType):
+                # A validation callback, validate_delay if None
+                values.append((value_type or validate_delay)(ctx, param, item))
+            else:
+                values.append(value_type.convert(item, param, ctx))
+        return values
+    return parse_values
+
+
+def grid(values):
+    """Return every combination of the given lists of values, as a list of dicts."""
+    names = sorted(values)
+    return [dict(zip(names, combination))
+            for combination in itertools.product(*(values[name] for name in names))]
+
+
+def point_key(point):
+    """Return a key identifying a point, leaving out optional parameters with their defaults."""
+    return json.dumps(dict((name, value) for name, value in point.items()
+                           if name not in OPTIONAL_PARAMETERS
+                           or value != OPTIONAL_PARAMETERS[name]), sort_keys=True)
+
+
+def completed_points(output):
+    """Return the keys of the points which completed successfully in an existing output file."""
+    done = set()
+    try:
+        with open(output, 'rt') as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except ValueError:
+                    # The last line of an interrupted sweep may be incomplete
+                    continue
+                if 'error' not in result:
+                    done.add(point_key(result['point']))
+    except IOError:
+        pass
+    return done
+
+
+def point_fpga(point):
+    """Return the FPGA level of a point, None if it has no FPGA hosts."""
+    return TreeIndex(point['spread'], point['depth'], point['fpga']).fpga
+
+
+def point_workload(point):
+    """Return the arguments of workload.run_workload for a point, or None if it has no workload or
+    its backend cannot run one."""
+    if point['backend'] != 'mininet' or point.get('workload') is None:
+        return None
+    return workload_options(*[point[name] for name in WORKLOAD_PARAMETERS])
+
+
+def point_repetition(point):
+    """Return the arguments of repetition.repeat for a point, or None if its probes run once."""
+    if point['backend'] == 'analytic' or point.get('ci_width') is None:
+        return None
+    return repetition_options(*[point[name] for name in REPETITION_PARAMETERS])
+
+
+def point_compute(point):
+    """Return the compute options of a point, or None if it was made without them."""
+    if any(name not in point for name in COMPUTE_PARAMETERS):
+        return None
+    return parameters.compute_options(*[point[name] for name in COMPUTE_PARAMETERS])
+
+
+def run_point(point, log='warning'):
+    """Evaluate a single point of the sweep and return its measurements.
+
+    Every leaf is equivalent, so the analytic backend only reports the prediction for h0."""
+    start = time.time()
+    result = dict(point=point)
+    args = [point[name] for name in PARAMETERS]
+    try:
+        if point['backend'] == 'analytic':
+            prediction = run_analytic(*(args + [point['ping_all'], point['iperf'],
+                                                point['cloud_fpga']]))
+            measurements = ([] if prediction is None
+                            else analytic.prediction_measurements(
+                                prediction, TreeIndex(point['spread'], point['depth'],
+                                                      point['fpga']))[:1])
+        else:
+            net = setup_network(point['backend'], log, *args, compute=point_compute(point))
+            try:
+                measurements = run_tests(net, point_fpga(point), point['cloud_fpga'],
+                                         point['ping_all'], point['iperf'], point_workload(point),
+                                         repetition=point_repetition(point))
+            finally:
+                net.stop()
+        result['measurements'] = [json_safe(measurement) for measurement in measurements]
+    except Exception as ex:
+        result['error'] = '{}: {}'.format(type(ex).__name__, ex)
+    result['elapsed'] = time.time() - start
+    return result
+
+
+def shape_key(point):
+    """Return the parameters which decide the shape of the network of a point.
+
+    The compute options are set when the hosts are created, so they are part of the shape."""
+    return ((point['spread'], point['depth'], point['fpga'])
+            + tuple(point.get(name) for name in COMPUTE_PARAMETERS))
+
+
+def run_shape(points, queue, log='warning'):
+    """Evaluate points which share a shape on a single network, putting each result on the queue as
+    soon as it completes.
+
+    The network is built for the first point, and its links are reconfigured in place for each
+    following point."""
+    net = None
+    try:
+        for point in points:
+            start = time.time()
+            result = dict(point=point)
+            try:
+                if net is None:
+                    net = setup_network(point['backend'], log,
+                                        *[point[name] for name in PARAMETERS],
+                                        compute=point_compute(point))
+                else:
+                    reconfigure_network(point['backend'], net,
+                                        *[point[name] for name in LINK_PARAMETERS])
+                measurements = run_tests(net, point_fpga(point), point['cloud_fpga'],
+                                         point['ping_all'], point['iperf'], point_workload(point),
+                                         repetition=point_repetition(point))
+                result['measurements'] = [json_safe(measurement) for measurement in measurements]
+            except Exception as ex:
+                result['error'] = '{}: {}'.format(type(ex).__name__, ex)
+            result['elapsed'] = time.time() - start
+            queue.put(result)
+    finally:
+        if net is not None:
+            net.stop()
+
+
+def shape_results(shapes, log='warning', target=run_shape, interval=SHAPE_POLL_INTERVAL):
+    """Run each list of points which share a shape with target (run_shape) in a fresh process,
+    one shape at a time, and yield the result of every point.
+
+    If a process exits without putting a result on the queue for each of its points, because it
+    crashed or was killed, the rest of its points get error results rather than being waited for
+    forever."""
+    queue = multiprocessing.Queue()
+    for points in shapes:
+        process = multiprocessing.Process(target=target, args=(points, queue, log))
+        process.start()
+        remaining = dict((point_key(point), point) for point in points)
+        try:
+            while remaining:
+                try:
+                    result = queue.get(timeout=interval)
+                except Empty:
+                    if process.is_alive():
+                        continue
+                    # Results put just before the process exited may still be in transit
+                    try:
+                        result = queue.get(timeout=interval)
+                    except Empty:
+                        break
+                remaining.pop(point_key(result['point']), None)
+                yield result
+            process.join()
+        finally:
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        for point in remaining.values():
+            yield dict(point=point, elapsed=0.0, error='Process exited with code {}'.format(
+                process.exitcode))
+
+
+@click.command()
+@click.option('-s', '--spread', default='2', show_default=True,
+              callback=values_of(click.IntRange(min=1)),
+              help='Numbers of children each node will have.')
+@click.option('-d', '--depth', default='4', show_default=True,
+              callback=values_of(click.IntRange(min=1)),
+              help='Numbers of levels in the tree.')
+@click.option('-b', '--bandwidth', default='10', show_default=True,
+              callback=values_of(click.IntRange(min=0)),
+              help='Max bandwidths of all links in Mbps.')
+@click.option('-e', '--delay', default='1ms', show_default=True, callback=values_of(None),
+              help='Delays of all links.')
+@click.option('-l', '--loss', default='0', show_default=True,
+              callback=values_of(click.IntRange(0, 100)),
+              help='Percentage chances of packet loss for all links.')
+@click.option('-f', '--fpga', default='none', show_default=True,
+              callback=values_of(click.IntRange(min=0)),
+              help='Levels of the tree which should be modelled as FPGA switches (root is 0).')
+@click.option('--fpga-bandwidth', default='504', show_default=True,
+              callback=values_of(click.IntRange(min=0)),
+              help='Max bandwidths of FPGA switches in Mbps.')
+@click.option('--fpga-delay', default='none', show_default=True, callback=values_of(None),
+              help='Delays of FPGA switches.')
+@click.option('--fpga-loss', default='none', show_default=True,
+              callback=values_of(click.IntRange(0, 100)),
+              help='Percentage chances of packet loss for FPGA switches.')
+@click.option('-p', '--ping-all', default='false', show_default=True,
+              callback=values_of(click.BOOL), help='Run a ping test between all hosts.')
+@click.option('-i', '--iperf', default='false', show_default=True,
+              callback=values_of(click.BOOL), help='Test bandwidth between first and last host.')
+@click.option('-c', '--cloud-fpga', default='true', show_default=True,
+              callback=values_of(click.BOOL),
+              help='Test performance between leaf and root or leaf and FPGA switch')
+@click.option('--ci-width', default='none', show_default=True,
+              callback=values_of(click.FloatRange(min=0.0001)),
+              help='Repeat the probes of each point in batches until the confidence interval of '
+                   'each estimate is within this fraction of it, so points with more variance get '
+                   'more repetitions.')
+@click.option('--ci-confidence', default='0.95', show_default=True,
+              callback=values_of(click.FloatRange(0.5, 0.999)),
+              help='Confidence levels of the intervals of --ci-width.')
+@click.option('--max-batches', default='10', show_default=True,
+              callback=values_of(click.IntRange(min=1)),
+              help='Most batches of each probe of a point to run for --ci-width.')
+@click.option('--poisson', default='false', show_default=True, callback=values_of(click.BOOL),
+              help="Use a poisson distribution for link delay.")
+@click.option('-w', '--workload', default='none', show_default=True,
+              callback=values_of(click.Choice(['open', 'closed'])),
+              help='RPC workloads to run from every leaf with the mininet backend.')
+@click.option('--rate', default='100', show_default=True,
+              callback=values_of(click.FloatRange(min=0.001)),
+              help='Requests per second from each leaf of open loop workloads.')
+@click.option('--connections', default='1', show_default=True,
+              callback=values_of(click.IntRange(min=1)),
+              help='Connections from each leaf of workloads.')
+@click.option('--duration', default='10', show_default=True,
+              callback=values_of(click.FloatRange(min=0)),
+              help='Seconds to run workloads for.')
+@click.option('--request-size', default='64', show_default=True,
+              callback=values_of(click.IntRange(min=0)),
+              help='Bytes of payload in each request of workloads.')
+@click.option('--response-size', default='64', show_default=True,
+              callback=values_of(click.IntRange(min=0)),
+              help='Bytes of payload in each response of workloads.')
+@click.option('--service-distribution', default='exponential', show_default=True,
+              callback=values_of(click.Choice(['constant', 'exponential', 'uniform'])),
+              help='Distributions of the service times of the compute services.')
+@click.option('--queue-size', default='64', show_default=True,
+              callback=values_of(click.IntRange(min=0)),
+              help='Requests which may wait for a pipeline of a compute service.')
+@click.option('--fpga-service-time', default='1ms', show_default=True,
+              callback=values_of(validate_service_time),
+              help='Mean CPU times an FPGA host spends on each request of workloads.')
+@click.option('--fpga-pipelines', default='1', show_default=True,
+              callback=values_of(click.IntRange(min=0)),
+              help='Requests each FPGA host serves at once.')
+@click.option('--fpga-cpu', default='none', show_default=True,
+              callback=values_of(click.FloatRange(0, 1)),
+              help='Fractions of the CPU of the machine each FPGA host may use.')
+@click.option('--cloud-service-time', default='100us', show_default=True,
+              callback=values_of(validate_service_time),
+              help='Mean CPU times the cloud spends on each request of workloads.')
+@click.option('--cloud-pipelines', default='4', show_default=True,
+              callback=values_of(click.IntRange(min=0)),
+              help='Requests the cloud serves at once.')
+@click.option('--cloud-cpu', default='none', show_default=True,
+              callback=values_of(click.FloatRange(0, 1)),
+              help='Fractions of the CPU of the machine the cloud may use.')
+@click.option('--backend', default='analytic', show_default=True,
+              type=click.Choice(['mininet', 'simulation', 'analytic']),
+              help='Emulate the network with mininet, simulate it packet by packet, or predict its '
+                   'performance analytically.')
+@click.option('-o', '--output', default='sweep.jsonl', show_default=True,
+              help='JSON lines file to append results to. Points already in it are skipped.')
+@click.option('-r', '--records', multiple=True, callback=validate_output,
+              help='Also append a record of each measurement to this .csv, .jsonl or .npz file. '
+                   'May be given more than once.')
+@click.option('-j', '--jobs', type=click.IntRange(min=1),
+              help='Number of points to run at once with the analytic and simulation backends. '
+                   'Defaults to the number of cores.')
+@click.option('--log', default='warning', show_default=True,
+              type=click.Choice(['debug', 'info', 'output', 'warning', 'error', 'critical']),
+              help='Set the log level.')
+def sweep(backend, output, records, jobs, log, **values):
+    """Run every combination of the given parameters."""
+    logger = configure_logging(log)
+
+    points = grid(values)
+    for point in points:
+        point['backend'] = backend
+    done = completed_points(output)
+    pending = [point for point in points if point_key(point) not in done]
+    logger.info('Running %d of %d points (%d already completed)', len(pending), len(points),
+                len(points) - len(pending))
+
+    pool = None
+    if backend == 'mininet':
+        # Emulated networks cannot share the machine, so each shape of network gets a fresh
+        # process, which builds it once and reconfigures its links for every point
+        shapes = {}
+        for point in pending:
+            shapes.setdefault(shape_key(point), []).append(point)
+        results = shape_results(list(shapes.values()), log)
+    else:
+        pool = multiprocessing.Pool(processes=jobs)
+        results = pool.imap_unordered(functools.partial(run_point, log=log), pending)
+
+    failed = 0
+    try:
+        with open(output, 'at') as f:
+            for result in results:
+                f.write(json.dumps(result, sort_keys=True) + '\n')
+                f.flush()
+                if 'error' in result:
+                    failed += 1
+                    logger.error('Point %s failed: %s', point_key(result['point']),
+                                 result['error'])
+                else:
+                    point = result['point']
+                    write_records(records, result['measurements'], backend=backend,
+                                  **dict((name, point[name]) for name in PARAMETERS))
+        if pool is not None:
+            pool.close()
+    finally:
+        if pool is None:
+            # Stops the process of the current shape
+            results.close()
+        else:
+            pool.terminate()
+            pool.join()
+
+    logger.info('Sweep complete: %d points run, %d failed', len(pending), failed)
+
+
+if __name__ == '__main__':
+    sweep()
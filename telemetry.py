@@ -0,0 +1,267 @@
+"""
+Live counters of the links of an emulated network, sampled in the background.
+
+Every link of a mininet network has at least one end on a switch, and the interfaces of the
+switches are in the root network namespace, so one process can read the counters of every link
+without entering a namespace. Each sample reads the byte, packet and drop counters of every
+interface (those of /sys/class/net/<interface>/statistics) with a single read of /proc/net/dev,
+and the drops and backlog of every root qdisc (the htb and netem qdiscs of TCLink) from a single
+`tc -s qdisc show`, rather than reading files or starting a process per interface.
+
+Samples are kept in a fixed-size ring buffer, so a long run keeps its latest samples in constant
+memory. When sampling stops, each interface is summarised as a telemetry measurement of the
+direction it sends in, and of the direction it receives in if the other end is a host: its mean and
+peak rates, its drops and its largest backlog, which show the bottleneck links of the tests run
+meanwhile. The time spent sampling is logged, to check that the sampler can stay on.
+"""
+
+import logging
+import re
+import subprocess
+import threading
+import time
+
+import numpy as np
+
+DEFAULT_INTERVAL_S = 1.0
+DEFAULT_CAPACITY = 600
+NET_DEV = '/proc/net/dev'
+QDISC_COMMAND = ('tc', '-s', 'qdisc', 'show')
+# Counters of each interface, named as in /sys/class/net/<interface>/statistics, and their columns
+# in /proc/net/dev
+COUNTERS = ('rx_bytes', 'tx_bytes', 'rx_packets', 'tx_packets', 'rx_dropped', 'tx_dropped')
+NET_DEV_COLUMNS = (0, 8, 1, 9, 3, 11)
+# Statistics of the root qdisc of each interface, which include those of its children
+QDISC_STATS = ('qdisc_drops', 'backlog_bytes', 'backlog_packets')
+STATS = COUNTERS + QDISC_STATS
+
+QDISC = re.compile(r'^qdisc \S+ \S+ dev (\S+) (\S+)')
+SENT = re.compile(r'Sent \d+ bytes \d+ pkt \(dropped (\d+)')
+BACKLOG = re.compile(r'backlog ([0-9.]+)([KMG]?)b (\d+)p')
+SIZE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+
+def link_interfaces(net):
+    """Return (interface, node, peer) names of every end of a link of a started mininet network
+    which is on a switch. A ShardedNet only has those of its coordinator and of the links which
+    join the shards."""
+    mininet = getattr(net, 'net', net)
+    switches = set(mininet.switches)
+    interfaces = []
+    for link in mininet.links:
+        for intf, peer in ((link.intf1, link.intf2), (link.intf2, link.intf1)):
+            if intf.node in switches:
+                interfaces.append((intf.name, intf.node.name, peer.node.name))
+    partition = getattr(net, 'partition', None)
+    if partition is not None:
+        from sharding import tunnel_names
+
+        index = partition.index
+        for upper, lower in partition.links():
+            upper_intf, lower_intf = tunnel_names(lower)
+            interfaces += [(upper_intf, index.name(upper), index.name(lower)),
+                           (lower_intf, index.name(lower), index.name(upper))]
+    return interfaces
+
+
+def parse_net_dev(text, interfaces=None):
+    """Parse the contents of /proc/net/dev into the COUNTERS of each interface, by interface name,
+    keeping only the given interfaces if any."""
+    counters = {}
+    for line in text.splitlines()[2:]:
+        name, _, columns = line.partition(':')
+        name = name.strip()
+        if interfaces is not None and name not in interfaces:
+            continue
+        columns = columns.split()
+        counters[name] = [float(columns[column]) for column in NET_DEV_COLUMNS]
+    return counters
+
+
+def parse_qdiscs(output):
+    """Parse the output of `tc -s qdisc show` into the QDISC_STATS of the root qdisc of each
+    interface, by interface name."""
+    stats = {}
+    device = None
+    for line in output.splitlines():
+        match = QDISC.match(line)
+        if match:
+            device = match.group(1) if match.group(2) == 'root' else None
+            if device is not None:
+                stats[device] = [float('nan')] * len(QDISC_STATS)
+            continue
+        if device is None:
+            continue
+        sent = SENT.search(line)
+        if sent:
+            stats[device][0] = float(sent.group(1))
+        backlog = BACKLOG.search(line)
+        if backlog:
+            stats[device][1] = float(backlog.group(1)) * SIZE_UNITS[backlog.group(2)]
+            stats[device][2] = float(backlog.group(3))
+    return stats
+
+
+class RingBuffer(object):
+    """The latest capacity samples of an array of a fixed shape, with the time of each."""
+
+    def __init__(self, capacity, shape):
+        self.capacity = capacity
+        self.times = np.full(capacity, np.nan)
+        self.values = np.full((capacity,) + tuple(shape), np.nan)
+        self.count = 0
+
+    def append(self, timestamp, values):
+        i = self.count % self.capacity
+        self.times[i] = timestamp
+        self.values[i] = values
+        self.count += 1
+
+    def samples(self):
+        """Return the times and values of the samples kept, oldest first."""
+        if self.count <= self.capacity:
+            return self.times[:self.count], self.values[:self.count]
+        order = np.roll(np.arange(self.capacity), -(self.count % self.capacity))
+        return self.times[order], self.values[order]
+
+
+class TelemetrySampler(object):
+    """Sample the STATS of the given (interface, node, peer) ends of links every interval seconds
+    in a background thread, keeping the latest capacity samples."""
+
+    def __init__(self, interfaces, interval=DEFAULT_INTERVAL_S, capacity=DEFAULT_CAPACITY,
+                 net_dev=NET_DEV, qdisc_command=QDISC_COMMAND):
+        self.interfaces = list(interfaces)
+        self.interval = interval
+        self.net_dev = net_dev
+        self.qdisc_command = qdisc_command
+        self.buffer = RingBuffer(capacity, (len(self.interfaces), len(STATS)))
+        self.names = set(name for name, _, _ in self.interfaces)
+        self.busy = 0.0
+        self.started = None
+        self.stopped = None
+        self.thread = None
+        self.done = threading.Event()
+
+    def sample(self):
+        """Read the counters of every interface once into the buffer."""
+        start = time.time()
+        with open(self.net_dev, 'rb') as f:
+            counters = parse_net_dev(f.read().decode(), self.names)
+        qdiscs = {}
+        if self.qdisc_command:
+            try:
+                qdiscs = parse_qdiscs(subprocess.check_output(list(self.qdisc_command)).decode())
+            except (OSError, subprocess.CalledProcessError):
+                pass
+        # Interfaces which went away are NaN
+        missing = [float('nan')] * len(COUNTERS)
+        missing_qdisc = [float('nan')] * len(QDISC_STATS)
+        values = np.array([counters.get(name, missing) + qdiscs.get(name, missing_qdisc)
+                           for name, _, _ in self.interfaces], dtype=float)
+        self.buffer.append(start, values)
+        self.busy += time.time() - start
+
+    def _run(self):
+        while not self.done.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        self.started = time.time()
+        self.sample()
+        self.thread = threading.Thread(target=self._run, name='telemetry')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """Stop sampling after a last sample, before the interfaces go away."""
+        self.done.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.stopped is None:
+            self.sample()
+        self.stopped = time.time()
+
+    def overhead(self):
+        """Return the fraction of the time sampled for which the sampler was busy."""
+        elapsed = (self.stopped or time.time()) - (self.started or time.time())
+        return self.busy / elapsed if elapsed > 0 else 0.0
+
+    def measurements(self):
+        """Return a telemetry measurement of the direction each interface sends in, and of the
+        direction it receives in if the other end is not also sampled, over the samples kept."""
+        times, values = self.buffer.samples()
+        stat = dict((name, i) for i, name in enumerate(STATS))
+        sampled = set((node, peer) for _, node, peer in self.interfaces)
+        measurements = []
+        if len(times) < 2:
+            return measurements
+        seconds = np.diff(times)
+        for i, (_, node, peer) in enumerate(self.interfaces):
+            directions = [(node, peer, 'tx', values[:, i, stat['qdisc_drops']],
+                           values[:, i, stat['backlog_packets']])]
+            if (peer, node) not in sampled:
+                directions.append((peer, node, 'rx', None, None))
+            for src, dst, side, qdisc_drops, backlog in directions:
+                counted = values[:, i, stat[side + '_bytes']]
+                rates = np.diff(counted) * 8 / 1e6 / seconds
+                dropped = values[:, i, stat[side + '_dropped']]
+                drops = dropped[-1] - dropped[0]
+                if qdisc_drops is not None:
+                    drops += np.nan_to_num(qdisc_drops[-1] - qdisc_drops[0])
+                measurements.append(dict(
+                    test='telemetry', src=src, dst=dst, samples=len(times),
+                    throughput_mbps=(counted[-1] - counted[0]) * 8 / 1e6 / (times[-1] - times[0]),
+                    peak_mbps=float(np.nanmax(rates)) if np.any(np.isfinite(rates)) else np.nan,
+                    drops=drops,
+                    backlog_max=(float(np.nanmax(backlog))
+                                 if backlog is not None and np.any(np.isfinite(backlog))
+                                 else np.nan)))
+        return measurements
+
+    def save(self, path):
+        """Save the samples kept to an .npz file, as the arrays times, values (sample, interface,
+        stat), interfaces, nodes, peers and stats."""
+        times, values = self.buffer.samples()
+        names = list(zip(*self.interfaces)) if self.interfaces else [(), (), ()]
+        np.savez(path, times=times, values=values, interfaces=np.array(names[0], dtype=np.str_),
+                 nodes=np.array(names[1], dtype=np.str_), peers=np.array(names[2], dtype=np.str_),
+                 stats=np.array(STATS))
+
+
+def start_telemetry(net, interval=DEFAULT_INTERVAL_S, capacity=DEFAULT_CAPACITY):
+    """Start sampling the links of a started mininet network, and return the sampler."""
+    logger = logging.getLogger(__name__)
+    interfaces = link_interfaces(net)
+    if hasattr(net, 'partition'):
+        logger.warning('Only the links of the coordinator shard and between shards are sampled.')
+    logger.info('Sampling the counters of %d link interfaces every %g s', len(interfaces),
+                interval)
+    sampler = TelemetrySampler(interfaces, interval, capacity)
+    sampler.start()
+    return sampler
+
+
+def stop_telemetry(sampler, output=None, top=5):
+    """Stop a sampler started by start_telemetry, save its samples to an output .npz file if
+    given, and return its measurements."""
+    logger = logging.getLogger(__name__)
+    sampler.stop()
+    measurements = sampler.measurements()
+    samples = min(sampler.buffer.count, sampler.buffer.capacity)
+    logger.info('Took %d telemetry samples of %d interfaces, %.2f ms each (%.3f%% of a core)',
+                sampler.buffer.count, len(sampler.interfaces),
+                sampler.busy / max(sampler.buffer.count, 1) * 1e3, sampler.overhead() * 100)
+    busiest = sorted((measurement for measurement in measurements
+                      if np.isfinite(measurement['peak_mbps'])),
+                     key=lambda measurement: -measurement['peak_mbps'])[:top]
+    for measurement in busiest:
+        logger.info('  %s->%s: peak %.3f Mbps, mean %.3f Mbps, %g drops, backlog up to %g packets',
+                    measurement['src'], measurement['dst'], measurement['peak_mbps'],
+                    measurement['throughput_mbps'], measurement['drops'],
+                    measurement['backlog_max'])
+    if output:
+        sampler.save(output)
+        logger.info('Saved %d telemetry samples to %s', samples, output)
+    return measurements
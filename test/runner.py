@@ -1,22 +1,241 @@
 #!/usr/bin/env python
+"""
+Discover and run the tests, sharing emulated networks between them.
 
+Building and tearing down a Mininet network takes far longer than any test run on it, so tests get
+their networks from network(), which keeps the network it built last running. A test asking for
+the same shape of TreeTopoGeneric (spread, depth and FPGA level) gets that network back, with its
+links reconfigured in place if their options differ, and only a new shape is built from scratch.
+Between tests, the network is reset cheaply by interrupting its hosts and killing any processes
+left running on them.
+
+Test cases which use network() are decorated with topology_tests, which turns each of their test
+methods into one test per topology. The runner orders those tests by shape, so each shape is built
+once, and with --jobs splits the shapes between parallel workers. Each worker runs in its own
+network namespace, with Linux bridges as switches and no controller, since Open vSwitch bridges,
+the controller port and host cgroups are shared by the whole machine.
+"""
+
+import atexit
 import os
+import subprocess
 import sys
-from unittest import TextTestRunner, TestLoader
+import tempfile
+from unittest import TestLoader, TestSuite, TextTestRunner
+
 import click
 
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from tree_index import TreeIndex  # noqa: E402
+
+# Set in the environment of the workers started by --jobs
+WORKER_ENV = 'FPGA_SWITCH_MODEL_TEST_WORKER'
+# Arguments of TreeTopoGeneric which only change the options of links
+LINK_OPTIONS = ('bandwidth', 'delay', 'loss', 'fpga_bandwidth', 'fpga_delay', 'fpga_loss',
+                'poisson')
+
+# The network built last, its shape and the options its links currently have
+_running = dict(net=None, shape=None, options=None)
+
+
+def shape_of(topology):
+    """Return the spread, depth and FPGA level of a dict of TreeTopoGeneric arguments.
+
+    Topologies whose FPGA level has no FPGA hosts share the shape of those without one."""
+    index = TreeIndex(topology['spread'], topology['depth'], topology.get('fpga'))
+    return index.spread, index.depth, index.fpga
+
+
+def _build(topo):
+    from mininet.clean import Cleanup
+    from mininet.link import TCLink
+    from mininet.net import Mininet
+    from mininet.node import CPULimitedHost, Host, LinuxBridge
+
+    if os.environ.get(WORKER_ENV):
+        net = Mininet(topo=topo, host=Host, switch=LinuxBridge, controller=None, link=TCLink,
+                      autoStaticArp=True)
+    else:
+        Cleanup.cleanup()
+        net = Mininet(topo=topo, host=CPULimitedHost, link=TCLink, autoStaticArp=True)
+    net.start()
+    return net
+
+
+def reset_network(net):
+    """Interrupt any command still running on the hosts of a network, and kill the processes left
+    running in the background by previous tests."""
+    for host in net.hosts:
+        if host.waiting:
+            host.sendInt()
+            host.waitOutput()
+
+    shells = dict((host.pid, host) for host in net.hosts)
+    try:
+        output = subprocess.check_output(['ps', '-o', 'pid=,ppid=', '--ppid',
+                                          ','.join(str(pid) for pid in shells)])
+    except subprocess.CalledProcessError:
+        # ps fails when no process matches
+        return
+    pids = output.split()
+    subprocess.call(['kill', '-9'] + [pid.decode() for pid in pids[::2]])
+    for ppid in set(int(ppid) for ppid in pids[1::2]):
+        # Collect the killed jobs, so their notices don't end up in the output of the next command
+        shells[ppid].cmd('wait')
+
+
+def stop_network():
+    """Stop the running network, if there is one."""
+    net = _running['net']
+    _running.update(net=None, shape=None, options=None)
+    if net is not None:
+        net.stop()
+
+
+atexit.register(stop_network)
+
+
+def network(**topology):
+    """Return a started network built from TreeTopoGeneric(**topology).
+
+    The network is shared with every other test asking for the same shape, and is reset and has
+    its links reconfigured rather than being rebuilt. Topologies with Poisson delays draw new
+    delays for every test, as they would for a new network."""
+    from mininet_functions import reconfigure_network, TreeTopoGeneric
+
+    shape = shape_of(topology)
+    options = dict((name, topology.get(name)) for name in LINK_OPTIONS)
+    net = _running['net']
+    if net is not None and _running['shape'] == shape:
+        reset_network(net)
+        if options != _running['options'] or options['poisson']:
+            reconfigure_network(net, **options)
+    else:
+        stop_network()
+        net = _build(TreeTopoGeneric(**topology))
+        _running.update(net=net, shape=shape)
+    _running['options'] = options
+    return net
+
+
+def topology_tests(cls):
+    """Class decorator which replaces every test method of a test case by one test for each dict of
+    TreeTopoGeneric arguments in its topologies attribute.
+
+    The test for the n-th topology is named <method>_<n>, and is passed network(**topology)."""
+    def make_test(method, topology):
+        def test(self):
+            return method(self, network(**topology))
+        test.__doc__ = method.__doc__
+        test.topology = topology
+        return test
+
+    for name in [name for name in vars(cls) if name.startswith('test')]:
+        method = getattr(cls, name)
+        delattr(cls, name)
+        for i, topology in enumerate(cls.topologies):
+            setattr(cls, '{}_{}'.format(name, i), make_test(method, topology))
+    return cls
+
+
+def iter_tests(suite):
+    """Yield every test of a suite, flattening the suites nested in it."""
+    for test in suite:
+        if isinstance(test, TestSuite):
+            for nested in iter_tests(test):
+                yield nested
+        else:
+            yield test
+
+
+def topology_of(test):
+    """Return the topology a test needs a network for, or None if it needs none."""
+    return getattr(getattr(test, getattr(test, '_testMethodName', ''), None), 'topology', None)
+
+
+def group_by_shape(tests):
+    """Split tests into those which need no network and a dict of those which do by shape."""
+    plain, shapes = [], {}
+    for test in tests:
+        topology = topology_of(test)
+        if topology is None:
+            plain.append(test)
+        else:
+            shapes.setdefault(shape_of(topology), []).append(test)
+    return plain, shapes
+
+
+def assign_shapes(shapes, jobs):
+    """Split the shapes between jobs workers, balancing the number of nodes each builds.
+
+    Returns a list of the shapes given to each worker."""
+    workers = [[] for _ in range(jobs)]
+    loads = [0] * jobs
+    sizes = dict((shape, TreeIndex(*shape).n_nodes) for shape in shapes)
+    # Give each shape, largest first, to the least loaded worker
+    for shape in sorted(shapes, key=lambda shape: (-sizes[shape], shape)):
+        worker = loads.index(min(loads))
+        workers[worker].append(shape)
+        loads[worker] += sizes[shape]
+    return [worker for worker in workers if worker]
+
+
+def _start_worker(tests, verbose):
+    """Run tests in a new process, in its own network namespace."""
+    env = dict(os.environ)
+    env[WORKER_ENV] = '1'
+    output = tempfile.TemporaryFile()
+    args = ['unshare', '--net', sys.executable, os.path.realpath(__file__), '--worker']
+    if verbose:
+        args.append('--verbose')
+    process = subprocess.Popen(args + [test.id() for test in tests], env=env, stdout=output,
+                               stderr=subprocess.STDOUT)
+    return process, output
+
 
 @click.command()
 @click.option('-v', '--verbose', is_flag=True, help='verbose output')
 @click.option('-t', '--test-dir', default=os.path.dirname(os.path.realpath(__file__)), type=str,
               help='The directory to look for tests in')
-def run_tests(test_dir, verbose):
+@click.option('-j', '--jobs', default=1, show_default=True, type=click.IntRange(min=1),
+              help='Number of workers to split the networks of the tests between.')
+@click.option('--worker', is_flag=True,
+              help='Run the given tests in this process, as a worker started by --jobs.')
+@click.argument('tests', nargs=-1)
+def run_tests(test_dir, verbose, jobs, worker, tests):
     """discover and run all tests in test_dir"""
-    test_suite = TestLoader().discover(test_dir)
     verbosity = 2 if verbose else 1
+    if worker:
+        # A new network namespace starts with its loopback interface down
+        subprocess.check_call(['ip', 'link', 'set', 'lo', 'up'])
+        result = TextTestRunner(verbosity=verbosity).run(TestLoader().loadTestsFromNames(tests))
+        sys.exit(0 if result.wasSuccessful() else 1)
+
+    test_suite = TestLoader().discover(test_dir, top_level_dir=ROOT)
+    plain, shapes = group_by_shape(iter_tests(test_suite))
+
+    workers = []
+    if jobs > 1 and shapes:
+        for worker_shapes in assign_shapes(shapes, jobs):
+            workers.append(_start_worker(
+                [test for shape in worker_shapes for test in shapes[shape]], verbose))
+    else:
+        # Run the tests of each shape together, so each network is built once
+        plain.extend(test for shape in sorted(shapes, key=str) for test in shapes[shape])
+
     # run tests
-    result = TextTestRunner(verbosity=verbosity).run(test_suite)
-    if result.wasSuccessful():
+    result = TextTestRunner(verbosity=verbosity).run(TestSuite(plain))
+    success = result.wasSuccessful()
+    for process, output in workers:
+        success = process.wait() == 0 and success
+        output.seek(0)
+        sys.stderr.write(output.read().decode())
+        output.close()
+
+    if success:
         sys.exit(0)
     sys.exit(1)
 
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+
+import unittest
+
+from aggregation import Aggregation, aggregate_index, aggregation_level
+from parameters import placement_options
+from tree_index import TreeIndex
+from workload import workload_targets
+
+
+class TestAggregation(unittest.TestCase):
+    """Test the Aggregation class"""
+    def test_switch(self):
+        index = TreeIndex(3, 4, 1)
+        aggregation = Aggregation(index, aggregation_level(index, 'switch'))
+        self.assertEqual(2, aggregation.level)
+        self.assertEqual(3, aggregation.weight)
+        self.assertEqual(['h0', 'h3', 'h6'], [index.name(leaf)
+                                              for leaf in aggregation.representatives()[:3]])
+        self.assertEqual(index.leaf(3), aggregation.representative(index.leaf(5)))
+        # Every switch stays, with one leaf each
+        nodes = aggregation.nodes()
+        self.assertEqual(index.n_switches + 9 + index.n_fpga + 1, len(nodes))
+        self.assertEqual(3, aggregation.bandwidth_scale(index.leaf(0)))
+        self.assertEqual(1, aggregation.bandwidth_scale(index.node(2, 0)))
+        self.assertEqual(3, aggregation.host_weight('h3'))
+        self.assertEqual(1, aggregation.host_weight('f0'))
+
+    def test_subtree(self):
+        index = TreeIndex(2, 5, 1)
+        aggregation = aggregate_index(2, 5, 1, mode='subtree')
+        self.assertEqual(1, aggregation.level)
+        self.assertEqual(8, aggregation.weight)
+        self.assertEqual([index.leaf(0), index.leaf(8)], aggregation.representatives())
+        # The root, the switches of level 1, the chain down to each representative, the FPGA
+        # hosts and the cloud
+        self.assertEqual(set([0, 1, 2, 3, 7, 15, 5, 11, 23]) | set(index.fpga_hosts())
+                         | set([index.cloud]), aggregation.nodes())
+        self.assertEqual([2, 4, 8], [aggregation.bandwidth_scale(node) for node in (3, 7, 15)])
+        self.assertEqual([('h0', 'f0'), ('h8', 'f1')],
+                         aggregation.targets(workload_targets(index)))
+        self.assertEqual(dict(aggregate_level=1, leaf_weight=8), aggregation.fields())
+
+    def test_levels(self):
+        index = TreeIndex(2, 5, placements=[placement_options(0), placement_options(2, [1])])
+        self.assertEqual(2, aggregation_level(index, 'subtree'))
+        self.assertEqual(0, aggregation_level(TreeIndex(2, 5), 'subtree'))
+        self.assertRaises(ValueError, Aggregation, index, 1)
+        self.assertRaises(ValueError, Aggregation, index, 4)
+        Aggregation(index, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+
+import unittest
+
+import numpy as np
+
+from analytic import predict, prediction_measurements
+from parameters import placement_options
+from tree_index import TreeIndex
+
+
+class TestPredict(unittest.TestCase):
+    """Test the predict function"""
+    def test_cloud(self):
+        prediction = predict(spread=2, depth=4, bandwidth=0, delay='1ms', loss=0, fpga=None)
+        self.assertEqual(8, len(prediction['host']))
+        # 3 standard links and a 0ms cloud link, each crossed in both directions
+        np.testing.assert_allclose(prediction['cloud_rtt'], 6.0, rtol=1e-3)
+        np.testing.assert_allclose(prediction['cloud_bandwidth'], 1000)
+        np.testing.assert_allclose(prediction['cloud_loss'], 0)
+        self.assertTrue(np.all(prediction['fpga_host'] == -1))
+        self.assertTrue(np.all(np.isnan(prediction['fpga_rtt'])))
+
+    def test_fpga(self):
+        prediction = predict(spread=3, depth=4, bandwidth=10, delay='2ms', loss=1, fpga=2,
+                             fpga_bandwidth=504, fpga_delay='10ms', fpga_loss=0)
+        np.testing.assert_array_equal(prediction['fpga_host'], np.arange(27) // 3)
+        # 1 standard link and the FPGA link with half of its delay, plus serialisation of a ping
+        serialisation = 2 * (84 * 8 / 10e6 + 84 * 8 / 504e6) * 1e3
+        np.testing.assert_allclose(prediction['fpga_rtt'], 14.0 + serialisation)
+        np.testing.assert_allclose(prediction['fpga_bandwidth'], 10)
+        np.testing.assert_allclose(prediction['fpga_loss'], (1 - 0.99 ** 2) * 100)
+        np.testing.assert_allclose(prediction['cloud_loss'], (1 - 0.99 ** 6) * 100)
+
+    def test_fpga_below_leaves(self):
+        prediction = predict(spread=5, depth=2, bandwidth=10, delay='1ms', loss=0, fpga=3)
+        self.assertTrue(np.all(np.isnan(prediction['fpga_rtt'])))
+
+
+class TestPredictionMeasurements(unittest.TestCase):
+    """Test the prediction_measurements function"""
+    def test_fpga(self):
+        prediction = predict(3, 3, 10, '1ms', 0, 1)
+        measurements = prediction_measurements(prediction, TreeIndex(3, 3, 1))
+        self.assertEqual(['f0'] * 3 + ['f1'] * 3 + ['f2'] * 3,
+                         [measurement['dst'] for measurement in measurements])
+
+    def test_fpga_below_leaves(self):
+        # There are no FPGA hosts, so the prediction is for the cloud
+        prediction = predict(5, 2, 10, '1ms', 0, 3)
+        measurement = prediction_measurements(prediction, TreeIndex(5, 2, 3))[0]
+        self.assertEqual('cloud', measurement['dst'])
+        self.assertEqual(prediction['cloud_rtt'][0], measurement['rtt_avg'])
+
+    def test_placement(self):
+        index = TreeIndex(2, 4, placements=[placement_options(1), placement_options(2, [1])])
+        prediction = predict(2, 4, 10, '1ms', 0, 2)
+        measurements = prediction_measurements(prediction, index, 1)
+        self.assertEqual([('h2', 'f2_1'), ('h3', 'f2_1')],
+                         [(measurement['src'], measurement['dst']) for measurement in measurements])
+        self.assertEqual(prediction['fpga_rtt'][2], measurements[0]['rtt_avg'])
+
+    def test_invalid_depth(self):
+        self.assertRaises(ValueError, predict, 2, 1, 10, '1ms', 0, None)
+
+
+if __name__ == '__main__':
+    unittest.main()
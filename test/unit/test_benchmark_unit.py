@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from click.testing import CliRunner
+
+from benchmark import (_timed_steps, benchmark, calibration, compare_startup, counts,
+                       find_regressions, fit_costs, make_baseline, run_benchmark, time_phases)
+
+
+def row(phase, units, seconds, memory_mb=None, spread=2, depth=3):
+    return dict(phase=phase, spread=spread, depth=depth, fpga=None, units=units, seconds=seconds,
+                memory_mb=memory_mb)
+
+
+class TestCounts(unittest.TestCase):
+    """Test the counts function"""
+    def test_simple(self):
+        self.assertEqual(dict(nodes=10, links=9, leaves=4, depth=3, pairs=42), counts(2, 3, 1))
+
+
+class TestRunBenchmark(unittest.TestCase):
+    """Test the run_benchmark function"""
+    def test_simple(self):
+        shapes = [dict(spread=2, depth=3, fpga=None), dict(spread=3, depth=3, fpga=1)]
+        rows = run_benchmark(shapes, ['index', 'simulation'], repeat=2)
+        self.assertEqual(['index', 'simulation'] * 2, [row['phase'] for row in rows])
+        self.assertEqual([8, 8, 17, 17], [row['units'] for row in rows])
+        for timing in rows:
+            self.assertGreater(timing['seconds'], 0)
+            self.assertIsNone(timing['memory_mb'])
+
+
+class TestTimedSteps(unittest.TestCase):
+    """Test the _timed_steps and time_phases functions"""
+    def test_simple(self):
+        recorded = []
+
+        def timed(phase, function, *args):
+            recorded.append(phase)
+            return function(*args)
+
+        step = _timed_steps(['links', 'start'], timed)
+        self.assertEqual([3, 2, 1], [step(phase, len, 'abc'[:i]) for i, phase in
+                                     ((3, 'nodes'), (2, 'links'), (1, 'start'))])
+        # The steps of other phases still run, untimed
+        self.assertEqual(['links', 'start'], recorded)
+
+    def test_dependency(self):
+        # The simulation is set up for simulation_cloud_fpga, but not recorded
+        seconds, _ = time_phases(2, 3, 1, ['simulation_cloud_fpga'])
+        self.assertEqual(['simulation_cloud_fpga'], list(seconds))
+
+
+class TestFitCosts(unittest.TestCase):
+    """Test the fit_costs and calibration functions"""
+    def test_simple(self):
+        rows = [row('index', units, 0.5 + 0.01 * units) for units in (10, 20, 40)]
+        rows.append(row('links', 9, 0.9, memory_mb=1.8))
+        costs = fit_costs(rows)
+        self.assertAlmostEqual(0.5, costs['index']['base_s'])
+        self.assertAlmostEqual(0.01, costs['index']['per_unit_s'])
+        self.assertIsNone(costs['index']['per_unit_mb'])
+        # A single shape gives the average cost per unit
+        self.assertAlmostEqual(0.1, costs['links']['per_unit_s'])
+        self.assertAlmostEqual(0.2, costs['links']['per_unit_mb'])
+        self.assertIsNone(calibration(costs))
+
+    def test_calibration(self):
+        rows = [row(phase, 10, 1.0, memory_mb=2.0)
+                for phase in ('cleanup', 'nodes', 'links', 'configure', 'start')]
+        rows.append(row('topology', 10, 1.0))
+        coefficients = calibration(fit_costs(rows))
+        # cleanup and links scale with links, the others with nodes
+        self.assertAlmostEqual(0.2, coefficients['startup_s']['per_link'])
+        self.assertAlmostEqual(0.4, coefficients['startup_s']['per_node'])
+        self.assertAlmostEqual(0.6, coefficients['memory_mb']['per_node'])
+
+
+class TestFindRegressions(unittest.TestCase):
+    """Test the find_regressions function"""
+    def test_simple(self):
+        baseline = make_baseline([row('index', 8, 0.010), row('analytic', 4, 0.010),
+                                  row('simulation', 8, 0.0001)])
+        rows = [row('index', 8, 0.011), row('analytic', 4, 0.020), row('simulation', 8, 0.0005),
+                row('index', 17, 0.020, spread=3)]
+        regressions = find_regressions(rows, baseline, 0.25)
+        # The simulation is 5 times slower, but by less than the noise
+        self.assertEqual([(rows[1], 0.010)], regressions)
+
+
+class TestCompareStartup(unittest.TestCase):
+    """Test the compare_startup function"""
+    def test_simple(self):
+        rows = [row(phase, 9, seconds) for phase, seconds in (
+            ('topology', 0.5), ('nodes', 1.0), ('links', 2.0), ('configure', 3.0), ('start', 4.0),
+            ('batched_startup', 2.5))]
+        # A shape without batched_startup is not compared
+        rows.extend(row(phase, 20, 1.0, spread=3) for phase in ('nodes', 'links', 'configure',
+                                                                   'start'))
+        self.assertEqual([(2, 3, None, 10.0, 2.5)], compare_startup(rows))
+
+
+class TestBenchmark(unittest.TestCase):
+    """Test the benchmark command"""
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.output = os.path.join(self.directory, 'baseline.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_baseline(self):
+        runner = CliRunner()
+        args = ['-s', '2:3', '-d', '2:3', '-r', '1', '--skip', 'simulation_cloud_fpga']
+        result = runner.invoke(benchmark, args + ['-o', self.output])
+        self.assertEqual(0, result.exit_code, result.output)
+        with open(self.output) as f:
+            baseline = json.load(f)
+        self.assertEqual(1, baseline['version'])
+        self.assertIn('simulation', baseline['costs'])
+        self.assertNotIn('simulation_cloud_fpga', baseline['costs'])
+
+        # An impossibly fast baseline
+        for timing in baseline['rows']:
+            timing['seconds'] = -1
+        with open(self.output, 'w') as f:
+            json.dump(baseline, f)
+        result = runner.invoke(benchmark, args + ['--baseline', self.output,
+                                                  '--skip', 'index', '--skip', 'analytic'])
+        self.assertEqual(1, result.exit_code)
+        self.assertIn('Regression: simulation', result.output)
+
+    def test_calibration_requires_mininet(self):
+        result = CliRunner().invoke(benchmark, ['--calibration', self.output])
+        self.assertEqual(2, result.exit_code)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+
+import signal
+import subprocess
+import time
+import unittest
+
+from executor import KILL_AFTER_S, Executor, run_command, run_commands
+
+
+class LocalHost(object):
+    """A host whose commands run on this machine, like a Mininet host in the root namespace."""
+    name = 'local'
+
+    def popen(self, args, **params):
+        return subprocess.Popen(args, **params)
+
+
+class CmdHost(object):
+    """A host without processes, like a host of the simulation backend."""
+    name = 'sim'
+
+    def cmd(self, command):
+        return 'ran ' + command
+
+
+class TestExecutor(unittest.TestCase):
+    """Test the Executor class and the run_commands function"""
+    def test_concurrent(self):
+        host = LocalHost()
+        start = time.time()
+        results = run_commands([(host, ['sh', '-c', 'sleep 0.5; echo {}'.format(i)])
+                                for i in range(5)])
+        self.assertLess(time.time() - start, 2.0)
+        self.assertEqual(['0\n', '1\n', '2\n', '3\n', '4\n'], [result.output for result in results])
+        self.assertTrue(all(result.ok for result in results))
+        result = run_command(host, ['sh', '-c', 'echo out; echo err >&2; exit 3'])
+        self.assertEqual(3, result.returncode)
+        self.assertEqual('out\nerr\n', result.output)
+        self.assertFalse(result.ok)
+
+    def test_timeout(self):
+        result = run_command(LocalHost(), ['sleep', 10], timeout=0.2)
+        self.assertTrue(result.timed_out)
+        self.assertEqual(-signal.SIGINT, result.returncode)
+        self.assertLess(result.elapsed, 2.0)
+        # A command which ignores SIGINT is killed
+        result = run_command(LocalHost(), ['sh', '-c', 'trap "" INT; exec sleep 10'], timeout=0.2)
+        self.assertEqual(-signal.SIGKILL, result.returncode)
+        self.assertLess(result.elapsed, KILL_AFTER_S + 2.0)
+
+    def test_cancel(self):
+        with Executor() as executor:
+            sleeper = executor.start(LocalHost(), ['sleep', 10])
+            echo = executor.start(LocalHost(), ['echo', 'done'])
+            self.assertEqual('done\n', executor.wait([echo])[0].output)
+            self.assertIsNone(executor.wait([sleeper], timeout=0.1)[0])
+            # A command which exits after closing its output does not wait for the others
+            start = time.time()
+            closer = executor.start(LocalHost(), ['sh', '-c', 'exec >&-; sleep 0.2'])
+            self.assertEqual(0, executor.wait([closer])[0].returncode)
+            self.assertLess(time.time() - start, 2.0)
+            executor.cancel(sleeper)
+            result, = executor.wait([sleeper])
+        self.assertTrue(result.cancelled)
+        self.assertFalse(result.timed_out)
+
+    def test_cmd(self):
+        result = run_command(CmdHost(), ['ping', '-c', 1, '10.0.0.1'])
+        self.assertEqual('ran ping -c 1 10.0.0.1', result.output)
+        self.assertTrue(result.ok)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from click.testing import CliRunner
+
+from flows import (DOWN, UP, flow_resources, flows, jain_index, link_capacities, max_min_rates,
+                   pick_pairs, read_matrix, resource_name, simulate_flows, traffic)
+from parameters import placement_options
+from tree_index import TreeIndex
+
+
+class TestLinkCapacities(unittest.TestCase):
+    """Test the link_capacities function"""
+    def test_simple(self):
+        index = TreeIndex(2, 3, 1)
+        capacity = link_capacities(index, 10, 504)
+        self.assertEqual(2 * index.n_nodes, len(capacity))
+        self.assertEqual(10, capacity[2 * index.leaf(0) + UP])
+        self.assertEqual(504, capacity[2 * index.fpga_host(1) + DOWN])
+        self.assertEqual(1000, capacity[2 * index.cloud + UP])
+        self.assertTrue(np.isinf(link_capacities(index, 0)[2 * index.leaf(0)]))
+
+    def test_placements(self):
+        index = TreeIndex(2, 3, placements=[placement_options(0),
+                                            placement_options(1, [1], bandwidth=100)])
+        capacity = link_capacities(index, 10)
+        self.assertEqual([10, 100], [capacity[2 * host] for host in index.fpga_hosts()])
+
+
+class TestFlowResources(unittest.TestCase):
+    """Test the flow_resources function"""
+    def test_simple(self):
+        index = TreeIndex(2, 3, 1)
+        h0, h1, h3 = index.leaf(0), index.leaf(1), index.leaf(3)
+        flows, resources = flow_resources(index, [h0, h0, h3], [h1, h3, index.cloud])
+        paths = [sorted(resources[flows == flow]) for flow in range(3)]
+        self.assertEqual([2 * h0 + UP, 2 * h1 + DOWN], paths[0])
+        self.assertEqual(sorted([2 * h0 + UP, 2 * 1 + UP, 2 * 2 + DOWN, 2 * h3 + DOWN]), paths[1])
+        self.assertEqual(sorted([2 * h3 + UP, 2 * 2 + UP, 2 * index.cloud + DOWN]), paths[2])
+        # Every flow crosses the links of its route once
+        for src, dst in ((h0, index.fpga_host(1)), (index.fpga_host(0), index.cloud)):
+            _, resources = flow_resources(index, [src], [dst])
+            self.assertEqual(len(index.route(src, dst)) - 1, len(resources))
+
+    def test_invalid(self):
+        index = TreeIndex(2, 3)
+        with self.assertRaises(ValueError):
+            flow_resources(index, [index.leaf(0)], [index.leaf(0)])
+        with self.assertRaises(ValueError):
+            flow_resources(index, [0], [index.leaf(0)])
+
+
+class TestMaxMinRates(unittest.TestCase):
+    """Test the max_min_rates function"""
+    def test_simple(self):
+        # Flow 0 crosses both resources, flows 1 and 2 one each
+        flows, resources = np.array([0, 0, 1, 2]), np.array([0, 1, 0, 1])
+        rates, bottleneck = max_min_rates(flows, resources, np.array([1.0, 1.0]), 3)
+        np.testing.assert_allclose([0.5, 0.5, 0.5], rates)
+        rates, bottleneck = max_min_rates(flows, resources, np.array([1.0, 2.0]), 3)
+        np.testing.assert_allclose([0.5, 0.5, 1.5], rates)
+        np.testing.assert_array_equal([0, 0, 1], bottleneck)
+
+    def test_demand(self):
+        flows, resources = np.array([0, 1, 2]), np.array([0, 0, 0])
+        rates, bottleneck = max_min_rates(flows, resources, np.array([9.0]), 3,
+                                          demand=[1.0, np.inf, np.inf])
+        np.testing.assert_allclose([1.0, 4.0, 4.0], rates)
+        np.testing.assert_array_equal([-1, 0, 0], bottleneck)
+
+    def test_unlimited(self):
+        rates, bottleneck = max_min_rates(np.array([0, 0]), np.array([0, 1]),
+                                          np.array([np.inf, np.inf]), 1)
+        self.assertTrue(np.isinf(rates[0]))
+
+    def test_mixed(self):
+        # Flow 0 crosses a 100 Mbps and an unshaped resource, flow 1 a 10 Mbps one
+        rates, bottleneck = max_min_rates(np.array([0, 0, 1]), np.array([0, 1, 2]),
+                                          np.array([100.0, np.inf, 10.0]), 2)
+        np.testing.assert_allclose([100.0, 10.0], rates)
+        np.testing.assert_array_equal([0, 2], bottleneck)
+        # Unshaped FPGA links are never the bottleneck of a tree
+        index = TreeIndex(2, 3, 1)
+        capacity = link_capacities(index, 10, 0)
+        result = simulate_flows(index, capacity, *traffic(index, 'fpga'))
+        self.assertTrue(np.all(np.isfinite(capacity[result['bottleneck']])))
+
+    def test_fair(self):
+        # Every flow has a saturated link on which no other flow is faster
+        index = TreeIndex(2, 4, 1)
+        capacity = link_capacities(index, 10, 30)
+        src, dst = traffic(index, 'all')
+        result = simulate_flows(index, capacity, src, dst)
+        flows, resources = flow_resources(index, src, dst)
+        fastest = np.zeros(len(capacity))
+        np.maximum.at(fastest, resources, result['rate'][flows])
+        np.testing.assert_allclose(capacity[result['bottleneck']],
+                                   result['load'][result['bottleneck']])
+        np.testing.assert_allclose(fastest[result['bottleneck']], result['rate'])
+
+
+class TestJainIndex(unittest.TestCase):
+    """Test the jain_index function"""
+    def test_simple(self):
+        self.assertAlmostEqual(1.0, jain_index([3, 3, 3]))
+        self.assertAlmostEqual(0.25, jain_index([5, 0, 0, 0]))
+        self.assertAlmostEqual(1.0, jain_index([0, 0]))
+
+
+class TestTraffic(unittest.TestCase):
+    """Test the traffic function"""
+    def test_patterns(self):
+        index = TreeIndex(2, 4, placements=[placement_options(1), placement_options(2, [3])])
+        src, dst = traffic(index, 'fpga')
+        self.assertEqual(['f1_0'] * 4 + ['f1_1'] * 2 + ['f2_3'] * 2,
+                         [index.name(node) for node in dst])
+        src, dst = traffic(index, 'cloud')
+        self.assertTrue(np.all(dst == index.cloud))
+        src, dst = traffic(index, 'all')
+        self.assertEqual(8 * 7, len(src))
+
+    def test_permutation(self):
+        index = TreeIndex(3, 4)
+        src, dst = traffic(index, 'permutation', seed=1)
+        self.assertFalse(np.any(src == dst))
+        np.testing.assert_array_equal(np.arange(index.n_switches, index.n_tree), np.sort(src))
+        np.testing.assert_array_equal(np.sort(src), np.sort(dst))
+        np.testing.assert_array_equal(dst, traffic(index, 'permutation', seed=1)[1])
+
+
+class TestSimulateFlows(unittest.TestCase):
+    """Test the simulate_flows and pick_pairs functions"""
+    def test_cloud(self):
+        # The 4 leaves below each switch of level 1 share its 10 Mbps uplink
+        index = TreeIndex(2, 4)
+        result = simulate_flows(index, link_capacities(index, 10), *traffic(index, 'cloud'))
+        np.testing.assert_allclose(np.full(8, 2.5), result['rate'])
+        self.assertEqual(10, result['load'][2 * 1 + UP])
+        self.assertEqual('s1->s0', resource_name(index, 2 * 1 + UP))
+
+    def test_pick_pairs(self):
+        index = TreeIndex(2, 4, 1)
+        result = simulate_flows(index, link_capacities(index, 10), *traffic(index, 'all'))
+        pairs = pick_pairs(index, result, 100)
+        # One flow for every saturated link, slowest first
+        self.assertEqual(len(set(result['bottleneck'])), len(pairs))
+        self.assertEqual(sorted(rate for _, _, rate in pairs), [rate for _, _, rate in pairs])
+        self.assertEqual(2, len(pick_pairs(index, result, 2)))
+
+
+class TestFlows(unittest.TestCase):
+    """Test the flows command and read_matrix"""
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.matrix = os.path.join(self.directory, 'matrix.csv')
+        with open(self.matrix, 'w') as f:
+            f.write('src,dst,demand_mbps\nh0,h3,1\nh1,h2,\nh2,cloud,\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_read_matrix(self):
+        index = TreeIndex(2, 3)
+        src, dst, demand = read_matrix(self.matrix, index)
+        self.assertEqual(['h0', 'h1', 'h2'], [index.name(node) for node in src])
+        self.assertEqual([1, np.inf, np.inf], list(demand))
+
+    def test_simple(self):
+        result = CliRunner().invoke(flows, ['-s', '2', '-d', '4', '-f', '1', '-t', 'permutation',
+                                            '--seed', '0'])
+        self.assertEqual(0, result.exit_code, result.output)
+        self.assertIn('Flows: 8', result.output)
+        self.assertIn('Pairs worth measuring with iperf:', result.output)
+
+    def test_matrix(self):
+        result = CliRunner().invoke(flows, ['-d', '3', '-m', self.matrix])
+        self.assertEqual(0, result.exit_code, result.output)
+        self.assertIn('aggregate throughput: 20.000 Mbps', result.output)
+        result = CliRunner().invoke(flows, ['-d', '2', '-m', self.matrix])
+        self.assertEqual(1, result.exit_code)
+        self.assertIn('has no host', result.output)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+import json
+import math
+import unittest
+
+from iperf_flows import aggregate, client_args, iperf_pairs, parse_iperf3
+from tree_index import TreeIndex
+
+
+def iperf3_output(received, sent, retransmits=0):
+    """Return the JSON an iperf3 client prints, with the parts parse_iperf3 reads."""
+    return json.dumps(dict(start={}, intervals=[], end=dict(
+        sum_sent=dict(bytes=1, bits_per_second=sent, retransmits=retransmits),
+        sum_received=dict(bytes=1, bits_per_second=received))))
+
+
+class TestIperfPairs(unittest.TestCase):
+    """Test the iperf_pairs function"""
+    def test_fpga(self):
+        pairs = iperf_pairs(TreeIndex(2, 4, 1))
+        self.assertEqual(('h0', 'f0'), pairs[0])
+        self.assertEqual(('h7', 'f1'), pairs[-1])
+        self.assertEqual(8, len(pairs))
+
+    def test_fan_in(self):
+        pairs = iperf_pairs(TreeIndex(2, 4, 1), fan_in=2)
+        self.assertEqual([('h0', 'f0'), ('h1', 'f0'), ('h4', 'f1'), ('h5', 'f1')], pairs)
+        pairs = iperf_pairs(TreeIndex(3, 3), 'cloud', fan_in=4)
+        self.assertEqual(['h0', 'h1', 'h2', 'h3'], [src for src, _ in pairs])
+
+    def test_permutation(self):
+        pairs = iperf_pairs(TreeIndex(2, 4), 'permutation', seed=3)
+        self.assertEqual(sorted(src for src, _ in pairs), sorted(dst for _, dst in pairs))
+        self.assertEqual(pairs, iperf_pairs(TreeIndex(2, 4), 'permutation', seed=3))
+
+
+class TestClientArgs(unittest.TestCase):
+    """Test the client_args function"""
+    def test_simple(self):
+        self.assertEqual(['sh', '-c', 'sleep 1.500; exec iperf3 -c 10.0.0.1 -p 5202 -t 10 -J'],
+                         client_args('10.0.0.1', 5202, 10, 1.5))
+        self.assertIn('sleep 0.000;', client_args('10.0.0.1', 5201, 5, -0.2)[2])
+
+
+class TestParseIperf3(unittest.TestCase):
+    """Test the parse_iperf3 function"""
+    def test_simple(self):
+        measurement = parse_iperf3(iperf3_output(9.5e6, 1e7, 3))
+        self.assertEqual(dict(throughput_mbps=9.5, client_throughput_mbps=10.0, retransmits=3),
+                         measurement)
+
+    def test_error(self):
+        with self.assertRaises(ValueError):
+            parse_iperf3(json.dumps(dict(start={}, intervals=[], end={},
+                                         error='unable to connect to server')))
+        with self.assertRaises(ValueError):
+            parse_iperf3('')
+
+
+class TestAggregate(unittest.TestCase):
+    """Test the aggregate function"""
+    def test_simple(self):
+        flows = [parse_iperf3(iperf3_output(received, 1e7, 1)) for received in (2e6, 6e6)]
+        measurement = aggregate(flows)
+        self.assertAlmostEqual(8.0, measurement['throughput_mbps'])
+        self.assertAlmostEqual(20.0, measurement['client_throughput_mbps'])
+        self.assertEqual(2, measurement['retransmits'])
+        self.assertEqual(2, measurement['flows'])
+        # (2 + 6) ** 2 / (2 * (2 ** 2 + 6 ** 2))
+        self.assertAlmostEqual(0.8, measurement['jain_index'])
+
+    def test_none(self):
+        measurement = aggregate([])
+        self.assertEqual(0, measurement['throughput_mbps'])
+        self.assertTrue(math.isnan(measurement['jain_index']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from latency_matrix import (branch_pair, compose, latency_matrix, plan_probes,
+                            run_latency_matrix)
+from parameters import placement_options
+from simulation import setup_simulation
+from tree_index import TreeIndex
+
+
+class TestBranchPair(unittest.TestCase):
+    """Test the branch_pair function"""
+    def test_simple(self):
+        index = TreeIndex(2, 4, 1)
+        self.assertEqual((index.leaf(0), index.leaf(4)), branch_pair(index, 0))
+        self.assertEqual((index.leaf(4), index.leaf(6)), branch_pair(index, 2))
+        self.assertEqual((index.leaf(2), index.leaf(3)), branch_pair(index, 4))
+
+    def test_single_child(self):
+        index = TreeIndex(1, 3, 1)
+        self.assertEqual((index.leaf(0), index.fpga_host(0)), branch_pair(index, 1))
+        self.assertEqual(None, branch_pair(index, 0))
+
+
+class TestPlanProbes(unittest.TestCase):
+    """Test the plan_probes function"""
+    def test_counts(self):
+        index = TreeIndex(3, 5, 2)
+        hosts, switches = plan_probes(index, 'edge')
+        self.assertEqual(index.n_leaves + index.n_fpga, len(hosts))
+        self.assertEqual(index.n_switches, len(switches))
+        hosts, switches = plan_probes(index, 'level')
+        self.assertEqual([index.leaf(0), index.fpga_host(0)], hosts)
+        self.assertEqual([index.node(level, 0) for level in range(4)], switches)
+
+
+class TestCompose(unittest.TestCase):
+    """Test the compose function"""
+    def test_simple(self):
+        index = TreeIndex(2, 4, placements=[placement_options(1), placement_options(2, [0])])
+        # Give the link above every node its own RTT
+        link_rtts = np.arange(index.n_nodes, dtype=float) + 1
+        distances = np.array([sum(link_rtts[node] for node in index.path_to_root(start)[:-1])
+                              for start in range(index.n_nodes)])
+        matrix = compose(index, distances)
+        hosts = list(index.hosts())
+        for i, a in enumerate(hosts):
+            for j, b in enumerate(hosts):
+                route = index.route(a, b)
+                # Every node of the route but the highest has its link on it
+                top = min(route, key=lambda node: (index.level(node), node != 0))
+                expected = sum(link_rtts[node] for node in route if node != top) if i != j else 0
+                self.assertEqual(expected, matrix[i, j])
+
+
+class TestLatencyMatrix(unittest.TestCase):
+    """Test the latency_matrix function on simulated networks"""
+    def test_methods(self):
+        for args in ((2, 4, 10, '1ms', 0, 1, 504, '4ms'), (3, 3, 10, '2ms', 0, None, None, None)):
+            net = setup_simulation(*(args + (None, False)))
+            full = latency_matrix(net, 'all', count=1)
+            n = len(full['hosts'])
+            self.assertEqual(n * (n - 1) // 2, full['probes'])
+            for method in ('edge', 'level'):
+                result = latency_matrix(net, method, count=1, validate=4, seed=0)
+                self.assertEqual(full['hosts'], result['hosts'])
+                self.assertLess(result['probes'], full['probes'])
+                # ping prints RTTs to the microsecond
+                np.testing.assert_allclose(full['rtt_ms'], result['rtt_ms'], atol=0.005)
+                self.assertEqual(4, len(result['errors']))
+                self.assertLess(np.max(result['errors']), 0.005)
+
+    def test_placements(self):
+        placements = [placement_options(0, delay='6ms'), placement_options(1, [1], delay='2ms')]
+        net = setup_simulation(2, 4, 10, '1ms', 0, None, 504, None, None, False,
+                               placements=placements)
+        full = latency_matrix(net, 'all', count=1)
+        for method in ('edge', 'level'):
+            result = latency_matrix(net, method, count=1)
+            np.testing.assert_allclose(full['rtt_ms'], result['rtt_ms'], atol=0.005)
+
+
+class TestRunLatencyMatrix(unittest.TestCase):
+    """Test the run_latency_matrix function"""
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_output(self):
+        path = os.path.join(self.directory, 'matrix.npz')
+        net = setup_simulation(2, 3, 10, '1ms', 0, None, None, None, None, False)
+        measurement = run_latency_matrix(net, 'level', path, validate=2)
+        self.assertEqual('latency_matrix', measurement['test'])
+        self.assertEqual('level', measurement['method'])
+        self.assertEqual(3, measurement['probes'])
+        self.assertLess(measurement['latency_error_ms'], 0.005)
+        saved = np.load(path)
+        self.assertEqual(['cloud', 'h0', 'h1', 'h2', 'h3'], list(saved['hosts']))
+        self.assertAlmostEqual(measurement['rtt_max'], saved['rtt_ms'].max())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,14 +1,16 @@
 #!/usr/bin/env python
 
 import re
+import subprocess
 import unittest
 
-from mininet.clean import Cleanup
-from mininet.net import Mininet
-from mininet.link import TCLink
-from mininet.node import CPULimitedHost
-
-from mininet_functions import halve_delay, get_poisson_delay, TreeTopoGeneric
+from mininet_functions import (_run_scripts, batch_script, batchable, halve_delay,
+                               get_poisson_delay, interface_commands, tc_add_commands,
+                               tc_change_commands, TreeTopoGeneric, veth_command)
+from parameters import compute_options, placement_options
+from sharding import Partition, tunnel_commands
+from test.runner import topology_tests
+from tree_index import TreeIndex
 
 
 class TestHalveDelay(unittest.TestCase):
@@ -34,31 +36,155 @@ class TestPoissonDelay(unittest.TestCase):
             self.assertEqual(match.group(2), 'ms')
 
 
+class TestTcChangeCommands(unittest.TestCase):
+    """Test the tc_change_commands function"""
+    def test_simple(self):
+        self.assertEqual(
+            ['class change dev s1-eth1 parent 5:0 classid 5:1 htb rate 10.000000Mbit burst 15k',
+             'qdisc change dev s1-eth1 parent 5:1 handle 10: netem delay 2ms loss 1.00000'],
+            tc_change_commands('s1-eth1', bw=10, delay='2ms', loss=1, use_htb=True))
+        self.assertEqual('qdisc change dev f0-eth0 parent 5:1 handle 10: netem delay 1ms',
+                         tc_change_commands('f0-eth0', bw=504, delay='1ms', loss=0)[1])
+
+
+class TestTcAddCommands(unittest.TestCase):
+    """Test the tc_add_commands function"""
+    def test_simple(self):
+        self.assertEqual(
+            ['qdisc add dev x3u root handle 5:0 htb default 1',
+             'class add dev x3u parent 5:0 classid 5:1 htb rate 10.000000Mbit burst 15k',
+             'qdisc add dev x3u parent 5:1 handle 10: netem delay 2ms'],
+            tc_add_commands('x3u', bw=10, delay='2ms', loss=0))
+
+
+class TestBatchedStartup(unittest.TestCase):
+    """Test the commands of BatchedMininet"""
+    def test_batchable(self):
+        self.assertTrue(batchable(dict(bw=10, delay='1ms', loss=0, use_htb=True)))
+        # TCIntf ignores bandwidths above 1000 Mbps, and tc_add_commands has no jitter
+        self.assertFalse(batchable(dict(bw=10000, delay='1ms', loss=0)))
+        self.assertFalse(batchable(dict(bw=10, delay='1ms', jitter='1ms')))
+
+    def test_commands(self):
+        self.assertEqual('link add name s0-eth1 address 02:00:00:00:00:01 type veth peer name '
+                         'h0-eth0 address 02:00:00:00:00:02 netns 123',
+                         veth_command('s0-eth1', '02:00:00:00:00:01', 'h0-eth0',
+                                      '02:00:00:00:00:02', 123))
+        ip_commands, tc_commands, shell_commands = interface_commands(
+            'h0-eth0', dict(bw=10, delay='2ms', loss=0, use_htb=True))
+        self.assertEqual(['link set h0-eth0 up'], ip_commands)
+        self.assertEqual(tc_add_commands('h0-eth0', bw=10, delay='2ms', loss=0), tc_commands)
+        self.assertEqual(["ip -force -batch - <<'EOF'", 'link set h0-eth0 up', 'EOF',
+                          "tc -force -batch - <<'EOF'"] + tc_commands + ['EOF'] + shell_commands,
+                         batch_script(ip_commands, tc_commands, shell_commands).splitlines())
+        self.assertEqual('ethtool -K x\n', batch_script(shell_commands=['ethtool -K x']))
+
+
+class ScriptNode(object):
+    """A node whose batch scripts run in the root namespace, recording how many run at once."""
+    pid = 1
+    processes = []
+    most = 0
+
+    def popen(self, args, mncmd=None, **params):
+        running = [process for process in self.processes if process.poll() is None]
+        ScriptNode.most = max(ScriptNode.most, len(running) + 1)
+        self.processes.append(subprocess.Popen(args, **params))
+        return self.processes[-1]
+
+
+class TestRunScripts(unittest.TestCase):
+    """Test the _run_scripts function"""
+    def test_in_flight(self):
+        nodes = [ScriptNode() for _ in range(6)]
+        scripts = dict((node, 'sleep 0.1; echo {}\n'.format(i)) for i, node in enumerate(nodes))
+        scripts[None] = 'echo root\n'
+        outputs = _run_scripts(scripts, in_flight=2)
+        self.assertEqual(['{}\n'.format(i) for i in range(6)], [outputs[node] for node in nodes])
+        self.assertEqual('root\n', outputs[None])
+        self.assertLessEqual(ScriptNode.most, 2)
+
+
+class TestTunnelCommands(unittest.TestCase):
+    """Test the tunnel_commands function"""
+    def test_simple(self):
+        partition = Partition(TreeIndex(2, 3), 3)
+        ip_commands, ovs_args, tc_commands = tunnel_commands(partition, dict(bw=10, delay='1ms'))
+        self.assertEqual(6, len(ip_commands))
+        self.assertEqual('link add x1u type veth peer name x1l', ip_commands[0])
+        self.assertEqual(['add-port', 's0', 'x1u', '--', 'add-port', 's1', 'x1l', '--'],
+                         ovs_args[:8])
+        self.assertEqual(12, len(tc_commands))
+
+
+@topology_tests
+class TestTreeTopoGenericNetwork(unittest.TestCase):
+    """Test networks built from the TreeTopoGeneric class"""
+    topologies = [
+        dict(spread=2, depth=3, bandwidth=10, delay='1ms', loss=0, fpga=None),
+        dict(spread=3, depth=5, bandwidth=10, delay='1ms', loss=1, fpga=None),
+        dict(spread=2, depth=7, bandwidth=10, delay='4ms', loss=2, fpga=None),
+        dict(spread=3, depth=2, bandwidth=1, delay='1ms', loss=50, fpga=None),
+        dict(spread=4, depth=4, bandwidth=100, delay='1ms', loss=0, fpga=None),
+        dict(spread=3, depth=5, bandwidth=10, delay='4ms', loss=2, fpga=None),
+        dict(spread=1, depth=4, bandwidth=10, delay='1ms', loss=50, fpga=None),
+        dict(spread=2, depth=7, bandwidth=10, delay='1ms', loss=0, fpga=None),
+    ]
+
+    def test_simple(self, net):
+        self.assertEqual(sorted(net.topo.hosts()), sorted(host.name for host in net.hosts))
+        self.assertEqual(sorted(net.topo.switches()),
+                         sorted(switch.name for switch in net.switches))
+
+
 class TestTreeTopoGeneric(unittest.TestCase):
     """Test the TreeTopoGeneric class"""
-    def test_simple(self):
-        topo_0 = TreeTopoGeneric(spread=2, depth=3, bandwidth=10, delay='1ms', loss=0, fpga=None)
-        # topo_1 = TreeTopoGeneric(spread=3, depth=5, bandwidth=10, delay='1ms', loss=1, fpga=None)
-        # topo_2 = TreeTopoGeneric(spread=2, depth=7, bandwidth=10, delay='4ms', loss=2, fpga=None)
-        # topo_3 = TreeTopoGeneric(spread=3, depth=2, bandwidth=1, delay='1ms', loss=50, fpga=None)
-        # topo_4 = TreeTopoGeneric(spread=4, depth=4, bandwidth=100, delay='1ms', loss=0, fpga=None)
-        # topo_5 = TreeTopoGeneric(spread=3, depth=5, bandwidth=10, delay='4ms', loss=2, fpga=None)
-        # topo_6 = TreeTopoGeneric(spread=1, depth=4, bandwidth=10, delay='1ms', loss=50, fpga=None)
-        # topo_7 = TreeTopoGeneric(spread=2, depth=7, bandwidth=10, delay='1ms', loss=0, fpga=None)
-
-        topologies = [topo_0]
-        # topologies = [topo_0, topo_1, topo_2, topo_3, topo_4, topo_5, topo_6, topo_7]
-
-        for topo in topologies:
-            try:
-                Cleanup.cleanup()
-                net = Mininet(topo=topo, host=CPULimitedHost, link=TCLink, autoStaticArp=True)
-                net.start()
-                self.assertEqual(True, True)
-            except Exception as ex:
-                self.assertEqual(True, False, 'TestTreeTopoGeneric rose an Exception of type {}.'.format(type(ex).__name__))
-            finally:
-                Cleanup.cleanup()
+    def test_index(self):
+        topo = TreeTopoGeneric(spread=12, depth=3, bandwidth=10, delay='1ms', loss=0, fpga=1)
+        index = topo.index
+        self.assertEqual(sorted(index.name(node) for node in index.hosts()), sorted(topo.hosts()))
+        self.assertEqual(sorted(index.name(node) for node in index.switches()),
+                         sorted(topo.switches()))
+        self.assertEqual(set(frozenset((index.name(upper), index.name(lower)))
+                             for upper, lower in index.links()),
+                         set(frozenset(link) for link in topo.links()))
+
+    def test_placements(self):
+        placements = [placement_options(0, pipelines=2),
+                      placement_options(1, [1], bandwidth=100, delay='10ms', cpu=0.1)]
+        topo = TreeTopoGeneric(spread=2, depth=3, bandwidth=10, delay='1ms', loss=0, fpga=None,
+                               compute=compute_options(), placements=placements)
+        self.assertEqual(['cloud', 'f0_0', 'f1_1', 'h0', 'h1', 'h2', 'h3'], topo.hosts())
+        self.assertEqual(dict(cpu=0.1), topo.nodeInfo('f1_1'))
+        self.assertEqual({}, topo.nodeInfo('f0_0'))
+        for switch, host, opts in (('s2', 'f1_1', ('5.0ms', 100)), ('s0', 'f0_0', ('1ms', 10))):
+            info = topo.linkInfo(switch, host)
+            self.assertEqual(opts, (info['delay'], info['bw']))
+
+    def test_nodes(self):
+        index = TreeIndex(2, 4, 1)
+        partition = Partition(index, 3, 2)
+        for shard in range(3):
+            nodes = set(partition.nodes(shard))
+            topo = TreeTopoGeneric(spread=2, depth=4, bandwidth=10, delay='1ms', loss=0, fpga=1,
+                                   nodes=nodes)
+            hosts = [node for node in nodes if not index.is_switch(node)]
+            self.assertEqual(sorted(index.name(node) for node in hosts), sorted(topo.hosts()))
+            for node in hosts:
+                self.assertEqual(index.ip(node) + '/8', topo.nodeInfo(index.name(node))['ip'])
+        # The links joining the shards are left to sharding.connect_shards
+        self.assertEqual(len(index.links()) - len(partition.links()),
+                         sum(len(TreeTopoGeneric(2, 4, 10, '1ms', 0, 1, nodes=set(
+                             partition.nodes(shard))).links()) for shard in range(3)))
+
+    def test_aggregate(self):
+        topo = TreeTopoGeneric(spread=2, depth=4, bandwidth=10, delay='1ms', loss=0, fpga=1,
+                               aggregate_level=1)
+        self.assertEqual(['cloud', 'f0', 'f1', 'h0', 'h4'], topo.hosts())
+        self.assertEqual('10.0.0.8/8', topo.nodeInfo('h4')['ip'])
+        # The links below the level have the bandwidth of the links they stand for
+        self.assertEqual([10, 20, 40], [topo.linkInfo(upper, lower)['bw'] for upper, lower in
+                                        (('s0', 's2'), ('s2', 's5'), ('s5', 'h4'))])
 
 
 if __name__ == '__main__':
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+import unittest
+
+from parameters import (compute_options, delay_to_seconds, format_placement, host_options,
+                        link_options, parse_placement, placement_compute, placement_link_options,
+                        placement_options)
+
+
+class TestDelayToSeconds(unittest.TestCase):
+    """Test the delay_to_seconds function"""
+    def test_simple(self):
+        self.assertAlmostEqual(0.01, delay_to_seconds('10ms'))
+        self.assertAlmostEqual(2.3, delay_to_seconds('2.3s'))
+        self.assertAlmostEqual(2e-7, delay_to_seconds('200ns'))
+        self.assertAlmostEqual(0.0, delay_to_seconds('0ms'))
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, delay_to_seconds, '10')
+        self.assertRaises(ValueError, delay_to_seconds, 'ms')
+
+
+class TestLinkOptions(unittest.TestCase):
+    """Test the link_options function"""
+    def test_defaults(self):
+        link_opts, fpga_link_opts, cloud_link_opts = link_options(10, '4ms', 1)
+        self.assertEqual(dict(bw=10, delay='4ms', loss=1, use_htb=True), link_opts)
+        self.assertEqual(dict(bw=10, delay='4ms', loss=2, use_htb=True), fpga_link_opts)
+        self.assertEqual(dict(bw=1000, delay='0ms', loss=0, use_htb=True), cloud_link_opts)
+
+    def test_fpga(self):
+        _, fpga_link_opts, _ = link_options(10, '4ms', 1, 504, '10ms', 3)
+        self.assertEqual(dict(bw=504, delay='5.0ms', loss=3, use_htb=True), fpga_link_opts)
+
+
+class TestComputeOptions(unittest.TestCase):
+    """Test the compute_options and host_options functions"""
+    def test_defaults(self):
+        compute = compute_options()
+        self.assertEqual(dict(service_time=1e-3, pipelines=1, cpu=None), compute['fpga'])
+        self.assertAlmostEqual(1e-4, compute['cloud']['service_time'])
+        self.assertEqual({}, host_options(compute, 'fpga'))
+        self.assertEqual({}, host_options(None, 'cloud'))
+
+    def test_cpu(self):
+        compute = compute_options(fpga_cpu=0.05, cloud_cpu=0.5)
+        self.assertEqual(dict(cpu=0.05), host_options(compute, 'fpga'))
+        self.assertEqual(dict(cpu=0.5), host_options(compute, 'cloud'))
+
+
+class TestPlacements(unittest.TestCase):
+    """Test parsing placements and their options"""
+    def test_parse(self):
+        self.assertEqual(placement_options(1), parse_placement('1'))
+        placement = parse_placement('2@3+0:bandwidth=100,delay=5ms,service-time=2ms,cpu=0.5')
+        self.assertEqual(placement_options(2, [0, 3], bandwidth=100, delay='5ms',
+                                           service_time='2ms', cpu=0.5), placement)
+        self.assertEqual('2@0+3:bandwidth=100,delay=5ms,service-time=2ms,cpu=0.5',
+                         format_placement(placement))
+
+    def test_invalid(self):
+        for text in ('x', '1@a', '-1', '1@-1', '1:size=1', '1:delay=5', '1:loss=101', '1:cpu=2',
+                     '1:pipelines=1,pipelines=2'):
+            self.assertRaises(ValueError, parse_placement, text)
+
+    def test_options(self):
+        placement = placement_options(1, delay='10ms', pipelines=4)
+        self.assertEqual(dict(bw=504, delay='5.0ms', loss=0, use_htb=True),
+                         placement_link_options(placement, 10, '1ms', 0, 504, '2ms', 0))
+        compute = placement_compute(compute_options(fpga_cpu=0.1), placement)
+        self.assertEqual(dict(service_time=1e-3, pipelines=4, cpu=0.1), compute['fpga'])
+        self.assertEqual(None, placement_compute(None, placement))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+import unittest
+
+import numpy as np
+from click.testing import CliRunner
+
+from placement import candidates, evaluate, placement, rank
+
+
+def values(**parameters):
+    """Return the lists of values of the placement options, overridden by parameters."""
+    lists = dict(spread=[2], depth=[4], bandwidth=[10], delay=['1ms'], fpga_bandwidth=[504],
+                 fpga_delay=[None], rate=[100.0], request_size=[64], response_size=[64],
+                 fpga_service_time=['1ms'], fpga_pipelines=[1], fpga_cpu=[None],
+                 cloud_service_time=['100us'], cloud_pipelines=[4], cloud_cpu=[None])
+    lists.update(parameters)
+    return lists
+
+
+class TestCandidates(unittest.TestCase):
+    """Test the candidates function"""
+    def test_every_level(self):
+        points = candidates(values(depth=[3, 4]))
+        self.assertEqual([None, 0, 1, None, 0, 1, 2], [point['fpga'] for point in points])
+        self.assertEqual([3] * 3 + [4] * 4, [point['depth'] for point in points])
+
+    def test_given_levels(self):
+        points = candidates(values(fpga=[1], spread=[2, 3]))
+        self.assertEqual([1, 1], [point['fpga'] for point in points])
+
+
+class TestRank(unittest.TestCase):
+    """Test the rank function"""
+    def test_objectives(self):
+        prediction = dict(latency_ms=np.array([5.0, np.inf, 3.0, 4.0]),
+                          max_rate=np.array([10.0, 50.0, 20.0, 20.0]))
+        np.testing.assert_array_equal([2, 3], rank(prediction, 'latency', 2))
+        # Saturated candidates have no latency, but still have a rate, and ties keep their order
+        np.testing.assert_array_equal([1, 2, 3, 0], rank(prediction, 'throughput', 5))
+
+    def test_evaluate(self):
+        points = candidates(values(spread=[2, 4], depth=[3, 5]))
+        prediction = evaluate(points, cores=4)
+        self.assertEqual((len(points),), prediction['latency_ms'].shape)
+        # Serving 1 leaf in the cloud is faster than going through an FPGA host with 1 pipeline
+        best = points[rank(prediction, 'latency')[0]]
+        self.assertEqual((2, 3, None), (best['spread'], best['depth'], best['fpga']))
+
+
+class TestPlacement(unittest.TestCase):
+    """Test the placement command"""
+    def test_simple(self):
+        result = CliRunner().invoke(placement, ['-s', '2:4', '-d', '3,4', '--rate', '100,1000',
+                                                '-t', '2'])
+        self.assertEqual(0, result.exit_code, result.output)
+        lines = result.output.splitlines()
+        self.assertEqual('Best candidates for latency:', lines[0])
+        self.assertEqual(2, lines.index('Best candidates for throughput:') - 2)
+        self.assertEqual(8, len(lines))
+
+    def test_saturated(self):
+        result = CliRunner().invoke(placement, ['-f', '0', '--rate', '1000'])
+        self.assertEqual(0, result.exit_code, result.output)
+        self.assertIn('No candidate sustains its offered load.', result.output)
+
+
+if __name__ == '__main__':
+    unittest.main()
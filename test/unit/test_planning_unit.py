@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from click.testing import CliRunner
+
+import fpga_switch_model
+from fpga_switch_model import main
+from parameters import placement_options
+from planning import CALIBRATION, check_plan, load_calibration, machine_limits, plan_network
+
+
+class TestPlanNetwork(unittest.TestCase):
+    """Test the plan_network function"""
+    def test_simple(self):
+        plan = plan_network(2, 3, 1)
+        self.assertEqual(3, plan['switches'])
+        # 4 leaves, 2 FPGA hosts and the cloud
+        self.assertEqual(7, plan['hosts'])
+        self.assertEqual(9, plan['links'])
+        self.assertEqual(7, plan['namespaces'])
+        self.assertEqual(18, plan['interfaces'])
+        self.assertEqual(36, plan['qdiscs'])
+        startup = CALIBRATION['startup_s']
+        self.assertAlmostEqual(startup['base'] + 10 * startup['per_node'] + 9 * startup['per_link'],
+                               plan['startup_s'])
+
+    def test_placements(self):
+        plan = plan_network(2, 3, placements=[placement_options(0), placement_options(1, [1])])
+        # 4 leaves, 2 FPGA hosts and the cloud
+        self.assertEqual(7, plan['hosts'])
+        self.assertEqual(9, plan['links'])
+
+    def test_shards(self):
+        single = plan_network(2, 6, 1)
+        plan = plan_network(2, 6, 1, shards=3, shard_level=2)
+        self.assertEqual(3, plan['shards'])
+        self.assertEqual(single['links'], plan['links'])
+        self.assertEqual(single['processes'] + 4, plan['processes'])
+        # The worker shards hold 2 subtrees of 15 switches and leaves each
+        startup = CALIBRATION['startup_s']
+        self.assertAlmostEqual(startup['base'] + 30 * startup['per_node']
+                               + (28 + 4) * startup['per_link'], plan['startup_s'])
+        self.assertLess(plan['open_files'], single['open_files'])
+
+    def test_aggregate(self):
+        single = plan_network(4, 6, 1)
+        # One leaf for every last-level switch
+        plan = plan_network(4, 6, 1, aggregate_level=4)
+        self.assertEqual(single['switches'], plan['switches'])
+        self.assertEqual(256 + 4 + 1, plan['hosts'])
+        # One leaf and its chain of 3 switches for each FPGA host
+        plan = plan_network(4, 6, 1, aggregate_level=1)
+        self.assertEqual(5 + 4 * 3, plan['switches'])
+        self.assertEqual(4 + 4 + 1, plan['hosts'])
+        self.assertEqual(plan['nodes'] - 1, plan['links'])
+        self.assertRaises(ValueError, plan_network, 4, 6, 1, aggregate_level=0)
+
+    def test_calibration(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'calibration.json')
+            with open(path, 'wt') as f:
+                json.dump(dict(memory_mb=dict(base=0, per_node=1, per_link=0)), f)
+            calibration = load_calibration(path)
+            self.assertEqual(CALIBRATION['startup_s'], calibration['startup_s'])
+            self.assertEqual(10, plan_network(2, 3, 1, calibration)['memory_mb'])
+
+            with open(path, 'wt') as f:
+                json.dump(dict(disk_mb=dict(base=0)), f)
+            self.assertRaises(ValueError, load_calibration, path)
+        finally:
+            shutil.rmtree(directory)
+
+
+class TestCheckPlan(unittest.TestCase):
+    """Test the check_plan function"""
+    def test_simple(self):
+        plan = plan_network(2, 3)
+        self.assertEqual([], check_plan(plan, dict(open_files=None, processes=None,
+                                                   memory_mb=None)))
+        problems = check_plan(plan, dict(open_files=10, processes=None, memory_mb=1e6))
+        self.assertEqual(1, len(problems))
+        self.assertIn('open files', problems[0])
+        self.assertEqual(set(['open_files', 'processes', 'memory_mb']), set(machine_limits()))
+
+
+class TestPlanOption(unittest.TestCase):
+    """Test the --plan option of fpga_switch_model"""
+    def test_simple(self):
+        result = CliRunner().invoke(main, ['--plan', '-s', '2', '-d', '3'])
+        self.assertEqual(0, result.exit_code, result.output)
+
+    def test_too_large(self):
+        result = CliRunner().invoke(main, ['--plan', '-s', '10', '-d', '9'])
+        self.assertEqual(1, result.exit_code)
+        self.assertIn('will not fit', result.output)
+
+    def test_shards(self):
+        result = CliRunner().invoke(main, ['--plan', '-s', '2', '-d', '4', '--shards', '3'])
+        self.assertEqual(0, result.exit_code, result.output)
+        result = CliRunner().invoke(main, ['--plan', '-s', '2', '-d', '3', '--shards', '4'])
+        self.assertEqual(2, result.exit_code)
+        self.assertIn('--shards', result.output)
+        result = CliRunner().invoke(main, ['--plan', '-s', '4', '-d', '6', '-f', '1',
+                                           '--aggregate', 'subtree'])
+        self.assertEqual(0, result.exit_code, result.output)
+        result = CliRunner().invoke(main, ['--plan', '-s', '4', '-d', '6', '-f', '2',
+                                           '--aggregate', 'subtree', '--aggregate-level', '1'])
+        self.assertEqual(2, result.exit_code)
+        self.assertIn('--aggregate-level', result.output)
+
+    def test_lazy_imports(self):
+        modules = subprocess.check_output([
+            sys.executable, '-c',
+            'import sys, fpga_switch_model; print(" ".join(sorted(sys.modules)))'],
+            cwd=os.path.dirname(os.path.abspath(fpga_switch_model.__file__)))
+        modules = modules.decode().split()
+        for module in ('numpy', 'mininet', 'analytic', 'simulation', 'performance_tests'):
+            self.assertNotIn(module, modules)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+
+import unittest
+
+import numpy as np
+
+from queueing import erlang_c, mmc, predict
+
+
+def prediction(**parameters):
+    """Predict a network with the defaults of fpga_switch_model, overridden by parameters."""
+    values = dict(spread=2, depth=4, fpga=None, bandwidth=10, delay='1ms', fpga_bandwidth=504,
+                  fpga_delay=None, rate=100, request_size=64, response_size=64,
+                  fpga_service_time=1e-3, fpga_pipelines=1, cloud_service_time=1e-4,
+                  cloud_pipelines=4, cores=4)
+    values.update(parameters)
+    return predict(**values)
+
+
+class TestErlangC(unittest.TestCase):
+    """Test the erlang_c function"""
+    def test_single_server(self):
+        # An M/M/1 queue waits as often as its server is busy
+        np.testing.assert_allclose(erlang_c(1, [0.1, 0.5, 0.9]), [0.1, 0.5, 0.9])
+
+    def test_servers(self):
+        np.testing.assert_allclose(erlang_c([2, 3], [1, 2]), [1 / 3.0, 4 / 9.0])
+
+    def test_saturated(self):
+        np.testing.assert_array_equal(erlang_c([1, 2], [1, 3]), [1, 1])
+
+
+class TestMMC(unittest.TestCase):
+    """Test the mmc function"""
+    def test_single_server(self):
+        queue = mmc(50, 100, 1)
+        self.assertAlmostEqual(0.5, queue['utilisation'])
+        self.assertAlmostEqual(1 / 50.0, queue['response'])
+        self.assertAlmostEqual(1 / 100.0, queue['wait'])
+
+    def test_saturated(self):
+        queue = mmc([100, 300], 100, 2)
+        self.assertEqual(0.5, queue['utilisation'][0])
+        self.assertTrue(np.isinf(queue['wait'][1]))
+        self.assertTrue(np.isinf(queue['response'][1]))
+
+    def test_no_servers(self):
+        queue = mmc(1000, 1, 0)
+        self.assertEqual(0, queue['response'])
+        self.assertEqual(0, queue['utilisation'])
+
+
+class TestPredict(unittest.TestCase):
+    """Test the predict function"""
+    def test_network(self):
+        # 3 standard links and a 0ms cloud link, each crossed in both directions, as in analytic
+        result = prediction(bandwidth=0, cloud_pipelines=0)
+        self.assertAlmostEqual(6.0, float(result['latency_ms']), places=2)
+        self.assertEqual(0, result['service_ms'])
+
+    def test_fpga(self):
+        # The 4 leaves below each FPGA host at level 1 send to an M/M/1 queue at 400 requests/s
+        result = prediction(fpga=1, bandwidth=0, fpga_delay='5ms', fpga_service_time=1e-3)
+        queue = mmc(400, 1000, 1)
+        self.assertEqual(2, result['n_fpga'])
+        self.assertAlmostEqual(0.4, float(result['utilisation']))
+        self.assertAlmostEqual(queue['wait'] * 1e3, float(result['wait_ms']))
+        # 2 standard links and the FPGA link with half of its delay, in both directions
+        self.assertAlmostEqual(9.0 + queue['response'] * 1e3, float(result['latency_ms']),
+                               places=2)
+        self.assertAlmostEqual(250.0, float(result['max_rate']))
+        self.assertEqual('compute', result['bottleneck'])
+
+    def test_saturated(self):
+        result = prediction(fpga=1, rate=300)
+        self.assertTrue(np.isinf(result['latency_ms']))
+        self.assertAlmostEqual(250.0, float(result['max_rate']))
+
+    def test_link_bottleneck(self):
+        # Each request of 116 bytes crosses the busiest 1 Mbps link for the 4 leaves below it
+        result = prediction(bandwidth=1, cloud_pipelines=0)
+        self.assertAlmostEqual(1e6 / (116 * 8 * 4), float(result['max_rate']))
+        self.assertEqual('link', result['bottleneck'])
+
+    def test_cpu(self):
+        # Two pipelines sharing one core serve at half speed
+        result = prediction(fpga=1, fpga_pipelines=2, fpga_cpu=0.25, rate=1)
+        self.assertAlmostEqual(2.0, float(result['service_ms']))
+        result = prediction(fpga=1, fpga_pipelines=2, fpga_cpu=1, rate=1)
+        self.assertAlmostEqual(1.0, float(result['service_ms']))
+
+    def test_arrays(self):
+        # The leaves are no FPGA hosts, so level 3 of a tree of depth 4 is the cloud alone
+        result = prediction(fpga=np.array([None, 0, 1, 2, 3], dtype=object))
+        self.assertEqual((5,), result['latency_ms'].shape)
+        np.testing.assert_array_equal(result['n_fpga'], [0, 1, 2, 4, 0])
+        self.assertEqual(result['latency_ms'][0], result['latency_ms'][4])
+        # Lower FPGA levels are fewer links away
+        self.assertTrue(np.all(np.diff(result['network_ms'][1:4]) < 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+
+import math
+import unittest
+
+from repetition import confidence_interval, repeat, t_quantile
+
+
+class TestConfidenceInterval(unittest.TestCase):
+    """Test the t_quantile and confidence_interval functions"""
+    def test_t_quantile(self):
+        self.assertAlmostEqual(12.706, t_quantile(0.975, 1), places=3)
+        self.assertAlmostEqual(2.228, t_quantile(0.975, 10), places=3)
+        self.assertAlmostEqual(4.604, t_quantile(0.995, 4), places=3)
+        self.assertAlmostEqual(1.960, t_quantile(0.975, 100000), places=3)
+
+    def test_simple(self):
+        mean, half_width = confidence_interval([1.0, 2.0, 3.0])
+        self.assertEqual(2.0, mean)
+        self.assertAlmostEqual(4.303 / math.sqrt(3), half_width, places=3)
+        self.assertTrue(math.isnan(confidence_interval([1.0])[1]))
+        self.assertTrue(math.isnan(confidence_interval([])[0]))
+
+
+class TestRepeat(unittest.TestCase):
+    """Test the repeat function"""
+    def test_converged(self):
+        batches = iter([[10.0, 12.0], [11.0, 11.0, 10.5, 11.5]] + [[11.0] * 10] * 8)
+        samples, confidence = repeat(lambda: next(batches), 0.05)
+        self.assertTrue(confidence['converged'])
+        self.assertLessEqual(confidence['ci_half_width'], 0.05 * 11)
+        self.assertEqual(len(samples), sum([2, 4, 10][:confidence['batches']]))
+        self.assertEqual(0.95, confidence['ci_confidence'])
+
+    def test_constant(self):
+        samples, confidence = repeat(lambda: [4.0, 4.0], 0.01)
+        self.assertEqual(1, confidence['batches'])
+        self.assertEqual(0.0, confidence['ci_half_width'])
+
+    def test_budget(self):
+        values = iter(range(100))
+        samples, confidence = repeat(lambda: [float(next(values) % 2 * 100)], 0.01,
+                                     max_batches=4)
+        self.assertEqual(4, len(samples))
+        self.assertEqual(4, confidence['batches'])
+        self.assertFalse(confidence['converged'])
+        # A probe without samples never converges
+        _, confidence = repeat(lambda: [], 0.5, max_batches=3)
+        self.assertEqual(3, confidence['batches'])
+        self.assertFalse(confidence['converged'])
+
+
+if __name__ == '__main__':
+    unittest.main()
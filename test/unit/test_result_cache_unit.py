@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+
+import csv
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from click.testing import CliRunner
+
+from fpga_switch_model import main
+from parameters import placement_options
+from result_cache import ResultCache, cache, normalise, run_key, run_parameters
+from results import FIELD_NAMES, make_records
+
+NETWORK = dict(backend='simulation', spread=2, depth=3, bandwidth=10, delay='1ms', loss=0, fpga=1,
+               fpga_bandwidth=504, fpga_delay=None, fpga_loss=None, poisson=False)
+
+
+def key(**changes):
+    """Return the key of a ping_all run of NETWORK with some parameters changed."""
+    parameters = run_parameters(ping_all=True, iperf=False, cloud_fpga=True,
+                                **dict(NETWORK, **changes))
+    return None if parameters is None else run_key(parameters)
+
+
+class TestRunKey(unittest.TestCase):
+    """Test the run_parameters and run_key functions"""
+    def test_normalised(self):
+        self.assertEqual(key(), key(delay='1000us'))
+        # An FPGA delay of twice the delay of the tree is its default
+        self.assertEqual(key(), key(fpga_delay='2ms'))
+        self.assertNotEqual(key(), key(fpga_delay='4ms'))
+        self.assertNotEqual(key(), key(backend='mininet'))
+        self.assertNotEqual(key(), key(placements=[placement_options(1, [0])]))
+        self.assertEqual(dict(a=[1.0, True, None, 0.002, 'edge']),
+                         normalise(dict(a=(1, True, None, '2ms', 'edge'))))
+
+    def test_poisson(self):
+        self.assertIsNone(key(poisson=True))
+        self.assertEqual(key(poisson=True, seed=1), key(poisson=True, seed=1))
+        self.assertNotEqual(key(poisson=True, seed=1), key(poisson=True, seed=2))
+        self.assertIsNone(key(poisson=True, seed=1, shards=2))
+        # The seed only matters to random delays
+        self.assertEqual(key(), key(seed=3))
+
+    def test_outputs(self):
+        latency = dict(method='edge', output=None, validate=0)
+        self.assertIsNotNone(key(latency=latency))
+        self.assertIsNone(key(latency=dict(latency, output='matrix.npz')))
+        telemetry = dict(interval=1.0, capacity=600, output=None)
+        self.assertNotEqual(key(), key(telemetry=telemetry))
+        self.assertIsNone(key(telemetry=dict(telemetry, output='telemetry.npz')))
+
+
+class TestResultCache(unittest.TestCase):
+    """Test the ResultCache class and the cache command"""
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'cache', 'results.sqlite')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def put(self, results, measurements, **changes):
+        parameters = run_parameters(ping_all=True, iperf=False, cloud_fpga=True,
+                                    **dict(NETWORK, **changes))
+        network = dict(NETWORK, **changes)
+        results.put(run_key(parameters), parameters, measurements,
+                    make_records(measurements, **network))
+        return run_key(parameters)
+
+    def test_simple(self):
+        results = ResultCache(self.path)
+        try:
+            self.assertIsNone(results.get(key()))
+            measurements = [dict(test='ping_all', src='*', dst='*', loss_percent=0.0,
+                                 rtt_avg=float('nan'))]
+            self.put(results, measurements)
+            self.assertEqual('ping_all', results.get(key())[0]['test'])
+            self.assertNotEqual(results.get(key())[0]['rtt_avg'],
+                                results.get(key())[0]['rtt_avg'])
+            self.put(results, measurements + measurements)
+            self.assertEqual(2, len(results.get(key())))
+            self.assertEqual(1, len(results.runs()))
+            self.assertEqual(2, results.runs()[0][2])
+        finally:
+            results.close()
+
+    def test_new_fields(self):
+        # A cache made before the last field was added gets its column
+        os.makedirs(os.path.dirname(self.path))
+        connection = sqlite3.connect(self.path)
+        connection.execute('CREATE TABLE records (key TEXT, {})'.format(
+            ', '.join(name for name in FIELD_NAMES[:-1])))
+        connection.close()
+        results = ResultCache(self.path)
+        try:
+            self.put(results, [dict(test='cloud_fpga', rtt_avg=1.0)])
+            self.assertEqual([(1, 1.0, 1.0, 1.0)], results.aggregate(['rtt_avg']))
+        finally:
+            results.close()
+
+    def test_aggregate(self):
+        results = ResultCache(self.path)
+        try:
+            for depth, rtt in ((3, 2.0), (4, 4.0)):
+                self.put(results, [dict(test='cloud_fpga', rtt_avg=rtt)], depth=depth)
+                self.put(results, [dict(test='cloud_fpga', rtt_avg=rtt * 2)], depth=depth,
+                         delay='2ms')
+            self.assertEqual([(3.0, 2, 3.0, 2.0, 4.0), (4.0, 2, 6.0, 4.0, 8.0)],
+                             results.aggregate(['rtt_avg'], ['depth']))
+            self.assertEqual([(2, 3.0, 2.0, 4.0)],
+                             results.aggregate(['rtt_avg'], where=[('depth', '3')]))
+            self.assertEqual(2, len(results.runs([('delay_ms', '2')])))
+            self.assertRaises(ValueError, results.aggregate, ['rtt'])
+            self.assertRaises(ValueError, results.runs, [('1=1 OR depth', '3')])
+        finally:
+            results.close()
+
+        result = CliRunner().invoke(cache, ['--cache', self.path, '-g', 'depth', '-a', 'rtt_avg'])
+        self.assertEqual(0, result.exit_code, result.output)
+        self.assertIn('mean rtt_avg', result.output)
+        result = CliRunner().invoke(cache, ['--cache', self.path, '-w', 'depth=4'])
+        self.assertEqual(0, result.exit_code, result.output)
+        self.assertEqual(2, result.output.count('depth=4'))
+        result = CliRunner().invoke(cache, ['--cache', self.path, '-w', 'depth'])
+        self.assertEqual(2, result.exit_code)
+
+    def test_run(self):
+        # A cached run is served without building the network
+        results = ResultCache(self.path)
+        try:
+            self.put(results, [dict(test='cloud_fpga', src='h0', dst='f0', rtt_avg=123.0)])
+        finally:
+            results.close()
+        output = os.path.join(self.directory, 'records.csv')
+        args = ['--backend', 'simulation', '-s', '2', '-d', '3', '-f', '1', '-p',
+                '--cache', self.path, '-o', output]
+        result = CliRunner().invoke(main, args)
+        self.assertEqual(0, result.exit_code, result.output)
+        result = CliRunner().invoke(main, args + ['--no-cache'])
+        self.assertEqual(0, result.exit_code, result.output)
+        with open(output) as f:
+            records = list(csv.DictReader(f))
+        self.assertEqual(['123.0', '4.137'], [record['rtt_avg'] for record in records
+                                              if record['test'] == 'cloud_fpga'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+
+import csv
+import json
+import math
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from results import (FIELD_NAMES, combine_pings, load_npz, make_record, open_sink, parse_ping,
+                     parse_ping_rtts, parse_rate)
+
+PING_OUTPUT = """PING 10.0.0.1 (10.0.0.1) 56(84) bytes of data.
+64 bytes from 10.0.0.1: icmp_seq=1 ttl=64 time=6.45 ms
+
+--- 10.0.0.1 ping statistics ---
+10 packets transmitted, 9 received, 10% packet loss, time 9013ms
+rtt min/avg/max/mdev = 6.123/6.405/7.001/0.250 ms
+"""
+
+
+class TestParsePing(unittest.TestCase):
+    """Test the parse_ping function"""
+    def test_simple(self):
+        self.assertEqual(dict(transmitted=10, received=9, loss_percent=10, rtt_min=6.123,
+                              rtt_avg=6.405, rtt_max=7.001, rtt_mdev=0.25),
+                         parse_ping(PING_OUTPUT))
+
+    def test_no_replies(self):
+        measurement = parse_ping('10 packets transmitted, 0 received, 100% packet loss, '
+                                 'time 9013ms\n')
+        self.assertEqual(100, measurement['loss_percent'])
+        self.assertTrue(math.isnan(measurement['rtt_avg']))
+
+    def test_combine(self):
+        self.assertEqual([6.45], parse_ping_rtts(PING_OUTPUT))
+        other = ('64 bytes from 10.0.0.1: icmp_seq=1 ttl=64 time=2.45 ms\n'
+                 '1 packets transmitted, 1 received, 0% packet loss, time 0ms\n')
+        measurement = combine_pings([PING_OUTPUT, other])
+        self.assertEqual(11, measurement['transmitted'])
+        self.assertEqual(10, measurement['received'])
+        self.assertAlmostEqual(100.0 / 11, measurement['loss_percent'])
+        self.assertEqual((2.45, 4.45, 6.45, 2.0), tuple(
+            round(measurement[name], 6) for name in ('rtt_min', 'rtt_avg', 'rtt_max', 'rtt_mdev')))
+
+
+class TestParseRate(unittest.TestCase):
+    """Test the parse_rate function"""
+    def test_simple(self):
+        self.assertAlmostEqual(9.57, parse_rate('9.57 Mbits/sec'))
+        self.assertAlmostEqual(1200, parse_rate('1.2 Gbits/sec'))
+        self.assertAlmostEqual(0.5, parse_rate('500 Kbits/sec'))
+        self.assertTrue(math.isnan(parse_rate('')))
+
+
+class TestSinks(unittest.TestCase):
+    """Test the CSV, JSON lines and NPZ sinks"""
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        measurement = parse_ping(PING_OUTPUT)
+        measurement.update(test='cloud_fpga', src='h0', dst='cloud')
+        self.records = [make_record(measurement, backend='simulation', spread=spread, depth=4,
+                                    bandwidth=10, delay='1ms', loss=0, fpga=None)
+                        for spread in range(2, 7)]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, records):
+        sink = open_sink(os.path.join(self.directory, name))
+        for record in records:
+            sink.write(record)
+        sink.close()
+        return os.path.join(self.directory, name)
+
+    def test_csv(self):
+        self.write('results.csv', self.records[:2])
+        path = self.write('results.csv', self.records[2:])
+        with open(path) as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(5, len(rows))
+        self.assertEqual(set(FIELD_NAMES), set(rows[0]))
+        self.assertEqual(6.405, float(rows[0]['rtt_avg']))
+
+    def test_jsonl(self):
+        path = self.write('results.jsonl', self.records)
+        with open(path) as f:
+            rows = [json.loads(line) for line in f]
+        self.assertEqual(5, len(rows))
+        self.assertEqual(None, rows[0]['fpga'])
+        self.assertEqual(1.0, rows[0]['delay_ms'])
+
+    def test_npz(self):
+        sink = open_sink(os.path.join(self.directory, 'results.npz'))
+        sink.chunk_size = 2
+        for record in self.records[:3]:
+            sink.write(record)
+        sink.close()
+        path = self.write('results.npz', self.records[3:])
+        columns = load_npz(path)
+        np.testing.assert_array_equal([2, 3, 4, 5, 6], columns['spread'])
+        np.testing.assert_array_equal(['h0'] * 5, columns['src'])
+        self.assertTrue(np.all(np.isnan(columns['fpga'])))
+
+    def test_unsupported(self):
+        self.assertRaises(ValueError, open_sink, os.path.join(self.directory, 'results.txt'))
+
+
+if __name__ == '__main__':
+    unittest.main()
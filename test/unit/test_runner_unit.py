@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+import unittest
+
+from test.runner import assign_shapes, group_by_shape, shape_of, topology_tests
+
+
+TOPOLOGIES = [
+    dict(spread=2, depth=3, bandwidth=10, delay='1ms', loss=0, fpga=None),
+    dict(spread=2, depth=3, bandwidth=1, delay='4ms', loss=0, fpga=5),
+    dict(spread=3, depth=4, bandwidth=10, delay='1ms', loss=0, fpga=1),
+]
+
+
+def network_tests():
+    """Return a test case of TOPOLOGIES, which isn't discovered since it would build networks."""
+    @topology_tests
+    class Networks(unittest.TestCase):
+        topologies = TOPOLOGIES
+
+        def test_simple(self, net):
+            pass
+    return Networks
+
+
+class TestShapeOf(unittest.TestCase):
+    """Test the shape_of function"""
+    def test_simple(self):
+        self.assertEqual((3, 4, 1), shape_of(TOPOLOGIES[2]))
+        # There are no FPGA hosts below the last level of switches
+        self.assertEqual(shape_of(TOPOLOGIES[0]), shape_of(TOPOLOGIES[1]))
+
+
+class TestTopologyTests(unittest.TestCase):
+    """Test the topology_tests decorator"""
+    def test_simple(self):
+        Networks = network_tests()
+        self.assertFalse(hasattr(Networks, 'test_simple'))
+        for i, topology in enumerate(TOPOLOGIES):
+            self.assertIs(topology, getattr(Networks, 'test_simple_{}'.format(i)).topology)
+
+    def test_group_by_shape(self):
+        Networks = network_tests()
+        tests = [Networks('test_simple_{}'.format(i)) for i in range(3)] + [self]
+        plain, shapes = group_by_shape(tests)
+        self.assertEqual([self], plain)
+        self.assertEqual([tests[:2], tests[2:3]], [shapes[(2, 3, None)], shapes[(3, 4, 1)]])
+
+
+class TestAssignShapes(unittest.TestCase):
+    """Test the assign_shapes function"""
+    def test_simple(self):
+        shapes = [(2, 7, None), (2, 3, None), (3, 5, 1), (2, 2, None)]
+        workers = assign_shapes(shapes, 2)
+        # Shapes of 128, 125, 8 and 4 nodes
+        self.assertEqual([[(2, 7, None), (2, 2, None)], [(3, 5, 1), (2, 3, None)]], workers)
+        self.assertEqual(1, len(assign_shapes(shapes[:1], 4)))
+
+
+if __name__ == '__main__':
+    unittest.main()
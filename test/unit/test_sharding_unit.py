@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+
+import unittest
+
+from parameters import placement_options
+from sharding import Partition, tunnel_names
+from tree_index import TreeIndex
+
+
+class TestPartition(unittest.TestCase):
+    """Test the Partition class"""
+    def test_default_level(self):
+        self.assertEqual(1, Partition(TreeIndex(2, 5), 3).level)
+        # 4 worker shards need the 4 subtrees of level 2
+        self.assertEqual(2, Partition(TreeIndex(2, 5), 5).level)
+        self.assertEqual(3, Partition(TreeIndex(2, 5), 2, 3).level)
+
+    def test_roots(self):
+        partition = Partition(TreeIndex(3, 5), 5, 2)
+        roots = [list(partition.roots(shard)) for shard in range(1, 5)]
+        self.assertEqual(list(range(9)), sum(roots, []))
+        self.assertEqual([3, 2, 2, 2], [len(positions) for positions in roots])
+
+    def test_nodes(self):
+        placements = [placement_options(1), placement_options(2, [0, 5])]
+        for index in (TreeIndex(2, 5, 2), TreeIndex(3, 4, placements=placements)):
+            for shards in (2, 3, 4):
+                partition = Partition(index, shards)
+                nodes = [node for shard in range(shards) for node in partition.nodes(shard)]
+                self.assertEqual(sorted(range(index.n_nodes)), sorted(nodes))
+                for shard in range(shards):
+                    for node in partition.nodes(shard):
+                        self.assertEqual(shard, partition.shard(node))
+
+    def test_links(self):
+        index = TreeIndex(2, 4, 1)
+        partition = Partition(index, 3, 2)
+        links = partition.links()
+        self.assertEqual([(1, 3), (1, 4), (2, 5), (2, 6)], links)
+        # Every link between shards joins a subtree root to the coordinator
+        crossing = [(upper, lower) for upper, lower in index.links()
+                    if partition.shard(upper) != partition.shard(lower)]
+        self.assertEqual(sorted(links), sorted(crossing))
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            Partition(TreeIndex(2, 2), 2)
+        with self.assertRaises(ValueError):
+            Partition(TreeIndex(2, 4), 2, 3)
+        with self.assertRaises(ValueError):
+            Partition(TreeIndex(2, 4), 4, 1)
+
+
+class TestTunnelNames(unittest.TestCase):
+    """Test the tunnel_names function"""
+    def test_simple(self):
+        self.assertEqual(('x3u', 'x3l'), tunnel_names(3))
+        # Interface names are at most 15 characters long
+        self.assertTrue(all(len(name) <= 15 for name in tunnel_names(10 ** 9)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from click.testing import CliRunner
+
+import performance_tests
+from analytic import predict
+from fpga_switch_model import main
+from parameters import placement_options
+from results import load_npz
+from simulation import setup_simulation
+
+
+class TestSimulator(unittest.TestCase):
+    """Test the Simulator class"""
+    def test_large_tree(self):
+        net = setup_simulation(2, 18, 10, '1ms', 0, 3, 504, None, None, False)
+        self.assertEqual(2 ** 17, net.index.n_leaves)
+        self.assertEqual('h131071', net.get('h131071').name)
+        performance_tests.test_cloud_fpga(net, 3)
+
+    def test_root_fpga(self):
+        net = setup_simulation(2, 3, 10, '1ms', 0, 0, 504, None, None, False)
+        measurement = performance_tests.test_cloud_fpga(net, 0)
+        self.assertEqual('f0', measurement['dst'])
+
+    def test_fpga_below_leaves(self):
+        # There are no FPGA hosts, so main tests the cloud instead
+        result = CliRunner().invoke(main, ['--backend', 'simulation', '-d', '2', '-f', '3',
+                                           '--log', 'warning', '--no-cache'])
+        self.assertEqual(0, result.exit_code, result.output)
+
+    def test_placements(self):
+        placements = [placement_options(1), placement_options(2, [3], delay='8ms')]
+        net = setup_simulation(2, 4, 10, '1ms', 0, None, 504, None, None, False,
+                               placements=placements)
+        prediction = predict(2, 4, 10, '1ms', 0, 2, 504, '8ms')
+        measurement = performance_tests.test_cloud_fpga(net, 2, 'h7', 'f2_3')
+        self.assertAlmostEqual(prediction['fpga_rtt'][7], measurement['rtt_avg'], places=3)
+
+
+class TestPlacementOption(unittest.TestCase):
+    """Test the --placement option of main"""
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.output = os.path.join(self.directory, 'records.npz')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_simple(self):
+        result = CliRunner().invoke(main, ['--backend', 'simulation', '-f', '1', '--placement',
+                                           '2@1:bandwidth=100', '--placement', '0:delay=8ms',
+                                           '-o', self.output, '--log', 'warning', '--no-cache'])
+        self.assertEqual(0, result.exit_code, result.output)
+        records = load_npz(self.output)
+        self.assertEqual(['1', '2@1:bandwidth=100', '0:delay=8ms'], list(records['placement']))
+        self.assertEqual(['f1_0', 'f2_1', 'f0_0'], list(records['dst']))
+        self.assertEqual(['h0', 'h2', 'h0'], list(records['src']))
+        self.assertEqual([1, 2, 0], list(records['fpga']))
+        self.assertEqual([504, 100, 504], list(records['fpga_bandwidth']))
+        self.assertEqual(8, records['fpga_delay_ms'][2])
+
+    def test_invalid(self):
+        for placement in ('3', '1@2', '1:speed=1'):
+            result = CliRunner().invoke(main, ['--backend', 'simulation', '-f', '1',
+                                               '--placement', placement])
+            self.assertEqual(2, result.exit_code, result.output)
+            self.assertIn('placement', result.output)
+
+
+class TestSimNet(unittest.TestCase):
+    """Test the SimNet class"""
+    def test_ping(self):
+        for fpga in (None, 1, 2):
+            net = setup_simulation(3, 4, 10, '2ms', 0, fpga, 504, '3ms', 0, False)
+            prediction = predict(3, 4, 10, '2ms', 0, fpga, 504, '3ms', 0)
+            target = 'f0' if fpga is not None else 'cloud'
+            output = net.get('h0').cmd('ping -c 5 {}'.format(net.get(target).IP()))
+            self.assertIn('5 packets transmitted, 5 received, 0% packet loss', output)
+            avg = float(output.split('=')[-1].split('/')[1])
+            key = 'fpga_rtt' if fpga is not None else 'cloud_rtt'
+            self.assertAlmostEqual(prediction[key][0], avg, places=3)
+
+    def test_loss(self):
+        net = setup_simulation(2, 3, 10, '1ms', 50, None, 504, None, None, False, seed=1)
+        output = net.get('h0').cmd('ping -c 20 {}'.format(net.get('cloud').IP()))
+        self.assertNotIn(' 0% packet loss', output)
+
+    def test_ping_all(self):
+        net = setup_simulation(2, 3, 10, '1ms', 0, 1, 504, None, None, False)
+        self.assertEqual(0, net.pingAll())
+
+    def test_iperf(self):
+        net = setup_simulation(2, 3, 10, '1ms', 0, None, 504, None, None, False)
+        server, client = net.iperf()
+        self.assertAlmostEqual(10, float(server.split()[0]), delta=0.5)
+
+    def test_reconfigure(self):
+        net = setup_simulation(3, 4, 10, '2ms', 0, 1, 504, None, None, False)
+        net.reconfigure(10, '4ms', 0, 504, '1ms', 0)
+        prediction = predict(3, 4, 10, '4ms', 0, 1, 504, '1ms', 0)
+        output = net.get('h0').cmd('ping -c 5 {}'.format(net.get('f0').IP()))
+        avg = float(output.split('=')[-1].split('/')[1])
+        self.assertAlmostEqual(prediction['fpga_rtt'][0], avg, places=3)
+
+    def test_unsupported_command(self):
+        net = setup_simulation(2, 3, 10, '1ms', 0, None, 504, None, None, False)
+        self.assertRaises(ValueError, net.get('h0').cmd, 'iperf -s')
+        self.assertRaises(KeyError, net.get, 'h4')
+        self.assertRaises(KeyError, net.get, 's0')
+
+
+if __name__ == '__main__':
+    unittest.main()
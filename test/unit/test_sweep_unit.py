@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+
+import csv
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from click.testing import CliRunner
+
+from results import load_npz
+from sweep import (OPTIONAL_PARAMETERS, completed_points, grid, point_key, run_point, run_shape,
+                   shape_results, sweep)
+
+
+def crash_after_first(points, queue, log):
+    """Evaluate the first point, then exit as if the network had crashed the process."""
+    run_shape(points[:1], queue, log)
+    queue.close()
+    queue.join_thread()
+    os._exit(1)
+
+
+class TestGrid(unittest.TestCase):
+    """Test the grid function"""
+    def test_simple(self):
+        points = grid(dict(spread=[2, 3], depth=[4], fpga=[None, 1]))
+        self.assertEqual(4, len(points))
+        self.assertIn(dict(spread=3, depth=4, fpga=None), points)
+
+
+class TestCompletedPoints(unittest.TestCase):
+    """Test the completed_points function"""
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.output = os.path.join(self.directory, 'sweep.jsonl')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_simple(self):
+        self.assertEqual(set(), completed_points(self.output))
+        with open(self.output, 'wt') as f:
+            f.write(json.dumps(dict(point=dict(spread=2), results={})) + '\n')
+            f.write(json.dumps(dict(point=dict(spread=3), error='ValueError: ')) + '\n')
+            # Interrupted while writing the last point
+            f.write('{"point": {"spread": 4}, "resu')
+        self.assertEqual({point_key(dict(spread=2))}, completed_points(self.output))
+
+    def test_optional_parameters(self):
+        self.assertEqual(point_key(dict(spread=2)), point_key(dict(spread=2, rate=100.0)))
+        self.assertNotEqual(point_key(dict(spread=2)), point_key(dict(spread=2, rate=10.0)))
+
+
+class TestRunPoint(unittest.TestCase):
+    """Test the run_point function"""
+    point = dict(backend='analytic', spread=2, depth=4, bandwidth=10, delay='1ms', loss=0, fpga=1,
+                 fpga_bandwidth=504, fpga_delay=None, fpga_loss=None, poisson=False,
+                 ping_all=False, iperf=False, cloud_fpga=True)
+
+    def test_analytic(self):
+        result = run_point(self.point)
+        self.assertNotIn('error', result)
+        measurement, = result['measurements']
+        self.assertEqual('f0', measurement['dst'])
+        self.assertAlmostEqual(6.271, measurement['rtt_avg'], places=3)
+
+    def test_simulation(self):
+        result = run_point(dict(self.point, backend='simulation', iperf=True))
+        self.assertNotIn('error', result)
+        cloud_fpga, iperf = result['measurements']
+        self.assertEqual(10, cloud_fpga['received'])
+        self.assertEqual('iperf', iperf['test'])
+        self.assertAlmostEqual(10, iperf['throughput_mbps'], delta=0.5)
+
+    def test_repetition(self):
+        result = run_point(dict(self.point, backend='simulation', iperf=True, ci_width=0.05,
+                                ci_confidence=0.9, max_batches=3))
+        self.assertNotIn('error', result)
+        cloud_fpga, iperf = result['measurements']
+        # Every echo request has the same RTT, so the first batch converges
+        self.assertEqual(1, cloud_fpga['batches'])
+        self.assertEqual(5, cloud_fpga['received'])
+        self.assertTrue(cloud_fpga['converged'])
+        self.assertEqual(0.9, cloud_fpga['ci_confidence'])
+        self.assertLessEqual(iperf['batches'], 3)
+        self.assertAlmostEqual(10, iperf['throughput_mbps'], delta=0.5)
+
+    def test_error(self):
+        result = run_point(dict(self.point, depth=1))
+        self.assertIn('ValueError', result['error'])
+
+
+class TestRunShape(unittest.TestCase):
+    """Test the run_shape function"""
+    def test_reconfigure(self):
+        points = [dict(TestRunPoint.point, backend='simulation', delay=delay)
+                  for delay in ('1ms', '5ms')]
+        results = queue.Queue()
+        run_shape(points, results)
+        rtts = []
+        for point in points:
+            result = results.get_nowait()
+            self.assertEqual(point, result['point'])
+            rtts.append(result['measurements'][0]['rtt_avg'])
+        self.assertEqual(run_point(points[1])['measurements'][0]['rtt_avg'], rtts[1])
+        self.assertGreater(rtts[1], rtts[0])
+
+
+class TestShapeResults(unittest.TestCase):
+    """Test the shape_results function"""
+    def points(self, spread):
+        return [dict(TestRunPoint.point, backend='simulation', spread=spread, delay=delay)
+                for delay in ('1ms', '5ms')]
+
+    def test_simple(self):
+        results = list(shape_results([self.points(2), self.points(3)]))
+        self.assertEqual(self.points(2) + self.points(3), [result['point'] for result in results])
+        self.assertFalse(any('error' in result for result in results))
+
+    def test_crash(self):
+        results = list(shape_results([self.points(2), self.points(3)], target=crash_after_first,
+                                     interval=0.1))
+        self.assertEqual(4, len(results))
+        self.assertNotIn('error', results[0])
+        self.assertEqual('Process exited with code 1', results[1]['error'])
+        self.assertEqual(self.points(2)[1], results[1]['point'])
+        self.assertNotIn('error', results[2])
+
+
+class TestSweep(unittest.TestCase):
+    """Test the sweep command"""
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.output = os.path.join(self.directory, 'sweep.jsonl')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_resume(self):
+        runner = CliRunner()
+        args = ['-s', '2:3', '-d', '3,4', '-f', 'none,1', '-j', '1', '-o', self.output]
+        result = runner.invoke(sweep, args)
+        self.assertEqual(0, result.exit_code, result.output)
+        with open(self.output) as f:
+            self.assertEqual(8, len(f.readlines()))
+
+        result = runner.invoke(sweep, ['-s', '2:4:2'] + args[2:])
+        self.assertEqual(0, result.exit_code, result.output)
+        with open(self.output) as f:
+            points = [json.loads(line)['point'] for line in f]
+        self.assertEqual(12, len(points))
+        self.assertEqual(4, len([point for point in points if point['spread'] == 4]))
+
+    def test_resume_without_optional_parameters(self):
+        # Points written before the workload and compute parameters existed are still completed
+        args = ['-s', '2,3', '-j', '1', '-o', self.output]
+        result = CliRunner().invoke(sweep, args)
+        self.assertEqual(0, result.exit_code, result.output)
+        with open(self.output) as f:
+            results = [json.loads(line) for line in f]
+        with open(self.output, 'wt') as f:
+            for result in results:
+                for name in OPTIONAL_PARAMETERS:
+                    del result['point'][name]
+                f.write(json.dumps(result) + '\n')
+
+        result = CliRunner().invoke(sweep, args)
+        self.assertEqual(0, result.exit_code, result.output)
+        with open(self.output) as f:
+            self.assertEqual(2, len(f.readlines()))
+
+    def test_records(self):
+        records = os.path.join(self.directory, 'records.npz')
+        result = CliRunner().invoke(sweep, ['-s', '2:5', '-j', '1', '-o', self.output,
+                                            '-r', records])
+        self.assertEqual(0, result.exit_code, result.output)
+        self.assertEqual([2, 3, 4, 5], sorted(load_npz(records)['spread']))
+
+    def test_records_without_replies(self):
+        # Every ping is lost, so the round trip times are NaN, which the output stores as null
+        records = os.path.join(self.directory, 'records.csv')
+        result = CliRunner().invoke(sweep, ['--backend', 'simulation', '-d', '2', '-l', '100',
+                                            '-j', '1', '-o', self.output, '-r', records])
+        self.assertEqual(0, result.exit_code, result.output)
+        with open(records) as f:
+            record, = list(csv.DictReader(f))
+        self.assertEqual('nan', record['rtt_avg'])
+        self.assertEqual('10.0', record['transmitted'])
+
+    def test_invalid_range(self):
+        result = CliRunner().invoke(sweep, ['-s', '2:4:0'])
+        self.assertNotEqual(0, result.exit_code)
+
+
+if __name__ == '__main__':
+    unittest.main()
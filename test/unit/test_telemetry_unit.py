@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import numpy as np
+
+from telemetry import (COUNTERS, STATS, RingBuffer, TelemetrySampler, parse_net_dev,
+                       parse_qdiscs)
+
+NET_DEV = """Inter-|   Receive                                                |  Transmit
+ face |bytes packets errs drop fifo frame compressed multicast|bytes packets errs drop fifo ...
+s1-eth1:    {rx} 10 0 1 0 0 0 0 {tx} 20 0 {tx_drop} 0 0 0 0
+s1-eth2: 5 1 0 0 0 0 0 0 7 1 0 0 0 0 0 0
+    lo: 100 1 0 0 0 0 0 0 100 1 0 0 0 0 0 0
+"""
+
+QDISCS = """qdisc htb 5: dev s1-eth1 root refcnt 2 r2q 10 default 0x1 direct_packets_stat 0
+ Sent 4000 bytes 40 pkt (dropped {drops}, overlimits 0 requeues 0)
+ backlog {backlog} requeues 0
+qdisc netem 10: dev s1-eth1 parent 5:1 limit 1000 delay 1ms
+ Sent 4000 bytes 40 pkt (dropped 99, overlimits 0 requeues 0)
+ backlog 0b 0p requeues 0
+qdisc noqueue 0: dev lo root refcnt 2
+ Sent 0 bytes 0 pkt (dropped 0, overlimits 0 requeues 0)
+ backlog 0b 0p requeues 0
+"""
+
+
+class TestParse(unittest.TestCase):
+    """Test the parse_net_dev and parse_qdiscs functions"""
+    def test_net_dev(self):
+        counters = parse_net_dev(NET_DEV.format(rx=1000, tx=2000, tx_drop=3))
+        self.assertEqual([1000, 2000, 10, 20, 1, 3], counters['s1-eth1'])
+        self.assertEqual(['s1-eth2'], list(parse_net_dev(NET_DEV, set(['s1-eth2']))))
+
+    def test_qdiscs(self):
+        stats = parse_qdiscs(QDISCS.format(drops=2, backlog='3Kb 2p'))
+        # Only the root qdisc of each interface is kept
+        self.assertEqual([2, 3072, 2], stats['s1-eth1'])
+        self.assertEqual([0, 0, 0], stats['lo'])
+
+
+class TestRingBuffer(unittest.TestCase):
+    """Test the RingBuffer class"""
+    def test_simple(self):
+        buffer = RingBuffer(3, (2,))
+        for i in range(2):
+            buffer.append(i, [i, -i])
+        times, values = buffer.samples()
+        self.assertEqual([0, 1], list(times))
+        for i in range(2, 5):
+            buffer.append(i, [i, -i])
+        times, values = buffer.samples()
+        self.assertEqual([2, 3, 4], list(times))
+        self.assertEqual([[2, -2], [3, -3], [4, -4]], values.tolist())
+
+
+class TestTelemetrySampler(unittest.TestCase):
+    """Test the TelemetrySampler class"""
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.net_dev = os.path.join(self.directory, 'dev')
+        self.qdiscs = os.path.join(self.directory, 'qdiscs')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, rx, tx, tx_drop, drops, backlog):
+        with open(self.net_dev, 'w') as f:
+            f.write(NET_DEV.format(rx=rx, tx=tx, tx_drop=tx_drop))
+        with open(self.qdiscs, 'w') as f:
+            f.write(QDISCS.format(drops=drops, backlog=backlog))
+
+    def test_measurements(self):
+        sampler = TelemetrySampler([('s1-eth1', 's1', 'h0'), ('s1-eth2', 's1', 's2'),
+                                    ('s2-eth3', 's2', 's1'), ('gone', 's2', 'h1')],
+                                   interval=60, capacity=4, net_dev=self.net_dev,
+                                   qdisc_command=['cat', self.qdiscs])
+        self.write(0, 0, 0, 0, '0b 0p')
+        sampler.start()
+        self.write(125000, 250000, 1, 4, '1514b 1p')
+        sampler.sample()
+        self.write(250000, 250000, 1, 5, '0b 0p')
+        sampler.stop()
+        self.assertEqual(3, sampler.buffer.count)
+        self.assertLess(sampler.overhead(), 1)
+        times, values = sampler.buffer.samples()
+        self.assertEqual((3, 4, len(STATS)), values.shape)
+        self.assertTrue(np.all(np.isnan(values[:, 3])))
+
+        measurements = dict(((m['src'], m['dst']), m) for m in sampler.measurements())
+        # s1-eth2 and s2-eth3 are the ends of one link, so neither receiving direction is added
+        self.assertEqual(set([('s1', 'h0'), ('h0', 's1'), ('s1', 's2'), ('s2', 's1'),
+                              ('s2', 'h1'), ('h1', 's2')]), set(measurements))
+        sent = measurements['s1', 'h0']
+        self.assertEqual(3, sent['samples'])
+        self.assertAlmostEqual(2.0 / (times[-1] - times[0]), sent['throughput_mbps'])
+        self.assertAlmostEqual(2.0 / (times[1] - times[0]), sent['peak_mbps'])
+        # A dropped packet of the interface and 5 of its qdisc
+        self.assertEqual(6, sent['drops'])
+        self.assertEqual(1, sent['backlog_max'])
+        received = measurements['h0', 's1']
+        self.assertAlmostEqual(2.0 / (times[-1] - times[0]), received['throughput_mbps'])
+        self.assertTrue(np.isnan(received['backlog_max']))
+        self.assertTrue(np.isnan(measurements['s2', 'h1']['throughput_mbps']))
+
+        path = os.path.join(self.directory, 'telemetry.npz')
+        sampler.save(path)
+        saved = np.load(path)
+        self.assertEqual(['s1-eth1', 's1-eth2', 's2-eth3', 'gone'], list(saved['interfaces']))
+        self.assertEqual(list(COUNTERS), list(saved['stats'][:len(COUNTERS)]))
+        np.testing.assert_array_equal(values, saved['values'])
+
+    def test_thread(self):
+        self.write(0, 0, 0, 0, '0b 0p')
+        sampler = TelemetrySampler([('s1-eth1', 's1', 'h0')], interval=0.01, capacity=2,
+                                   net_dev=self.net_dev, qdisc_command=None)
+        sampler.start()
+        while sampler.buffer.count < 4:
+            time.sleep(0.01)
+        sampler.stop()
+        self.assertEqual(2, len(sampler.buffer.samples()[0]))
+        self.assertTrue(np.isnan(sampler.buffer.samples()[1][0, 0, len(COUNTERS)]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import socket
+import struct
+import tempfile
+import unittest
+
+from rpc_agent import read_schedule
+from traces import flow_name, is_pcap, plan_replay, read_pcap, read_request_log, read_trace
+
+
+def udp_packet(source, destination, source_port, destination_port, payload=b''):
+    """Return an Ethernet frame of an IPv4 UDP packet."""
+    udp = struct.pack('!HHHH', source_port, destination_port, 8 + len(payload), 0) + payload
+    ip = struct.pack('!BBHHHBBH4s4s', 0x45, 0, 20 + len(udp), 0, 0, 64, 17, 0,
+                     socket.inet_aton(source), socket.inet_aton(destination))
+    return b'\x00' * 12 + b'\x08\x00' + ip + udp
+
+
+def write_pcap(path, packets):
+    """Write (time, frame) packets to a little endian pcap file of Ethernet frames."""
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1))
+        for time, frame in packets:
+            seconds = int(time)
+            f.write(struct.pack('<IIII', seconds, int(round((time - seconds) * 1e6)), len(frame),
+                                len(frame)))
+            f.write(frame)
+
+
+class TestTraces(unittest.TestCase):
+    """Test reading traces and splitting them between leaves"""
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_pcap(self):
+        path = os.path.join(self.directory, 'trace.pcap')
+        write_pcap(path, [(10.0, udp_packet('10.0.0.1', '10.0.0.2', 5000, 53, b'x' * 10)),
+                          (10.5, udp_packet('10.0.0.2', '10.0.0.1', 53, 5000)),
+                          (11.25, udp_packet('10.0.0.3', '10.0.0.2', 5000, 53)),
+                          # Not an IP packet
+                          (12.0, b'\x00' * 12 + b'\x08\x06' + b'\x00' * 28)])
+        self.assertTrue(is_pcap(path))
+        requests = list(read_pcap(path))
+        self.assertEqual([10.0, 10.5, 11.25], [time for time, _, _, _ in requests])
+        self.assertEqual([52, 42, 42], [size for _, _, size, _ in requests])
+        # Both directions of a conversation are one flow
+        self.assertEqual(requests[0][1], requests[1][1])
+        self.assertNotEqual(requests[0][1], requests[2][1])
+        self.assertEqual('10.0.0.1:5000-10.0.0.2:53/udp', flow_name(requests[0][1]))
+
+    def test_request_log(self):
+        path = os.path.join(self.directory, 'requests.csv')
+        with open(path, 'w') as f:
+            f.write('time,flow,request_size,response_size\n# A comment\n0.5,a,100\n\n'
+                    '1.0,b,200,3000\n')
+        self.assertFalse(is_pcap(path))
+        self.assertEqual([(0.5, 'a', 100, None), (1.0, 'b', 200, 3000)], list(read_trace(path)))
+        with open(path, 'a') as f:
+            f.write('2.0,a\n')
+        self.assertRaises(ValueError, list, read_request_log(path))
+
+    def test_plan_replay(self):
+        requests = [(5.0, 'a', 10, None), (5.5, 'b', 20, 30), (6.0, 'c', 40, None),
+                    (7.0, 'a', 50, None)]
+        plan = plan_replay(requests, [('h0', 'f0'), ('h1', 'f0')], self.directory, speed=2.0,
+                           response_size=64)
+        self.assertEqual([('a', 'h0', 'f0'), ('b', 'h1', 'f0'), ('c', 'h0', 'f0')], plan['flows'])
+        self.assertEqual(4, plan['requests'])
+        self.assertEqual(1.0, plan['duration'])
+        self.assertEqual([(0.0, 0, 10, 64), (0.5, 2, 40, 64), (1.0, 0, 50, 64)],
+                         list(read_schedule(plan['schedules']['h0'])))
+        self.assertEqual([(0.25, 1, 20, 30)], list(read_schedule(plan['schedules']['h1'])))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from click.testing import CliRunner
+
+import tracing
+from fpga_switch_model import main
+
+
+class TestTracing(unittest.TestCase):
+    """Test the tracing module"""
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.trace = os.path.join(self.directory, 'trace.json')
+
+    def tearDown(self):
+        tracing.stop()
+        shutil.rmtree(self.directory)
+
+    def load(self):
+        with open(self.trace) as f:
+            return json.load(f)['traceEvents']
+
+    def test_disabled(self):
+        self.assertFalse(tracing.enabled())
+        self.assertIs(tracing.NULL_SPAN, tracing.span('main', spread=2))
+        self.assertIs(tracing.NULL_SPAN, tracing.detail('addHost', 'h0'))
+
+    def test_simple(self):
+        tracing.start(self.trace)
+        with tracing.span('outer', spread=2):
+            with tracing.span('inner'):
+                pass
+            self.assertIs(tracing.NULL_SPAN, tracing.detail('addHost', 'h0'))
+        try:
+            with tracing.span('failed'):
+                raise ValueError()
+        except ValueError:
+            pass
+        tracing.stop()
+        self.assertFalse(tracing.enabled())
+
+        inner, outer, failed = self.load()
+        self.assertEqual(['inner', 'outer', 'failed'],
+                         [event['name'] for event in (inner, outer, failed)])
+        self.assertEqual('X', outer['ph'])
+        self.assertEqual(dict(spread=2), outer['args'])
+        self.assertLessEqual(outer['ts'], inner['ts'])
+        self.assertGreaterEqual(outer['ts'] + outer['dur'], inner['ts'] + inner['dur'])
+        self.assertEqual('ValueError', failed['args']['error'])
+
+    def test_detail(self):
+        tracing.start(self.trace, detail=True)
+        with tracing.detail('addHost', 'h0'):
+            pass
+        tracing.stop()
+        event, = self.load()
+        self.assertEqual('detail', event['cat'])
+        self.assertEqual(dict(node='h0'), event['args'])
+
+    def test_main(self):
+        result = CliRunner().invoke(main, ['--backend', 'simulation', '--trace', self.trace,
+                                           '--log', 'warning', '--no-cache'])
+        self.assertEqual(0, result.exit_code, result.output)
+        names = [event['name'] for event in self.load()]
+        for name in ('main', 'setup_network', 'run_tests', 'cloud_fpga', 'ping', 'stop'):
+            self.assertIn(name, names)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+import unittest
+
+import numpy as np
+
+from parameters import placement_options
+from tree_index import TreeIndex
+
+
+class TestTreeIndex(unittest.TestCase):
+    """Test the TreeIndex class"""
+    def test_sizes(self):
+        index = TreeIndex(spread=3, depth=4, fpga=2)
+        self.assertEqual(13, index.n_switches)
+        self.assertEqual(27, index.n_leaves)
+        self.assertEqual(9, index.n_fpga)
+        self.assertEqual(13 + 27 + 9 + 1, index.n_nodes)
+        self.assertEqual(0, TreeIndex(spread=5, depth=2, fpga=3).n_fpga)
+
+    def test_addressing(self):
+        index = TreeIndex(spread=2, depth=4, fpga=1)
+        self.assertEqual(range(3, 5), index.children(1))
+        self.assertEqual(range(0), index.children(index.leaf(0)))
+        self.assertEqual(1, index.parent(3))
+        self.assertEqual(None, index.parent(0))
+        self.assertEqual(2, index.parent(index.fpga_host(1)))
+        self.assertEqual(0, index.parent(index.cloud))
+        self.assertEqual([3, 2, 2, 1], [index.level(node) for node in
+                                        (index.leaf(0), 3, index.fpga_host(0), index.cloud)])
+        self.assertEqual([index.leaf(5), 5, 2, 0], index.path_to_root(index.leaf(5)))
+        self.assertEqual(2, index.ancestor(index.leaf(5), 1))
+        self.assertEqual(len(list(index.links())), index.n_nodes - 1)
+
+    def test_route(self):
+        index = TreeIndex(spread=2, depth=4, fpga=1)
+        # h0 (node 7) to h7 (node 14) goes up to the root and back down
+        self.assertEqual([7, 3, 1, 0, 2, 6, 14], index.route(7, 14))
+        # h0 to h1 only goes through their shared switch
+        self.assertEqual([7, 3, 8], index.route(7, 8))
+        self.assertEqual([7, 3, 1, 0, 2, index.fpga_host(1)], index.route(7, index.fpga_host(1)))
+        self.assertEqual([index.cloud, 0, 1, 3, 7], index.route(index.cloud, 7))
+
+    def test_vectorised(self):
+        index = TreeIndex(spread=3, depth=5, fpga=2)
+        nodes = np.arange(1, index.n_tree)
+        np.testing.assert_array_equal([index.level(node) for node in nodes], index.levels(nodes))
+        np.testing.assert_array_equal([index.parent(node) for node in nodes], index.parents(nodes))
+        positions = np.arange(index.n_leaves)
+        np.testing.assert_array_equal(
+            [index.position(index.ancestor(index.leaf(p), 2)) for p in positions],
+            index.ancestor_positions(positions, 4, 2))
+
+    def test_common_ancestors(self):
+        index = TreeIndex(spread=2, depth=4, placements=[placement_options(0),
+                                                         placement_options(2, [1, 2])])
+        hosts = list(index.hosts())
+        pairs = [(a, b) for a in hosts for b in hosts if a != b]
+        # The lowest common ancestor is the highest node of the route between two hosts
+        expected = [min(index.route(a, b)[1:-1], key=index.level) for a, b in pairs]
+        np.testing.assert_array_equal(expected, index.common_ancestors(*zip(*pairs)))
+        np.testing.assert_array_equal([index.parent(node) for node in hosts],
+                                      index.host_parents(hosts))
+
+    def test_names(self):
+        # With s[level][position] naming, s1/11 and s11/1 would both be s111
+        index = TreeIndex(spread=12, depth=3, fpga=1)
+        names = [index.name(node) for node in range(index.n_nodes)]
+        self.assertEqual(len(names), len(set(names)))
+        for node in range(index.n_nodes):
+            self.assertEqual(node, index.node_by_name(index.name(node)))
+        self.assertRaises(KeyError, index.node_by_name, 'h144')
+        self.assertRaises(KeyError, index.node_by_name, 's01')
+
+    def test_hosts(self):
+        index = TreeIndex(spread=2, depth=3, fpga=1)
+        self.assertEqual(['cloud', 'f0', 'f1', 'h0', 'h1', 'h2', 'h3'],
+                         [index.name(node) for node in index.hosts()])
+        for number, node in enumerate(index.hosts()):
+            self.assertEqual(number, index.host_number(node))
+            self.assertEqual(node, index.host_by_number(number))
+        self.assertRaises(KeyError, index.host_by_number, 7)
+
+    def test_placements(self):
+        index = TreeIndex(2, 4, placements=[placement_options(2, [3, 0]), placement_options(0)])
+        self.assertEqual(None, index.fpga)
+        self.assertEqual(3, index.n_fpga)
+        # FPGA hosts are numbered, and named, in the order of their switches
+        self.assertEqual(['cloud', 'f0_0', 'f2_0', 'f2_3', 'h0'],
+                         [index.name(node) for node in index.hosts()][:5])
+        self.assertEqual([index.node(2, 0), index.node(2, 3)],
+                         [index.parent(host) for host in index.placement_hosts(0)])
+        self.assertEqual([1, 3], [index.level(host) for host in index.placement_hosts(1)
+                                  + index.placement_hosts(0)[:1]])
+        self.assertEqual(None, index.fpga_host_of(index.node(2, 1)))
+        for node in range(index.n_nodes):
+            self.assertEqual(node, index.node_by_name(index.name(node)))
+        self.assertRaises(KeyError, index.node_by_name, 'f2_1')
+        self.assertRaises(KeyError, index.node_by_name, 'f0')
+        self.assertEqual(['h0', 'h1', 'h6', 'h7'],
+                         [index.name(leaf) for leaf, _ in index.placement_targets(0)])
+        self.assertEqual(index.n_leaves, len(index.placement_targets(1)))
+
+    def test_subtrees(self):
+        # Placements on a single level keep the names of the FPGA level
+        index = TreeIndex(3, 3, placements=[placement_options(1, [2]), placement_options(1, [0])])
+        self.assertEqual(['f0', 'f2'], [index.name(host) for host in index.fpga_hosts()])
+        self.assertEqual([('h6', 'f2'), ('h7', 'f2'), ('h8', 'f2')],
+                         [(index.name(leaf), index.name(host))
+                          for leaf, host in index.placement_targets(0)])
+        self.assertEqual(index.fpga_host(0), index.node_by_name('f0'))
+        self.assertRaises(KeyError, index.node_by_name, 'f1')
+
+    def test_invalid_placements(self):
+        self.assertRaises(ValueError, TreeIndex, 2, 3, placements=[placement_options(2)])
+        self.assertRaises(ValueError, TreeIndex, 2, 3, placements=[placement_options(1, [2])])
+        self.assertRaises(ValueError, TreeIndex, 2, 3,
+                          placements=[placement_options(1), placement_options(1, [1])])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+
+import math
+import os
+import random
+import shutil
+import tempfile
+import threading
+import unittest
+
+from parameters import compute_options, placement_options
+from rpc_agent import SCHEDULE, Client, ComputeServer, Server, service_times
+from tree_index import TreeIndex
+from workload import server_args, summarize, workload_targets
+
+
+class TestWorkloadTargets(unittest.TestCase):
+    """Test the workload_targets function"""
+    def test_fpga(self):
+        targets = workload_targets(TreeIndex(2, 4, 1))
+        self.assertEqual(8, len(targets))
+        self.assertEqual(('h0', 'f0'), targets[0])
+        self.assertEqual(('h3', 'f0'), targets[3])
+        self.assertEqual(('h4', 'f1'), targets[4])
+        self.assertEqual(('h7', 'f1'), targets[7])
+
+    def test_last_switch_level(self):
+        targets = workload_targets(TreeIndex(3, 3, 1))
+        self.assertEqual([('h{}'.format(i), 'f{}'.format(i // 3)) for i in range(9)], targets)
+
+    def test_leaf_level(self):
+        # The leaves themselves are not FPGA hosts, so the workload goes to the cloud
+        targets = workload_targets(TreeIndex(3, 3, 2))
+        self.assertEqual(set(['cloud']), set(target for _, target in targets))
+
+    def test_placement(self):
+        index = TreeIndex(2, 3, placements=[placement_options(0), placement_options(1, [1])])
+        self.assertEqual([('h2', 'f1_1'), ('h3', 'f1_1')], workload_targets(index, 1))
+        self.assertEqual(set(['f0_0']), set(target for _, target in workload_targets(index, 0)))
+
+    def test_cloud(self):
+        targets = workload_targets(TreeIndex(2, 3))
+        self.assertEqual([('h{}'.format(i), 'cloud') for i in range(4)], targets)
+
+
+class TestServerArgs(unittest.TestCase):
+    """Test the server_args function"""
+    def test_simple(self):
+        self.assertEqual(['server', '--port', '5555'], server_args(None, 'f0')[2:])
+
+    def test_compute(self):
+        compute = compute_options('constant', 8, '2ms', 3, None, '1ms', 16, None)
+        args = server_args(compute, 'cloud', 6000)[2:]
+        self.assertEqual(['server', '--port', '6000', '--pipelines', '16', '--service-time',
+                          '0.001', '--distribution', 'constant', '--queue-size', '8'], args)
+        self.assertIn('0.002', server_args(compute, 'f1'))
+
+
+class TestSummarize(unittest.TestCase):
+    """Test the summarize function"""
+    def test_simple(self):
+        summaries = [dict(sent=3, rejected=0, errors=0, latencies=[0.001, 0.002, 0.003]),
+                     dict(sent=3, rejected=1, errors=1, latencies=[0.004])]
+        measurement = summarize(summaries, 2.0)
+        self.assertEqual(6, measurement['requests'])
+        self.assertEqual(4, measurement['completed'])
+        self.assertEqual(1, measurement['rejected'])
+        self.assertEqual(1, measurement['errors'])
+        self.assertEqual(2.0, measurement['rps'])
+        self.assertAlmostEqual(2.5, measurement['latency_mean_ms'])
+        self.assertAlmostEqual(2.5, measurement['latency_p50_ms'])
+        self.assertAlmostEqual(4.0, measurement['latency_p999_ms'], places=2)
+
+    def test_none_completed(self):
+        measurement = summarize([dict(sent=1, rejected=0, errors=1, latencies=[])], 1.0)
+        self.assertEqual(0, measurement['completed'])
+        self.assertTrue(math.isnan(measurement['latency_p99_ms']))
+
+
+class TestServiceTimes(unittest.TestCase):
+    """Test the service_times function"""
+    def test_mean(self):
+        for distribution in ('constant', 'exponential', 'uniform'):
+            sample = service_times(distribution, 0.002, random.Random(1))
+            times = [sample() for _ in range(10000)]
+            self.assertAlmostEqual(0.002, sum(times) / len(times), delta=1e-4)
+            self.assertTrue(all(time >= 0 for time in times))
+
+    def test_unknown(self):
+        self.assertRaises(ValueError, service_times, 'normal', 0.001, random.Random())
+
+
+class TestRpcAgent(unittest.TestCase):
+    """Test the rpc_agent server and client over the loopback interface"""
+    def make_server(self):
+        return Server(0, '127.0.0.1')
+
+    def setUp(self):
+        self.server = self.make_server()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.serve)
+        self.thread.start()
+
+    def tearDown(self):
+        self.stopped.set()
+        self.thread.join()
+        if isinstance(self.server, ComputeServer):
+            self.server.close()
+
+    def serve(self):
+        while not self.stopped.is_set():
+            self.server.step(0.05)
+
+    def test_closed(self):
+        client = Client('127.0.0.1', self.server.port, connections=2, response_size=1000)
+        summary = client.run('closed', duration=0.2)
+        self.assertEqual(0, summary['errors'])
+        self.assertGreater(summary['completed'], 10)
+        # Each connection has one request outstanding when the run ends, which is then answered
+        self.assertEqual(summary['sent'], summary['completed'])
+
+    def test_open(self):
+        client = Client('127.0.0.1', self.server.port)
+        summary = client.run('open', rate=500, duration=0.2, seed=1)
+        self.assertEqual(0, summary['errors'])
+        self.assertEqual(summary['sent'], summary['completed'])
+        self.assertAlmostEqual(100, summary['sent'], delta=40)
+        self.assertTrue(all(latency >= 0 for latency in summary['latencies']))
+
+    def test_replay(self):
+        directory = tempfile.mkdtemp()
+        try:
+            schedule = os.path.join(directory, 'h0.schedule')
+            with open(schedule, 'wb') as f:
+                for offset, flow in ((0.0, 0), (0.05, 1), (0.1, 0)):
+                    f.write(SCHEDULE.pack(offset, flow, 100, 1000))
+            client = Client('127.0.0.1', self.server.port, connections=2)
+            summary = client.run('replay', schedule=schedule)
+        finally:
+            shutil.rmtree(directory)
+        self.assertEqual(3, summary['completed'])
+        self.assertEqual([0, 1], [flow['flow'] for flow in summary['flows']])
+        self.assertEqual([2, 1], [flow['completed'] for flow in summary['flows']])
+        # The requests and responses of a flow
+        self.assertEqual(2 * 1100, summary['flows'][0]['bytes'])
+
+
+class TestComputeServer(TestRpcAgent):
+    """Test the rpc_agent compute server over the loopback interface"""
+    def make_server(self):
+        return ComputeServer(0, '127.0.0.1', service_time=0.005, distribution='constant',
+                             pipelines=2, queue_size=1)
+
+    def test_closed(self):
+        # Two connections keep both pipelines busy without queueing
+        client = Client('127.0.0.1', self.server.port, connections=2)
+        summary = client.run('closed', duration=0.2)
+        self.assertEqual(0, summary['rejected'])
+        self.assertEqual(summary['sent'], summary['completed'])
+        self.assertGreater(summary['completed'], 0)
+        # Every request needs 5 ms of CPU time, which takes at least 5 ms
+        self.assertTrue(all(latency >= 0.005 for latency in summary['latencies']))
+
+    def test_open(self):
+        # Requests arrive at four times the rate the pipelines can serve them
+        client = Client('127.0.0.1', self.server.port)
+        summary = client.run('open', rate=1600, duration=0.2, drain=1.0, seed=1)
+        self.assertEqual(0, summary['errors'])
+        self.assertEqual(summary['sent'], summary['completed'] + summary['rejected'])
+        self.assertGreater(summary['rejected'], 0)
+        self.assertEqual(summary['rejected'], self.server.rejected)
+        # No more can be served than the pipelines have CPU time for, plus those waiting
+        self.assertLessEqual(summary['completed'], 2 * (0.2 + 1.0) / 0.005 + 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
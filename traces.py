@@ -0,0 +1,221 @@
+"""
+Packet traces and request logs, read as streams of requests to replay from the leaves of a network.
+
+A trace is either a pcap file or a request log. Pcap files may be Ethernet, raw IP or Linux cooked
+captures, with microsecond or nanosecond timestamps, in either byte order. A request log is a text
+file with a line of TIME,FLOW,REQUEST_SIZE[,RESPONSE_SIZE] for each request, TIME in seconds and
+FLOW any name, with # comments and an optional header line. Every IP packet of a pcap file is a
+request of its size on the wire, whose flow is the conversation it belongs to: its addresses,
+ports and protocol, in either direction.
+
+Both are read through a memory map one request at a time, so traces larger than the memory of the
+machine can be replayed. plan_replay splits a trace between the leaves of a network: each flow is
+given a (leaf, target) pair in the order the flows first appear, and the requests of the flows of
+each leaf are written to a schedule file (see rpc_agent.SCHEDULE), which the rpc_agent client of
+the leaf replays. Requests keep their offsets from the first request of the trace, divided by a
+speed up.
+"""
+
+import contextlib
+import mmap
+import os
+import socket
+import struct
+
+from rpc_agent import SCHEDULE
+
+# Byte order and seconds per unit of the timestamps of pcap files, by magic number
+PCAP_MAGICS = {
+    b'\xd4\xc3\xb2\xa1': ('<', 1e-6),
+    b'\xa1\xb2\xc3\xd4': ('>', 1e-6),
+    b'\x4d\x3c\xb2\xa1': ('<', 1e-9),
+    b'\xa1\xb2\x3c\x4d': ('>', 1e-9),
+}
+PCAP_HEADER_SIZE = 24
+# Offset of the EtherType (None if the link type has none) and of the IP header of each link type
+LINK_TYPES = {
+    1: (12, 14),  # Ethernet
+    101: (None, 0),  # Raw IP
+    113: (14, 16),  # Linux cooked capture
+    228: (None, 0),  # Raw IPv4
+    229: (None, 0),  # Raw IPv6
+}
+ETHERTYPE_VLAN = 0x8100
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_IPV6 = 0x86dd
+# Protocols whose packets start with a source and a destination port
+PORT_PROTOCOLS = {6: 'tcp', 17: 'udp', 132: 'sctp'}
+# Bytes of schedules kept for each leaf before they are appended to its file
+FLUSH_BYTES = 1 << 20
+
+
+@contextlib.contextmanager
+def _mapped(path):
+    """Memory map a file for reading, as an empty bytes object if it is empty."""
+    with open(path, 'rb') as f:
+        if not os.fstat(f.fileno()).st_size:
+            yield b''
+            return
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            yield mapped
+        finally:
+            mapped.close()
+
+
+def is_pcap(path):
+    """Return whether a file starts with the magic number of a pcap file."""
+    with open(path, 'rb') as f:
+        return f.read(4) in PCAP_MAGICS
+
+
+def _conversation(packet, start, ethertype_at):
+    """Return the key of the conversation of the IP packet at start of a captured packet, or None
+    if it is not an IP packet."""
+    if ethertype_at is None:
+        version = packet[start] >> 4 if start < len(packet) else None
+        ethertype = {4: ETHERTYPE_IPV4, 6: ETHERTYPE_IPV6}.get(version)
+    elif len(packet) >= ethertype_at + 2:
+        ethertype, = struct.unpack_from('!H', packet, ethertype_at)
+        if ethertype == ETHERTYPE_VLAN and len(packet) >= ethertype_at + 6:
+            ethertype, = struct.unpack_from('!H', packet, ethertype_at + 4)
+            start += 4
+    else:
+        return None
+    if ethertype == ETHERTYPE_IPV4 and len(packet) >= start + 20:
+        header = (packet[start] & 0x0f) * 4
+        protocol = packet[start + 9]
+        source, destination = packet[start + 12:start + 16], packet[start + 16:start + 20]
+        # Only the first fragment of a packet has its ports
+        fragment = struct.unpack_from('!H', packet, start + 6)[0] & 0x1fff
+        ports_at = start + header if not fragment else None
+    elif ethertype == ETHERTYPE_IPV6 and len(packet) >= start + 40:
+        protocol = packet[start + 6]
+        source, destination = packet[start + 8:start + 24], packet[start + 24:start + 40]
+        ports_at = start + 40
+    else:
+        return None
+    ends = [source, destination]
+    if protocol in PORT_PROTOCOLS and ports_at is not None and len(packet) >= ports_at + 4:
+        ends = [source + packet[ports_at:ports_at + 2],
+                destination + packet[ports_at + 2:ports_at + 4]]
+    return (protocol,) + tuple(sorted(bytes(end) for end in ends))
+
+
+def flow_name(key):
+    """Return the name of a flow key of read_trace: the flow of a request log, or
+    ADDRESS[:PORT]-ADDRESS[:PORT]/PROTOCOL for a conversation of a pcap file."""
+    if not isinstance(key, tuple):
+        return key
+    protocol, ends = key[0], key[1:]
+    names = []
+    for end in ends:
+        address, port = (end[:-2], end[-2:]) if len(end) in (6, 18) else (end, None)
+        name = socket.inet_ntop(socket.AF_INET if len(address) == 4 else socket.AF_INET6, address)
+        if port is not None:
+            name = ('[{}]:{}' if len(address) == 16 else '{}:{}').format(
+                name, struct.unpack('!H', port)[0])
+        names.append(name)
+    return '{}/{}'.format('-'.join(names), PORT_PROTOCOLS.get(protocol, protocol))
+
+
+def read_pcap(path):
+    """Yield the (time, flow key, size, None) of every IP packet of a pcap file."""
+    with _mapped(path) as data:
+        if len(data) < PCAP_HEADER_SIZE or data[:4] not in PCAP_MAGICS:
+            raise ValueError("'{}' is not a pcap file (pcapng files are not supported).".format(
+                path))
+        order, unit = PCAP_MAGICS[data[:4]]
+        link_type = struct.unpack_from(order + 'I', data, 20)[0] & 0x0fffffff
+        if link_type not in LINK_TYPES:
+            raise ValueError("'{}' has link type {}, which is not supported.".format(
+                path, link_type))
+        ethertype_at, ip_at = LINK_TYPES[link_type]
+        record = struct.Struct(order + 'IIII')
+        start = PCAP_HEADER_SIZE
+        while start + record.size <= len(data):
+            seconds, fraction, captured, size = record.unpack_from(data, start)
+            start += record.size
+            packet = data[start:start + captured]
+            start += captured
+            key = _conversation(bytearray(packet), ip_at, ethertype_at)
+            if key is not None:
+                yield seconds + fraction * unit, key, size, None
+
+
+def read_request_log(path):
+    """Yield the (time, flow, request size, response size or None) of every request of a request
+    log."""
+    with _mapped(path) as data:
+        for number, line in enumerate(iter(data.readline, b'') if data else [], 1):
+            line = line.decode().strip()
+            if not line or line.startswith('#'):
+                continue
+            fields = [field.strip() for field in line.split(',')]
+            try:
+                if len(fields) not in (3, 4):
+                    raise ValueError('expected 3 or 4 fields')
+                time = float(fields[0])
+                sizes = [int(field) for field in fields[2:]]
+            except ValueError as ex:
+                if number == 1:
+                    # A header line
+                    continue
+                raise ValueError("Line {} of '{}' is not TIME,FLOW,REQUEST_SIZE[,RESPONSE_SIZE]: "
+                                 "{}".format(number, path, ex))
+            yield time, fields[1], sizes[0], sizes[1] if len(sizes) > 1 else None
+
+
+def read_trace(path):
+    """Yield the (time, flow key, request size, response size or None) of every request of a pcap
+    file or a request log."""
+    return read_pcap(path) if is_pcap(path) else read_request_log(path)
+
+
+def plan_replay(requests, targets, directory, speed=1.0, response_size=64):
+    """Split the requests of read_trace between (leaf, target) pairs of workload_targets,
+    writing the schedule of each leaf to a file in directory.
+
+    Each flow goes to the pair of its number, in the order the flows first appear, modulo the
+    number of pairs. Requests are due at their offsets from the first request divided by speed,
+    but never before the previous request of their leaf, and their responses are response_size
+    bytes unless the trace gives their size.
+
+    Returns a dict of the schedule file of each leaf, the (name, leaf, target) of each flow, the
+    number of requests and the offset of the last request."""
+    flows = {}
+    flow_pairs = []
+    buffers = {}
+    schedules = {}
+    last = {}
+    first = None
+    count = 0
+
+    def flush(leaf):
+        with open(schedules[leaf], 'ab') as f:
+            f.write(buffers[leaf])
+        buffers[leaf] = bytearray()
+
+    for time, key, request_size, flow_response_size in requests:
+        if first is None:
+            first = time
+        flow = flows.get(key)
+        if flow is None:
+            flow = flows[key] = len(flow_pairs)
+            flow_pairs.append((flow_name(key),) + tuple(targets[flow % len(targets)]))
+        leaf = flow_pairs[flow][1]
+        if leaf not in schedules:
+            schedules[leaf] = os.path.join(directory, '{}.schedule'.format(leaf))
+            buffers[leaf] = bytearray()
+            last[leaf] = 0.0
+        last[leaf] = max(last[leaf], (time - first) / speed)
+        buffers[leaf].extend(SCHEDULE.pack(
+            last[leaf], flow, request_size,
+            response_size if flow_response_size is None else flow_response_size))
+        if len(buffers[leaf]) >= FLUSH_BYTES:
+            flush(leaf)
+        count += 1
+    for leaf in schedules:
+        flush(leaf)
+    return dict(schedules=schedules, flows=flow_pairs, requests=count,
+                duration=max(last.values()) if last else 0.0)
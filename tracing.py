@@ -0,0 +1,106 @@
+"""
+Named spans of time, written as Chrome trace events.
+
+Code wraps each phase in `with span('name'):`. Tracing is disabled by default, and span then
+returns a shared context manager which does nothing, so a disabled span costs a function call.
+start(path) enables tracing, and stop() writes every span recorded since as Chrome trace-event JSON
+to path, which chrome://tracing and Perfetto open.
+
+detail spans are for steps repeated for every node or link. They are only recorded if tracing was
+started with detail=True, since there can be thousands of them.
+"""
+
+import json
+import os
+import threading
+import timeit
+
+_tracer = None
+
+
+class _NullSpan(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class _Span(object):
+    __slots__ = ('tracer', 'name', 'category', 'args', 'begin')
+
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.begin = timeit.default_timer()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end = timeit.default_timer()
+        args = self.args
+        if exc_type is not None:
+            args = dict(args, error=exc_type.__name__)
+        self.tracer.events.append(dict(
+            name=self.name, cat=self.category, ph='X', pid=self.tracer.pid,
+            tid=threading.current_thread().ident, ts=(self.begin - self.tracer.origin) * 1e6,
+            dur=(end - self.begin) * 1e6, args=args))
+        return False
+
+
+class Tracer(object):
+    """Records spans, to be written to a Chrome trace file."""
+
+    def __init__(self, path, detail=False):
+        self.path = path
+        self.detail = detail
+        self.events = []
+        self.pid = os.getpid()
+        self.origin = timeit.default_timer()
+
+    def write(self):
+        with open(self.path, 'wt') as f:
+            json.dump(dict(traceEvents=self.events, displayTimeUnit='ms'), f)
+
+
+def start(path, detail=False):
+    """Start recording spans, to be written to path by stop. If detail is set, detail spans are
+    recorded too."""
+    global _tracer
+    _tracer = Tracer(path, detail)
+    return _tracer
+
+
+def stop():
+    """Stop recording spans, and write those recorded to the trace file."""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    if tracer is not None:
+        tracer.write()
+    return tracer
+
+
+def enabled():
+    return _tracer is not None
+
+
+def span(name, category='phase', **args):
+    """Return a context manager recording the time spent in it as a span with the given name and
+    arguments."""
+    if _tracer is None:
+        return NULL_SPAN
+    return _Span(_tracer, name, category, args)
+
+
+def detail(name, node=None):
+    """Return a context manager recording a detail span, for a step repeated for every node or link
+    (named node, if given)."""
+    if _tracer is None or not _tracer.detail:
+        return NULL_SPAN
+    return _Span(_tracer, name, 'detail', {} if node is None else dict(node=str(node)))
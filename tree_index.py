@@ -0,0 +1,318 @@
+"""
+Implicit index of the nodes of a TreeTopoGeneric tree.
+
+The switches and leaf hosts of the tree are numbered in level order, like a heap: the root switch
+is node 0, the children of node k are nodes spread * k + 1 to spread * k + spread, and level i
+starts at node (spread ** i - 1) / (spread - 1). They are followed by the FPGA hosts, in the order
+of the switches they are attached to, and finally by the cloud host. The parent, children, level
+and path to the root of any node are computed arithmetically, so nothing is stored per node.
+
+FPGA hosts are attached to every switch of the FPGA level, or to the switches of several
+placements: each one either every switch of a level, or the switches at the given positions of it
+(the roots of selected subtrees). Only the switches of placements which select positions are
+stored.
+
+Nodes are named unambiguously after their number: switches are s{node}, the hosts on the last
+level are h{position in level}, the FPGA hosts are f{position of their switch in its level} (or
+f{level}_{position} if they are on several levels) and the cloud host is cloud.
+"""
+
+import bisect
+
+
+def _number(text):
+    """Return the number a node name ends with, or None if it is not written canonically."""
+    if text.isdigit() and str(int(text)) == text:
+        return int(text)
+    return None
+
+
+class TreeIndex(object):
+    """Implicit, heap-style index of a tree with the given spread, depth and FPGA level.
+
+    placements, a list of dicts with a 'level' and the 'positions' of the switches on it (None
+    for every switch of the level), such as parameters.placement_options returns, replaces the
+    FPGA level. Placements must be above the leaves and must not share switches."""
+
+    def __init__(self, spread, depth, fpga=None, placements=None):
+        self.spread = spread
+        self.depth = depth
+
+        # First node of each level of the tree, the last entry being the number of tree nodes
+        self.level_offsets = [0]
+        for i in range(depth):
+            self.level_offsets.append(self.level_offsets[-1] + spread ** i)
+        self.n_tree = self.level_offsets[-1]
+        self.n_switches = self.level_offsets[depth - 1]
+        self.n_leaves = spread ** (depth - 1)
+
+        if placements is None:
+            # There are no FPGA hosts if the FPGA level is the last level of the tree or below it
+            fpga = fpga if fpga is not None and fpga < depth - 1 else None
+            placements = [] if fpga is None else [dict(level=fpga, positions=None)]
+        self.placements = list(placements)
+        self.placement_switches = [self._switches_of(placement) for placement in self.placements]
+        # The FPGA level, if the FPGA hosts are on every switch of a single level
+        self.fpga = (self.placements[0]['level'] if len(self.placements) == 1
+                     and self.placements[0]['positions'] is None else None)
+        self.fpga_levels = sorted(set(placement['level'] for placement in self.placements))
+
+        # Switch of each FPGA host, in order
+        if len(self.placements) == 1:
+            self.fpga_switches = self.placement_switches[0]
+        else:
+            self.fpga_switches = sorted(switch for switches in self.placement_switches
+                                        for switch in switches)
+            for first, second in zip(self.fpga_switches, self.fpga_switches[1:]):
+                if first == second:
+                    raise ValueError('Placements share switch {}.'.format(self.name(first)))
+        self.n_fpga = len(self.fpga_switches)
+        self.cloud = self.n_tree + self.n_fpga
+        self.n_nodes = self.cloud + 1
+
+    def _switches_of(self, placement):
+        """Return the switches of a placement, checking that they are in the tree."""
+        level, positions = placement['level'], placement['positions']
+        if not 0 <= level < self.depth - 1:
+            raise ValueError('FPGA level {} is not a level of switches of a tree of depth {}.'
+                             .format(level, self.depth))
+        if positions is None:
+            return range(self.level_offsets[level], self.level_offsets[level + 1])
+        for position in positions:
+            if not 0 <= position < self.spread ** level:
+                raise ValueError('Level {} of the tree has no switch at position {}.'.format(
+                    level, position))
+        return sorted(set(self.node(level, position) for position in positions))
+
+    # Node classes
+
+    def switches(self):
+        return range(0, self.n_switches)
+
+    def leaves(self):
+        return range(self.n_switches, self.n_tree)
+
+    def fpga_hosts(self):
+        return range(self.n_tree, self.cloud)
+
+    def is_switch(self, node):
+        return node < self.n_switches
+
+    def is_leaf(self, node):
+        return self.n_switches <= node < self.n_tree
+
+    def is_fpga(self, node):
+        return self.n_tree <= node < self.cloud
+
+    # Arithmetic addressing
+
+    def level(self, node):
+        """Return the number of links between the node and the root switch."""
+        if node < self.n_tree:
+            return bisect.bisect_right(self.level_offsets, node) - 1
+        if node < self.cloud:
+            return self.level(self.parent(node)) + 1
+        return 1
+
+    def position(self, node):
+        """Return the position of a tree node within its level."""
+        return node - self.level_offsets[self.level(node)]
+
+    def node(self, level, position):
+        """Return the tree node at the given position of the given level."""
+        return self.level_offsets[level] + position
+
+    def leaf(self, position):
+        return self.n_switches + position
+
+    def fpga_host(self, position):
+        return self.n_tree + position
+
+    def fpga_host_of(self, switch):
+        """Return the FPGA host attached to a switch, or None if it has none."""
+        i = bisect.bisect_left(self.fpga_switches, switch)
+        if i < self.n_fpga and self.fpga_switches[i] == switch:
+            return self.n_tree + i
+        return None
+
+    def placement_hosts(self, placement):
+        """Return the FPGA hosts of the placement with the given number, in order."""
+        return [self.fpga_host_of(switch) for switch in self.placement_switches[placement]]
+
+    def placement_targets(self, placement):
+        """Return (leaf, FPGA host) for every leaf below the FPGA hosts of the placement with the
+        given number."""
+        targets = []
+        for switch in self.placement_switches[placement]:
+            level = self.level(switch)
+            leaves = self.spread ** (self.depth - 1 - level)
+            host = self.fpga_host_of(switch)
+            first = self.position(switch) * leaves
+            targets.extend((self.leaf(position), host)
+                           for position in range(first, first + leaves))
+        return targets
+
+    def parent(self, node):
+        """Return the node above the given node, or None for the root switch."""
+        if node == 0:
+            return None
+        if node < self.n_tree:
+            return (node - 1) // self.spread
+        if node < self.cloud:
+            return self.fpga_switches[node - self.n_tree]
+        return 0
+
+    def children(self, node):
+        """Return the tree nodes directly below the given node."""
+        if node >= self.n_switches:
+            return range(0)
+        return range(self.spread * node + 1, self.spread * node + self.spread + 1)
+
+    def ancestor(self, node, level):
+        """Return the node at the given level above the given node."""
+        while self.level(node) > level:
+            node = self.parent(node)
+        return node
+
+    def path_to_root(self, node):
+        """Return the nodes from the given node up to and including the root switch."""
+        path = [node]
+        while node != 0:
+            node = self.parent(node)
+            path.append(node)
+        return path
+
+    def route(self, src, dst):
+        """Return the nodes visited by a packet travelling from src to dst."""
+        up = self.path_to_root(src)
+        down = self.path_to_root(dst)
+        # Strip the common ancestors, keeping the lowest one
+        while len(up) > 1 and len(down) > 1 and up[-2] == down[-2]:
+            up.pop()
+            down.pop()
+        down.pop()
+        down.reverse()
+        return up + down
+
+    def links(self):
+        """Yield (upper, lower) for the link above every node but the root switch.
+
+        A link is identified by its lower node."""
+        for node in range(1, self.n_nodes):
+            yield self.parent(node), node
+
+    # Vectorised addressing
+
+    def ancestor_positions(self, positions, from_level, to_level):
+        """Return the positions on to_level above an array of positions on from_level."""
+        import numpy as np
+
+        return np.asarray(positions) // self.spread ** (from_level - to_level)
+
+    def levels(self, nodes):
+        """Return the level of each tree node in an array of nodes."""
+        import numpy as np
+
+        return np.searchsorted(self.level_offsets, np.asarray(nodes), side='right') - 1
+
+    def parents(self, nodes):
+        """Return the parent of each tree node in an array of nodes (-1 for the root)."""
+        import numpy as np
+
+        return (np.asarray(nodes) - 1) // self.spread
+
+    def host_parents(self, nodes):
+        """Return the switch each host in an array of hosts hangs from."""
+        import numpy as np
+
+        nodes = np.asarray(nodes)
+        parents = np.zeros_like(nodes)
+        tree = nodes < self.n_tree
+        parents[tree] = self.parents(nodes[tree])
+        fpga = (nodes >= self.n_tree) & (nodes < self.cloud)
+        parents[fpga] = np.asarray(self.fpga_switches)[nodes[fpga] - self.n_tree]
+        return parents
+
+    def common_ancestors(self, a, b):
+        """Return the lowest common ancestor of each pair of distinct hosts in two arrays."""
+        a, b = self.host_parents(a), self.host_parents(b)
+        a_levels, b_levels = self.levels(a), self.levels(b)
+        climbing = a != b
+        while climbing.any():
+            rising = climbing & (a_levels >= b_levels)
+            falling = climbing & (b_levels >= a_levels)
+            a[rising] = self.parents(a[rising])
+            a_levels[rising] -= 1
+            b[falling] = self.parents(b[falling])
+            b_levels[falling] -= 1
+            climbing = a != b
+        return a
+
+    # Names
+
+    def name(self, node):
+        if node < self.n_switches:
+            return 's{}'.format(node)
+        if node < self.n_tree:
+            return 'h{}'.format(node - self.n_switches)
+        if node < self.cloud:
+            switch = self.parent(node)
+            if len(self.fpga_levels) > 1:
+                return 'f{}_{}'.format(self.level(switch), self.position(switch))
+            return 'f{}'.format(self.position(switch))
+        if node == self.cloud:
+            return 'cloud'
+        raise IndexError(node)
+
+    def node_by_name(self, name):
+        """Return the node with the given name, raising KeyError if there is none."""
+        if name == 'cloud':
+            return self.cloud
+        numbers = [_number(part) for part in name[1:].split('_')]
+        if None not in numbers and len(numbers) == 1:
+            number = numbers[0]
+            if name[0] == 's' and number < self.n_switches:
+                return number
+            if name[0] == 'h' and number < self.n_leaves:
+                return self.n_switches + number
+        # FPGA hosts are only named after their level if they are on several levels
+        if (name[0] == 'f' and None not in numbers and self.fpga_levels
+                and len(numbers) == min(len(self.fpga_levels), 2)):
+            level, position = ([self.fpga_levels[0]] + numbers)[-2:]
+            if level in self.fpga_levels and position < self.spread ** level:
+                host = self.fpga_host_of(self.node(level, position))
+                if host is not None:
+                    return host
+        raise KeyError(name)
+
+    def hosts(self):
+        """Yield every host in the order Mininet sorts their names, and so numbers their IPs."""
+        yield self.cloud
+        for node in self.fpga_hosts():
+            yield node
+        for node in self.leaves():
+            yield node
+
+    def host_number(self, node):
+        """Return the position of a host in hosts()."""
+        if node == self.cloud:
+            return 0
+        if node >= self.n_tree:
+            return 1 + node - self.n_tree
+        return 1 + self.n_fpga + node - self.n_switches
+
+    def ip(self, node):
+        """Return the IP address Mininet gives a host, numbering the hosts of 10.0.0.0/8 from
+        10.0.0.1 in the order of hosts()."""
+        number = self.host_number(node) + 1
+        return '10.{}.{}.{}'.format(number >> 16 & 0xff, number >> 8 & 0xff, number & 0xff)
+
+    def host_by_number(self, number):
+        """Return the host at the given position of hosts(), raising KeyError if there is none."""
+        if number == 0:
+            return self.cloud
+        if 0 < number <= self.n_fpga:
+            return self.n_tree + number - 1
+        if self.n_fpga < number <= self.n_fpga + self.n_leaves:
+            return self.n_switches + number - 1 - self.n_fpga
+        raise KeyError(number)
@@ -0,0 +1,258 @@
+"""
+Request/response workloads from every leaf of an emulated network.
+
+run_workload starts an rpc_agent server on every FPGA host (or on the cloud, if there are none) and
+an rpc_agent client on every leaf, sending requests to the FPGA host above it (or to the cloud).
+If the topology has compute options (see parameters.compute_options), the servers emulate the
+compute service of the FPGA hosts or the cloud, with its service times, pipelines and queue.
+The clients all start sending at the same time, and the summaries they print are aggregated into a
+single measurement: the requests sent and completed, the completed requests per second and the
+percentiles of the latency of every request of every leaf. Sweeping the rate or the connections
+shows where the FPGA level (or the cloud) saturates. In a network with several placements of FPGA
+hosts, a workload runs on one placement at a time, from the leaves below it. In a network of
+representative leaves (see aggregation), each representative sends the requests of every leaf it
+stands for.
+
+run_replay sends the requests of a packet trace or request log (see traces) instead, each flow of
+the trace from one of the leaves, at the times of the trace or a multiple of its speed. It is
+measured as a whole like a workload, and each flow on its own.
+"""
+
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from parameters import placement_compute
+from rpc_agent import RPC_PORT
+
+AGENT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rpc_agent.py')
+# Percentiles of the latency reported, and the fields they are reported in
+PERCENTILES = (('latency_p50_ms', 50), ('latency_p99_ms', 99), ('latency_p999_ms', 99.9))
+# Time given to the clients to start and connect before they all start sending, in total and per
+# client
+START_DELAY_S = 2.0
+START_DELAY_PER_CLIENT_S = 0.01
+
+
+def workload_targets(index, placement=None):
+    """Return (leaf, target) names for every leaf of a TreeIndex, the target being the FPGA host
+    above the leaf, or the cloud if there is no FPGA level.
+
+    With placement, the number of one of the placements of the index, only the leaves below its
+    FPGA hosts send, to them."""
+    if placement is not None:
+        return [(index.name(leaf), index.name(host))
+                for leaf, host in index.placement_targets(placement)]
+    if index.fpga is None:
+        return [(index.name(leaf), 'cloud') for leaf in index.leaves()]
+    fpga_positions = index.ancestor_positions(range(index.n_leaves), index.depth - 1, index.fpga)
+    return [(index.name(index.leaf(position)), index.name(index.fpga_host(fpga_position)))
+            for position, fpga_position in enumerate(fpga_positions)]
+
+
+def _representatives(net, targets):
+    """Return the targets whose leaves are built in a network, and the leaves each stands for."""
+    aggregation = net.topo.aggregation
+    if aggregation is None:
+        return targets, 1
+    return aggregation.targets(targets), aggregation.weight
+
+
+def server_args(compute, target, port=RPC_PORT):
+    """Return the command line of the rpc_agent server of a target host."""
+    args = [sys.executable, AGENT, 'server', '--port', str(port)]
+    if compute is not None:
+        options = compute['cloud' if target == 'cloud' else 'fpga']
+        args += ['--pipelines', str(options['pipelines']),
+                 '--service-time', repr(options['service_time']),
+                 '--distribution', compute['distribution'],
+                 '--queue-size', str(compute['queue_size'])]
+    return args
+
+
+def summarize(summaries, duration):
+    """Aggregate the summaries printed by rpc_agent clients into a measurement."""
+    import numpy as np
+
+    latencies = np.array([latency for summary in summaries for latency in summary['latencies']])
+    measurement = dict(
+        requests=sum(summary['sent'] for summary in summaries),
+        completed=len(latencies),
+        rejected=sum(summary['rejected'] for summary in summaries),
+        errors=sum(summary['errors'] for summary in summaries),
+        rps=len(latencies) / duration if duration else float('nan'),
+        latency_mean_ms=float(latencies.mean()) * 1e3 if len(latencies) else float('nan'),
+    )
+    for name, percentile in PERCENTILES:
+        measurement[name] = (float(np.percentile(latencies, percentile)) * 1e3 if len(latencies)
+                             else float('nan'))
+    return measurement
+
+
+def run_workload(net, mode='closed', rate=100.0, connections=1, duration=10.0, request_size=64,
+                 response_size=64, port=RPC_PORT, seed=None, placement=None, repetition=None):
+    """Run RPC traffic from every leaf of a started mininet network built from TreeTopoGeneric, and
+    return its measurement.
+
+    In open loop (mode 'open'), each leaf sends rate requests per second with Poisson arrivals. In
+    closed loop, each leaf keeps one request outstanding on each of its connections. placement
+    runs the workload on one placement of the network (see workload_targets). repetition, if
+    given, is a dict of the arguments of repetition.repeat, which runs the clients for duration
+    seconds at a time until the mean latency of the runs converges."""
+    logger = logging.getLogger(__name__)
+    index = net.topo.index
+    targets, weight = _representatives(net, workload_targets(index, placement))
+    compute = net.topo.compute
+    if placement is not None:
+        compute = placement_compute(compute, index.placements[placement])
+    target_names = sorted(set(target for _, target in targets))
+    logger.info('Running a %s loop RPC workload from %d leaves to %s', mode, len(targets),
+                ', '.join(target_names))
+
+    servers = [net.get(name).popen(server_args(compute, name, port))
+               for name in target_names]
+    summaries = []
+    runs = []
+
+    def run_clients():
+        """Run the clients of every leaf once, and return the mean latency of their requests
+        in ms as the sample of the run."""
+        start_at = time.time() + START_DELAY_S + START_DELAY_PER_CLIENT_S * len(targets)
+        clients = []
+        for i, (leaf, target) in enumerate(targets):
+            args = [sys.executable, AGENT, 'client', '--server', net.get(target).IP(),
+                    '--port', str(port), '--mode', mode, '--rate', str(rate * weight),
+                    '--connections', str(connections * weight), '--duration', str(duration),
+                    '--start-at', repr(start_at), '--request-size', str(request_size),
+                    '--response-size', str(response_size)]
+            if seed is not None:
+                # Every leaf, and every repetition, draws its own arrivals
+                args += ['--seed', str(seed + i + len(targets) * len(runs))]
+            clients.append(net.get(leaf).popen(args, stdout=subprocess.PIPE,
+                                               stderr=subprocess.PIPE))
+
+        latencies = []
+        for (leaf, _), client in zip(targets, clients):
+            output, error = client.communicate()
+            if client.returncode:
+                logger.warning('RPC client on %s failed: %s', leaf, error.decode().strip())
+            else:
+                summaries.append(json.loads(output.decode()))
+                latencies += summaries[-1]['latencies']
+        runs.append(len(latencies))
+        return [sum(latencies) / len(latencies) * 1e3] if latencies else []
+
+    try:
+        confidence = {}
+        if repetition is None:
+            run_clients()
+        else:
+            from repetition import repeat
+
+            _, confidence = repeat(run_clients, **repetition)
+    finally:
+        for server in servers:
+            server.terminate()
+            server.wait()
+
+    measurement = summarize(summaries, duration * len(runs))
+    measurement.update(test='rpc', src='h*',
+                       dst=target_names[0] if len(target_names) == 1 else 'f*',
+                       workload=mode, rate=rate, connections=connections, **confidence)
+    logger.info('%d of %d requests completed (%.1f per second) and %d rejected, '
+                'latency p50 %.3f ms, p99 %.3f ms, p99.9 %.3f ms',
+                measurement['completed'], measurement['requests'], measurement['rps'],
+                measurement['rejected'], measurement['latency_p50_ms'],
+                measurement['latency_p99_ms'], measurement['latency_p999_ms'])
+    if repetition is not None:
+        logger.info('Mean latency %.3f +- %.3f ms (%g%% confidence) over %d runs%s',
+                    measurement['latency_mean_ms'], measurement['ci_half_width'],
+                    measurement['ci_confidence'] * 100, len(runs),
+                    '' if measurement['converged'] else ', not converged')
+    return measurement
+
+
+def flow_measurement(flow, leaf, target, summary):
+    """Return the measurement of a replayed flow from the summary an rpc_agent client printed of
+    it."""
+    return dict(test='replay', src=leaf, dst=target, flow=flow, requests=summary['sent'],
+                completed=summary['completed'], rejected=summary['rejected'],
+                latency_mean_ms=summary['latency_mean'] * 1e3,
+                latency_p50_ms=summary['latency_p50'] * 1e3,
+                latency_p99_ms=summary['latency_p99'] * 1e3,
+                throughput_mbps=(summary['bytes'] * 8 / 1e6 / summary['seconds']
+                                 if summary['seconds'] > 0 else float('nan')))
+
+
+def run_replay(net, trace, speed=1.0, connections=1, response_size=64, port=RPC_PORT,
+               placement=None):
+    """Replay a packet trace or request log (see traces) from the leaves of a started mininet
+    network built from TreeTopoGeneric to their targets (see workload_targets), speed times faster
+    than it was recorded, and return a measurement of the whole replay and one of each flow.
+
+    Responses to the packets of a pcap file are response_size bytes. placement replays the trace
+    from the leaves below one placement of the network."""
+    from traces import plan_replay, read_trace
+
+    logger = logging.getLogger(__name__)
+    index = net.topo.index
+    targets, weight = _representatives(net, workload_targets(index, placement))
+    compute = net.topo.compute
+    if placement is not None:
+        compute = placement_compute(compute, index.placements[placement])
+
+    directory = tempfile.mkdtemp(prefix='replay-')
+    servers = []
+    try:
+        plan = plan_replay(read_trace(trace), targets, directory, speed, response_size)
+        target_names = sorted(set(target for _, _, target in plan['flows']))
+        logger.info('Replaying %d requests of %d flows of %s over %.3f s from %d leaves to %s',
+                    plan['requests'], len(plan['flows']), trace, plan['duration'],
+                    len(plan['schedules']), ', '.join(target_names))
+        servers = [net.get(name).popen(server_args(compute, name, port))
+                   for name in target_names]
+        leaves = sorted(plan['schedules'])
+        leaf_targets = dict((leaf, target) for _, leaf, target in plan['flows'])
+        start_at = time.time() + START_DELAY_S + START_DELAY_PER_CLIENT_S * len(leaves)
+        clients = []
+        for leaf in leaves:
+            args = [sys.executable, AGENT, 'client', '--server',
+                    net.get(leaf_targets[leaf]).IP(), '--port', str(port), '--mode', 'replay',
+                    '--schedule', plan['schedules'][leaf],
+                    '--connections', str(connections * weight),
+                    '--start-at', repr(start_at)]
+            clients.append(net.get(leaf).popen(args, stdout=subprocess.PIPE,
+                                               stderr=subprocess.PIPE))
+
+        summaries = []
+        for leaf, client in zip(leaves, clients):
+            output, error = client.communicate()
+            if client.returncode:
+                logger.warning('RPC client on %s failed: %s', leaf, error.decode().strip())
+            else:
+                summaries.append(json.loads(output.decode()))
+    finally:
+        for server in servers:
+            server.terminate()
+            server.wait()
+        shutil.rmtree(directory)
+
+    measurement = summarize(summaries, plan['duration'])
+    measurement.update(test='replay', src='h*', flow='*', flows=len(plan['flows']), speed=speed,
+                       dst=target_names[0] if len(target_names) == 1 else 'f*',
+                       connections=connections)
+    logger.info('%d of %d requests of %d flows completed and %d rejected, latency p50 %.3f ms, '
+                'p99 %.3f ms, p99.9 %.3f ms', measurement['completed'], measurement['requests'],
+                len(plan['flows']), measurement['rejected'], measurement['latency_p50_ms'],
+                measurement['latency_p99_ms'], measurement['latency_p999_ms'])
+    measurements = [measurement]
+    for summary in summaries:
+        for flow in summary['flows']:
+            name, leaf, target = plan['flows'][flow['flow']]
+            measurements.append(dict(flow_measurement(name, leaf, target, flow), speed=speed))
+    return measurements